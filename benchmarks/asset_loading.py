@@ -0,0 +1,151 @@
+"""
+Benchmark: open a scene of N mesh files and draw it at 60 Hz, with
+- blocking: every file read, optimized and uploaded before the first frame, as the examples did
+- threads:  AssetLoader with the optimizing reads forced onto a thread pool, uploads within
+            a per-frame budget and the frames draw whatever is ready so far
+- processes: the same with the loader's default, the optimizing reads in worker processes,
+            which do not hold the render thread's GIL
+
+Reports the time to the first frame, the render thread's work per frame while the scene
+streams in (P50, uploads included), the frame interval (P50 and worst, 16.7 ms unless the
+render thread waited for the CPU or the GIL), the longest upload of a frame and the time
+until the whole scene is drawn. The last frames are compared with the blocking one pixel by pixel.
+
+The OBJ files are generated grids of about ``vertices`` vertices, written once to a temp folder.
+
+    python benchmarks/asset_loading.py [vertices] [scene sizes...]
+"""
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from mesh_loading import write_grid_obj
+from common.asset_loader import AssetLoader, read_mesh_file
+from common.gl_state import default_state
+from common.mesh import Mesh
+from common.shader_program import ShaderProgram
+
+SHADERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyopengl-glfw", "shaders")
+WIDTH, HEIGHT = 640, 640
+FRAME = 1.0 / 60.0
+
+
+def cell_fit(index: int, count: int) -> tuple:
+    """u_fit placing mesh ``index`` of ``count`` in its own cell of a square grid."""
+    side = int(np.ceil(np.sqrt(count)))
+    scale = 0.9 / side
+    center = ((index % side + 0.5) / side * 2.0 - 1.0, (index // side + 0.5) / side * 2.0 - 1.0)
+
+    return -center[0] / scale, -center[1] / scale, 0.0, scale
+
+
+def draw(program, fit_location: int, meshes: list, count: int):
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+    program.use()
+    for index, mesh in meshes:
+        gl.glUniform4f(fit_location, *cell_fit(index, count))
+        mesh.draw()
+
+
+def present(start: float) -> float:
+    """Finish the frame and wait for the next 60 Hz tick like a swap with vsync, return the work time."""
+    gl.glFinish()
+    work = time.perf_counter() - start
+    time.sleep(max(0.0, FRAME - work))
+
+    return work
+
+
+def blocking(paths: list, program, fit_location: int) -> tuple:
+    """(first frame s, the frame's work s, image) of loading everything up front."""
+    start = time.perf_counter()
+    meshes = [(index, Mesh(read_mesh_file(path, optimize=True))) for index, path in enumerate(paths)]
+    draw(program, fit_location, meshes, len(paths))
+    gl.glFinish()
+    first = time.perf_counter() - start
+    image = gl.glReadPixels(0, 0, WIDTH, HEIGHT, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
+    for _, mesh in meshes:
+        mesh.delete()
+
+    return first, first, image
+
+
+def streamed(paths: list, program, fit_location: int, process_executor=None) -> tuple:
+    """(first frame s, all ready s, frame works, frame intervals, loader, image) of loading while drawing."""
+    start = time.perf_counter()
+    loader = AssetLoader(process_executor=process_executor)
+    assets = [loader.load_mesh(path, optimize=True) for path in paths]
+    meshes = []
+    first, works, starts = None, [], []
+    while True:
+        frame_start = time.perf_counter()
+        starts.append(frame_start)
+        loaded = loader.pending == 0
+        for asset in loader.update():
+            meshes.append((assets.index(asset), asset.value))
+        draw(program, fit_location, meshes, len(paths))
+        works.append(present(frame_start))
+        if first is None:
+            # Like blocking: until the frame is finished, not the vsync wait after it
+            first = frame_start + works[-1] - start
+        if loaded:
+            break
+    ready = loader.stats.last_ready - start
+    image = gl.glReadPixels(0, 0, WIDTH, HEIGHT, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE)
+    loader.shutdown()
+    for _, mesh in meshes:
+        mesh.delete()
+
+    return first, ready, works, np.diff(starts), loader, image
+
+
+def run(vertices: int, scenes):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}::{os.cpu_count()} CPUS")
+    program = ShaderProgram.from_files(os.path.join(SHADERS, "index_drawing.vs"),
+                                       os.path.join(SHADERS, "index_drawing.fs"))
+    fit_location = gl.glGetUniformLocation(program.program, "u_fit")
+    gl.glClearColor(0.0, 0.1, 0.1, 1.0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, "grid.obj")
+        write_grid_obj(source, vertices)
+        for count in scenes:
+            # Hard links, separate files to the loader without writing them again
+            paths = [os.path.join(directory, f"grid{index}.obj") for index in range(count)]
+            for path in paths:
+                if not os.path.exists(path):
+                    os.link(source, path)
+
+            print(f"{count:>4} files of {vertices} vertices, optimized while loading")
+            print(f"{'':>10} {'first frame':>12} {'work P50':>9} {'interval P50':>13} {'worst':>9} {'all ready':>10}")
+            first, work, reference = blocking(paths, program, fit_location)
+            print(f"{'blocking':>10} {first * 1000.0:10.1f}ms {'-':>9} {'-':>13} {work * 1000.0:7.1f}ms"
+                  f" {first * 1000.0:8.1f}ms")
+            for name, executor in (("threads", ThreadPoolExecutor()), ("processes", None)):
+                first, ready, works, intervals, loader, image = streamed(paths, program, fit_location, executor)
+                if executor is not None:
+                    executor.shutdown()
+                p50, interval, worst = (np.percentile(works, 50) * 1000.0, np.percentile(intervals, 50) * 1000.0,
+                                        max(intervals) * 1000.0)
+                print(f"{name:>10} {first * 1000.0:10.1f}ms {p50:7.2f}ms {interval:11.1f}ms {worst:7.1f}ms"
+                      f" {ready * 1000.0:8.1f}ms"
+                      f"  ({len(works)} frames, uploads max {loader.stats.max_frame_upload * 1000.0:.2f}ms,"
+                      f" last frame {'identical' if image == reference else 'differs'})")
+
+    default_state().delete_program(program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    arguments = [int(arg) for arg in sys.argv[1:]]
+    run(arguments[0] if arguments else 50000, arguments[1:] or [4, 16])
+    destroy_context(window)
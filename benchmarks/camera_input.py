@@ -0,0 +1,116 @@
+"""
+Benchmark: orbiting the camera with a 1000 Hz mouse while drawing at 60 Hz, with
+- per event: the camera is updated in every mouse event, as the viewport used to
+- coalesced: CameraInput sums the events and updates the camera once per frame
+
+Reports the Python time spent on camera updates per second of input, the input-to-present
+latency (first event of a frame to glFinish after drawing it, headless so no compositor or
+display is included) and how far the orbit quaternion drifts from unit length after many
+small drags, with and without renormalization.
+
+    python benchmarks/camera_input.py [mouse rate in Hz]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common import matrices
+from common.camera_input import CameraInput
+from common.gl_state import default_state
+from common.infinite_grid import InfiniteGrid
+from common.transform import Camera
+from common.uniform_buffer import CameraUniformBuffer
+
+WIDTH, HEIGHT = 1280, 720
+FPS = 60.0
+SECONDS = 2.0
+DRIFT_EVENTS = 100000
+
+SHADERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyopengl-qt", "3.viewport_rotate", "shaders")
+
+
+def drags(count: int, rng) -> np.ndarray:
+    """Small mouse moves in pixels, a slow circle with jitter."""
+    angle = np.linspace(0.0, 4.0 * np.pi, count)
+
+    return np.stack((np.cos(angle), np.sin(angle)), axis=1) * 2.0 + rng.normal(0.0, 0.5, (count, 2))
+
+
+def session(rate: float, coalesce: bool, grid, camera_ubo) -> tuple:
+    """(camera update seconds, latencies in ms) of SECONDS of dragging at ``rate`` Hz."""
+    camera = Camera(eye=(0.0, 5.0, -10.0))
+    camera.set_perspective(45.0, WIDTH / HEIGHT, 0.1, 1000.0)
+    camera_input = CameraInput()
+    moves = drags(int(rate * SECONDS), np.random.default_rng(0))
+    per_frame = int(round(rate / FPS))
+
+    updating = 0.0
+    latencies = []
+    for start in range(0, len(moves), per_frame):
+        # The events arrived during the last frame, evenly spaced
+        now = time.perf_counter()
+        frame = moves[start:start + per_frame]
+        stamps = now - (len(frame) - np.arange(len(frame))) / rate
+
+        begin = time.perf_counter()
+        for (dx, dy), stamp in zip(frame.tolist(), stamps.tolist()):
+            camera_input.rotate(dx, dy, stamp)
+            if not coalesce:
+                camera_input.apply(camera, HEIGHT)
+                camera.view_matrix
+        camera_input.apply(camera, HEIGHT)
+        camera_ubo.update(camera.view_matrix, camera.projection_matrix)
+        updating += time.perf_counter() - begin
+
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        grid.draw()
+        gl.glFinish()
+        latencies.append((time.perf_counter() - stamps[0]) * 1000.0)
+        camera_input.presented()
+
+    return updating, np.array(latencies)
+
+
+def drift() -> tuple:
+    """Length error of the orbit quaternion after DRIFT_EVENTS float32 updates."""
+    moves = drags(DRIFT_EVENTS, np.random.default_rng(1))
+    raw = normalized = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+    for dx, dy in moves.tolist():
+        delta = matrices.quaternion_from_axis_angle((dy, dx, 0.0), np.hypot(dx, dy) / 2.0)
+        raw = matrices.quaternion_multiply(delta, raw)
+        normalized = matrices.quaternion_normalize(matrices.quaternion_multiply(delta, normalized))
+
+    return abs(float(np.linalg.norm(raw)) - 1.0), abs(float(np.linalg.norm(normalized)) - 1.0)
+
+
+def run(rate: float):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    default_state().enable(gl.GL_DEPTH_TEST)
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+
+    grid = InfiniteGrid(os.path.join(SHADERS, "grid_vertex.glsl"), os.path.join(SHADERS, "grid_fragment.glsl"))
+    camera_ubo = CameraUniformBuffer()
+    print(f"{rate:.0f} Hz mouse, {FPS:.0f} fps, {SECONDS:.0f}s of dragging")
+    print(f"{'':>10} {'updates':>10} {'latency P50':>12} {'P99':>8}")
+    for name, coalesce in (("per event", False), ("coalesced", True)):
+        updating, latencies = session(rate, coalesce, grid, camera_ubo)
+        p50, p99 = np.percentile(latencies, (50, 99))
+        print(f"{name:>10} {updating / SECONDS * 1000.0:8.2f}ms {p50:10.2f}ms {p99:6.2f}ms")
+
+    raw, normalized = drift()
+    print(f"INFO::CAMERA_INPUT::DRIFT AFTER {DRIFT_EVENTS} UPDATES::|q| - 1 = {raw:.2e} RAW, {normalized:.2e} RENORMALIZED")
+
+    grid.delete()
+    camera_ubo.delete()
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run(float(sys.argv[1]) if len(sys.argv) > 1 else 1000.0)
+    destroy_context(window)
@@ -0,0 +1,142 @@
+"""
+Benchmark: markers scattered over a 1000 x 1000 plane, camera orbiting as when dragging
+in the 3D viewport, drawn with
+- none:  every marker uploaded and drawn
+- brute: each AABB tested against the frustum (vectorized, but all N every frame)
+- bvh:   BoundingVolumeHierarchy.cull(), whole subtrees rejected or accepted
+- moving: bvh with 1% of the markers moving every frame, refit() before culling
+
+    python benchmarks/frustum_culling.py [marker counts...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common import matrices
+from common.culling import BoundingVolumeHierarchy, aabbs_in_frustum, frustum_planes, transform_bounds
+from common.gl_state import default_state
+from common.instanced_mesh import InstancedMesh
+from common.shader_program import ShaderProgram
+from common.transform import Camera
+from common.transform_batch import TransformBatch
+from common.uniform_buffer import CameraUniformBuffer
+
+SHADERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyopengl-qt", "3.viewport_rotate", "shaders")
+WIDTH, HEIGHT = 1280, 720
+FRAMES = 20
+
+QUAD_VERTICES = np.array([0.5, 0.5, 0.0,
+                          0.5, -0.5, 0.0,
+                          -0.5, -0.5, 0.0,
+                          -0.5, 0.5, 0.0], dtype=np.float32)
+QUAD_INDICES = np.array([0, 1, 3,
+                         1, 2, 3], dtype=np.uint32)
+QUAD_BOUNDS = ((-0.5, -0.5, 0.0), (0.5, 0.5, 0.0))
+
+
+def build_scene(count: int) -> TransformBatch:
+    rng = np.random.default_rng(0)
+    positions = np.zeros((count, 3), dtype=np.float32)
+    positions[:, [0, 2]] = rng.uniform(-500.0, 500.0, (count, 2))
+    batch = TransformBatch(count)
+    batch.extend(positions, np.tile(matrices.quaternion_from_axis_angle((1.0, 0.0, 0.0), 90.0), (count, 1)))
+    batch.compose()
+
+    return batch
+
+
+def orbit(frame: int) -> np.ndarray:
+    return matrices.quaternion_from_axis_angle((0.0, 1.0, 0.0), frame * 360.0 / FRAMES)
+
+
+def bench(count: int) -> dict:
+    batch = build_scene(count)
+    camera = Camera(eye=(0.0, 5.0, -10.0))
+    camera.set_perspective(45.0, WIDTH / HEIGHT, 0.1, 1000.0)
+    camera_ubo = CameraUniformBuffer()
+    program = ShaderProgram.from_files(os.path.join(SHADERS, "mark_vertex_instanced.glsl"),
+                                       os.path.join(SHADERS, "mark_fragment_instanced.glsl"))
+    mesh = InstancedMesh(QUAD_VERTICES, QUAD_INDICES, max_instances=count)
+    rng = np.random.default_rng(1)
+
+    bvh = BoundingVolumeHierarchy()
+    lower, upper = transform_bounds(batch.models, *QUAD_BOUNDS)
+    start = time.perf_counter()
+    bvh.build(lower, upper)
+    build = (time.perf_counter() - start) * 1000.0
+
+    def cull_none(view_projection):
+        return np.arange(count)
+
+    def cull_brute(view_projection):
+        return np.flatnonzero(aabbs_in_frustum(frustum_planes(view_projection), lower, upper))
+
+    def cull_bvh(view_projection):
+        return bvh.cull(view_projection)
+
+    def cull_moving(view_projection):
+        moved = rng.choice(count, max(1, count // 100), replace=False)
+        batch.positions[moved] += rng.uniform(-1.0, 1.0, (len(moved), 3)).astype(np.float32)
+        batch.mark_dirty(moved)
+        models, _ = batch.compose()
+        lower[moved], upper[moved] = transform_bounds(models[moved], *QUAD_BOUNDS)
+        bvh.refit(lower, upper, moved)
+
+        return bvh.cull(view_projection)
+
+    results = {}
+    for name, cull in (("none", cull_none), ("brute", cull_brute), ("bvh", cull_bvh), ("moving", cull_moving)):
+        culling = 0.0
+        visible = 0
+        gl.glFinish()
+        start = time.perf_counter()
+        for frame in range(FRAMES):
+            camera.rotation = orbit(frame)
+            view = camera.view_matrix
+            camera_ubo.update(view, camera.projection_matrix)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+            culled = time.perf_counter()
+            indices = cull(camera.projection_matrix @ view)
+            culling += time.perf_counter() - culled
+            visible += len(indices)
+
+            mesh.set_models(batch.models[indices])
+            program.use()
+            mesh.draw()
+        gl.glFinish()
+        frame_time = (time.perf_counter() - start) / FRAMES * 1000.0
+        results[name] = (visible // FRAMES, culling / FRAMES * 1000.0, frame_time)
+
+    print(f"INFO::BVH::BUILD {build:.1f}ms::DEPTH {bvh.depth}::{bvh.stats.report()}")
+    mesh.delete()
+    camera_ubo.delete()
+    default_state().delete_program(program.program)
+
+    return results
+
+
+def run(counts):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    gl.glEnable(gl.GL_DEPTH_TEST)
+
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+    for count in counts:
+        results = bench(count)
+        print(f"{count:>10} markers")
+        print(f"{'':>10} {'visible':>9} {'culling':>10} {'frame':>10}")
+        for name, (visible, culling, frame_time) in results.items():
+            print(f"{name:>10} {visible:9d} {culling:8.2f}ms {frame_time:8.2f}ms")
+
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([int(arg) for arg in sys.argv[1:]] or [10000, 100000, 1000000])
+    destroy_context(window)
@@ -0,0 +1,59 @@
+"""Context and render target helpers shared by the benchmark scripts."""
+import glfw
+import OpenGL.GL as gl
+
+
+def create_context(width: int = 1280, height: int = 720):
+    """Hidden GLFW window, only used for its context. Vsync is disabled."""
+    if not glfw.init():
+        raise RuntimeError("GLFW initialization error")
+    glfw.window_hint(glfw.VISIBLE, glfw.FALSE)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MAJOR, 4)
+    glfw.window_hint(glfw.CONTEXT_VERSION_MINOR, 3)
+    glfw.window_hint(glfw.OPENGL_FORWARD_COMPAT, gl.GL_TRUE)
+    glfw.window_hint(glfw.OPENGL_PROFILE, glfw.OPENGL_CORE_PROFILE)
+    window = glfw.create_window(width, height, "benchmark", None, None)
+    if not window:
+        glfw.terminate()
+        raise RuntimeError("GLFW window can not be created")
+    glfw.make_context_current(window)
+    glfw.swap_interval(0)
+
+    return window
+
+
+def destroy_context(window):
+    glfw.destroy_window(window)
+    glfw.terminate()
+
+
+def create_framebuffer(width: int, height: int, samples: int = 0):
+    """
+    Bind an offscreen RGBA8 + depth framebuffer so results do not depend on the window.
+    :param width: Framebuffer width
+    :param height: Framebuffer height
+    :param samples: MSAA sample count, 0 for a single sampled target
+    :return: (fbo, [color renderbuffer, depth renderbuffer])
+    """
+    fbo = gl.glGenFramebuffers(1)
+    renderbuffers = list(gl.glGenRenderbuffers(2))
+    gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, fbo)
+
+    for renderbuffer, internal_format, attachment in zip(renderbuffers,
+                                                         (gl.GL_RGBA8, gl.GL_DEPTH_COMPONENT24),
+                                                         (gl.GL_COLOR_ATTACHMENT0, gl.GL_DEPTH_ATTACHMENT)):
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, renderbuffer)
+        gl.glRenderbufferStorageMultisample(gl.GL_RENDERBUFFER, samples, internal_format, width, height)
+        gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, attachment, gl.GL_RENDERBUFFER, renderbuffer)
+
+    if gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) != gl.GL_FRAMEBUFFER_COMPLETE:
+        raise RuntimeError("Benchmark framebuffer is incomplete")
+    gl.glViewport(0, 0, width, height)
+
+    return fbo, renderbuffers
+
+
+def delete_framebuffer(fbo, renderbuffers):
+    gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+    gl.glDeleteRenderbuffers(len(renderbuffers), renderbuffers)
+    gl.glDeleteFramebuffers(1, [fbo])
@@ -0,0 +1,120 @@
+"""
+Benchmark: a frame of small objects, each setting its program, VAO, depth and blend state
+before its draw call the way independent drawing code does, with
+- raw:     every state call goes to GL
+- tracked: the same calls through GLState, unchanged state is skipped
+
+Objects are sorted by program and mesh, so most of the state repeats from one draw to
+the next. Reports CPU milliseconds per frame and state calls issued/skipped per frame.
+
+    python benchmarks/gl_state.py [object counts...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common.gl_state import GLState, default_state
+from common.mesh import Mesh
+from common.mesh_io import MeshData
+from common.shader_program import ShaderProgram
+
+WIDTH, HEIGHT = 640, 360
+FRAMES = 20
+PROGRAMS = 4
+MESHES = 16
+
+VERTEX_SRC = """# version 330
+layout (location = 0) in vec3 a_position;
+uniform float u_scale;
+void main() { gl_Position = vec4(a_position * u_scale, 1.0); }
+"""
+FRAGMENT_SRC = """# version 330
+out vec4 fragColor;
+void main() { fragColor = vec4(1.0); }
+"""
+
+
+def quad() -> MeshData:
+    data = np.empty(4, dtype=[("position", np.float32, (3,))])
+    data["position"] = ((0.5, 0.5, 0.0), (0.5, -0.5, 0.0), (-0.5, -0.5, 0.0), (-0.5, 0.5, 0.0))
+
+    return MeshData(data, np.array([0, 1, 3, 1, 2, 3], dtype=np.uint16))
+
+
+def draw_raw(objects):
+    gl.glClearColor(0.2, 0.3, 0.3, 1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+    for program, mesh in objects:
+        gl.glUseProgram(program.program)
+        gl.glBindVertexArray(mesh.vao)
+        gl.glEnable(gl.GL_DEPTH_TEST)
+        gl.glDisable(gl.GL_BLEND)
+        gl.glDepthMask(gl.GL_TRUE)
+        gl.glDrawElements(gl.GL_TRIANGLES, mesh.index_count, mesh.index_type, None)
+
+
+def draw_tracked(objects, state: GLState):
+    state.clear_color(0.2, 0.3, 0.3, 1.0)
+    gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+    for program, mesh in objects:
+        state.use_program(program.program)
+        state.bind_vertex_array(mesh.vao)
+        state.enable(gl.GL_DEPTH_TEST)
+        state.disable(gl.GL_BLEND)
+        state.depth_mask(True)
+        gl.glDrawElements(gl.GL_TRIANGLES, mesh.index_count, mesh.index_type, None)
+    state.end_frame()
+
+
+def frame_time(draw) -> float:
+    """CPU milliseconds per frame, the GPU is waited for only outside the loop."""
+    draw()
+    gl.glFinish()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        draw()
+    elapsed = time.perf_counter() - start
+    gl.glFinish()
+
+    return elapsed / FRAMES * 1000.0
+
+
+def run(counts):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+
+    programs = [ShaderProgram.from_sources(VERTEX_SRC, FRAGMENT_SRC) for _ in range(PROGRAMS)]
+    meshes = [Mesh(quad()) for _ in range(MESHES)]
+    for count in counts:
+        # Sorted by program, then mesh: consecutive objects mostly share their state
+        objects = [(programs[index * PROGRAMS // count], meshes[index * MESHES // count]) for index in range(count)]
+
+        raw = frame_time(lambda: draw_raw(objects))
+        # Raw calls above bypassed the tracker, start it from scratch
+        state = GLState()
+        tracked = frame_time(lambda: draw_tracked(objects, state))
+        frames = state.stats.frames
+
+        print(f"{count:>10} objects, {PROGRAMS} programs, {MESHES} meshes")
+        print(f"{'':>10} {'frame':>10} {'issued':>8} {'skipped':>8}")
+        print(f"{'raw':>10} {raw:8.2f}ms {count * 5 + 1:8d} {0:8d}")
+        print(f"{'tracked':>10} {tracked:8.2f}ms {state.stats.issued / frames:8.1f} {state.stats.skipped / frames:8.1f}")
+        print(state.stats.report())
+
+    default_state().invalidate()
+    for mesh in meshes:
+        mesh.delete()
+    for program in programs:
+        default_state().delete_program(program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
+    destroy_context(window)
@@ -0,0 +1,110 @@
+"""
+Fragment-bound comparison of the 1000x scaled quad grid (discard between the lines)
+and the analytic ground-plane grid, rendered at 4K with 4x MSAA. Each is drawn once over
+an empty depth buffer and once "occluded", with the depth buffer cleared to that of a wall
+OCCLUDER units in front of the camera: the plane behind it can be rejected by the early
+depth test before it is shaded.
+
+    python benchmarks/grid_fill_rate.py [width height samples]
+"""
+import os
+import sys
+import time
+
+import OpenGL.GL as gl
+from OpenGL.GL.ARB.pipeline_statistics_query import GL_FRAGMENT_SHADER_INVOCATIONS_ARB
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common import matrices
+from common.gl_info import query_result, has_extension
+from common.infinite_grid import InfiniteGrid, QuadGrid
+from common.uniform_buffer import CameraUniformBuffer
+
+SHADERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyopengl-qt", "3.viewport_rotate", "shaders")
+FRAMES = 5
+OCCLUDER = 20.0
+
+
+def measure(draw, clear_depth: float = 1.0):
+    """
+    Average GPU time (GL_TIME_ELAPSED) and wall time per frame in milliseconds, plus the
+    number of fragment shader invocations if the driver can count them.
+    Software rasterizers report almost no GPU time, compare wall time there.
+    :param clear_depth: Depth buffer value before each frame, below 1 it hides part of the plane
+    """
+    gl.glClearDepth(clear_depth)
+    query = gl.glGenQueries(1)[0]
+    draw()
+    gl.glFinish()
+
+    gpu_ns = 0
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        gl.glBeginQuery(gl.GL_TIME_ELAPSED, query)
+        draw()
+        gl.glEndQuery(gl.GL_TIME_ELAPSED)
+        gpu_ns += query_result(query)
+    wall = (time.perf_counter() - start) / FRAMES * 1000.0
+
+    gl.glDeleteQueries(1, [query])
+
+    invocations = None
+    if has_extension("GL_ARB_pipeline_statistics_query"):
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        query = gl.glGenQueries(1)[0]
+        gl.glBeginQuery(GL_FRAGMENT_SHADER_INVOCATIONS_ARB, query)
+        draw()
+        gl.glEndQuery(GL_FRAGMENT_SHADER_INVOCATIONS_ARB)
+        invocations = query_result(query)
+        gl.glDeleteQueries(1, [query])
+
+    gl.glClearDepth(1.0)
+
+    return gpu_ns / FRAMES / 1e6, wall, invocations
+
+
+def run(width: int, height: int, samples: int):
+    target = create_framebuffer(width, height, samples)
+    gl.glEnable(gl.GL_DEPTH_TEST)
+    gl.glClearColor(0.4, 0.4, 0.4, 1.0)
+
+    camera = CameraUniformBuffer()
+    projection = matrices.perspective(45.0, width / height, 0.1, 1000.0)
+    camera.update(matrices.look_at((0.0, 5.0, -10.0), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0)), projection)
+    # Window depth of a point OCCLUDER units down the view axis
+    clip = projection @ (0.0, 0.0, -OCCLUDER, 1.0)
+    occluder_depth = clip[2] / clip[3] * 0.5 + 0.5
+
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+    print(f"INFO::TARGET::{width}x{height}::{samples}x MSAA")
+    grids = (("quad", QuadGrid(os.path.join(SHADERS, "grid_quad_vertex.glsl"),
+                               os.path.join(SHADERS, "grid_quad_fragment.glsl"))),
+             ("analytic", InfiniteGrid(os.path.join(SHADERS, "grid_vertex.glsl"),
+                                       os.path.join(SHADERS, "grid_fragment.glsl"))))
+    for scene, clear_depth in (("open", 1.0), ("occluded", occluder_depth)):
+        print(f"{scene} plane")
+        print(f"{'grid':>10} {'gpu':>10} {'wall':>10} {'fs invocations':>15}")
+        results = {}
+        for name, grid in grids:
+            results[name] = gpu, wall, invocations = measure(grid.draw, clear_depth)
+            print(f"{name:>10} {gpu:8.2f}ms {wall:8.2f}ms {invocations if invocations is not None else 'n/a':>15}")
+
+        (quad_gpu, quad_wall, quad_fs), (grid_gpu, grid_wall, grid_fs) = results["quad"], results["analytic"]
+        print(f"INFO::GPU_TIME_SPEEDUP::{quad_gpu / grid_gpu:.1f}x")
+        print(f"INFO::WALL_TIME_SPEEDUP::{quad_wall / grid_wall:.1f}x")
+        if quad_fs and grid_fs:
+            print(f"INFO::FRAGMENT_INVOCATIONS_RATIO::{quad_fs / grid_fs:.1f}x")
+
+    for _, grid in grids:
+        grid.delete()
+    camera.delete()
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    width, height, samples = [int(arg) for arg in sys.argv[1:4]] or [3840, 2160, 4]
+    window = create_context()
+    run(width, height, samples)
+    destroy_context(window)
@@ -0,0 +1,118 @@
+"""
+Benchmark scene: N markers drawn one by one (uniform upload + glDrawElements per object)
+versus one glDrawElementsInstanced call.
+
+    python benchmarks/instancing.py [marker counts...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common import matrices
+from common.gl_state import default_state
+from common.instanced_mesh import InstancedMesh
+from common.shader_program import ShaderProgram
+from common.transform_batch import TransformBatch
+from common.uniform_buffer import CameraUniformBuffer
+
+SHADERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyopengl-qt", "3.viewport_rotate", "shaders")
+WIDTH, HEIGHT = 1280, 720
+FRAMES = 10
+
+QUAD_VERTICES = np.array([0.5, 0.5, 0.0,
+                          0.5, -0.5, 0.0,
+                          -0.5, -0.5, 0.0,
+                          -0.5, 0.5, 0.0], dtype=np.float32)
+QUAD_INDICES = np.array([0, 1, 3,
+                         1, 2, 3], dtype=np.uint32)
+
+
+def build_scene(count: int) -> TransformBatch:
+    rng = np.random.default_rng(0)
+    batch = TransformBatch(count)
+    batch.extend(rng.uniform(-50.0, 50.0, (count, 3)),
+                 np.tile(matrices.quaternion_from_axis_angle((1.0, 0.0, 0.0), 90.0), (count, 1)),
+                 rng.uniform(0.2, 1.0, (count, 1)))
+    batch.compose()
+
+    return batch
+
+
+def frame_time(draw) -> float:
+    """Average milliseconds per frame including GPU completion."""
+    draw()
+    gl.glFinish()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        draw()
+    gl.glFinish()
+
+    return (time.perf_counter() - start) / FRAMES * 1000.0
+
+
+def bench(count: int, per_object: bool = True):
+    batch = build_scene(count)
+
+    camera = CameraUniformBuffer()
+    camera.update(matrices.look_at((0.0, 60.0, -80.0), (0.0, 0.0, 0.0), (0.0, 1.0, 0.0)),
+                  matrices.perspective(45.0, WIDTH / HEIGHT, 0.1, 1000.0))
+
+    # -- Per-object draws --
+    single_time = None
+    if per_object:
+        program = ShaderProgram.from_files(os.path.join(SHADERS, "mark_vertex.glsl"),
+                                           os.path.join(SHADERS, "mark_fragment.glsl"))
+        mesh = InstancedMesh(QUAD_VERTICES, QUAD_INDICES, max_instances=1)
+        models = batch.models
+
+        def draw_single():
+            program.use()
+            default_state().bind_vertex_array(mesh.vao)
+            for model in models:
+                program.set_matrix4("u_modelMatrix", model)
+                gl.glDrawElements(gl.GL_TRIANGLES, 6, gl.GL_UNSIGNED_INT, None)
+
+        single_time = frame_time(draw_single)
+        mesh.delete()
+
+    # -- Instanced draw --
+    program = ShaderProgram.from_files(os.path.join(SHADERS, "mark_vertex_instanced.glsl"),
+                                       os.path.join(SHADERS, "mark_fragment_instanced.glsl"))
+    mesh = InstancedMesh(QUAD_VERTICES, QUAD_INDICES, max_instances=count)
+
+    def draw_instanced():
+        # Matrices are re-uploaded every frame to include the upload cost
+        mesh.set_models(batch.models)
+        program.use()
+        mesh.draw()
+
+    instanced_time = frame_time(draw_instanced)
+    mesh.delete()
+    camera.delete()
+
+    return single_time, instanced_time
+
+
+def run(counts):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    gl.glEnable(gl.GL_DEPTH_TEST)
+
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+    print(f"{'markers':>10} {'per-object':>12} {'instanced':>12} {'speedup':>9}")
+    for count in counts:
+        single, instanced = bench(count)
+        print(f"{count:>10} {single:10.2f}ms {instanced:10.2f}ms {single / instanced:8.1f}x")
+
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([int(arg) for arg in sys.argv[1:]] or [1000, 10000, 50000])
+    destroy_context(window)
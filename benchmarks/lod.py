@@ -0,0 +1,146 @@
+"""
+Benchmark: a field of dense, bumpy spheres receding from the camera, drawn with
+- full: every sphere at full detail
+- lod:  levels from build_lods(), picked per sphere by projected error (select_levels)
+
+Reports LOD generation time, triangles per frame (all spheres and the distant ones), frame
+time, and how much the two images differ: pixels changed by more than 8/255 in any
+channel and the mean difference.
+
+    python benchmarks/lod.py [spheres]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common import matrices
+from common.gl_state import default_state
+from common.lod import LodMesh, build_lods, projection_scale, select_levels
+from common.mesh_io import MeshData
+from common.shader_program import ShaderProgram
+from common.transform_batch import TransformBatch
+
+WIDTH, HEIGHT = 1280, 720
+FRAMES = 5
+# Spheres further than this count as distant in the report
+DISTANT = 50.0
+
+VERTEX_SRC = """# version 420
+layout (location = 0) in vec3 a_position;
+layout (location = 2) in mat4 a_modelMatrix;
+uniform mat4 u_viewProjection;
+out vec3 v_normal;
+void main() {
+    v_normal = mat3(a_modelMatrix) * normalize(a_position);
+    gl_Position = u_viewProjection * a_modelMatrix * vec4(a_position, 1.0);
+}
+"""
+FRAGMENT_SRC = """# version 420
+in vec3 v_normal;
+out vec4 fragColor;
+void main() {
+    float light = max(dot(normalize(v_normal), normalize(vec3(0.4, 0.8, 0.5))), 0.0);
+    fragColor = vec4(vec3(0.15 + 0.85 * light), 1.0);
+}
+"""
+
+
+def bumpy_sphere(side: int = 200) -> MeshData:
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, side), np.linspace(0.0, 1.0, side))
+    theta, phi = u.ravel() * 2.0 * np.pi, v.ravel() * np.pi
+    radius = 1.0 + 0.05 * np.sin(theta * 12.0) * np.sin(phi * 9.0)
+    positions = np.stack((np.sin(phi) * np.cos(theta), np.cos(phi), np.sin(phi) * np.sin(theta)), axis=1)
+
+    data = np.empty(side * side, dtype=[("position", np.float32, (3,))])
+    data["position"] = positions * radius[:, None]
+    corner = (np.arange(side - 1)[None, :] + np.arange(side - 1)[:, None] * side).ravel()
+    indices = np.stack((corner, corner + side, corner + 1, corner + 1, corner + side, corner + side + 1), axis=1)
+
+    return MeshData(data, indices.astype(np.uint32).reshape(-1))
+
+
+def sphere_field(count: int) -> TransformBatch:
+    """Spheres on a grid in front of the camera, from 4 to about 250 units away."""
+    columns = int(np.ceil(np.sqrt(count)))
+    row, column = np.divmod(np.arange(count), columns)
+    positions = np.stack(((column - columns / 2.0) * 6.0, np.zeros(count), -4.0 - row * 250.0 / columns), axis=1)
+    batch = TransformBatch(count)
+    batch.extend(positions)
+    batch.compose()
+
+    return batch
+
+
+def render(draw) -> tuple:
+    """(milliseconds per frame, RGB image of the last frame)."""
+    draw()
+    gl.glFinish()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        draw()
+    gl.glFinish()
+    milliseconds = (time.perf_counter() - start) / FRAMES * 1000.0
+    pixels = gl.glReadPixels(0, 0, WIDTH, HEIGHT, gl.GL_RGB, gl.GL_UNSIGNED_BYTE)
+
+    return milliseconds, np.frombuffer(pixels, dtype=np.uint8).reshape(HEIGHT, WIDTH, 3).astype(np.int16)
+
+
+def run(count: int):
+    # Single-sampled so every edge difference shows up in the comparison
+    target = create_framebuffer(WIDTH, HEIGHT, 0)
+    gl.glEnable(gl.GL_DEPTH_TEST)
+    gl.glClearColor(0.2, 0.25, 0.3, 1.0)
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+
+    mesh_data = bumpy_sphere()
+    start = time.perf_counter()
+    levels = build_lods(mesh_data)
+    print(f"INFO::LOD::BUILD {(time.perf_counter() - start) * 1000.0:.0f}ms::LEVELS "
+          + " ".join(f"{len(indices) // 3}/{error:.4f}" for indices, error in levels))
+
+    batch = sphere_field(count)
+    lod = LodMesh(mesh_data, levels, max_instances=count)
+    program = ShaderProgram.from_sources(VERTEX_SRC, FRAGMENT_SRC)
+    program.use()
+    view = matrices.look_at((0.0, 3.0, 0.0), (0.0, 0.0, -60.0), (0.0, 1.0, 0.0))
+    projection = matrices.perspective(45.0, WIDTH / HEIGHT, 0.1, 1000.0)
+    program.set_matrix4("u_viewProjection", projection @ view, transpose=True)
+
+    eye = np.array((0.0, 3.0, 0.0))
+    distances = np.linalg.norm(batch.positions - eye, axis=1) - 1.05
+    selected = select_levels(lod.errors, distances, projection_scale(projection, HEIGHT))
+    print(f"INFO::LOD::OBJECTS PER LEVEL::{np.bincount(selected, minlength=lod.level_count).tolist()}")
+    distant = distances > DISTANT
+    distant_full = int(distant.sum()) * int(lod.triangles[0])
+    distant_lod = int(lod.triangles[selected[distant]].sum())
+
+    results = {}
+    for name, chosen in (("full", np.zeros(count, dtype=np.int64)), ("lod", selected)):
+        milliseconds, image = render(lambda: lod.draw_instances(batch.models, chosen))
+        results[name] = (lod.stats.triangles, milliseconds, image)
+
+    print(f"{'':>6} {'triangles':>10} {'frame':>10}")
+    for name, (triangles, milliseconds, _) in results.items():
+        print(f"{name:>6} {triangles:10d} {milliseconds:8.2f}ms")
+    difference = np.abs(results["full"][2] - results["lod"][2])
+    changed = (difference.max(axis=2) > 8).mean() * 100.0
+    print(f"INFO::LOD::DISTANT (> {DISTANT:.0f})::{int(distant.sum())} SPHERES::TRIANGLES {distant_full} -> {distant_lod}"
+          f" ({distant_full / max(distant_lod, 1):.1f}x FEWER)")
+    print(f"INFO::LOD::TRIANGLES {results['full'][0] / results['lod'][0]:.1f}x FEWER"
+          f"::PIXELS CHANGED {changed:.3f}%::MEAN DIFFERENCE {difference.mean():.3f}/255")
+
+    lod.delete()
+    default_state().delete_program(program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 400)
+    destroy_context(window)
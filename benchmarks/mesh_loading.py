@@ -0,0 +1,94 @@
+"""
+Benchmark: load a mesh and upload it to VBO/EBO from
+- python lists: the OBJ read line by line into lists, then np.array (how the examples build geometry)
+- read_obj:     the vectorized OBJ importer
+- read_mesh:    the converted .mesh file, memory-mapped and uploaded from the mapping
+
+The OBJ is a generated grid of about ``vertices`` vertices, written once to a temp folder.
+
+    python benchmarks/mesh_loading.py [vertices]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context
+from common.mesh import Mesh
+from common.mesh_io import MeshData, read_mesh, read_obj, write_mesh
+
+
+def write_grid_obj(path: str, vertices: int):
+    side = int(np.sqrt(vertices))
+    x, y = np.meshgrid(np.linspace(-1.0, 1.0, side), np.linspace(-1.0, 1.0, side))
+    z = np.sin(x * 8.0) * np.cos(y * 8.0) * 0.1
+    positions = np.stack((x.ravel(), y.ravel(), z.ravel()), axis=1)
+
+    corner = (np.arange(side - 1)[None, :] + np.arange(side - 1)[:, None] * side).ravel() + 1
+    quads = np.stack((corner, corner + 1, corner + side + 1, corner + side), axis=1)
+
+    with open(path, "w") as file:
+        np.savetxt(file, positions, fmt="v %.6f %.6f %.6f")
+        np.savetxt(file, quads, fmt="f %d %d %d %d")
+
+
+def load_lists(path: str) -> MeshData:
+    positions, faces = [], []
+    with open(path) as file:
+        for line in file:
+            words = line.split()
+            if not words:
+                continue
+            if words[0] == "v":
+                positions.append([float(value) for value in words[1:4]])
+            elif words[0] == "f":
+                corners = [int(value.split("/")[0]) - 1 for value in words[1:]]
+                for index in range(1, len(corners) - 1):
+                    faces.extend((corners[0], corners[index], corners[index + 1]))
+    vertices = np.array(positions, dtype=np.float32).view([("position", np.float32, (3,))]).reshape(-1)
+
+    return MeshData(vertices, np.array(faces, dtype=np.uint32))
+
+
+def timed(load) -> tuple:
+    """(load ms, upload ms) including GPU completion of the upload."""
+    start = time.perf_counter()
+    mesh_data = load()
+    loaded = time.perf_counter()
+    mesh = Mesh(mesh_data)
+    gl.glFinish()
+    uploaded = time.perf_counter()
+    mesh.delete()
+
+    return (loaded - start) * 1000.0, (uploaded - loaded) * 1000.0
+
+
+def run(vertices: int):
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+    with tempfile.TemporaryDirectory() as directory:
+        obj_path = os.path.join(directory, "grid.obj")
+        mesh_path = os.path.join(directory, "grid.mesh")
+        write_grid_obj(obj_path, vertices)
+
+        start = time.perf_counter()
+        write_mesh(mesh_path, read_obj(obj_path))
+        converted = (time.perf_counter() - start) * 1000.0
+
+        print(f"INFO::OBJ {os.path.getsize(obj_path) / 2 ** 20:.1f} MB::MESH {os.path.getsize(mesh_path) / 2 ** 20:.1f} MB"
+              f"::CONVERSION {converted:.0f}ms")
+        print(f"{'':>14} {'load':>12} {'upload':>12}")
+        for name, load in (("python lists", lambda: load_lists(obj_path)),
+                           ("read_obj", lambda: read_obj(obj_path)),
+                           ("read_mesh", lambda: read_mesh(mesh_path))):
+            load_time, upload_time = timed(load)
+            print(f"{name:>14} {load_time:10.1f}ms {upload_time:10.1f}ms")
+
+
+if __name__ == '__main__':
+    window = create_context()
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
+    destroy_context(window)
@@ -0,0 +1,121 @@
+"""
+Benchmark: a sphere with its triangles shuffled and every corner its own vertex (how
+unindexed exports look), drawn as it is and after optimize_mesh().
+
+Reports vertex count, ACMR/ATVR of a simulated 16 entry FIFO cache, draw time and, if the
+driver can count them (GL_ARB_pipeline_statistics_query), vertex and fragment shader
+invocations: the first shows the real post-transform cache, the second the overdraw.
+
+    python benchmarks/mesh_optimizer.py [vertex counts...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+from OpenGL.GL.ARB.pipeline_statistics_query import (GL_FRAGMENT_SHADER_INVOCATIONS_ARB,
+                                                     GL_VERTEX_SHADER_INVOCATIONS_ARB)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common.gl_info import has_extension, query_result
+from common.gl_state import default_state
+from common.mesh import Mesh
+from common.mesh_io import MeshData
+from common.mesh_optimizer import cache_statistics, optimize_mesh
+from common.shader_program import ShaderProgram
+
+WIDTH, HEIGHT = 640, 360
+FRAMES = 20
+
+VERTEX_SRC = """# version 330
+layout (location = 0) in vec3 a_position;
+out vec3 v_position;
+void main() {
+    v_position = a_position;
+    gl_Position = vec4(a_position.x * 0.5, a_position.y * 0.9, a_position.z * 0.5, 1.0);
+}
+"""
+FRAGMENT_SRC = """# version 330
+in vec3 v_position;
+out vec4 fragColor;
+void main() { fragColor = vec4(v_position * 0.5 + 0.5, 1.0); }
+"""
+
+
+def shuffled_sphere(vertices: int) -> MeshData:
+    """Bumpy sphere, triangles in random order, three vertices per triangle."""
+    side = max(int(np.sqrt(vertices / 6.0)), 3)
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, side), np.linspace(0.0, 1.0, side))
+    theta, phi = u.ravel() * 2.0 * np.pi, v.ravel() * np.pi
+    radius = 1.0 + 0.05 * np.sin(theta * 12.0) * np.sin(phi * 9.0)
+    positions = np.stack((np.sin(phi) * np.cos(theta), np.cos(phi), np.sin(phi) * np.sin(theta)), axis=1)
+    positions *= radius[:, None]
+
+    corner = (np.arange(side - 1)[None, :] + np.arange(side - 1)[:, None] * side).ravel()
+    triangles = np.stack((corner, corner + side, corner + 1, corner + 1, corner + side, corner + side + 1), axis=1)
+    triangles = triangles.reshape(-1, 3)[np.random.default_rng(0).permutation(len(corner) * 2)]
+
+    data = np.empty(triangles.size, dtype=[("position", np.float32, (3,))])
+    data["position"] = positions[triangles.reshape(-1)]
+
+    return MeshData(data, np.arange(triangles.size, dtype=np.uint32))
+
+
+def measure(mesh: Mesh) -> tuple:
+    """Wall milliseconds per draw, vertex and fragment shader invocations (None if unsupported)."""
+    mesh.draw()
+    gl.glFinish()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        mesh.draw()
+    gl.glFinish()
+    wall = (time.perf_counter() - start) / FRAMES * 1000.0
+
+    if not has_extension("GL_ARB_pipeline_statistics_query"):
+        return wall, None, None
+    counts = []
+    for target in (GL_VERTEX_SHADER_INVOCATIONS_ARB, GL_FRAGMENT_SHADER_INVOCATIONS_ARB):
+        query = gl.glGenQueries(1)[0]
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        gl.glBeginQuery(target, query)
+        mesh.draw()
+        gl.glEndQuery(target)
+        counts.append(query_result(query))
+        gl.glDeleteQueries(1, [query])
+
+    return (wall, *counts)
+
+
+def run(counts):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    program = ShaderProgram.from_sources(VERTEX_SRC, FRAGMENT_SRC)
+    program.use()
+    gl.glEnable(gl.GL_DEPTH_TEST)
+
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+    for count in counts:
+        source = shuffled_sphere(count)
+        optimized, stats = optimize_mesh(source)
+        print(f"{source.vertex_count:>10} vertices, {source.index_count // 3} triangles")
+        print(stats.report())
+        print(f"{'':>10} {'vertices':>9} {'ACMR':>6} {'ATVR':>6} {'draw':>10} {'vs runs':>10} {'fs runs':>10}")
+        for name, mesh_data in (("input", source), ("optimized", optimized)):
+            acmr, atvr = cache_statistics(mesh_data.indices, mesh_data.vertex_count)
+            mesh = Mesh(mesh_data)
+            wall, vertex_runs, fragment_runs = measure(mesh)
+            mesh.delete()
+            print(f"{name:>10} {mesh_data.vertex_count:9d} {acmr:6.3f} {atvr:6.3f} {wall:8.2f}ms"
+                  f" {vertex_runs if vertex_runs is not None else '-':>10}"
+                  f" {fragment_runs if fragment_runs is not None else '-':>10}")
+
+    default_state().delete_program(program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([int(arg) for arg in sys.argv[1:]] or [60000, 600000])
+    destroy_context(window)
@@ -0,0 +1,175 @@
+"""
+Benchmark: clicking on one of N instanced markers, picked with
+- blocking:  IDs drawn for the whole window, the result waited for right away
+- full:      IDs drawn for the whole window, read back asynchronously
+- scissor:   only a 5x5 box around the cursor drawn and read, asynchronously
+- half:      the same box in an ID buffer at half the window resolution
+
+Reports the CPU time a click adds to its frame, the latency until the result is
+available while frames keep being drawn, and how many picks hit the expected marker and
+its depth. Also selects a rectangle and compares it with the markers projected into it.
+
+    python benchmarks/picking.py [marker counts...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common import matrices
+from common.gl_state import default_state
+from common.instanced_mesh import InstancedMesh
+from common.picking import ObjectPicker
+from common.shader_program import ShaderProgram
+from common.transform_batch import TransformBatch
+from common.uniform_buffer import CameraUniformBuffer
+
+SHADERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyopengl-qt", "3.viewport_rotate", "shaders")
+WIDTH, HEIGHT = 1280, 720
+CLICKS = 50
+# Side of the box drawn around the cursor
+BOX = 5
+
+QUAD_VERTICES = np.array([0.5, 0.5, 0.0,
+                          0.5, -0.5, 0.0,
+                          -0.5, -0.5, 0.0,
+                          -0.5, 0.5, 0.0], dtype=np.float32)
+QUAD_INDICES = np.array([0, 1, 3,
+                         1, 2, 3], dtype=np.uint32)
+
+
+def build_scene(count: int) -> TransformBatch:
+    """Markers facing the camera at 20 to 120 units, scattered over the view."""
+    rng = np.random.default_rng(0)
+    depth = rng.uniform(20.0, 120.0, count)
+    positions = np.stack((rng.uniform(-0.6, 0.6, count) * depth, rng.uniform(-0.35, 0.35, count) * depth, -depth),
+                         axis=1)
+    batch = TransformBatch(count)
+    batch.extend(positions, scales=rng.uniform(0.2, 0.4, (count, 1)))
+    batch.compose()
+
+    return batch
+
+
+def window_position(view_projection: np.ndarray, positions) -> tuple:
+    """(x, y, window depth) of world positions, origin at the top left."""
+    positions = np.asarray(positions, dtype=np.float64)
+    clip = np.concatenate((positions, np.ones(positions.shape[:-1] + (1,))), axis=-1) @ view_projection.T
+    ndc = clip[..., :3] / clip[..., 3:]
+
+    return (ndc[..., 0] + 1.0) * WIDTH / 2.0, (1.0 - ndc[..., 1]) * HEIGHT / 2.0, (ndc[..., 2] + 1.0) / 2.0
+
+
+def click(picker: ObjectPicker, draw_scene, draw_ids, x: float, y: float, box: int, block: bool) -> tuple:
+    """(CPU seconds added to the frame, result) of one click, frames are drawn until it arrives."""
+    draw_scene()
+    start = time.perf_counter()
+    picker.pick(int(x) - box // 2, int(y) - box // 2, draw_ids, box, box)
+    results = picker.wait() if block else picker.poll()
+    cost = time.perf_counter() - start
+    while not results:
+        draw_scene()
+        results = picker.poll()
+
+    return cost, results[0]
+
+
+def run(counts):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    default_state().enable(gl.GL_DEPTH_TEST)
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+
+    program = ShaderProgram.from_files(os.path.join(SHADERS, "mark_vertex_instanced.glsl"),
+                                       os.path.join(SHADERS, "mark_fragment_instanced.glsl"))
+    id_program = ShaderProgram.from_files(os.path.join(SHADERS, "pick_vertex_instanced.glsl"),
+                                          os.path.join(SHADERS, "pick_fragment.glsl"))
+    camera_ubo = CameraUniformBuffer()
+    view = matrices.look_at((0.0, 0.0, 0.0), (0.0, 0.0, -1.0), (0.0, 1.0, 0.0))
+    projection = matrices.perspective(45.0, WIDTH / HEIGHT, 0.1, 1000.0)
+    camera_ubo.update(view, projection)
+    view_projection = projection @ view
+
+    for count in counts:
+        batch = build_scene(count)
+        mesh = InstancedMesh(QUAD_VERTICES, QUAD_INDICES, max_instances=count)
+        mesh.set_models(batch.models)
+        mesh.set_colors(np.tile((1.0, 0.5, 0.2, 1.0), (count, 1)))
+
+        def draw_scene():
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+            program.use()
+            mesh.draw()
+
+        def draw_ids():
+            id_program.use()
+            mesh.draw()
+
+        def full_ids():
+            # The whole window, as without a scissor box. The readback stays 1x1
+            default_state().disable(gl.GL_SCISSOR_TEST)
+            gl.glClearBufferuiv(gl.GL_COLOR, 0, np.zeros(4, dtype=np.uint32))
+            gl.glClearBufferfv(gl.GL_DEPTH, 0, np.ones(1, dtype=np.float32))
+            draw_ids()
+            default_state().enable(gl.GL_SCISSOR_TEST)
+
+        # Markers whose centre is on top of everything else, the ones a click should find
+        rng = np.random.default_rng(count)
+        picker = ObjectPicker(WIDTH, HEIGHT)
+        draw_scene()
+        aims = []
+        for index in rng.choice(count, CLICKS * 4, replace=False).tolist():
+            x, y, depth = window_position(view_projection, batch.positions[index])
+            picker.pick(int(x), int(y), draw_ids)
+            if picker.wait()[0].object_id == index + 1 and len(aims) < CLICKS:
+                aims.append((x, y, depth, index))
+        picker.delete()
+
+        print(f"{count:>10} markers, {len(aims)} clicks")
+        print(f"{'':>10} {'frame cost':>11} {'latency':>9} {'polls':>6} {'hits':>7} {'depth error':>12}")
+        for name, box, scale, block in (("blocking", None, 1.0, True), ("full", None, 1.0, False),
+                                        ("scissor", BOX, 1.0, False), ("half", BOX, 0.5, False)):
+            picker = ObjectPicker(WIDTH, HEIGHT, scale)
+            costs, hits, depth_errors = [], 0, []
+            for x, y, depth, index in aims:
+                if box is None:
+                    cost, result = click(picker, draw_scene, full_ids, x, y, 1, block)
+                else:
+                    cost, result = click(picker, draw_scene, draw_ids, x, y, box, block)
+                costs.append(cost)
+                if result.object_id == index + 1:
+                    hits += 1
+                    depth_errors.append(abs(result.depth - depth))
+            print(f"{name:>10} {np.mean(costs) * 1000.0:9.2f}ms {np.mean(picker.stats.latency):7.2f}ms"
+                  f" {np.mean(picker.stats.polls):6.1f} {hits:3d}/{len(aims):<3d}"
+                  f" {max(depth_errors, default=0.0):12.2e}")
+            picker.delete()
+
+        # Rectangle selection: every marker whose centre projects inside should be found,
+        # markers hidden behind others are not
+        picker = ObjectPicker(WIDTH, HEIGHT)
+        left, top, width, height = 400, 200, 300, 200
+        draw_scene()
+        picker.pick(left, top, draw_ids, width, height)
+        result = picker.wait()[0]
+        x, y, _ = window_position(view_projection, batch.positions)
+        inside = np.flatnonzero((left <= x) & (x < left + width) & (top <= y) & (y < top + height)) + 1
+        print(f"INFO::PICKING::RECTANGLE {width}x{height}::{len(result.ids)} IDS"
+              f"::{np.isin(inside, result.ids).sum()}/{len(inside)} MARKERS CENTERED INSIDE FOUND")
+        print(picker.stats.report())
+        picker.delete()
+        mesh.delete()
+
+    camera_ubo.delete()
+    default_state().delete_program(program.program)
+    default_state().delete_program(id_program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
+    destroy_context(window)
@@ -0,0 +1,141 @@
+"""
+Benchmark: point clouds of growing size drawn as sprites, with
+- naive:   every point, one glDrawArrays per vertex buffer, as the Viewport examples would
+- culled:  chunks outside the frustum skipped, visible chunks drawn completely
+- lod:     culled and thinned per chunk to ``density`` points per projected pixel, within
+           the default point budget
+- budget:  lod with a budget of 2M points per frame
+
+The cloud is a generated terrain sheet (a stand-in for a LiDAR scan). It is prepared once,
+written as .points and memory-mapped again for the upload. The camera orbits the terrain
+low and close, so part of it is outside the frustum and the rest spans near to far.
+Frame times include glFinish.
+
+    python benchmarks/point_cloud.py [millions of points...]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common import matrices
+from common.gl_state import default_state
+from common.point_cloud import GROUP_CHUNKS, PointCloud, prepare_points, read_points, write_points
+from common.shader_program import ShaderProgram
+from common.uniform_buffer import CameraUniformBuffer
+
+SHADERS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "pyopengl-qt", "5.point_sprites", "shaders")
+WIDTH, HEIGHT = 1280, 720
+VIEWS = 6
+SIZE = 400.0
+
+
+def terrain(count: int, seed: int = 0) -> np.ndarray:
+    """(count, 3) points on rolling hills of SIZE x SIZE units."""
+    rng = np.random.default_rng(seed)
+    positions = np.empty((count, 3), dtype=np.float32)
+    positions[:, 0] = rng.uniform(-SIZE / 2.0, SIZE / 2.0, count)
+    positions[:, 2] = rng.uniform(-SIZE / 2.0, SIZE / 2.0, count)
+    positions[:, 1] = np.sin(positions[:, 0] * 0.05) * np.cos(positions[:, 2] * 0.04) * 12.0
+
+    return positions
+
+
+def views() -> list:
+    cameras = []
+    for index in range(VIEWS):
+        angle = index / VIEWS * 2.0 * np.pi
+        eye = (np.cos(angle) * SIZE * 0.35, 25.0, np.sin(angle) * SIZE * 0.35)
+        cameras.append(matrices.look_at(eye, (0.0, 0.0, 0.0), (0.0, 1.0, 0.0)))
+
+    return cameras
+
+
+def naive(cloud: PointCloud, program, count: int):
+    program.set_float("u_pointSize", cloud.point_size)
+    for group, vao in enumerate(cloud.vaos):
+        program.set_int("u_firstChunk", group * GROUP_CHUNKS)
+        default_state().bind_vertex_array(vao)
+        first_point = group * GROUP_CHUNKS * cloud.chunk_size
+        gl.glDrawArrays(gl.GL_POINTS, 0, min(GROUP_CHUNKS * cloud.chunk_size, count - first_point))
+
+
+def measure(cloud: PointCloud, program, camera, projection, draw) -> tuple:
+    """(mean frame s, worst frame s, mean drawn points) over the orbit."""
+    frames, drawn = [], []
+    for view in views():
+        camera.update(view, projection)
+        start = time.perf_counter()
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        program.use()
+        drawn.append(draw(view))
+        gl.glFinish()
+        frames.append(time.perf_counter() - start)
+
+    return float(np.mean(frames)), max(frames), float(np.mean(drawn))
+
+
+def run(millions):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    default_state().enable(gl.GL_DEPTH_TEST)
+    default_state().enable(gl.GL_PROGRAM_POINT_SIZE)
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}::{WIDTH}x{HEIGHT}")
+    program = ShaderProgram.from_files(os.path.join(SHADERS, "points_vertex.glsl"),
+                                       os.path.join(SHADERS, "points_fragment.glsl"))
+    camera = CameraUniformBuffer()
+    projection = matrices.perspective(45.0, WIDTH / HEIGHT, 0.5, 2000.0)
+    program.use()
+
+    for million in millions:
+        count = int(million * 1000000)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cloud.points")
+            start = time.perf_counter()
+            write_points(path, prepare_points(terrain(count)))
+            prepared = time.perf_counter() - start
+            start = time.perf_counter()
+            cloud = PointCloud(read_points(path))
+            gl.glFinish()
+            uploaded = time.perf_counter() - start
+
+            print(f"{count} points: prepared in {prepared:.2f}s, mapped and uploaded in {uploaded:.2f}s"
+                  f" ({count * 16 / 2 ** 20:.0f} MB, {cloud.stats.chunks} chunks)")
+            print(f"{'':>8} {'frame mean':>11} {'worst':>9} {'points':>10}")
+
+            def full(view):
+                naive(cloud, program, count)
+                return count
+
+            def lod(density: float, budget: int):
+                def draw(view):
+                    cloud.density, cloud.point_budget = density, budget
+                    cloud.draw(program, view, projection, HEIGHT)
+                    return cloud.stats.drawn
+                return draw
+
+            # Every chunk drawn whole once: the uniforms are set and every sprite scale is 1 for naive
+            cloud.density, cloud.point_budget = np.inf, 2 ** 62
+            program.use()
+            cloud.draw(program, views()[0], projection, HEIGHT)
+            for name, draw in (("naive", full), ("culled", lod(np.inf, 2 ** 62)),
+                               ("lod", lod(0.5, 8 * 2 ** 20)), ("budget", lod(0.5, 2 * 2 ** 20))):
+                mean, worst, drawn = measure(cloud, program, camera, projection, draw)
+                print(f"{name:>8} {mean * 1000.0:9.1f}ms {worst * 1000.0:7.1f}ms {drawn:10.0f}")
+            print(cloud.stats.report())
+            cloud.delete()
+            del cloud
+
+    camera.delete()
+    default_state().delete_program(program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([float(arg) for arg in sys.argv[1:]] or [1, 5, 20])
+    destroy_context(window)
@@ -0,0 +1,81 @@
+"""
+Benchmark: startup cost of linking every shader program in the repository, cold (compiled
+from source, binaries written) versus warm (loaded with glProgramBinary).
+
+Each pair is built in several #define variants to get closer to a real shader set.
+Mesa's own shader disk cache is pointed at an empty folder so that "cold" really compiles
+(disabling it would also disable Mesa's program binaries).
+
+    python benchmarks/program_cache.py [variants]
+"""
+import os
+import sys
+import tempfile
+import time
+
+# Before the driver is loaded
+os.environ.setdefault("MESA_SHADER_CACHE_DIR", tempfile.mkdtemp())
+
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context
+from common.program_cache import ProgramCache
+from common.shader_program import ShaderProgram
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+PROGRAMS = [
+    ("pyopengl-glfw/shaders/triangle.vs", "pyopengl-glfw/shaders/triangle.fs"),
+    ("pyopengl-glfw/shaders/index_drawing.vs", "pyopengl-glfw/shaders/index_drawing.fs"),
+    ("pyopengl-qt/2.hello_triangle/shaders/triangle.vs", "pyopengl-qt/2.hello_triangle/shaders/triangle.fs"),
+    ("pyopengl-qt/3.viewport_rotate/shaders/grid_vertex.glsl",
+     "pyopengl-qt/3.viewport_rotate/shaders/grid_fragment.glsl"),
+    ("pyopengl-qt/3.viewport_rotate/shaders/grid_quad_vertex.glsl",
+     "pyopengl-qt/3.viewport_rotate/shaders/grid_quad_fragment.glsl"),
+    ("pyopengl-qt/3.viewport_rotate/shaders/mark_vertex.glsl",
+     "pyopengl-qt/3.viewport_rotate/shaders/mark_fragment.glsl"),
+    ("pyopengl-qt/3.viewport_rotate/shaders/mark_vertex_instanced.glsl",
+     "pyopengl-qt/3.viewport_rotate/shaders/mark_fragment_instanced.glsl"),
+]
+
+
+def load_all(cache: ProgramCache, variants: int) -> float:
+    start = time.perf_counter()
+    programs = []
+    for path_vertex, path_fragment in PROGRAMS:
+        for variant in range(variants):
+            programs.append(ShaderProgram.from_files(os.path.join(ROOT, path_vertex),
+                                                     os.path.join(ROOT, path_fragment),
+                                                     defines={"VARIANT": variant}, cache=cache))
+    elapsed = (time.perf_counter() - start) * 1000.0
+
+    for program in programs:
+        gl.glDeleteProgram(program.program)
+
+    return elapsed
+
+
+def run(variants: int):
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+    # Programs are validated against the bound VAO by some drivers
+    vao = gl.glGenVertexArrays(1)
+    gl.glBindVertexArray(vao)
+
+    with tempfile.TemporaryDirectory() as directory:
+        cold_cache = ProgramCache(directory)
+        cold = load_all(cold_cache, variants)
+        print(cold_cache.report())
+
+        warm_cache = ProgramCache(directory)
+        warm = load_all(warm_cache, variants)
+        print(warm_cache.report())
+
+    count = len(PROGRAMS) * variants
+    print(f"INFO::PROGRAMS::{count}::COLD {cold:.1f}ms::WARM {warm:.1f}ms::SPEEDUP {cold / warm:.1f}x")
+    gl.glDeleteVertexArrays(1, [vao])
+
+
+if __name__ == '__main__':
+    window = create_context()
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 4)
+    destroy_context(window)
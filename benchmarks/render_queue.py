@@ -0,0 +1,168 @@
+"""
+Benchmark: a frame of small objects submitted in random order, spread over a few
+programs, materials and meshes, a quarter of them blended, drawn
+- unsorted: one draw call per object in submission order, state through GLState
+- queue:    RenderQueue, sorted by key and merged into indirect multi-draw calls
+- direct:   RenderQueue without multi-draw, sorted but one draw call per object
+
+Reports CPU milliseconds per frame, state changes and draw calls before and after
+sorting, and the radix sort against numpy's argsort on the same keys.
+
+    python benchmarks/render_queue.py [object counts...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common.gl_state import default_state
+from common.mesh import Mesh
+from common.mesh_io import MeshData
+from common.render_queue import PASS_OPAQUE, PASS_TRANSPARENT, RenderQueue, radix_argsort
+from common.shader_program import ShaderProgram
+
+WIDTH, HEIGHT = 640, 360
+FRAMES = 10
+PROGRAMS = 4
+MATERIALS = 8
+MESHES = 16
+TRANSPARENT = 0.25
+
+VERTEX_SRC = """# version 330
+layout (location = 0) in vec3 a_position;
+void main() { gl_Position = vec4(a_position * 0.05, 1.0); }
+"""
+FRAGMENT_SRC = """# version 330
+uniform vec4 u_color;
+out vec4 fragColor;
+void main() { fragColor = u_color; }
+"""
+
+
+class Material(object):
+    """Flat color, blended when transparent."""
+
+    def __init__(self, color, transparent: bool):
+        self.color = color
+        self.transparent = transparent
+
+    def bind(self):
+        program = gl.glGetIntegerv(gl.GL_CURRENT_PROGRAM)
+        gl.glUniform4f(gl.glGetUniformLocation(program, "u_color"), *self.color)
+        if self.transparent:
+            default_state().enable(gl.GL_BLEND)
+            default_state().blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+
+    def unbind(self):
+        if self.transparent:
+            default_state().disable(gl.GL_BLEND)
+
+
+def quad() -> MeshData:
+    data = np.empty(4, dtype=[("position", np.float32, (3,))])
+    data["position"] = ((0.5, 0.5, 0.0), (0.5, -0.5, 0.0), (-0.5, -0.5, 0.0), (-0.5, 0.5, 0.0))
+
+    return MeshData(data, np.array([0, 1, 3, 1, 2, 3], dtype=np.uint16))
+
+
+def scene(count: int, programs, materials, meshes, rng) -> list:
+    """(program, material, mesh, pass, depth) per object, in random order."""
+    objects = []
+    for _ in range(count):
+        transparent = rng.random() < TRANSPARENT
+        material = materials[rng.integers(MATERIALS // 2) + (MATERIALS // 2 if transparent else 0)]
+        objects.append((programs[rng.integers(PROGRAMS)], material, meshes[rng.integers(MESHES)],
+                        PASS_TRANSPARENT if transparent else PASS_OPAQUE, float(rng.random())))
+
+    return objects
+
+
+def draw_unsorted(objects):
+    state = default_state()
+    material = None
+    for program, object_material, mesh, _, _ in objects:
+        if state.use_program(program.program) or object_material is not material:
+            if material is not None:
+                material.unbind()
+            object_material.bind()
+            material = object_material
+        state.bind_vertex_array(mesh.vao)
+        gl.glDrawElements(gl.GL_TRIANGLES, mesh.index_count, mesh.index_type, None)
+    material.unbind()
+
+
+def draw_queue(objects, queue: RenderQueue):
+    for program, material, mesh, pass_id, depth in objects:
+        mesh.submit(queue, program, material=material, pass_id=pass_id, depth=depth)
+    queue.flush()
+
+
+def frame_time(draw) -> float:
+    """CPU milliseconds per frame, the GPU is waited for only outside the loop."""
+    draw()
+    gl.glFinish()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        draw()
+        default_state().end_frame()
+    elapsed = time.perf_counter() - start
+    gl.glFinish()
+
+    return elapsed / FRAMES * 1000.0
+
+
+def sort_time(sort, keys) -> float:
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        sort(keys)
+
+    return (time.perf_counter() - start) / FRAMES * 1000.0
+
+
+def run(counts):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    default_state().enable(gl.GL_DEPTH_TEST)
+    default_state().clear_color(0.2, 0.3, 0.3, 1.0)
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+
+    rng = np.random.default_rng(7)
+    programs = [ShaderProgram.from_sources(VERTEX_SRC, FRAGMENT_SRC) for _ in range(PROGRAMS)]
+    materials = [Material((*rng.random(3), 0.5 if index >= MATERIALS // 2 else 1.0), index >= MATERIALS // 2)
+                 for index in range(MATERIALS)]
+    meshes = [Mesh(quad()) for _ in range(MESHES)]
+    queue = RenderQueue()
+    direct_queue = RenderQueue(multi_draw=False)
+    print(f"INFO::RENDER_QUEUE::MULTI DRAW {'ON' if queue.multi_draw else 'UNAVAILABLE'}")
+
+    for count in counts:
+        objects = scene(count, programs, materials, meshes, rng)
+        print(f"{count:>10} objects, {PROGRAMS} programs, {MATERIALS} materials, {MESHES} meshes")
+        print(f"{'':>10} {'frame':>10}")
+        print(f"{'unsorted':>10} {frame_time(lambda: draw_unsorted(objects)):8.2f}ms")
+        print(f"{'queue':>10} {frame_time(lambda: draw_queue(objects, queue)):8.2f}ms")
+        print(f"{'direct':>10} {frame_time(lambda: draw_queue(objects, direct_queue)):8.2f}ms")
+        print(queue.stats.report())
+
+        keys = np.random.default_rng(count).integers(0, 1 << 63, count, dtype=np.int64).astype(np.uint64)
+        radix, numpy_sort = sort_time(radix_argsort, keys), sort_time(lambda k: np.argsort(k, kind="stable"), keys)
+        print(f"INFO::RENDER_QUEUE::SORT {count} KEYS::RADIX {radix:.3f}ms::NUMPY STABLE {numpy_sort:.3f}ms")
+
+    queue.delete()
+    direct_queue.delete()
+    default_state().invalidate()
+    for mesh in meshes:
+        mesh.delete()
+    for program in programs:
+        default_state().delete_program(program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([int(arg) for arg in sys.argv[1:]] or [1000, 10000])
+    destroy_context(window)
@@ -0,0 +1,138 @@
+"""
+Benchmark: a point cloud replaced every frame, uploaded by
+- recreate:   a new VBO per frame with glBufferData(GL_STATIC_DRAW), how Viewport.set_vertices worked
+- orphan:     StreamBuffer fallback, glBufferData(NULL) + glBufferSubData
+- persistent: StreamBuffer with a persistently mapped ring and fences
+
+    python benchmarks/stream_buffer.py [vertex counts...]
+"""
+import ctypes
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common.gl_state import default_state
+from common.shader_program import ShaderProgram
+from common.stream_buffer import StreamBuffer
+
+WIDTH, HEIGHT = 640, 360
+FRAMES = 20
+
+VERTEX_SRC = """# version 430
+layout (location = 0) in vec3 a_position;
+void main() { gl_Position = vec4(a_position, 1.0); }
+"""
+FRAGMENT_SRC = """# version 430
+out vec4 fragColor;
+void main() { fragColor = vec4(1.0); }
+"""
+
+
+def point_clouds(count: int) -> list:
+    """A few different clouds so no frame uploads the same data twice in a row."""
+    rng = np.random.default_rng(0)
+
+    return [rng.uniform(-1.0, 1.0, (count, 3)).astype(np.float32) for _ in range(3)]
+
+
+def point_attribute(buffer: int, offset: int):
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, buffer)
+    gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 12, ctypes.c_void_p(offset))
+    gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+
+
+def frame_time(upload, finish, clouds: list) -> tuple:
+    """
+    Average milliseconds per frame including GPU completion, and of that the time the
+    render thread spent in upload(), which returns (buffer, offset) of the cloud.
+    """
+    def frame(cloud):
+        start = time.perf_counter()
+        buffer, offset = upload(cloud)
+        uploading = time.perf_counter() - start
+        point_attribute(buffer, offset)
+        gl.glDrawArrays(gl.GL_POINTS, 0, len(cloud))
+        finish()
+
+        return uploading
+
+    frame(clouds[0])
+    gl.glFinish()
+    uploading = 0.0
+    start = time.perf_counter()
+    for index in range(FRAMES):
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        uploading += frame(clouds[index % len(clouds)])
+    gl.glFinish()
+
+    return (time.perf_counter() - start) / FRAMES * 1000.0, uploading / FRAMES * 1000.0
+
+
+def bench(count: int) -> dict:
+    clouds = point_clouds(count)
+    results = {}
+
+    vbos = []
+
+    def recreate(cloud):
+        vbo = gl.glGenBuffers(1)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, cloud.nbytes, cloud, gl.GL_STATIC_DRAW)
+        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, 0)
+        vbos.append(vbo)
+
+        return vbo, 0
+
+    def delete_vbo():
+        gl.glDeleteBuffers(1, [vbos.pop()])
+
+    results["recreate"] = frame_time(recreate, delete_vbo, clouds)
+
+    for name, persistent in (("orphan", False), ("persistent", True)):
+        stream = StreamBuffer(clouds[0].nbytes, persistent=persistent)
+        if persistent and not stream.persistent:
+            stream.delete()
+            continue
+
+        def streamed(cloud):
+            return stream.buffer, stream.write(cloud)
+
+        results[name] = frame_time(streamed, stream.end_frame, clouds)
+        print(f"  {name}: {stream.stats.report()}")
+        stream.delete()
+
+    return results
+
+
+def run(counts):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    program = ShaderProgram.from_sources(VERTEX_SRC, FRAGMENT_SRC)
+    program.use()
+    vao = gl.glGenVertexArrays(1)
+    gl.glBindVertexArray(vao)
+    gl.glEnableVertexAttribArray(0)
+
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+    for count in counts:
+        results = bench(count)
+        megabytes = count * 12 / 2 ** 20
+        print(f"{count:>10} vertices ({megabytes:.1f} MB/frame)")
+        print(f"{'':>14} {'frame':>10} {'vertices/s':>12} {'upload':>10} {'upload MB/s':>12}")
+        for name, (milliseconds, upload) in results.items():
+            print(f"{name:>14} {milliseconds:8.2f}ms {count / milliseconds / 1000.0:10.1f}M"
+                  f" {upload:8.2f}ms {megabytes / upload * 1000.0:12.0f}")
+
+    gl.glDeleteVertexArrays(1, [vao])
+    default_state().delete_program(program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([int(arg) for arg in sys.argv[1:]] or [100000, 1000000, 4000000])
+    destroy_context(window)
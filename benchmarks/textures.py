@@ -0,0 +1,222 @@
+"""
+Benchmark: texture loading, storage and upload paths of common/texture.py.
+
+- decode:   PNG (unfiltered rows and Paeth rows) decoded and mip filtered in numpy vs the same
+            image as memory-mapped KTX
+- formats:  GPU memory, encode time and PSNR of RGBA8, BC1 and BC3 for one photo-like image
+- upload:   one synchronous glTexSubImage2D per level vs TextureUploader tiles through the
+            unpack buffer within a 4 ms frame budget: longest frame, frames and MB/s
+- sampling: a texture minified 8x drawn to the framebuffer, with and without mip levels, RGBA8 vs BC1
+- cache:    pages of textures requested in turn from a TextureCache with a budget of a
+            few textures: hit rate, evictions and the peak GPU memory against the budget
+
+    python benchmarks/textures.py [size]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common.asset_loader import AssetLoader
+from common.gl_state import default_state
+from common.image_io import read_ktx, write_ktx, write_png
+from common.shader_program import ShaderProgram
+from common.texture import Texture, TextureCache, TextureUploader, compression_supported, read_texture
+from common.texture_compression import compress_image, decompress_image, psnr
+
+WIDTH, HEIGHT = 1024, 1024
+FRAME_BUDGET = 0.004
+
+VERTEX = """
+#version 330 core
+uniform float u_repeat;
+out vec2 v_uv;
+void main()
+{
+    vec2 corner = vec2(gl_VertexID & 1, gl_VertexID >> 1);
+    v_uv = corner * u_repeat;
+    gl_Position = vec4(corner * 2.0 - 1.0, 0.0, 1.0);
+}
+"""
+FRAGMENT = """
+#version 330 core
+uniform sampler2D u_texture;
+in vec2 v_uv;
+out vec4 out_color;
+void main()
+{
+    out_color = texture(u_texture, v_uv);
+}
+"""
+
+
+def test_image(size: int) -> np.ndarray:
+    """Smooth gradients with noise and hard edges, RGBA, top row first."""
+    rng = np.random.default_rng(7)
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    red = 0.5 + 0.5 * np.sin(x * 9.0 + y * 3.0)
+    green = 0.5 + 0.5 * np.cos(y * 7.0 - x * 2.0)
+    blue = ((x * 16.0).astype(int) % 2) * 0.6 + 0.2
+    pixels = np.dstack([red, green, blue, 0.5 + 0.5 * x]) * 255.0
+    pixels += rng.normal(0.0, 4.0, pixels.shape)
+
+    return np.clip(pixels, 0.0, 255.0).astype(np.uint8)
+
+
+def decode(directory: str, pixels: np.ndarray):
+    png = os.path.join(directory, "image.png")
+    paeth = os.path.join(directory, "paeth.png")
+    ktx = os.path.join(directory, "image.ktx")
+    write_png(png, pixels)
+    write_png(paeth, pixels, paeth=True)
+    write_ktx(ktx, compress_image(pixels, srgb=True, encoding="none"))
+    print(f"{'decode':>10} {'file MB':>8} {'read':>9}")
+    for name, path in (("png", png), ("png paeth", paeth), ("ktx", ktx)):
+        start = time.perf_counter()
+        read_texture(path)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>10} {os.path.getsize(path) / 2 ** 20:8.1f} {elapsed * 1000.0:7.1f}ms")
+
+
+def formats(pixels: np.ndarray) -> dict:
+    """{encoding: KtxImage} of the image, printing memory, encode time and quality."""
+    images = {}
+    print(f"{'format':>10} {'VRAM MB':>8} {'encode':>9} {'PSNR dB':>8} {'native':>7}")
+    for encoding in ("none", "bc1", "bc3"):
+        start = time.perf_counter()
+        image = compress_image(pixels, srgb=False, encoding=encoding)
+        elapsed = time.perf_counter() - start
+        decoded = decompress_image(image).levels[0][::-1] if image.compressed else image.levels[0][::-1]
+        channels = 3 if encoding == "bc1" else 4
+        quality = psnr(pixels[..., :channels], decoded[..., :channels])
+        native = compression_supported(image.internal_format) if image.compressed else True
+        print(f"{encoding:>10} {image.nbytes / 2 ** 20:8.2f} {elapsed * 1000.0:7.1f}ms {quality:8.2f} {str(native):>7}")
+        images[encoding] = image
+
+    return images
+
+
+def upload(images: dict):
+    print(f"{'upload':>10} {'frames':>7} {'longest':>9} {'MB/s':>7}")
+    for encoding, image in images.items():
+        start = time.perf_counter()
+        texture = Texture.from_image(image)
+        gl.glFinish()
+        elapsed = time.perf_counter() - start
+        texture.delete()
+        print(f"{encoding + ' sync':>10} {1:7} {elapsed * 1000.0:7.1f}ms {image.nbytes / elapsed / 2 ** 20:7.0f}")
+
+        uploader = TextureUploader()
+        texture = Texture(image.width, image.height, image.internal_format, len(image.levels))
+        steps = uploader.upload_steps(texture, image)
+        frames, longest, total, done = 0, 0.0, 0.0, False
+        while not done:
+            frame_start = time.perf_counter()
+            while time.perf_counter() - frame_start < FRAME_BUDGET:
+                try:
+                    next(steps)
+                except StopIteration:
+                    done = True
+                    break
+            # The driver's copies out of the unpack buffer count for the frame as well
+            gl.glFinish()
+            frame = time.perf_counter() - frame_start
+            frames += 1
+            longest = max(longest, frame)
+            total += frame
+        texture.delete()
+        uploader.delete()
+        print(f"{encoding + ' tiled':>10} {frames:7} {longest * 1000.0:7.1f}ms {image.nbytes / total / 2 ** 20:7.0f}")
+
+
+def sampling(images: dict, repeats: int = 20):
+    program = ShaderProgram.from_sources(VERTEX, FRAGMENT)
+    program.use()
+    program.set_int("u_texture", 0)
+    # 8 texels per pixel along each axis
+    program.set_float("u_repeat", 8.0 * WIDTH / images["none"].width)
+    vao = gl.glGenVertexArrays(1)
+    default_state().bind_vertex_array(vao)
+    print(f"{'sampling':>10} {'8x minified, ms/draw':>22}")
+    for encoding in ("none", "bc1"):
+        image = images[encoding]
+        if image.compressed and not compression_supported(image.internal_format):
+            continue
+        for mipmaps in (False, True):
+            texture = Texture.from_image(image if mipmaps else _first_level(image),
+                                         min_filter=gl.GL_LINEAR_MIPMAP_LINEAR if mipmaps else gl.GL_LINEAR)
+            texture.bind(0)
+            gl.glDrawArrays(gl.GL_TRIANGLE_STRIP, 0, 4)
+            gl.glFinish()
+            start = time.perf_counter()
+            for _ in range(repeats):
+                gl.glDrawArrays(gl.GL_TRIANGLE_STRIP, 0, 4)
+            gl.glFinish()
+            elapsed = (time.perf_counter() - start) / repeats
+            texture.delete()
+            name = f"{encoding} {'mips' if mipmaps else 'level 0'}"
+            print(f"{name:>10} {elapsed * 1000.0:20.2f}ms")
+    gl.glDeleteVertexArrays(1, [vao])
+    default_state().delete_program(program.program)
+
+
+def cache(directory: str, pixels: np.ndarray, count: int = 12, page: int = 3):
+    """Pages of ``page`` textures out of ``count``, the budget holds two pages."""
+    paths = []
+    for index in range(count):
+        paths.append(os.path.join(directory, f"cached{index}.ktx"))
+        write_ktx(paths[-1], compress_image(np.roll(pixels, index * 16, axis=1), srgb=True, encoding="bc1"))
+    one = read_ktx(paths[0]).nbytes
+    textures = TextureCache(2 * page * one, loader=AssetLoader(budget=FRAME_BUDGET))
+    frames_to_show = []
+    for visit in range(2 * count // page):
+        wanted = paths[(visit * page) % count:][:page]
+        frames = 0
+        while True:
+            textures.update()
+            shown = [textures.get(path) for path in wanted]
+            textures.end_frame()
+            frames += 1
+            if all(texture is not None and texture.ready for texture in shown):
+                break
+            time.sleep(0.001)
+        frames_to_show.append(frames)
+        # A few frames looking at the page
+        for _ in range(3):
+            textures.update()
+            for path in wanted:
+                textures.get(path)
+            textures.end_frame()
+    print(f"{count} BC1 textures of {one / 2 ** 20:.2f} MB, pages of {page}, budget {2 * page}:"
+          f" frames until a page is sharp P50 {np.percentile(frames_to_show, 50):.0f} max {max(frames_to_show)}")
+    print(textures.stats.report())
+    print(textures.uploader.stats.report())
+    textures.delete()
+
+
+def _first_level(image):
+    return type(image)(image.internal_format, image.pixel_format, image.width, image.height, image.levels[:1])
+
+
+def run(size: int = 2048):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}::{size}x{size}")
+    pixels = test_image(size)
+    with tempfile.TemporaryDirectory() as directory:
+        decode(directory, pixels)
+        images = formats(pixels)
+        upload(images)
+        sampling(images)
+        cache(directory, pixels[:size // 2, :size // 2])
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run(*[int(arg) for arg in sys.argv[1:]])
+    destroy_context(window)
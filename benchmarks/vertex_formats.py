@@ -0,0 +1,138 @@
+"""
+Benchmark: the same mesh (position, normal, texcoord) in different vertex formats
+- float32:    12 + 12 + 8 bytes, how the examples stored everything
+- half+snorm: float16 position, snorm8 normal, unorm16 texcoord
+- half+2_10:  float16 position, GL_INT_2_10_10_10_REV normal, unorm16 texcoord
+
+Indices are uint16 in all of them as long as the vertex count fits. Reports bytes per
+vertex, upload and draw time and the largest position/normal error the encoding introduces.
+
+    python benchmarks/vertex_formats.py [vertex counts...]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from gl_context import create_context, destroy_context, create_framebuffer, delete_framebuffer
+from common.gl_state import default_state
+from common.mesh import Mesh
+from common.mesh_io import MeshData
+from common.shader_program import ShaderProgram
+from common.vertex_format import pack_mesh
+
+WIDTH, HEIGHT = 640, 360
+FRAMES = 20
+FORMATS = (
+    ("float32", {}),
+    ("half+snorm", {"position": "float16", "normal": "snorm8", "texcoord": "unorm16"}),
+    ("half+2_10", {"position": "float16", "normal": "2_10_10_10", "texcoord": "unorm16"}),
+)
+
+VERTEX_SRC = """# version 330
+layout (location = 0) in vec3 a_position;
+layout (location = 1) in vec3 a_normal;
+layout (location = 2) in vec2 a_texcoord;
+out vec3 v_color;
+void main() {
+    v_color = a_normal * 0.5 + 0.5 + vec3(a_texcoord, 0.0) * 0.01;
+    gl_Position = vec4(a_position * 0.9, 1.0);
+}
+"""
+FRAGMENT_SRC = """# version 330
+in vec3 v_color;
+out vec4 fragColor;
+void main() { fragColor = vec4(v_color, 1.0); }
+"""
+
+
+def sphere(vertices: int) -> MeshData:
+    """UV sphere of about ``vertices`` vertices, unit normals and [0, 1] texcoords."""
+    side = max(int(np.sqrt(vertices)), 2)
+    u, v = np.meshgrid(np.linspace(0.0, 1.0, side), np.linspace(0.0, 1.0, side))
+    theta, phi = u.ravel() * 2.0 * np.pi, v.ravel() * np.pi
+    normals = np.stack((np.sin(phi) * np.cos(theta), np.cos(phi), np.sin(phi) * np.sin(theta)), axis=1)
+
+    data = np.empty(side * side, dtype=[("position", np.float32, (3,)), ("normal", np.float32, (3,)),
+                                        ("texcoord", np.float32, (2,))])
+    data["position"] = normals
+    data["normal"] = normals
+    data["texcoord"] = np.stack((u.ravel(), v.ravel()), axis=1)
+
+    corner = (np.arange(side - 1)[None, :] + np.arange(side - 1)[:, None] * side).ravel()
+    indices = np.stack((corner, corner + side, corner + 1, corner + 1, corner + side, corner + side + 1), axis=1)
+
+    return MeshData(data, indices.astype(np.uint32).reshape(-1))
+
+
+def decoded(mesh: MeshData, name: str) -> np.ndarray:
+    """The xyz the vertex shader sees for an attribute."""
+    values = mesh.vertices[name]
+    if name in mesh.packed:
+        bits = values.view(np.uint32)[:, None] >> np.array([0, 10, 20], dtype=np.uint32) & 0x3FF
+        signed = np.where(bits >= 512, bits.astype(np.int64) - 1024, bits)
+        return np.maximum(signed / 511.0, -1.0)
+    values = values.reshape(len(values), -1)[:, :3].astype(np.float64)
+    if name in mesh.normalized:
+        info = np.iinfo(mesh.vertices.dtype[name].base)
+        return np.maximum(values / info.max, -1.0)
+
+    return values
+
+
+def bench(source: MeshData, encodings: dict) -> dict:
+    mesh_data = pack_mesh(source, encodings)
+    start = time.perf_counter()
+    mesh = Mesh(mesh_data)
+    gl.glFinish()
+    upload = (time.perf_counter() - start) * 1000.0
+
+    mesh.draw()
+    gl.glFinish()
+    start = time.perf_counter()
+    for _ in range(FRAMES):
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        mesh.draw()
+    gl.glFinish()
+    draw = (time.perf_counter() - start) / FRAMES * 1000.0
+    mesh.delete()
+
+    return {
+        "vertex": mesh_data.stride,
+        "index": mesh_data.indices.dtype.itemsize,
+        "megabytes": (mesh_data.vertices.nbytes + mesh_data.indices.nbytes) / 2 ** 20,
+        "upload": upload,
+        "draw": draw,
+        "position": np.abs(decoded(mesh_data, "position") - source.vertices["position"]).max(),
+        "normal": np.abs(decoded(mesh_data, "normal") - source.vertices["normal"]).max(),
+    }
+
+
+def run(counts):
+    target = create_framebuffer(WIDTH, HEIGHT)
+    program = ShaderProgram.from_sources(VERTEX_SRC, FRAGMENT_SRC)
+    program.use()
+    gl.glEnable(gl.GL_DEPTH_TEST)
+
+    print(f"INFO::RENDERER::{gl.glGetString(gl.GL_RENDERER).decode()}")
+    for count in counts:
+        source = sphere(count)
+        print(f"{source.vertex_count:>10} vertices")
+        print(f"{'':>12} {'vertex':>7} {'index':>6} {'MB':>7} {'upload':>10} {'draw':>10} {'pos err':>9} {'nrm err':>9}")
+        for name, encodings in FORMATS:
+            result = bench(source, encodings)
+            print(f"{name:>12} {result['vertex']:6d}B {result['index']:5d}B {result['megabytes']:7.1f}"
+                  f" {result['upload']:8.2f}ms {result['draw']:8.2f}ms"
+                  f" {result['position']:9.2e} {result['normal']:9.2e}")
+
+    default_state().delete_program(program.program)
+    delete_framebuffer(*target)
+
+
+if __name__ == '__main__':
+    window = create_context(WIDTH, HEIGHT)
+    run([int(arg) for arg in sys.argv[1:]] or [10000, 60000, 1000000])
+    destroy_context(window)
@@ -0,0 +1,6 @@
+"""
+Reusable OpenGL helpers shared by the GLFW and Qt examples.
+
+Examples live in folders that are not Python packages, so every script puts the
+repository root on ``sys.path`` before importing from here.
+"""
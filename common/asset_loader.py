@@ -0,0 +1,321 @@
+"""
+Assets loaded in the background and uploaded a little every frame, so the first frame
+does not wait for the scene and the window keeps responding while it streams in.
+
+Loading is split in two stages:
+
+- read:   file I/O, decoding and mesh processing, on concurrent.futures pools. Reads
+          submitted as ``cpu_bound`` go to a ProcessPoolExecutor: mesh optimization and
+          simplification run Python loops that hold the GIL and would take the render
+          thread's time on a thread. ``read`` and its result are pickled then (module
+          level functions, functools.partial). Other reads, e.g. mapping a .mesh file,
+          stay on threads, where their results need no copy.
+- upload: GL calls on the render thread. update(), called once per frame, runs uploads
+          until its time budget is spent. An upload that is a generator (Mesh.upload_steps)
+          is resumed over several frames, one buffer chunk per step.
+
+    loader = AssetLoader(on_loaded=scheduler.invalidate)   # wake an on-demand loop
+    asset = loader.load_mesh("model.obj")
+    ...
+    for ready in loader.update():                           # every frame
+        scene.append(ready.value)
+
+GL uploads stay on the render thread rather than in a second, shared context: VAOs are
+not shared between contexts, GLState tracks one context per thread, and a shared context
+needs a fence per object before the render thread may use it. One budgeted queue works
+the same with GLFW, Qt and headless contexts.
+"""
+import functools
+import inspect
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from .mesh import Mesh
+from .mesh_io import import_mesh
+from .mesh_optimizer import optimize_mesh
+
+# Bytes uploaded per step, a few milliseconds worth for most drivers
+UPLOAD_CHUNK = 4 * 2 ** 20
+# Memory pages are touched in the reader so mapped files do not page in during the upload
+PAGE_SIZE = 4096
+# Scheduling priority reader processes drop to, 19 is the lowest
+READER_NICENESS = 10
+
+
+class LoaderStats(object):
+    """Assets requested, read and uploaded, reader and upload time, and the longest upload frame."""
+
+    def __init__(self):
+        self.requested = 0
+        self.read = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.read_time = 0.0
+        self.upload_time = 0.0
+        self.upload_frames = 0
+        self.max_frame_upload = 0.0
+        # perf_counter() of the first request and of the last asset becoming ready
+        self.first_request = None
+        self.last_ready = None
+
+    def report(self) -> str:
+        elapsed = (self.last_ready - self.first_request) if self.last_ready is not None else 0.0
+
+        return (f"INFO::ASSETS::{self.uploaded}/{self.requested} READY::{self.failed} FAILED"
+                f"::READ {self.read_time * 1000.0:.1f}ms::UPLOAD {self.upload_time * 1000.0:.1f}ms"
+                f" IN {self.upload_frames} FRAMES (MAX {self.max_frame_upload * 1000.0:.2f}ms/FRAME)"
+                f"::ALL READY AFTER {elapsed * 1000.0:.1f}ms")
+
+
+class Asset(object):
+    """
+    Handle of one asset. ``value`` is set on the render thread once it is uploaded,
+    ``error`` if reading or uploading failed.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.data = None
+        self.value = None
+        self.error = None
+        self.requested = time.perf_counter()
+        self.ready_time = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_time is not None
+
+    @property
+    def latency(self) -> float:
+        """Seconds from the request to the asset being ready, None until then."""
+        return None if self.ready_time is None else self.ready_time - self.requested
+
+
+class AssetLoader(object):
+    """Reads on a pool, uploads within a per-frame budget in request order."""
+
+    def __init__(self, budget: float = 0.004, workers: int = None, executor=None, on_loaded=None,
+                 process_executor=None):
+        """
+        :param budget: Seconds of uploads per update(), at least one step always runs
+        :param workers: Reader threads and processes, os.cpu_count() if None
+        :param executor: Use this concurrent.futures executor instead of an own thread pool
+        :param on_loaded: Called from the reader when an asset waits for its upload, e.g. to
+                          wake an on-demand render loop (RenderScheduler.invalidate)
+        :param process_executor: Executor of the cpu_bound reads instead of an own process
+                                 pool, which is only started by the first such read
+        """
+        self.budget = budget
+        self.on_loaded = on_loaded
+        self.stats = LoaderStats()
+
+        self.__workers = workers or os.cpu_count()
+        self.__own_executor = executor is None
+        self.__executor = executor if executor is not None else ThreadPoolExecutor(max_workers=self.__workers)
+        self.__own_process_executor = process_executor is None
+        self.__process_executor = process_executor
+        self.__lock = threading.Lock()
+        # asset -> (read result or exception, upload), read and waiting for the render thread
+        self.__read = {}
+        # Assets not uploaded yet, in request order
+        self.__order = []
+        # Upload in progress: (asset, upload callable or its generator, read exception)
+        self.__current = None
+        # Reads not finished yet, shutdown() cancels those that have not started
+        self.__futures = set()
+
+    @property
+    def pending(self) -> int:
+        """Assets not ready yet."""
+        return self.stats.requested - self.stats.uploaded - self.stats.failed
+
+    @property
+    def uploads_waiting(self) -> bool:
+        """True if update() has work to do right now."""
+        with self.__lock:
+            return self.__current is not None or any(asset in self.__read for asset in self.__order)
+
+    def submit(self, name: str, read, upload, cpu_bound: bool = False) -> Asset:
+        """
+        Queue an asset.
+        :param name: For reports, e.g. the file path
+        :param read: Called on the pool without a GL context, its result is passed to upload
+        :param upload: Called on the render thread with the read result. Returns the asset
+                       value, or a generator that uploads in steps and returns it
+        :param cpu_bound: Read in a worker process, ``read`` and its result must pickle
+        :return:
+        """
+        asset = Asset(name)
+        if self.stats.first_request is None:
+            self.stats.first_request = asset.requested
+        self.stats.requested += 1
+        with self.__lock:
+            self.__order.append(asset)
+
+        if cpu_bound:
+            if self.__process_executor is None:
+                self.__process_executor = ProcessPoolExecutor(max_workers=self.__workers,
+                                                              initializer=_lower_priority)
+            future = self.__process_executor.submit(_timed, read)
+        else:
+            future = self.__executor.submit(_timed, read)
+        with self.__lock:
+            self.__futures.add(future)
+        future.add_done_callback(lambda done: self.__finish_read(asset, upload, done))
+
+        return asset
+
+    def load_mesh(self, path: str, locations: dict = None, optimize: bool = None) -> Asset:
+        """
+        Queue a mesh file (.mesh, .obj, .ply) becoming a Mesh.
+        :param path: Mesh file
+        :param locations: {field name: attribute location} for the Mesh
+        :param optimize: Weld and reorder for the vertex cache in the reader, default is
+                         every format but .mesh (optimized when converted). Optimized files
+                         are read in a worker process
+        :return:
+        """
+        if optimize is None:
+            optimize = not path.endswith(".mesh")
+
+        return self.submit(path, functools.partial(read_mesh_file, path, optimize),
+                           lambda mesh: Mesh.upload_steps(mesh, locations, UPLOAD_CHUNK), cpu_bound=optimize)
+
+    def update(self, budget: float = None) -> list:
+        """
+        Upload on the render thread until the budget is spent. Call once per frame with the
+        context current.
+        :param budget: Seconds, the loader's budget if None
+        :return: Assets that became ready (or failed) during this call
+        """
+        budget = self.budget if budget is None else budget
+        start = time.perf_counter()
+        finished = []
+        while True:
+            if self.__current is None:
+                self.__current = self.__next_upload()
+                if self.__current is None:
+                    break
+            self.__step(finished)
+            if time.perf_counter() - start >= budget:
+                break
+
+        elapsed = time.perf_counter() - start
+        if elapsed > 0.0 and (finished or self.__current is not None):
+            self.stats.upload_time += elapsed
+            self.stats.upload_frames += 1
+            self.stats.max_frame_upload = max(self.stats.max_frame_upload, elapsed)
+
+        return finished
+
+    def shutdown(self, wait: bool = True):
+        """Stop the readers, assets not read yet are dropped."""
+        # Executor.shutdown(cancel_futures=True) needs Python 3.9
+        with self.__lock:
+            futures = list(self.__futures)
+        for future in futures:
+            future.cancel()
+        if self.__own_executor:
+            self.__executor.shutdown(wait=wait)
+        if self.__own_process_executor and self.__process_executor is not None:
+            self.__process_executor.shutdown(wait=wait)
+
+    def __finish_read(self, asset: Asset, upload, future):
+        with self.__lock:
+            self.__futures.discard(future)
+        if future.cancelled():
+            return
+        try:
+            data, seconds = future.result()
+        except Exception as error:
+            data, seconds = error, 0.0
+        with self.__lock:
+            self.__read[asset] = (data, upload)
+            self.stats.read += 1
+            self.stats.read_time += seconds
+        if self.on_loaded is not None:
+            self.on_loaded()
+
+    def __next_upload(self):
+        """(asset, upload, read exception) of the first asset in request order that was read."""
+        with self.__lock:
+            # Request order, so a scene fills in the order it was listed; one slow file only
+            # holds back the assets behind it until it is read, not the reading itself
+            ready = next((asset for asset in self.__order if asset in self.__read), None)
+            if ready is None:
+                return None
+            self.__order.remove(ready)
+            data, upload = self.__read.pop(ready)
+
+        if isinstance(data, Exception):
+            return ready, None, data
+        ready.data = data
+
+        return ready, upload, None
+
+    def __step(self, finished: list):
+        """One step of the current upload: the upload call itself, then one step of its generator."""
+        asset, job, error = self.__current
+        if error is None:
+            try:
+                if not inspect.isgenerator(job):
+                    job = job(asset.data)
+                    if not inspect.isgenerator(job):
+                        # A plain value, uploaded at once
+                        self.__done(asset, job, None, finished)
+                        return
+                    self.__current = (asset, job, None)
+                next(job)
+                return
+            except StopIteration as stop:
+                self.__done(asset, stop.value, None, finished)
+                return
+            except Exception as upload_error:
+                error = upload_error
+
+        self.__done(asset, None, error, finished)
+
+    def __done(self, asset: Asset, value, error, finished: list):
+        asset.value = value
+        asset.error = error
+        # The read data is not needed any more, drop mapped files and copies
+        asset.data = None
+        asset.ready_time = time.perf_counter()
+        if error is None:
+            self.stats.uploaded += 1
+        else:
+            self.stats.failed += 1
+            print(f"ERROR::ASSETS::{asset.name}::{error}")
+        self.stats.last_ready = asset.ready_time
+        self.__current = None
+        finished.append(asset)
+
+
+def read_mesh_file(path: str, optimize: bool = False):
+    """Reader of load_mesh(): import, optionally optimize, and page in mapped files."""
+    mesh = import_mesh(path)
+    if optimize:
+        mesh, _ = optimize_mesh(mesh)
+    for array in (mesh.vertices, mesh.indices):
+        if isinstance(array, np.memmap) and array.size:
+            # One byte per page is enough to read the file in
+            array.reshape(-1).view(np.uint8)[::PAGE_SIZE].max()
+
+    return mesh
+
+
+def _lower_priority():
+    """Reader processes yield the CPU to the render thread when they compete for a core."""
+    if hasattr(os, "nice"):
+        os.nice(READER_NICENESS)
+
+
+def _timed(read) -> tuple:
+    start = time.perf_counter()
+    data = read()
+
+    return data, time.perf_counter() - start
@@ -0,0 +1,143 @@
+"""
+Mouse input for an orbit camera, coalesced per frame.
+
+Mice poll at up to 1000 Hz, far more often than frames are shown. Event handlers only add
+their deltas to a CameraInput, the camera is updated once per drawn frame with the sum:
+
+    def mouseMoveEvent(self, event):
+        self.input.rotate(dx, dy)       # a few additions, no camera math
+        self.update()                   # Qt merges pending update requests
+
+    def paintGL(self):
+        self.input.apply(self.camera, height)   # one rotation / pan / zoom per frame
+
+The orbit quaternion is renormalized after every update, so it does not drift however
+long the camera is dragged around. The time of the oldest event waiting for a frame is
+kept as well: presented(), called once the frame is on screen (QOpenGLWidget.frameSwapped),
+records the input-to-present latency of that frame.
+"""
+import collections
+import time
+
+import numpy as np
+
+from . import matrices
+
+# Degrees of orbit per pixel dragged
+ROTATE_SPEED = 0.5
+# Distance factor per wheel step (120 units of QWheelEvent.angleDelta)
+ZOOM_FACTOR = 0.9
+
+
+class InputStats(object):
+    """Input events, camera updates and input-to-present latency in milliseconds."""
+
+    def __init__(self, history: int = 240):
+        self.events = 0
+        self.updates = 0
+        self.latency = collections.deque(maxlen=history)
+
+    def report(self) -> str:
+        coalesced = self.events / self.updates if self.updates else 0.0
+        report = f"INFO::INPUT::EVENTS {self.events}::CAMERA UPDATES {self.updates} ({coalesced:.1f} EVENTS EACH)"
+        if self.latency:
+            p50, p95, p99 = np.percentile(np.fromiter(self.latency, dtype=np.float64), (50, 95, 99))
+            report += f"::LATENCY P50 {p50:.2f}ms P95 {p95:.2f}ms P99 {p99:.2f}ms"
+
+        return report
+
+
+class CameraInput(object):
+    """
+    Rotation, pan and zoom deltas accumulated between frames and applied to a Camera.
+    Rotation orbits around the pivot, panning moves the pivot in the view plane, zooming
+    moves the eye towards the target.
+    """
+
+    def __init__(self, min_distance: float = 0.5, max_distance: float = 500.0, stats: InputStats = None):
+        """
+        :param min_distance: Closest the eye gets to the target when zooming
+        :param max_distance: Farthest the eye gets from the target when zooming
+        :param stats: Shared counters, a private one is created if omitted
+        """
+        self.min_distance = min_distance
+        self.max_distance = max_distance
+        self.stats = stats if stats is not None else InputStats()
+
+        self.__rotate = np.zeros(2)
+        self.__pan = np.zeros(2)
+        self.__zoom = 0.0
+        # perf_counter() of the oldest event not applied yet, of the last applied frame
+        self.__oldest = None
+        self.__applied = None
+
+    @property
+    def pending(self) -> bool:
+        return self.__oldest is not None
+
+    def rotate(self, dx: float, dy: float, timestamp: float = None):
+        """:param dx, dy: Pixels dragged since the last event"""
+        self.__rotate += (dx, dy)
+        self.__event(timestamp)
+
+    def pan(self, dx: float, dy: float, timestamp: float = None):
+        """:param dx, dy: Pixels dragged since the last event, the pivot follows the cursor"""
+        self.__pan += (dx, dy)
+        self.__event(timestamp)
+
+    def zoom(self, steps: float, timestamp: float = None):
+        """:param steps: Wheel steps, positive moves closer"""
+        self.__zoom += steps
+        self.__event(timestamp)
+
+    def apply(self, camera, viewport_height: int = None) -> bool:
+        """
+        Apply everything accumulated since the last call to ``camera``.
+        :param camera: common.transform.Camera
+        :param viewport_height: Pixels, pans move the pivot by as much as the cursor moved
+                                on the target plane. Pans are ignored without it
+        :return: True if the camera changed
+        """
+        if self.__oldest is None:
+            return False
+
+        if self.__rotate.any():
+            dx, dy = self.__rotate
+            # Same axis and angle as the viewport's QQuaternion.fromAxisAndAngle, for the summed drag
+            delta = matrices.quaternion_from_axis_angle((dy, dx, 0.0), np.hypot(dx, dy) * ROTATE_SPEED)
+            camera.rotation = matrices.quaternion_normalize(matrices.quaternion_multiply(delta, camera.rotation))
+
+        offset = camera.eye - camera.target
+        distance = float(np.linalg.norm(offset))
+        if self.__pan.any() and viewport_height:
+            # World units per pixel at the target distance, projection[1, 1] = 1 / tan(fov / 2)
+            scale = 2.0 * distance / (camera.projection_matrix[1, 1] * viewport_height)
+            view = camera.view_matrix
+            dx, dy = self.__pan * scale
+            # Rows of the view rotation are the camera axes in world space
+            camera.pivot = camera.pivot - view[0, :3] * dx + view[1, :3] * dy
+
+        if self.__zoom and distance > 0.0:
+            zoomed = np.clip(distance * ZOOM_FACTOR ** self.__zoom, self.min_distance, self.max_distance)
+            camera.eye = camera.target + offset * (zoomed / distance)
+
+        self.__rotate[:] = 0.0
+        self.__pan[:] = 0.0
+        self.__zoom = 0.0
+        self.__applied, self.__oldest = self.__oldest, None
+        self.stats.updates += 1
+
+        return True
+
+    def presented(self, timestamp: float = None):
+        """The last applied frame is visible: record its latency from its oldest event."""
+        if self.__applied is None:
+            return
+        now = time.perf_counter() if timestamp is None else timestamp
+        self.stats.latency.append((now - self.__applied) * 1000.0)
+        self.__applied = None
+
+    def __event(self, timestamp: float):
+        if self.__oldest is None:
+            self.__oldest = time.perf_counter() if timestamp is None else timestamp
+        self.stats.events += 1
@@ -0,0 +1,296 @@
+import time
+
+import numpy as np
+
+
+class CullStats(object):
+    """Objects, visible and culled counts of the last cull() and the time spent in it."""
+
+    def __init__(self):
+        self.objects = 0
+        self.visible = 0
+        self.culled = 0
+        self.nodes = 0
+        self.seconds = 0.0
+        self.refits = 0
+        self.rebuilds = 0
+
+    def report(self) -> str:
+        return (f"INFO::CULLING::{self.visible}/{self.objects} VISIBLE::CULLED::{self.culled}"
+                f"::NODES TESTED::{self.nodes}::{self.seconds * 1000.0:.3f}ms"
+                f"::REFITS::{self.refits}::REBUILDS::{self.rebuilds}")
+
+
+def frustum_planes(view_projection: np.ndarray) -> np.ndarray:
+    """
+    The six planes (left, right, bottom, top, near, far) of a row-major projection @ view
+    matrix as (6, 4) rows (a, b, c, d), normalized, pointing inwards: a point p is inside
+    when a*x + b*y + c*z + d >= 0 for every plane (Gribb/Hartmann).
+    """
+    matrix = np.asarray(view_projection, dtype=np.float64)
+    planes = np.array([matrix[3] + matrix[0], matrix[3] - matrix[0],
+                       matrix[3] + matrix[1], matrix[3] - matrix[1],
+                       matrix[3] + matrix[2], matrix[3] - matrix[2]])
+
+    return planes / np.linalg.norm(planes[:, :3], axis=1)[:, None]
+
+
+def transform_bounds(models: np.ndarray, lower, upper) -> tuple:
+    """
+    World space AABBs of local AABBs under (N, 4, 4) model matrices in GL layout
+    (TransformBatch.models): the box around each transformed box, via |M| * extent.
+    :param models: (N, 4, 4) transposed model matrices
+    :param lower: Local minimum corner, (3,) shared or (N, 3)
+    :param upper: Local maximum corner, (3,) shared or (N, 3)
+    :return: (lower, upper) as (N, 3) float32
+    """
+    models = np.asarray(models, dtype=np.float32)
+    lower = np.asarray(lower, dtype=np.float32)
+    upper = np.asarray(upper, dtype=np.float32)
+    center = (lower + upper) * 0.5
+    extent = (upper - lower) * 0.5
+
+    # GL layout: row r of models[i] is column r of the math matrix
+    rotation = models[:, :3, :3]
+    world_center = np.einsum("...j,...jk->...k", center, rotation) + models[:, 3, :3]
+    world_extent = np.einsum("...j,...jk->...k", extent, np.abs(rotation))
+
+    return world_center - world_extent, world_center + world_extent
+
+
+def aabbs_in_frustum(planes: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+    """
+    Per box: True unless it lies completely behind one plane. Conservative like every
+    plane test, a box near a frustum corner can pass without being visible.
+    """
+    center = (np.asarray(lower, dtype=np.float64) + upper) * 0.5
+    extent = (np.asarray(upper, dtype=np.float64) - lower) * 0.5
+    # Distance of the corner furthest along each plane normal
+    distance = center @ planes[:, :3].T + extent @ np.abs(planes[:, :3]).T + planes[:, 3]
+
+    return (distance >= 0.0).all(axis=1)
+
+
+class BoundingVolumeHierarchy(object):
+    """
+    BVH over object AABBs for frustum culling of large scenes.
+
+    Objects are sorted along a Morton (Z-order) curve of their centers and grouped into
+    leaves of ``leaf_size`` neighbours. The leaves are the bottom level of an implicit
+    complete binary tree, node i has children 2i and 2i + 1, so the tree is a list of
+    (nodes, 3) bound arrays per level and building, refitting and culling run level by
+    level with numpy. Every subtree covers a contiguous run of the sorted objects: a node
+    found completely inside the frustum accepts all of them without testing further.
+
+        bvh = BoundingVolumeHierarchy()
+        bvh.build(lower, upper)              # (N, 3) world AABBs, e.g. from transform_bounds()
+        bvh.refit(lower, upper, moved)       # objects moved, only their branches are updated
+        visible = bvh.cull(projection @ view)
+
+    Refitting keeps the tree but lets boxes grow apart as objects travel; when the leaves
+    have ``rebuild_ratio`` times the surface area they had when built, refit() rebuilds.
+    """
+
+    def __init__(self, leaf_size: int = 16, rebuild_ratio: float = 2.0):
+        """
+        :param leaf_size: Objects per leaf, tested one by one when a leaf straddles a plane
+        :param rebuild_ratio: Leaf surface area growth that triggers a rebuild in refit()
+        """
+        self.leaf_size = leaf_size
+        self.rebuild_ratio = rebuild_ratio
+        self.count = 0
+        self.stats = CullStats()
+
+        self.__order = np.zeros(0, dtype=np.int64)
+        self.__slots = np.zeros(0, dtype=np.int64)
+        self.__lower = np.zeros((0, 3), dtype=np.float32)
+        self.__upper = np.zeros((0, 3), dtype=np.float32)
+        # Per level, root first
+        self.__node_lower = []
+        self.__node_upper = []
+        self.__build_area = 0.0
+
+    @property
+    def depth(self) -> int:
+        return len(self.__node_lower)
+
+    def build(self, lower: np.ndarray, upper: np.ndarray):
+        """
+        Sort the objects and build the tree.
+        :param lower: (N, 3) minimum corners
+        :param upper: (N, 3) maximum corners
+        """
+        lower = np.asarray(lower, dtype=np.float32)
+        upper = np.asarray(upper, dtype=np.float32)
+        self.count = len(lower)
+        self.stats.rebuilds += 1
+
+        self.__order = np.argsort(_morton_codes((lower + upper) * 0.5), kind="stable")
+        self.__slots = np.empty(self.count, dtype=np.int64)
+        self.__slots[self.__order] = np.arange(self.count)
+
+        leaves = max(1, -(-self.count // self.leaf_size))
+        levels = max(1, int(np.ceil(np.log2(leaves))) + 1)
+        # Padding slots and leaves hold empty boxes (+inf, -inf), min/max ignore them
+        padded = (1 << (levels - 1)) * self.leaf_size
+        self.__lower = np.full((padded, 3), np.inf, dtype=np.float32)
+        self.__upper = np.full((padded, 3), -np.inf, dtype=np.float32)
+        self.__lower[:self.count] = lower[self.__order]
+        self.__upper[:self.count] = upper[self.__order]
+
+        self.__node_lower = [np.empty((1 << level, 3), dtype=np.float32) for level in range(levels)]
+        self.__node_upper = [np.empty((1 << level, 3), dtype=np.float32) for level in range(levels)]
+        self.__fit()
+
+        self.__build_area = self.__leaf_area()
+
+    def refit(self, lower: np.ndarray, upper: np.ndarray, moved=None):
+        """
+        Update object boxes and the nodes above them, keeping the tree structure.
+        :param lower: (N, 3) minimum corners of all objects, same order as in build()
+        :param upper: (N, 3) maximum corners
+        :param moved: Indices of the objects that changed, all if None
+        """
+        lower = np.asarray(lower, dtype=np.float32)
+        upper = np.asarray(upper, dtype=np.float32)
+        if len(lower) != self.count:
+            # Objects were added or removed, the sort order no longer applies
+            self.build(lower, upper)
+            return
+
+        self.stats.refits += 1
+        if moved is None:
+            self.__lower[:self.count] = lower[self.__order]
+            self.__upper[:self.count] = upper[self.__order]
+            self.__fit()
+        else:
+            moved = np.asarray(moved, dtype=np.int64)
+            slots = self.__slots[moved]
+            self.__lower[slots] = lower[moved]
+            self.__upper[slots] = upper[moved]
+            self.__fit(np.unique(slots // self.leaf_size))
+
+        if self.__build_area > 0.0 and self.__leaf_area() > self.rebuild_ratio * self.__build_area:
+            self.build(lower, upper)
+
+    def cull(self, view_projection: np.ndarray) -> np.ndarray:
+        """
+        Objects whose AABB intersects the frustum of a row-major projection @ view matrix.
+        :return: Object indices, in tree order
+        """
+        start = time.perf_counter()
+        planes = frustum_planes(view_projection)
+        normals, offsets = planes[:, :3], planes[:, 3]
+        absolute = np.abs(normals)
+
+        first, last = [], []
+        tested = 0
+        nodes = np.zeros(1, dtype=np.int64) if self.count else np.zeros(0, dtype=np.int64)
+        partial = nodes
+        for level in range(self.depth):
+            # Objects covered by a node of this level: [node * span, (node + 1) * span)
+            span = self.leaf_size << (self.depth - 1 - level)
+            nodes = nodes[nodes * span < self.count]
+            if not len(nodes):
+                partial = nodes
+                break
+            tested += len(nodes)
+
+            lower, upper = self.__node_lower[level][nodes], self.__node_upper[level][nodes]
+            center = (lower + upper).astype(np.float64) * 0.5
+            extent = (upper - lower).astype(np.float64) * 0.5
+            middle = center @ normals.T + offsets
+            reach = extent @ absolute.T
+            outside = (middle + reach < 0.0).any(axis=1)
+            inside = (middle - reach >= 0.0).all(axis=1)
+
+            first.append(nodes[inside] * span)
+            last.append(np.minimum((nodes[inside] + 1) * span, self.count))
+            partial = nodes[~outside & ~inside]
+            if level < self.depth - 1:
+                nodes = np.stack((partial * 2, partial * 2 + 1), axis=1).reshape(-1)
+
+        # Leaves straddling a plane: test their objects one by one
+        slots = (partial[:, None] * self.leaf_size + np.arange(self.leaf_size)).reshape(-1)
+        slots = slots[slots < self.count]
+        tested += len(slots)
+        slots = slots[aabbs_in_frustum(planes, self.__lower[slots], self.__upper[slots])]
+
+        if first:
+            slots = np.concatenate((_ranges(np.concatenate(first), np.concatenate(last)), slots))
+        visible = self.__order[slots]
+
+        self.stats.objects = self.count
+        self.stats.visible = len(visible)
+        self.stats.culled = self.count - len(visible)
+        self.stats.nodes = tested
+        self.stats.seconds = time.perf_counter() - start
+
+        return visible
+
+    def __fit(self, leaves: np.ndarray = None):
+        """Recompute node bounds bottom up, only the branches above ``leaves`` if given."""
+        shape = (-1, self.leaf_size, 3)
+        if leaves is None:
+            _reduce_slots(np.minimum, self.__lower.reshape(shape), self.__node_lower[-1])
+            _reduce_slots(np.maximum, self.__upper.reshape(shape), self.__node_upper[-1])
+            for level in range(self.depth - 2, -1, -1):
+                below_lower, below_upper = self.__node_lower[level + 1], self.__node_upper[level + 1]
+                np.minimum(below_lower[0::2], below_lower[1::2], out=self.__node_lower[level])
+                np.maximum(below_upper[0::2], below_upper[1::2], out=self.__node_upper[level])
+            return
+
+        nodes = leaves
+        self.__node_lower[-1][nodes] = _reduce_slots(np.minimum, self.__lower.reshape(shape)[nodes])
+        self.__node_upper[-1][nodes] = _reduce_slots(np.maximum, self.__upper.reshape(shape)[nodes])
+        for level in range(self.depth - 2, -1, -1):
+            nodes = np.unique(nodes >> 1)
+            below_lower, below_upper = self.__node_lower[level + 1], self.__node_upper[level + 1]
+            self.__node_lower[level][nodes] = np.minimum(below_lower[nodes * 2], below_lower[nodes * 2 + 1])
+            self.__node_upper[level][nodes] = np.maximum(below_upper[nodes * 2], below_upper[nodes * 2 + 1])
+
+    def __leaf_area(self) -> float:
+        leaves = -(-self.count // self.leaf_size)
+        size = (self.__node_upper[-1][:leaves] - self.__node_lower[-1][:leaves]).astype(np.float64)
+
+        return float((size[:, 0] * size[:, 1] + size[:, 1] * size[:, 2] + size[:, 2] * size[:, 0]).sum())
+
+
+def _reduce_slots(function, values: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """function.reduce over axis 1 of (leaves, slots, 3), one elementwise call per slot,
+    several times faster than numpy's strided reduction along the middle axis."""
+    if out is None:
+        out = np.empty(values[:, 0].shape, dtype=values.dtype)
+    out[:] = values[:, 0]
+    for slot in range(1, values.shape[1]):
+        function(out, values[:, slot], out=out)
+
+    return out
+
+
+def _ranges(first: np.ndarray, last: np.ndarray) -> np.ndarray:
+    """Concatenated np.arange(first[i], last[i]) without a Python loop."""
+    lengths = last - first
+    total = int(lengths.sum())
+    if total == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.cumsum(lengths) - lengths
+
+    return np.repeat(first - starts, lengths) + np.arange(total)
+
+
+def _morton_codes(points: np.ndarray) -> np.ndarray:
+    """30-bit Morton codes of points, 10 bits per axis within their bounding box."""
+    if not len(points):
+        return np.zeros(0, dtype=np.uint32)
+    low, high = points.min(axis=0), points.max(axis=0)
+    scaled = (points - low) / np.maximum(high - low, 1e-30) * 1023.0
+    cells = np.clip(scaled, 0.0, 1023.0).astype(np.uint32)
+
+    # Spread 10 bits so two zero bits separate each of them
+    cells = (cells | (cells << 16)) & 0x030000FF
+    cells = (cells | (cells << 8)) & 0x0300F00F
+    cells = (cells | (cells << 4)) & 0x030C30C3
+    cells = (cells | (cells << 2)) & 0x09249249
+
+    return (cells[:, 0] << 2) | (cells[:, 1] << 1) | cells[:, 2]
@@ -0,0 +1,254 @@
+import ctypes
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_info import supports, mapped_array
+from .image_io import write_png, write_raw
+
+
+class CaptureStats(object):
+    """Throughput and time the render thread spent waiting on readback or encoding."""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+        self.readback_stall = 0.0
+        self.encode_stall = 0.0
+        self.started = None
+        self.finished = None
+
+    @property
+    def elapsed(self) -> float:
+        if self.started is None or self.finished is None:
+            return 0.0
+
+        return self.finished - self.started
+
+    def report(self) -> str:
+        elapsed = self.elapsed
+        fps = self.frames / elapsed if elapsed > 0.0 else 0.0
+        mb_per_second = self.bytes / elapsed / 2 ** 20 if elapsed > 0.0 else 0.0
+
+        return (f"INFO::CAPTURE::{self.frames} FRAMES::{fps:.1f} FPS::{mb_per_second:.1f} MB/s"
+                f"::READBACK_STALL::{self.readback_stall * 1000.0:.1f}ms"
+                f"::ENCODE_STALL::{self.encode_stall * 1000.0:.1f}ms")
+
+
+class FrameCapture(object):
+    """
+    Asynchronous capture of every rendered frame through a ring of pixel pack buffers.
+
+    capture() only queues glReadPixels into the next PBO and a fence, so the copy runs on
+    the GPU while the next frames render. A frame is picked up once its fence has signalled
+    and handed to a thread pool that writes it as PNG or raw RGBA.
+
+    On GL 4.4+ (or with ARB_buffer_storage) the PBOs are persistently mapped and the workers
+    receive numpy views straight into them, no copy at all; a PBO is only reused after its
+    file was written. Older contexts map, copy and unmap each frame instead.
+    """
+
+    def __init__(self, width: int, height: int, directory: str, file_format: str = "png",
+                 ring: int = 3, workers: int = 2, multisampled: bool = False):
+        """
+        Create the PBO ring. Needs a current context.
+        :param width: Width of the captured framebuffer
+        :param height: Height of the captured framebuffer
+        :param directory: Output folder, created if missing
+        :param file_format: "png" or "raw"
+        :param ring: Number of PBOs, i.e. frames that can be in flight
+        :param workers: Encoder threads
+        :param multisampled: Source framebuffer has samples and is resolved before reading
+        """
+        if file_format not in ("png", "raw"):
+            raise ValueError(f"Unknown capture format '{file_format}'")
+
+        self.directory = directory
+        self.file_format = file_format
+        self.ring = ring
+        self.multisampled = multisampled
+        self.persistent = supports((4, 4), "GL_ARB_buffer_storage") and bool(gl.glBufferStorage)
+        self.stats = CaptureStats()
+
+        os.makedirs(directory, exist_ok=True)
+        self.__pool = ThreadPoolExecutor(max_workers=workers)
+        self.__frame = 0
+
+        self.__allocate(width, height)
+
+    def capture(self, framebuffer: int = None):
+        """
+        Queue the readback of the framebuffer's first color attachment. Call after drawing.
+        :param framebuffer: Source framebuffer, the current read framebuffer if None
+        :return:
+        """
+        if self.stats.started is None:
+            self.stats.started = time.perf_counter()
+        previous_read = gl.glGetIntegerv(gl.GL_READ_FRAMEBUFFER_BINDING)
+        previous_draw = gl.glGetIntegerv(gl.GL_DRAW_FRAMEBUFFER_BINDING)
+        source = previous_read if framebuffer is None else framebuffer
+
+        # Pick up whatever finished since the last frame without blocking
+        self.__collect(block=False)
+
+        slot = self.__frame % self.ring
+        self.__release(slot)
+
+        if self.multisampled:
+            gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, source)
+            gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, self.__resolve_fbo)
+            gl.glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, self.width, self.height,
+                                 gl.GL_COLOR_BUFFER_BIT, gl.GL_NEAREST)
+            source = self.__resolve_fbo
+
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, source)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self.__pbos[slot])
+        gl.glReadPixels(0, 0, self.width, self.height, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, ctypes.c_void_p(0))
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        self.__fences[slot] = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.__pending.append((slot, self.__frame))
+
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, previous_read)
+        gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, previous_draw)
+        self.__frame += 1
+
+    def flush(self):
+        """Wait until every queued frame is written to disk."""
+        self.__collect(block=True)
+        for slot in range(self.ring):
+            self.__release(slot)
+        self.stats.finished = time.perf_counter()
+
+    def resize(self, width: int, height: int):
+        """Flush the frames of the old size and reallocate the ring."""
+        if (width, height) == (self.width, self.height):
+            return
+
+        self.flush()
+        self.__free()
+        self.__allocate(width, height)
+
+    def delete(self):
+        self.flush()
+        self.__free()
+        self.__pool.shutdown()
+
+    def __allocate(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.frame_size = width * height * 4
+
+        self.__pbos = [int(pbo) for pbo in np.atleast_1d(gl.glGenBuffers(self.ring))]
+        self.__fences = [None] * self.ring
+        self.__views = [None] * self.ring
+        # Encoder futures still using a slot's mapping
+        self.__futures = [None] * self.ring
+        # (slot, frame number) in submission order, waiting for their fence
+        self.__pending = []
+
+        for slot, pbo in enumerate(self.__pbos):
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
+            if self.persistent:
+                flags = gl.GL_MAP_READ_BIT | gl.GL_MAP_PERSISTENT_BIT | gl.GL_MAP_COHERENT_BIT
+                gl.glBufferStorage(gl.GL_PIXEL_PACK_BUFFER, self.frame_size, None, flags)
+                address = gl.glMapBufferRange(gl.GL_PIXEL_PACK_BUFFER, 0, self.frame_size, flags)
+                self.__views[slot] = mapped_array(address, self.frame_size).reshape(height, width, 4)
+            else:
+                gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER, self.frame_size, None, gl.GL_STREAM_READ)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+
+        self.__resolve_fbo = None
+        self.__resolve_rbo = None
+        if self.multisampled:
+            self.__resolve_fbo = gl.glGenFramebuffers(1)
+            self.__resolve_rbo = gl.glGenRenderbuffers(1)
+            gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.__resolve_rbo)
+            gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_RGBA8, width, height)
+            gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, 0)
+
+            previous = gl.glGetIntegerv(gl.GL_DRAW_FRAMEBUFFER_BINDING)
+            gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, self.__resolve_fbo)
+            gl.glFramebufferRenderbuffer(gl.GL_DRAW_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0,
+                                         gl.GL_RENDERBUFFER, self.__resolve_rbo)
+            gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, previous)
+
+    def __free(self):
+        for slot, pbo in enumerate(self.__pbos):
+            if self.persistent:
+                gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
+                gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+            self.__views[slot] = None
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        gl.glDeleteBuffers(len(self.__pbos), self.__pbos)
+
+        if self.multisampled:
+            gl.glDeleteFramebuffers(1, [self.__resolve_fbo])
+            gl.glDeleteRenderbuffers(1, [self.__resolve_rbo])
+
+    def __collect(self, block: bool):
+        """Hand frames whose readback finished to the encoders, oldest first."""
+        while self.__pending:
+            slot, frame = self.__pending[0]
+            if not self.__wait_fence(slot, block):
+                return
+            self.__pending.pop(0)
+            self.__encode(slot, frame)
+
+    def __release(self, slot: int):
+        """Make a slot writable again: its readback picked up and its file written."""
+        if any(pending_slot == slot for pending_slot, _ in self.__pending):
+            # The ring is full, the GPU has not finished copying this frame yet
+            while self.__pending and self.__fences[slot] is not None:
+                pending_slot, frame = self.__pending.pop(0)
+                self.__wait_fence(pending_slot, block=True)
+                self.__encode(pending_slot, frame)
+
+        future = self.__futures[slot]
+        if future is not None:
+            start = time.perf_counter()
+            future.result()
+            self.stats.encode_stall += time.perf_counter() - start
+            self.stats.frames += 1
+            self.stats.bytes += self.frame_size
+            self.__futures[slot] = None
+
+    def __wait_fence(self, slot: int, block: bool) -> bool:
+        fence = self.__fences[slot]
+        start = time.perf_counter()
+        result = gl.glClientWaitSync(fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000 if block else 0)
+        while block and result == gl.GL_TIMEOUT_EXPIRED:
+            result = gl.glClientWaitSync(fence, 0, 1000000000)
+        if result == gl.GL_TIMEOUT_EXPIRED:
+            return False
+        if block:
+            self.stats.readback_stall += time.perf_counter() - start
+
+        gl.glDeleteSync(fence)
+        self.__fences[slot] = None
+
+        return True
+
+    def __encode(self, slot: int, frame: int):
+        if self.persistent:
+            pixels = self.__views[slot]
+        else:
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, self.__pbos[slot])
+            address = gl.glMapBufferRange(gl.GL_PIXEL_PACK_BUFFER, 0, self.frame_size, gl.GL_MAP_READ_BIT)
+            pixels = mapped_array(address, self.frame_size).reshape(self.height, self.width, 4).copy()
+            gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+
+        path = os.path.join(self.directory, f"frame_{frame:06d}.{self.file_format}")
+        self.__futures[slot] = self.__pool.submit(self.__write, path, pixels)
+
+    def __write(self, path: str, pixels: np.ndarray):
+        # GL rows start at the bottom, flipping the view costs nothing
+        pixels = pixels[::-1]
+        if self.file_format == "png":
+            write_png(path, pixels)
+        else:
+            write_raw(path, pixels)
@@ -0,0 +1,60 @@
+import ctypes
+
+import numpy as np
+import OpenGL.GL as gl
+
+
+def gl_version() -> tuple:
+    """(major, minor) of the current context."""
+    return (int(gl.glGetIntegerv(gl.GL_MAJOR_VERSION)),
+            int(gl.glGetIntegerv(gl.GL_MINOR_VERSION)))
+
+
+def has_extension(name: str) -> bool:
+    """Check the current context for an extension, e.g. "GL_ARB_buffer_storage"."""
+    count = gl.glGetIntegerv(gl.GL_NUM_EXTENSIONS)
+    for index in range(count):
+        if gl.glGetStringi(gl.GL_EXTENSIONS, index).decode() == name:
+            return True
+
+    return False
+
+
+def supports(version: tuple, extension: str = None) -> bool:
+    """
+    True if the context is at least ``version`` or exposes ``extension``.
+    :param version: Core version as (major, minor)
+    :param extension: Extension that provides the same functionality
+    :return:
+    """
+    if gl_version() >= version:
+        return True
+
+    return extension is not None and has_extension(extension)
+
+
+def mapped_array(address: int, nbytes: int, dtype=np.uint8) -> np.ndarray:
+    """
+    Wrap a pointer returned by glMapBuffer(Range) into a numpy array without copying.
+    The array is only valid while the buffer stays mapped.
+    :param address: Mapped pointer
+    :param nbytes: Size of the mapped range in bytes
+    :param dtype: Element type of the returned array
+    :return:
+    """
+    if isinstance(address, ctypes.c_void_p):
+        address = address.value
+    raw = (ctypes.c_ubyte * nbytes).from_address(address)
+
+    return np.frombuffer(raw, dtype=dtype)
+
+
+def query_result(query: int) -> int:
+    """
+    64-bit result of a query object (e.g. GL_TIME_ELAPSED nanoseconds), waits if not ready.
+    PyOpenGL cannot allocate the output array for glGetQueryObjectui64v by itself.
+    """
+    result = ctypes.c_uint64()
+    gl.glGetQueryObjectui64v(query, gl.GL_QUERY_RESULT, ctypes.byref(result))
+
+    return result.value
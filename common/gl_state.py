@@ -0,0 +1,254 @@
+"""
+Shadow copy of the OpenGL state: state changes that would not change anything never
+reach the driver.
+
+Every GL call from Python crosses the ctypes boundary and, with PyOpenGL's error checking
+on (the default), is followed by a glGetError. Drawing code that sets its state
+unconditionally every frame (program, VAO, clear color, blend...) pays that for calls that
+are no-ops. GLState remembers the last value of each piece of state it set and only calls
+GL when the value differs:
+
+    state = default_state()
+    state.use_program(program)          # issued
+    state.use_program(program)          # skipped
+    state.end_frame()                   # per frame counters for the profiler
+
+The helpers in common/ go through default_state(), so it only stays correct if every
+change of the tracked state goes through it as well. Code that calls GL directly (a
+library, QPainter, another context made current on the thread) has to call invalidate()
+afterwards. Untracked: framebuffers, the viewport (QOpenGLWidget sets both before
+paintGL), indexed buffer bindings and pixel pack/unpack buffers.
+"""
+import threading
+
+import OpenGL.GL as gl
+
+
+class StateStats(object):
+    """State calls issued to GL and skipped because the state already matched."""
+
+    def __init__(self):
+        self.issued = 0
+        self.skipped = 0
+        self.frames = 0
+        # Counters of the frame in progress and of the last finished one
+        self.frame_issued = 0
+        self.frame_skipped = 0
+        self.last_issued = 0
+        self.last_skipped = 0
+
+    def end_frame(self):
+        self.last_issued, self.last_skipped = self.frame_issued, self.frame_skipped
+        self.frame_issued = self.frame_skipped = 0
+        self.frames += 1
+
+    def report(self) -> str:
+        total = self.issued + self.skipped
+        ratio = self.skipped / total * 100.0 if total else 0.0
+        frames = max(self.frames, 1)
+
+        return (f"INFO::GL_STATE::ISSUED {self.issued}::SKIPPED {self.skipped} ({ratio:.1f}%)"
+                f"::PER FRAME {self.issued / frames:.1f}/{self.skipped / frames:.1f}"
+                f"::LAST FRAME {self.last_issued}/{self.last_skipped}")
+
+
+class GLState(object):
+    """
+    Last known value of the program, VAO, buffer and texture bindings, capabilities,
+    polygon mode, clear color, depth and blend state of one context. Unknown state (after
+    creation or invalidate()) is always issued.
+
+    Every setter returns True if the call reached GL.
+    """
+
+    def __init__(self, stats: StateStats = None):
+        self.stats = stats if stats is not None else StateStats()
+        # key -> last value set, missing keys are unknown
+        self.__state = {}
+
+    def invalidate(self):
+        """Forget everything, e.g. after raw GL calls changed tracked state."""
+        self.__state.clear()
+
+    def end_frame(self):
+        self.stats.end_frame()
+
+    def use_program(self, program) -> bool:
+        """:param program: Program name or anything with __int__ (ShaderProgram)"""
+        program = int(program)
+        if not self.__changed("program", program):
+            return False
+        gl.glUseProgram(program)
+
+        return True
+
+    def bind_vertex_array(self, vao) -> bool:
+        vao = int(vao)
+        if not self.__changed("vertex_array", vao):
+            return False
+        gl.glBindVertexArray(vao)
+        # The element array binding belongs to the VAO
+        self.__state.pop(("buffer", gl.GL_ELEMENT_ARRAY_BUFFER), None)
+
+        return True
+
+    def bind_buffer(self, target, buffer) -> bool:
+        buffer = int(buffer)
+        if not self.__changed(("buffer", target), buffer):
+            return False
+        gl.glBindBuffer(target, buffer)
+
+        return True
+
+    def bind_buffer_range(self, target, index: int, buffer, offset: int, size: int):
+        """Always issued. Also binds ``buffer`` to the generic ``target``, as GL does."""
+        buffer = int(buffer)
+        gl.glBindBufferRange(target, index, buffer, offset, size)
+        self.__issued()
+        self.__state[("buffer", target)] = buffer
+
+    def bind_texture(self, unit: int, target, texture) -> bool:
+        """
+        Bind ``texture`` to texture unit ``unit`` (0, 1, ... not GL_TEXTURE0 + unit).
+        glActiveTexture is only issued when the binding itself has to change.
+        """
+        texture = int(texture)
+        if not self.__changed(("texture", unit, target), texture):
+            return False
+        self.__active_texture(unit)
+        gl.glBindTexture(target, texture)
+
+        return True
+
+    def enable(self, capability) -> bool:
+        if not self.__changed(("enabled", capability), True):
+            return False
+        gl.glEnable(capability)
+
+        return True
+
+    def disable(self, capability) -> bool:
+        if not self.__changed(("enabled", capability), False):
+            return False
+        gl.glDisable(capability)
+
+        return True
+
+    def set_enabled(self, capability, enabled: bool) -> bool:
+        return self.enable(capability) if enabled else self.disable(capability)
+
+    def is_enabled(self, capability) -> bool:
+        """Known value without a round trip to the driver, glIsEnabled otherwise."""
+        enabled = self.__state.get(("enabled", capability))
+        if enabled is None:
+            enabled = bool(gl.glIsEnabled(capability))
+            self.__state[("enabled", capability)] = enabled
+
+        return enabled
+
+    def polygon_mode(self, mode) -> bool:
+        if not self.__changed("polygon_mode", int(mode)):
+            return False
+        gl.glPolygonMode(gl.GL_FRONT_AND_BACK, mode)
+
+        return True
+
+    def clear_color(self, r: float, g: float, b: float, a: float = 1.0) -> bool:
+        if not self.__changed("clear_color", (float(r), float(g), float(b), float(a))):
+            return False
+        gl.glClearColor(r, g, b, a)
+
+        return True
+
+    def depth_func(self, func) -> bool:
+        if not self.__changed("depth_func", int(func)):
+            return False
+        gl.glDepthFunc(func)
+
+        return True
+
+    def depth_mask(self, write: bool) -> bool:
+        if not self.__changed("depth_mask", bool(write)):
+            return False
+        gl.glDepthMask(gl.GL_TRUE if write else gl.GL_FALSE)
+
+        return True
+
+    def blend_func(self, source, destination) -> bool:
+        if not self.__changed("blend_func", (int(source), int(destination))):
+            return False
+        gl.glBlendFunc(source, destination)
+
+        return True
+
+    def cull_face(self, mode) -> bool:
+        if not self.__changed("cull_face", int(mode)):
+            return False
+        gl.glCullFace(mode)
+
+        return True
+
+    def delete_program(self, program):
+        program = int(program)
+        gl.glDeleteProgram(program)
+        # A program deleted while in use stays current until another one is used
+        if self.__state.get("program") == program:
+            self.__state.pop("program")
+
+    def delete_vertex_arrays(self, vaos):
+        vaos = [int(vao) for vao in vaos]
+        gl.glDeleteVertexArrays(len(vaos), vaos)
+        # Deleting the bound VAO binds 0
+        if self.__state.get("vertex_array") in vaos:
+            self.__state["vertex_array"] = 0
+            self.__state.pop(("buffer", gl.GL_ELEMENT_ARRAY_BUFFER), None)
+
+    def delete_buffers(self, buffers):
+        buffers = [int(buffer) for buffer in buffers]
+        gl.glDeleteBuffers(len(buffers), buffers)
+        # Deleted names are unbound and may be handed out again
+        for key, value in list(self.__state.items()):
+            if isinstance(key, tuple) and key[0] == "buffer" and value in buffers:
+                self.__state[key] = 0
+
+    def delete_textures(self, textures):
+        textures = [int(texture) for texture in textures]
+        gl.glDeleteTextures(len(textures), textures)
+        for key, value in list(self.__state.items()):
+            if isinstance(key, tuple) and key[0] == "texture" and value in textures:
+                self.__state[key] = 0
+
+    def __active_texture(self, unit: int):
+        if self.__changed("active_texture", unit):
+            gl.glActiveTexture(gl.GL_TEXTURE0 + unit)
+
+    def __changed(self, key, value) -> bool:
+        """Record ``value`` and count the call: False if it is already the current value."""
+        if self.__state.get(key) == value:
+            self.stats.skipped += 1
+            self.stats.frame_skipped += 1
+            return False
+
+        self.__state[key] = value
+        self.__issued()
+
+        return True
+
+    def __issued(self):
+        self.stats.issued += 1
+        self.stats.frame_issued += 1
+
+
+_thread_state = threading.local()
+
+
+def default_state() -> GLState:
+    """
+    Tracker shared by all helpers, one per thread: a context is current on one thread,
+    so this is the tracker of the context the thread draws with.
+    """
+    state = getattr(_thread_state, "state", None)
+    if state is None:
+        state = _thread_state.state = GLState()
+
+    return state
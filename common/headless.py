@@ -0,0 +1,260 @@
+"""
+Offscreen OpenGL contexts for machines without a display.
+
+PyOpenGL picks its platform (GLX, EGL, OSMesa) once, when OpenGL is first imported, so
+:func:`select_platform` has to run before any ``import OpenGL`` / ``from OpenGL.GL import *``.
+Nothing in this module imports OpenGL at module level for that reason.
+"""
+import ctypes
+import os
+import sys
+import time
+
+import numpy as np
+
+BACKENDS = ("glfw", "egl", "osmesa")
+
+# PYOPENGL_PLATFORM value needed by each headless backend
+_PLATFORMS = {"egl": "egl", "osmesa": "osmesa"}
+
+
+def select_platform(backend: str):
+    """
+    Point PyOpenGL at the platform a backend needs. Must be called before OpenGL is imported.
+    :param backend: One of BACKENDS, "glfw" leaves the platform untouched
+    :return:
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+    if backend == "glfw":
+        return
+
+    platform = _PLATFORMS[backend]
+    if "OpenGL.platform" in sys.modules and os.environ.get("PYOPENGL_PLATFORM") != platform:
+        raise RuntimeError(f"OpenGL was imported before select_platform('{backend}'), "
+                           f"set PYOPENGL_PLATFORM={platform} or select the backend earlier")
+
+    os.environ["PYOPENGL_PLATFORM"] = platform
+    if backend == "egl":
+        # Mesa: no X11/Wayland connection, render into pbuffers/FBOs only
+        os.environ.setdefault("EGL_PLATFORM", "surfaceless")
+
+
+def platform_from_argv(default: str = "glfw") -> str:
+    """
+    Read ``--backend <name>`` from the command line and select its platform.
+    Meant for the top of example scripts, before their OpenGL imports.
+    :return: Backend name to pass to the Viewport constructor
+    """
+    backend = default
+    if "--backend" in sys.argv:
+        position = sys.argv.index("--backend")
+        if position + 1 < len(sys.argv):
+            backend = sys.argv[position + 1]
+    select_platform(backend)
+
+    return backend
+
+
+class HeadlessContext(object):
+    """
+    Core profile context without a window, rendering into its own RGBA8 + depth framebuffer.
+
+    "egl" uses a surfaceless EGL context (GPU drivers or Mesa llvmpipe), "osmesa" Mesa's
+    software OSMesa library. There is no swap chain, so no vsync and no window system
+    round trips: frames are produced as fast as the rasterizer allows.
+    """
+
+    def __init__(self, width: int, height: int, backend: str = "egl", samples: int = 0, version=(4, 3)):
+        """
+        Create the context, make it current and bind the framebuffer.
+        :param width: Framebuffer width
+        :param height: Framebuffer height
+        :param backend: "egl" or "osmesa", see select_platform()
+        :param samples: MSAA sample count, 0 for a single sampled target
+        :param version: Requested core profile (major, minor)
+        """
+        if backend not in _PLATFORMS:
+            raise ValueError(f"HeadlessContext backend must be one of {tuple(_PLATFORMS)}")
+        select_platform(backend)
+
+        self.width = width
+        self.height = height
+        self.backend = backend
+        self.samples = samples
+        self.fps = 0.0
+
+        self.__display = None
+        self.__context = None
+        self.__osmesa_buffer = None
+        if backend == "egl":
+            self.__create_egl(version)
+        else:
+            self.__create_osmesa(version)
+
+        self.__create_framebuffer()
+
+    @property
+    def framebuffer(self) -> int:
+        """Framebuffer every frame is drawn into, bound after construction."""
+        return self.__fbo
+
+    def make_current(self):
+        if self.backend == "egl":
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.__display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, self.__context)
+        else:
+            import OpenGL.GL as gl
+            from OpenGL import osmesa
+            osmesa.OSMesaMakeCurrent(self.__context, self.__osmesa_buffer, gl.GL_UNSIGNED_BYTE,
+                                     self.width, self.height)
+
+    def render_frames(self, draw, frames: int, capture=None) -> float:
+        """
+        Call ``draw()`` ``frames`` times into the framebuffer without any synchronisation
+        in between, then wait for the GPU once.
+        :param draw: Callable issuing the GL commands of one frame
+        :param frames: Number of frames
+        :param capture: Optional FrameCapture of the same size, every frame is written out
+        :return: Frames per second, also stored in ``fps``
+        """
+        import OpenGL.GL as gl
+
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
+        gl.glViewport(0, 0, self.width, self.height)
+
+        start = time.perf_counter()
+        for _ in range(frames):
+            draw()
+            if capture is not None:
+                capture.capture(self.__fbo)
+        if capture is not None:
+            capture.flush()
+        gl.glFinish()
+        elapsed = time.perf_counter() - start
+
+        self.fps = frames / elapsed if elapsed > 0.0 else 0.0
+        print(f"INFO::HEADLESS::{self.backend.upper()}::{frames} FRAMES::{elapsed:.3f}s::{self.fps:.1f} FPS")
+        if capture is not None:
+            print(capture.stats.report())
+
+        return self.fps
+
+    def read_pixels(self) -> np.ndarray:
+        """
+        Color buffer of the last frame.
+        :return: (height, width, 4) uint8 array, first row is the top of the image
+        """
+        import OpenGL.GL as gl
+
+        read_fbo = self.__fbo
+        if self.samples:
+            # Multisampled renderbuffers can not be read directly
+            gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, self.__fbo)
+            gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, self.__resolve_fbo)
+            gl.glBlitFramebuffer(0, 0, self.width, self.height, 0, 0, self.width, self.height,
+                                 gl.GL_COLOR_BUFFER_BIT, gl.GL_NEAREST)
+            read_fbo = self.__resolve_fbo
+
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, read_fbo)
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 1)
+        pixels = np.empty((self.height, self.width, 4), dtype=np.uint8)
+        gl.glReadPixels(0, 0, self.width, self.height, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, pixels)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
+
+        return pixels[::-1]
+
+    def delete(self):
+        import OpenGL.GL as gl
+
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, 0)
+        gl.glDeleteRenderbuffers(len(self.__renderbuffers), self.__renderbuffers)
+        gl.glDeleteFramebuffers(len(self.__framebuffers), self.__framebuffers)
+
+        if self.backend == "egl":
+            from OpenGL import EGL
+            EGL.eglMakeCurrent(self.__display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, EGL.EGL_NO_CONTEXT)
+            EGL.eglDestroyContext(self.__display, self.__context)
+            EGL.eglTerminate(self.__display)
+        else:
+            from OpenGL import osmesa
+            osmesa.OSMesaDestroyContext(self.__context)
+        self.__context = None
+
+    def __create_egl(self, version):
+        from OpenGL import EGL
+
+        display = EGL.eglGetDisplay(EGL.EGL_DEFAULT_DISPLAY)
+        if display == EGL.EGL_NO_DISPLAY or not EGL.eglInitialize(display, None, None):
+            raise RuntimeError("EGL display can not be initialized")
+
+        config = EGL.EGLConfig()
+        config_count = EGL.EGLint()
+        config_attributes = (EGL.EGLint * 5)(EGL.EGL_SURFACE_TYPE, EGL.EGL_PBUFFER_BIT,
+                                             EGL.EGL_RENDERABLE_TYPE, EGL.EGL_OPENGL_BIT,
+                                             EGL.EGL_NONE)
+        EGL.eglChooseConfig(display, config_attributes, ctypes.pointer(config), 1, ctypes.pointer(config_count))
+        if config_count.value == 0:
+            raise RuntimeError("EGL has no config for desktop OpenGL")
+
+        EGL.eglBindAPI(EGL.EGL_OPENGL_API)
+        context_attributes = (EGL.EGLint * 7)(EGL.EGL_CONTEXT_MAJOR_VERSION, version[0],
+                                              EGL.EGL_CONTEXT_MINOR_VERSION, version[1],
+                                              EGL.EGL_CONTEXT_OPENGL_PROFILE_MASK,
+                                              EGL.EGL_CONTEXT_OPENGL_CORE_PROFILE_BIT,
+                                              EGL.EGL_NONE)
+        context = EGL.eglCreateContext(display, config, EGL.EGL_NO_CONTEXT, context_attributes)
+        if context == EGL.EGL_NO_CONTEXT:
+            raise RuntimeError(f"EGL can not create an OpenGL {version[0]}.{version[1]} core context")
+
+        self.__display = display
+        self.__context = context
+        # Surfaceless (EGL_KHR_surfaceless_context): all rendering goes to our framebuffer
+        if not EGL.eglMakeCurrent(display, EGL.EGL_NO_SURFACE, EGL.EGL_NO_SURFACE, context):
+            raise RuntimeError("EGL context can not be made current without a surface")
+
+    def __create_osmesa(self, version):
+        from OpenGL import arrays, osmesa
+
+        attributes = arrays.GLintArray.asArray([osmesa.OSMESA_FORMAT, osmesa.OSMESA_RGBA,
+                                                osmesa.OSMESA_DEPTH_BITS, 24,
+                                                osmesa.OSMESA_PROFILE, osmesa.OSMESA_CORE_PROFILE,
+                                                osmesa.OSMESA_CONTEXT_MAJOR_VERSION, version[0],
+                                                osmesa.OSMESA_CONTEXT_MINOR_VERSION, version[1],
+                                                0])
+        context = osmesa.OSMesaCreateContextAttribs(attributes, None)
+        if not context:
+            raise RuntimeError(f"OSMesa can not create an OpenGL {version[0]}.{version[1]} core context")
+
+        # OSMesa always needs a client memory buffer, even though we draw into an FBO
+        self.__context = context
+        self.__osmesa_buffer = arrays.GLubyteArray.zeros((self.height, self.width, 4))
+        self.make_current()
+
+    def __create_framebuffer(self):
+        import OpenGL.GL as gl
+
+        self.__framebuffers = [int(fbo) for fbo in np.atleast_1d(gl.glGenFramebuffers(2))]
+        self.__fbo, self.__resolve_fbo = self.__framebuffers
+        self.__renderbuffers = [int(rbo) for rbo in np.atleast_1d(gl.glGenRenderbuffers(3))]
+        color, depth, resolve = self.__renderbuffers
+
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
+        for renderbuffer, internal_format, attachment in ((color, gl.GL_RGBA8, gl.GL_COLOR_ATTACHMENT0),
+                                                          (depth, gl.GL_DEPTH24_STENCIL8,
+                                                           gl.GL_DEPTH_STENCIL_ATTACHMENT)):
+            gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, renderbuffer)
+            gl.glRenderbufferStorageMultisample(gl.GL_RENDERBUFFER, self.samples, internal_format,
+                                                self.width, self.height)
+            gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, attachment, gl.GL_RENDERBUFFER, renderbuffer)
+        if gl.glCheckFramebufferStatus(gl.GL_FRAMEBUFFER) != gl.GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError("Headless framebuffer is incomplete")
+
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__resolve_fbo)
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, resolve)
+        gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_RGBA8, self.width, self.height)
+        gl.glFramebufferRenderbuffer(gl.GL_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_RENDERBUFFER, resolve)
+
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, 0)
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
+        gl.glViewport(0, 0, self.width, self.height)
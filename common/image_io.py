@@ -0,0 +1,338 @@
+"""
+Images without an imaging library: PNG with zlib, raw dumps and KTX (version 1) containers.
+
+KTX stores GL texture data as it is uploaded: format enums, every mip level, and
+compressed blocks (BC1/BC3...) as they are. read_ktx() maps the levels with np.memmap
+like read_mesh() does for meshes, nothing is decoded. PNG files are inflated and
+unfiltered in numpy, still some 100x slower than mapping a .ktx: convert large images once,
+
+    python -m common.texture_compression image.png image.ktx
+"""
+import struct
+import zlib
+
+import numpy as np
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# PNG color type by channel count: gray, gray + alpha, RGB, RGBA
+_COLOR_TYPES = {1: 0, 2: 4, 3: 2, 4: 6}
+# Channel count by PNG color type, palette images become RGB or RGBA
+_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+KTX_IDENTIFIER = b"\xabKTX 11\xbb\r\n\x1a\n"
+KTX_ENDIANNESS = 0x04030201
+# endianness, glType, glTypeSize, glFormat, glInternalFormat, glBaseInternalFormat,
+# width, height, depth, array elements, faces, mip levels, key/value bytes
+KTX_HEADER = struct.Struct("<12s13I")
+# GL enums stored in KTX headers
+GL_UNSIGNED_BYTE = 0x1401
+GL_RED, GL_RG, GL_RGB, GL_RGBA = 0x1903, 0x8227, 0x1907, 0x1908
+KTX_CHANNELS = {GL_RED: 1, GL_RG: 2, GL_RGB: 3, GL_RGBA: 4}
+# Compressed internal formats -> bytes per 4x4 block: BC1 (DXT1), BC2 (DXT3), BC3 (DXT5),
+# their sRGB variants, BC4, BC5 and BC7
+KTX_BLOCK_BYTES = {0x83F0: 8, 0x83F1: 8, 0x83F2: 16, 0x83F3: 16,
+                   0x8C4C: 8, 0x8C4D: 8, 0x8C4E: 16, 0x8C4F: 16,
+                   0x8DBB: 8, 0x8DBC: 8, 0x8DBD: 16, 0x8DBE: 16,
+                   0x8E8C: 16, 0x8E8D: 16}
+
+
+class KtxImage(object):
+    """
+    2D texture data with all its mip levels, as stored in a KTX file.
+
+    Uncompressed levels are (height, width, channels) uint8, compressed levels are
+    (block rows, block columns, block bytes) uint8, both row 0 at the bottom as GL
+    expects them. ``pixel_format`` is the glFormat of uncompressed data, 0 when compressed.
+    """
+
+    def __init__(self, internal_format: int, pixel_format: int, width: int, height: int, levels: list):
+        self.internal_format = internal_format
+        self.pixel_format = pixel_format
+        self.width = width
+        self.height = height
+        self.levels = levels
+
+    @property
+    def compressed(self) -> bool:
+        return self.pixel_format == 0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(level.nbytes for level in self.levels)
+
+    def level_size(self, level: int) -> tuple:
+        """(width, height) in texels of mip ``level``."""
+        return max(1, self.width >> level), max(1, self.height >> level)
+
+
+def read_png(path: str) -> np.ndarray:
+    """
+    Decode a non-interlaced 8 or 16-bit PNG, zlib releases the GIL while inflating.
+    16-bit samples are reduced to 8 bits, palette images expanded to RGB (RGBA with tRNS).
+    :param path: PNG file
+    :return: (height, width, channels) uint8, first row is the top of the image
+    """
+    with open(path, "rb") as file:
+        data = file.read()
+    if data[:8] != PNG_SIGNATURE:
+        raise ValueError(f"{path} is not a PNG file")
+
+    header, palette, transparency, compressed = None, None, None, []
+    position = 8
+    while position < len(data):
+        length, tag = struct.unpack_from(">I4s", data, position)
+        body = data[position + 8:position + 8 + length]
+        position += 12 + length
+        if tag == b"IHDR":
+            header = struct.unpack(">IIBBBBB", body)
+        elif tag == b"PLTE":
+            palette = np.frombuffer(body, dtype=np.uint8).reshape(-1, 3)
+        elif tag == b"tRNS":
+            transparency = np.frombuffer(body, dtype=np.uint8)
+        elif tag == b"IDAT":
+            compressed.append(body)
+        elif tag == b"IEND":
+            break
+
+    width, height, depth, color_type, _, _, interlace = header
+    if depth not in (8, 16) or (color_type == 3 and depth != 8) or color_type not in _CHANNELS:
+        raise ValueError(f"{path}: {depth}-bit PNG color type {color_type} is not supported")
+    if interlace:
+        raise ValueError(f"{path}: interlaced PNG is not supported")
+
+    channels = _CHANNELS[color_type]
+    pixel_bytes = channels * depth // 8
+    rows = np.frombuffer(zlib.decompress(b"".join(compressed)), dtype=np.uint8).reshape(height, -1)
+    pixels = _unfilter(rows[:, 1:], rows[:, 0], pixel_bytes)
+
+    if depth == 16:
+        # Big-endian samples, the high byte is the 8-bit value
+        pixels = pixels.reshape(height, width, channels, 2)[..., 0]
+    pixels = pixels.reshape(height, width, channels)
+    if color_type == 3:
+        colors = palette
+        if transparency is not None:
+            alpha = np.full(len(palette), 255, dtype=np.uint8)
+            alpha[:len(transparency)] = transparency[:len(palette)]
+            colors = np.concatenate((palette, alpha[:, None]), axis=1)
+        pixels = colors[pixels[:, :, 0]]
+
+    return pixels
+
+
+def read_raw(path: str, width: int, height: int, channels: int, dtype=np.uint8) -> np.ndarray:
+    """
+    Map a file written by write_raw() (or any headerless dump) without reading it.
+    :return: (height, width, channels) array backed by the file
+    """
+    return np.memmap(path, dtype=dtype, mode="r", shape=(height, width, channels))
+
+
+def read_ktx(path: str) -> KtxImage:
+    """
+    Open a 2D KTX file, every mip level memory-mapped. Array, cube map and 3D textures are
+    not supported, uncompressed data must be unsigned bytes.
+    """
+    with open(path, "rb") as file:
+        header = KTX_HEADER.unpack(file.read(KTX_HEADER.size))
+    (identifier, endianness, gl_type, _, pixel_format, internal_format, _,
+     width, height, depth, elements, faces, level_count, key_value_bytes) = header
+    if identifier != KTX_IDENTIFIER or endianness != KTX_ENDIANNESS:
+        raise ValueError(f"{path} is not a little-endian KTX 1 file")
+    if depth > 1 or elements > 0 or faces != 1 or height == 0:
+        raise ValueError(f"{path}: only 2D textures are supported")
+    if pixel_format != 0 and (gl_type != GL_UNSIGNED_BYTE or pixel_format not in KTX_CHANNELS):
+        raise ValueError(f"{path}: glFormat {pixel_format:#x} / glType {gl_type:#x} is not supported")
+    if pixel_format == 0 and internal_format not in KTX_BLOCK_BYTES:
+        raise ValueError(f"{path}: compressed format {internal_format:#x} is not supported")
+
+    image = KtxImage(internal_format, pixel_format, width, height, [])
+    mapped = np.memmap(path, dtype=np.uint8, mode="r")
+    offset = KTX_HEADER.size + key_value_bytes
+    for level in range(max(level_count, 1)):
+        size = int(mapped[offset:offset + 4].view("<u4")[0])
+        block = mapped[offset + 4:offset + 4 + size]
+        level_width, level_height = image.level_size(level)
+        if image.compressed:
+            block_bytes = KTX_BLOCK_BYTES[internal_format]
+            image.levels.append(block.reshape((level_height + 3) // 4, (level_width + 3) // 4, block_bytes))
+        else:
+            channels = KTX_CHANNELS[pixel_format]
+            # Rows are padded to 4 bytes, the padding stays in the mapping
+            stride = _align(level_width * channels, 4)
+            image.levels.append(block.reshape(level_height, stride)[:, :level_width * channels]
+                                .reshape(level_height, level_width, channels))
+        offset += 4 + _align(size, 4)
+
+    return image
+
+
+def write_ktx(path: str, image: KtxImage, base_internal_format: int = None):
+    """
+    Store a KtxImage as a KTX 1 file, read_ktx() maps it back.
+    :param base_internal_format: glBaseInternalFormat, GL_RGBA for compressed data and the
+                                 pixel format otherwise if None
+    """
+    if base_internal_format is None:
+        base_internal_format = GL_RGBA if image.compressed else image.pixel_format
+    gl_type, type_size = (0, 1) if image.compressed else (GL_UNSIGNED_BYTE, 1)
+
+    with open(path, "wb") as file:
+        file.write(KTX_HEADER.pack(KTX_IDENTIFIER, KTX_ENDIANNESS, gl_type, type_size, image.pixel_format,
+                                   image.internal_format, base_internal_format, image.width, image.height,
+                                   0, 0, 1, len(image.levels), 0))
+        for level in image.levels:
+            level = np.ascontiguousarray(level, dtype=np.uint8)
+            if not image.compressed:
+                height, width, channels = level.shape
+                padded = np.zeros((height, _align(width * channels, 4)), dtype=np.uint8)
+                padded[:, :width * channels] = level.reshape(height, -1)
+                level = padded
+            file.write(struct.pack("<I", level.nbytes))
+            file.write(level.data)
+            file.write(b"\0" * (_align(level.nbytes, 4) - level.nbytes))
+
+
+def write_png(path: str, pixels: np.ndarray, level: int = 1, paeth: bool = False):
+    """
+    Encode an 8-bit image as PNG with zlib only, no imaging library needed.
+    zlib releases the GIL, so several files can be encoded from a thread pool in parallel.
+    :param path: Output file
+    :param pixels: (height, width, channels) uint8, first row is the top of the image
+    :param level: zlib compression level, low levels favour throughput over size
+    :param paeth: Paeth filter every row, smaller files of photos, as most encoders write them
+    :return:
+    """
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    height, width, channels = pixels.shape
+
+    # Every scanline starts with its filter type, 0 = none
+    scanlines = np.zeros((height, width * channels + 1), dtype=np.uint8)
+    scanlines[:, 1:] = pixels.reshape(height, -1)
+    if paeth:
+        # Predicted from the unfiltered neighbours, zeros beyond the border
+        padded = np.zeros((height + 1, width + 1, channels), dtype=np.int16)
+        padded[1:, 1:] = pixels
+        predictor = _paeth(padded[1:, :-1], padded[:-1, 1:], padded[:-1, :-1])
+        scanlines[:, 1:] = ((padded[1:, 1:] - predictor) & 0xff).reshape(height, -1)
+        scanlines[:, 0] = 4
+
+    header = struct.pack(">IIBBBBB", width, height, 8, _color_type(channels), 0, 0, 0)
+    with open(path, "wb") as file:
+        file.write(PNG_SIGNATURE)
+        file.write(_chunk(b"IHDR", header))
+        file.write(_chunk(b"IDAT", zlib.compress(scanlines.data, level)))
+        file.write(_chunk(b"IEND", b""))
+
+
+def write_raw(path: str, pixels: np.ndarray):
+    """
+    Dump pixels as they are, row after row from the top. Width, height and channel count
+    are not stored, readers have to know them (e.g. ffmpeg -f rawvideo -s WxH -pix_fmt rgba).
+    """
+    with open(path, "wb") as file:
+        file.write(np.ascontiguousarray(pixels).data)
+
+
+def _unfilter(filtered: np.ndarray, filters: np.ndarray, pixel_bytes: int) -> np.ndarray:
+    """Undo the PNG filter of every scanline, each row depends on the one above."""
+    height, stride = filtered.shape
+    rows = np.zeros((height + 1, stride), dtype=np.uint8)
+    for row, kind in enumerate(filters.tolist(), 1):
+        line, prior = filtered[row - 1], rows[row - 1]
+        if kind == 0:
+            rows[row] = line
+        elif kind == 1:
+            # Sub: running sum per channel, uint8 accumulation wraps around like the filter
+            rows[row] = np.cumsum(line.reshape(-1, pixel_bytes), axis=0, dtype=np.uint8).reshape(-1)
+        elif kind == 2:
+            rows[row] = line + prior
+        elif kind in (3, 4):
+            # From the first Average / Paeth row on, all rows go through the wavefront at once
+            rows[row:] = _unfilter_wavefront(filtered[row - 1:], filters[row - 1:], prior, pixel_bytes)
+            break
+        else:
+            raise ValueError(f"Unknown PNG filter type {kind}")
+
+    return rows[1:]
+
+
+def _unfilter_wavefront(filtered: np.ndarray, kinds: np.ndarray, prior: np.ndarray, pixel_bytes: int) -> np.ndarray:
+    """
+    Average (3) and Paeth (4) need the decoded byte to the left, so a row can not be
+    decoded in one numpy step. A pixel only depends on the pixels to its left, above and
+    above left though: all pixels of one anti-diagonal are decoded together, width + height
+    numpy steps for the whole image instead of one Python step per byte. Rows of the
+    other filter types in between are decoded along with them.
+    :param filtered: (rows, stride) filtered bytes
+    :param kinds: (rows,) filter type per row
+    :param prior: (stride,) decoded row above the first one, zeros at the top of the image
+    :return: (rows, stride) uint8
+    """
+    height, stride = filtered.shape
+    width = stride // pixel_bytes
+    if not np.isin(kinds, (0, 1, 2, 3, 4)).all():
+        raise ValueError(f"Unknown PNG filter type {int(kinds[~np.isin(kinds, (0, 1, 2, 3, 4))][0])}")
+
+    # Diagonal-major storage, every diagonal is contiguous: pixel (r, c) at [r + c + 1, r + 1],
+    # the prior row is row -1. Diagonal d is written to [d + 1], the left and upper neighbours
+    # of its pixels are in [d], the upper left ones in [d - 1]. Cells left of a row's first
+    # pixel stay 0, the border PNG assumes
+    diagonals = np.zeros((width + height + 1, height + 1, pixel_bytes), dtype=np.int16)
+    diagonals[:width, 0] = prior.reshape(width, pixel_bytes)
+    step, row_step, item = diagonals.strides
+    pixels = np.lib.stride_tricks.as_strided(diagonals[1:, 1:], (height, width, pixel_bytes),
+                                             (step + row_step, step, item))
+    source = np.zeros((width + height, height, pixel_bytes), dtype=np.int16)
+    step, row_step, item = source.strides
+    np.lib.stride_tricks.as_strided(source, (height, width, pixel_bytes),
+                                    (step + row_step, step, item))[:] = filtered.reshape(height, width, pixel_bytes)
+
+    kinds = np.asarray(kinds)[:, None]
+    present = set(np.unique(kinds).tolist())
+    for diagonal in range(width + height - 1):
+        # Rows whose pixel on this diagonal exists
+        first, last = max(0, diagonal - width + 1), min(height, diagonal + 1)
+        left = diagonals[diagonal, first + 1:last + 1]
+        up = diagonals[diagonal, first:last]
+        kind = kinds[first:last]
+        predictor = np.zeros_like(up)
+        if 4 in present:
+            paeth = _paeth(left, up, diagonals[diagonal - 1, first:last] if diagonal else predictor)
+            predictor = paeth if present == {4} else np.where(kind == 4, paeth, predictor)
+        if 3 in present:
+            predictor = np.where(kind == 3, (left + up) >> 1, predictor)
+        if 2 in present:
+            predictor = np.where(kind == 2, up, predictor)
+        if 1 in present:
+            predictor = np.where(kind == 1, left, predictor)
+        diagonals[diagonal + 1, first + 1:last + 1] = (source[diagonal, first:last] + predictor) & 0xff
+
+    return pixels.astype(np.uint8).reshape(height, stride)
+
+
+def _paeth(left: np.ndarray, up: np.ndarray, upper_left: np.ndarray) -> np.ndarray:
+    """Paeth predictor of int16 bytes: the neighbour closest to left + up - upper_left."""
+    from_left, from_up = left - upper_left, up - upper_left
+    distance_left, distance_up = np.abs(from_up), np.abs(from_left)
+    distance_corner = np.abs(from_left + from_up)
+
+    return np.where((distance_left <= distance_up) & (distance_left <= distance_corner), left,
+                    np.where(distance_up <= distance_corner, up, upper_left))
+
+
+def _align(value: int, alignment: int) -> int:
+    return (value + alignment - 1) // alignment * alignment
+
+
+def _color_type(channels: int) -> int:
+    if channels not in _COLOR_TYPES:
+        raise ValueError(f"PNG can not store {channels} channels")
+
+    return _COLOR_TYPES[channels]
+
+
+def _chunk(tag: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
@@ -0,0 +1,138 @@
+import numpy as np
+import OpenGL.GL as gl
+
+from . import matrices
+from .gl_state import default_state
+from .render_queue import PASS_OPAQUE, PASS_TRANSPARENT
+from .shader_program import ShaderProgram
+from .vertex_format import VertexFormat
+
+
+class QuadGrid(object):
+    """
+    Ground plane grid drawn as a textured quad scaled to ``size`` world units.
+
+    The fragment shader tests the texture coordinates against the line pattern and discards
+    everything between the lines. Cheap per pixel and shaded once per pixel with MSAA (the
+    texture coordinates are not interpolated per sample), but the lines alias in the distance.
+    The viewport's default grid, see InfiniteGrid for the analytic one.
+    """
+
+    def __init__(self, path_vertex: str, path_fragment: str, size: float = 1000.0, cache=None):
+        """
+        Upload the quad and compile the grid program. Needs a current context.
+        :param path_vertex: Path to quad grid vertex shader
+        :param path_fragment: Path to quad grid fragment shader
+        :param size: World size of the quad
+        :param cache: Optional ProgramCache for the grid program
+        """
+        vertex_format = VertexFormat(np.dtype([("position", np.float32, (3,)), ("texcoord", np.float32, (2,))]))
+        vertices = np.array([((0.5, 0.5, 0.0), (1.0, 1.0)),
+                             ((0.5, -0.5, 0.0), (1.0, 0.0)),
+                             ((-0.5, -0.5, 0.0), (0.0, 0.0)),
+                             ((-0.5, 0.5, 0.0), (0.0, 1.0))], dtype=vertex_format.dtype)
+        indices = np.array([0, 1, 3, 1, 2, 3], dtype=np.uint16)
+
+        self.vao = gl.glGenVertexArrays(1)
+        self.vbo, self.ebo = gl.glGenBuffers(2)
+        default_state().bind_vertex_array(self.vao)
+        default_state().bind_buffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, vertices.nbytes, vertices, gl.GL_STATIC_DRAW)
+        default_state().bind_buffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, gl.GL_STATIC_DRAW)
+        vertex_format.bind()
+        self.program = ShaderProgram.from_files(path_vertex, path_fragment, cache=cache)
+        default_state().bind_vertex_array(0)
+
+        # Lies in the XZ plane
+        self.model = (matrices.rotation(matrices.quaternion_from_axis_angle((1.0, 0.0, 0.0), 90.0))
+                      @ matrices.scaling(size))
+        # World AABB (lower, upper) for frustum culling
+        self.bounds = (np.array((-0.5 * size, 0.0, -0.5 * size)), np.array((0.5 * size, 0.0, 0.5 * size)))
+
+    def draw(self):
+        self.program.use()
+        self.bind()
+        default_state().bind_vertex_array(self.vao)
+        gl.glDrawElements(gl.GL_TRIANGLES, 6, gl.GL_UNSIGNED_SHORT, None)
+
+    def submit(self, queue, pass_id: int = PASS_OPAQUE):
+        """Queue the grid in a RenderQueue, the grid is its own material."""
+        queue.submit(self.program, self.vao, 6, index_type=gl.GL_UNSIGNED_SHORT, material=self, pass_id=pass_id)
+
+    def bind(self):
+        """Model matrix of the grid. The grid program must be in use."""
+        self.program.set_matrix4("u_modelMatrix", self.model, transpose=True)
+
+    def delete(self):
+        default_state().delete_vertex_arrays([self.vao])
+        default_state().delete_buffers([self.vbo, self.ebo])
+
+
+class InfiniteGrid(object):
+    """
+    Ground plane grid drawn as one quad on y = 0, centered under the eye.
+
+    The vertex shader builds the quad from gl_VertexID and the camera uniform block, sized
+    to the distance where the lines fade out. The rasterizer clips it to the frustum and
+    interpolates depth, the fragment shader never writes gl_FragDepth, so early depth
+    testing stays on. It draws derivative (fwidth) anti-aliased lines and fades them with
+    distance and between LOD levels. Unlike the scaled quad grid it shades each pixel once,
+    even with MSAA, and never discards.
+
+    Draw it after opaque geometry: it is depth tested but leaves the depth buffer alone,
+    so objects below the plane stay visible between the lines.
+    """
+
+    def __init__(self, path_vertex: str, path_fragment: str, cell_size: float = 1.0,
+                 min_cell_pixels: float = 8.0, fade_distance: float = 150.0, cache=None):
+        """
+        Compile the grid program. Needs a current context.
+        :param path_vertex: Path to grid vertex shader
+        :param path_fragment: Path to grid fragment shader
+        :param cell_size: World size of the finest grid level
+        :param min_cell_pixels: A level fades out before its cells get smaller than this on screen
+        :param fade_distance: Distance from the eye where lines disappear
+        :param cache: Optional ProgramCache for the grid program
+        """
+        self.cell_size = cell_size
+        self.min_cell_pixels = min_cell_pixels
+        self.fade_distance = fade_distance
+        # No fixed bounds to cull, the quad follows the eye and is always under it
+        self.bounds = None
+
+        # Core profile needs a bound VAO even when no attribute is read
+        self.vao = gl.glGenVertexArrays(1)
+        default_state().bind_vertex_array(self.vao)
+        self.program = ShaderProgram.from_files(path_vertex, path_fragment, cache=cache)
+        default_state().bind_vertex_array(0)
+
+    def draw(self):
+        self.program.use()
+        self.bind()
+        default_state().bind_vertex_array(self.vao)
+        gl.glDrawArrays(gl.GL_TRIANGLES, 0, 6)
+        self.unbind()
+
+    def submit(self, queue, pass_id: int = PASS_TRANSPARENT):
+        """Queue the grid in a RenderQueue, the grid is its own material."""
+        queue.submit(self.program, self.vao, 6, index_type=None, material=self, pass_id=pass_id)
+
+    def bind(self):
+        """Blend state and uniforms of the grid. The grid program must be in use."""
+        state = default_state()
+        state.enable(gl.GL_BLEND)
+        state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        state.depth_mask(False)
+
+        self.program.set_float("u_cellSize", self.cell_size)
+        self.program.set_float("u_minCellPixels", self.min_cell_pixels)
+        self.program.set_float("u_fadeDistance", self.fade_distance)
+
+    def unbind(self):
+        state = default_state()
+        state.depth_mask(True)
+        state.disable(gl.GL_BLEND)
+
+    def delete(self):
+        default_state().delete_vertex_arrays([self.vao])
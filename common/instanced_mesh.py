@@ -0,0 +1,124 @@
+import ctypes
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_state import default_state
+from .render_queue import PASS_OPAQUE
+
+
+class InstancedMesh(object):
+    """
+    Indexed mesh drawn many times with one glDrawElementsInstanced call.
+
+    Per-instance data lives in a second VBO read with glVertexAttribDivisor(1):
+
+        layout (location = 2) in mat4 a_modelMatrix;   // occupies locations 2..5
+        layout (location = 6) in vec4 a_color;
+
+    Model matrices are expected in OpenGL (column-major) layout, i.e. exactly what
+    TransformBatch.models holds, so they are copied into the buffer as they are.
+    """
+
+    MODEL_LOCATION = 2
+    COLOR_LOCATION = 6
+
+    def __init__(self, vertices: np.ndarray, indices: np.ndarray, max_instances: int,
+                 attributes=((0, 3, 0),), stride: int = 3 * 4):
+        """
+        Create VAO, vertex/index buffers and the per-instance buffer. Needs a current context.
+        :param vertices: Interleaved float32 vertex data
+        :param indices: uint32 triangle indices
+        :param max_instances: Capacity of the per-instance buffer
+        :param attributes: Per-vertex attributes as (location, float count, byte offset)
+        :param stride: Size of one vertex in bytes
+        """
+        self.max_instances = max_instances
+        self.index_count = len(indices)
+        self.instance_count = 0
+
+        vertices = np.ascontiguousarray(vertices, dtype=np.float32)
+        indices = np.ascontiguousarray(indices, dtype=np.uint32)
+
+        self.vao = gl.glGenVertexArrays(1)
+        self.vbo, self.ebo, self.instance_vbo = gl.glGenBuffers(3)
+
+        state = default_state()
+        state.bind_vertex_array(self.vao)
+
+        state.bind_buffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, vertices.nbytes, vertices, gl.GL_STATIC_DRAW)
+        for location, size, offset in attributes:
+            gl.glEnableVertexAttribArray(location)
+            gl.glVertexAttribPointer(location, size, gl.GL_FLOAT, gl.GL_FALSE, stride, ctypes.c_void_p(offset))
+
+        state.bind_buffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, gl.GL_STATIC_DRAW)
+
+        # Instance buffer: all matrices first, then all colors
+        self.__colors_offset = max_instances * 16 * 4
+        state.bind_buffer(gl.GL_ARRAY_BUFFER, self.instance_vbo)
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, self.__colors_offset + max_instances * 4 * 4, None, gl.GL_DYNAMIC_DRAW)
+
+        for column in range(4):
+            location = self.MODEL_LOCATION + column
+            gl.glEnableVertexAttribArray(location)
+            gl.glVertexAttribPointer(location, 4, gl.GL_FLOAT, gl.GL_FALSE, 16 * 4, ctypes.c_void_p(column * 4 * 4))
+            gl.glVertexAttribDivisor(location, 1)
+
+        gl.glEnableVertexAttribArray(self.COLOR_LOCATION)
+        gl.glVertexAttribPointer(self.COLOR_LOCATION, 4, gl.GL_FLOAT, gl.GL_FALSE, 4 * 4,
+                                 ctypes.c_void_p(self.__colors_offset))
+        gl.glVertexAttribDivisor(self.COLOR_LOCATION, 1)
+
+        state.bind_vertex_array(0)
+
+        self.set_colors(np.ones((max_instances, 4), dtype=np.float32))
+
+    def set_models(self, models: np.ndarray):
+        """
+        Upload per-instance model matrices and set the instance count.
+        :param models: (K, 4, 4) float32 in GL layout, K <= max_instances
+        :return:
+        """
+        models = np.ascontiguousarray(models, dtype=np.float32)
+        if len(models) > self.max_instances:
+            raise ValueError(f"InstancedMesh holds at most {self.max_instances} instances")
+
+        default_state().bind_buffer(gl.GL_ARRAY_BUFFER, self.instance_vbo)
+        gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, models.nbytes, models)
+        self.instance_count = len(models)
+
+    def set_colors(self, colors: np.ndarray, first: int = 0):
+        """
+        Upload per-instance RGBA colors.
+        :param colors: (K, 4) float32
+        :param first: Index of the first instance to overwrite
+        :return:
+        """
+        colors = np.ascontiguousarray(colors, dtype=np.float32)
+
+        default_state().bind_buffer(gl.GL_ARRAY_BUFFER, self.instance_vbo)
+        gl.glBufferSubData(gl.GL_ARRAY_BUFFER, self.__colors_offset + first * 4 * 4, colors.nbytes, colors)
+
+    def draw(self, count: int = None):
+        """
+        Draw ``count`` instances (all uploaded ones by default) in a single call.
+        The program must be in use.
+        """
+        count = self.instance_count if count is None else count
+        if count == 0:
+            return
+
+        default_state().bind_vertex_array(self.vao)
+        gl.glDrawElementsInstanced(gl.GL_TRIANGLES, self.index_count, gl.GL_UNSIGNED_INT, None, count)
+
+    def submit(self, queue, program, count: int = None, material=None, pass_id: int = PASS_OPAQUE,
+               depth: float = 0.0):
+        """Queue the same draw as draw() in a RenderQueue."""
+        queue.submit(program, self.vao, self.index_count, instances=self.instance_count if count is None else count,
+                     material=material, pass_id=pass_id, depth=depth)
+
+    def delete(self):
+        default_state().delete_vertex_arrays([self.vao])
+        default_state().delete_buffers([self.vbo, self.ebo, self.instance_vbo])
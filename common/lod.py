@@ -0,0 +1,379 @@
+"""
+Level of detail: simplified index buffers of a mesh and per-object level selection.
+
+build_lods() simplifies with quadric error metrics in the vectorized form of vertex
+clustering (P. Lindstrom: Out-of-Core Simplification of Large Polygonal Models, 2000):
+every vertex gets the area-weighted plane quadrics of its triangles, vertices are
+grouped in a grid, and each cell collapses onto its vertex with the lowest error under
+the summed quadric. The grid is refined until the triangle budget of a level is met.
+Levels only pick existing vertices, so all of them index one shared vertex buffer and
+LodMesh stores them back to back in one index buffer: switching level is an offset.
+
+Each level has a geometric error from the quadrics: over all cells, the largest root mean
+square distance of the cell's representative to the planes of the triangles it replaces.
+Vertices sliding within a flat region cost nothing, unlike the distance they moved.
+select_levels() projects it to pixels and picks the coarsest level below a pixel
+threshold, with hysteresis so objects at a boundary distance do not flip between levels
+every frame.
+"""
+import ctypes
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_state import default_state
+from .mesh import UPLOAD_CHUNK, buffer_upload_steps
+from .mesh_io import MeshData, index_dtype
+from .mesh_optimizer import optimize_vertex_cache
+from .render_queue import PASS_OPAQUE
+from .vertex_format import INDEX_TYPES, VertexFormat
+
+# Triangle budgets of the generated levels relative to the full mesh
+LOD_RATIOS = (0.5, 0.25, 0.1, 0.03, 0.01)
+# Finest grid tried while searching for a triangle budget, cells per axis
+MAX_RESOLUTION = 1024
+
+
+class LodStats(object):
+    """Triangles drawn with the selected levels against drawing every object at full detail."""
+
+    def __init__(self):
+        self.objects = 0
+        self.triangles = 0
+        self.full_triangles = 0
+        self.switches = 0
+
+    def report(self) -> str:
+        ratio = self.full_triangles / self.triangles if self.triangles else 0.0
+
+        return (f"INFO::LOD::{self.objects} OBJECTS::TRIANGLES {self.triangles} OF {self.full_triangles}"
+                f" ({ratio:.1f}x fewer)::SWITCHES::{self.switches}")
+
+
+def vertex_quadrics(positions: np.ndarray, indices: np.ndarray) -> np.ndarray:
+    """
+    (V, 10) upper triangles of the 4x4 error quadrics: the sum over the triangles around
+    each vertex of area * p p^T, p = (a, b, c, d) the triangle's plane.
+    """
+    corners = positions[indices.reshape(-1, 3)]
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    lengths = np.linalg.norm(normals, axis=1)
+    valid = lengths > 0.0
+    normals[valid] /= lengths[valid, None]
+    planes = np.concatenate((normals, -(normals * corners[:, 0]).sum(axis=1)[:, None]), axis=1)
+    area = lengths * 0.5
+
+    rows, columns = np.triu_indices(4)
+    per_triangle = planes[:, rows] * planes[:, columns] * area[:, None]
+    vertices = indices.reshape(-1).astype(np.int64)
+    quadrics = np.empty((len(positions), 10))
+    for component in range(10):
+        quadrics[:, component] = np.bincount(vertices, weights=np.repeat(per_triangle[:, component], 3),
+                                             minlength=len(positions))
+
+    return quadrics
+
+
+def simplify(positions: np.ndarray, indices: np.ndarray, target_triangles: int, quadrics: np.ndarray = None) -> tuple:
+    """
+    Reduce a triangle list to at most ``target_triangles`` by quadric-weighted clustering.
+    :param positions: (V, 3) vertex positions
+    :param indices: Triangle list into positions
+    :param target_triangles: Triangle budget
+    :param quadrics: vertex_quadrics() of the mesh, computed if omitted
+    :return: (indices into the same vertices, geometric error in position units)
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    indices = np.asarray(indices, dtype=np.int64)
+    if quadrics is None:
+        quadrics = vertex_quadrics(positions, indices)
+
+    return _search(positions, indices, quadrics, target_triangles, 1, MAX_RESOLUTION)[:2]
+
+
+def build_lods(mesh: MeshData, ratios=LOD_RATIOS, position: str = "position", optimize: bool = True) -> list:
+    """
+    Simplified index buffers of a mesh, level 0 being the original.
+    :param mesh: Triangle mesh
+    :param ratios: Triangle budget of each further level relative to the original
+    :param position: Name of the position field
+    :param optimize: Reorder every level for the vertex cache (optimize_vertex_cache)
+    :return: [(indices, error)] from finest to coarsest; levels that would not remove
+    triangles are left out, errors never decrease
+    """
+    positions = np.asarray(mesh.vertices[position], dtype=np.float64).reshape(mesh.vertex_count, -1)[:, :3]
+    indices = np.asarray(mesh.indices, dtype=np.int64)
+    quadrics = vertex_quadrics(positions, indices)
+    dtype = index_dtype(mesh.vertex_count)
+
+    levels = [(indices.astype(dtype), 0.0)]
+    # Surface triangles grow with the square of the grid resolution, a probe gives the factor
+    resolution = 64
+    triangles = max(len(_cluster(positions, indices, quadrics, resolution)[0]) // 3, 1)
+    for ratio in ratios:
+        target = max(1, int(len(indices) // 3 * ratio))
+        guess = resolution * np.sqrt(target / triangles)
+        simplified, error, resolution = _search(positions, indices, quadrics, target, max(1, int(guess * 0.75)),
+                                                min(MAX_RESOLUTION, int(guess * 1.33) + 1))
+        triangles = max(len(simplified) // 3, 1)
+        if not len(simplified) or len(simplified) >= len(levels[-1][0]):
+            continue
+        if optimize:
+            simplified = optimize_vertex_cache(simplified, mesh.vertex_count)
+        levels.append((simplified.astype(dtype), max(error, levels[-1][1])))
+
+    return levels
+
+
+def projection_scale(projection: np.ndarray, viewport_height: int) -> float:
+    """Pixels covered by one unit at distance one, from a row-major perspective matrix."""
+    return float(projection[1, 1]) * viewport_height * 0.5
+
+
+def select_levels(errors, distances: np.ndarray, scale: float, current: np.ndarray = None,
+                  threshold: float = 1.0, hysteresis: float = 0.25, stats: LodStats = None) -> np.ndarray:
+    """
+    Coarsest level per object whose error stays under ``threshold`` pixels on screen.
+    An object only switches to a coarser level once that level's error is under
+    ``threshold * (1 - hysteresis)``, and keeps its level until the error exceeds
+    ``threshold``: between the two it stays where it is.
+    :param errors: Geometric error per level, increasing, errors[0] == 0
+    :param distances: (N,) distance of each object to the eye, divided by the object's scale
+    :param scale: projection_scale()
+    :param current: (N,) levels of the last frame, negative for objects without one yet,
+    None on the first frame
+    :param stats: Counts the objects that changed level
+    :return: (N,) level per object
+    """
+    errors = np.asarray(errors, dtype=np.float64)
+    distances = np.maximum(np.asarray(distances, dtype=np.float64), 1e-6)
+    # Projected error of every level for every object, (N, levels)
+    pixels = errors[None, :] * scale / distances[:, None]
+
+    coarsest = np.maximum((pixels <= threshold * (1.0 - hysteresis)).sum(axis=1) - 1, 0)
+    if current is None:
+        return coarsest
+
+    current = np.asarray(current)
+    allowed = np.maximum((pixels <= threshold).sum(axis=1) - 1, 0)
+    # Finer when the current level became too coarse, coarser only past the margin
+    levels = np.where(current > allowed, allowed, np.maximum(current, coarsest))
+    levels = np.where(current < 0, coarsest, levels)
+    if stats is not None:
+        stats.switches += int(((current >= 0) & (levels != current)).sum())
+
+    return levels
+
+
+class LodMesh(object):
+    """
+    All levels of a mesh in one VAO: the shared vertex buffer and one index buffer
+    holding the levels back to back. Draws a level alone, or many objects at once with
+    one instanced call per level, per-instance model matrices in GL layout at
+    locations 2..5 like InstancedMesh.
+
+        lod = LodMesh(mesh_data, build_lods(mesh_data), max_instances=1000)
+        levels = select_levels(lod.errors, distances, scale, levels)
+        lod.draw_instances(models, levels)
+    """
+
+    MODEL_LOCATION = 2
+
+    def __init__(self, mesh: MeshData, levels: list, locations: dict = None, max_instances: int = 0):
+        """
+        Create and fill the buffers. Needs a current context.
+        :param mesh: Vertices shared by all levels
+        :param levels: [(indices, error)] from build_lods()
+        :param locations: {field name: attribute location}, field order if None
+        :param max_instances: Capacity of the per-instance buffer, 0 for none
+        """
+        for _ in self.__build(mesh, levels, locations, max_instances, UPLOAD_CHUNK):
+            pass
+
+    @classmethod
+    def upload_steps(cls, mesh: MeshData, levels: list, locations: dict = None, max_instances: int = 0,
+                     chunk: int = UPLOAD_CHUNK):
+        """
+        Build a LodMesh a chunk at a time like Mesh.upload_steps(), e.g. within the
+        AssetLoader's per-frame budget. The LodMesh is the value of the StopIteration.
+        """
+        instance = cls.__new__(cls)
+        yield from instance.__build(mesh, levels, locations, max_instances, chunk)
+
+        return instance
+
+    def __build(self, mesh: MeshData, levels: list, locations: dict, max_instances: int, chunk: int):
+        self.max_instances = max_instances
+        self.stats = LodStats()
+        # Instance slot -> index into the models of the last upload, slots are sorted by level
+        self.instance_order = np.zeros(0, dtype=np.int64)
+        self.errors = np.array([error for _, error in levels])
+
+        index_type = index_dtype(mesh.vertex_count)
+        self.index_size = index_type.itemsize
+        self.index_type = INDEX_TYPES[index_type]
+        # (byte offset, index count) per level
+        self.ranges = []
+        offset = 0
+        for indices, _ in levels:
+            self.ranges.append((offset, len(indices)))
+            offset += len(indices) * index_type.itemsize
+        self.triangles = np.array([count // 3 for _, count in self.ranges])
+
+        self.vbo, self.ebo, self.instance_vbo = gl.glGenBuffers(3)
+        yield from buffer_upload_steps(self.vbo, np.ascontiguousarray(mesh.vertices), chunk)
+        all_indices = np.concatenate([indices.astype(index_type) for indices, _ in levels])
+        yield from buffer_upload_steps(self.ebo, all_indices, chunk)
+        if max_instances:
+            default_state().bind_buffer(gl.GL_COPY_WRITE_BUFFER, self.instance_vbo)
+            gl.glBufferData(gl.GL_COPY_WRITE_BUFFER, max_instances * 16 * 4, None, gl.GL_DYNAMIC_DRAW)
+            yield
+
+        # The VAO is set up last, drawing between the steps never sees it half done
+        self.vao = gl.glGenVertexArrays(1)
+        state = default_state()
+        state.bind_vertex_array(self.vao)
+        state.bind_buffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        VertexFormat.from_mesh(mesh).bind(locations)
+        state.bind_buffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+
+        if max_instances:
+            state.bind_buffer(gl.GL_ARRAY_BUFFER, self.instance_vbo)
+            for column in range(4):
+                location = self.MODEL_LOCATION + column
+                gl.glEnableVertexAttribArray(location)
+                gl.glVertexAttribPointer(location, 4, gl.GL_FLOAT, gl.GL_FALSE, 16 * 4,
+                                         ctypes.c_void_p(column * 4 * 4))
+                gl.glVertexAttribDivisor(location, 1)
+
+        state.bind_vertex_array(0)
+
+    @property
+    def level_count(self) -> int:
+        return len(self.ranges)
+
+    def draw(self, level: int = 0):
+        offset, count = self.ranges[level]
+        default_state().bind_vertex_array(self.vao)
+        gl.glDrawElements(gl.GL_TRIANGLES, count, self.index_type, ctypes.c_void_p(offset))
+
+    def draw_instances(self, models: np.ndarray, levels: np.ndarray, program=None):
+        """
+        Draw one object per model matrix at its level: instances are uploaded sorted by
+        level and every level is one glDrawElementsInstancedBaseInstance call.
+        :param models: (K, 4, 4) float32 in GL layout, K <= max_instances
+        :param levels: (K,) level per instance
+        :param program: ShaderProgram in use whose ``u_baseInstance`` is set to the first instance
+                        of every level, gl_InstanceID restarts at 0 with each draw (core GL has
+                        no gl_BaseInstance before 4.6)
+        :return:
+        """
+        default_state().bind_vertex_array(self.vao)
+        for level, first, count in self.__upload(models, levels):
+            offset, index_count = self.ranges[level]
+            if program is not None:
+                program.set_int("u_baseInstance", first)
+            gl.glDrawElementsInstancedBaseInstance(gl.GL_TRIANGLES, index_count, self.index_type,
+                                                   ctypes.c_void_p(offset), count, first)
+
+    def submit(self, queue, program, models: np.ndarray, levels: np.ndarray, material=None,
+               pass_id: int = PASS_OPAQUE, depth: float = 0.0):
+        """
+        Same as draw_instances() through a RenderQueue: one packet per level, all of them
+        share the VAO and end up in one multi-draw call. The instances are uploaded now.
+        """
+        for level, first, count in self.__upload(models, levels):
+            offset, index_count = self.ranges[level]
+            queue.submit(program, self.vao, index_count, index_type=self.index_type, first=offset // self.index_size,
+                         instances=count, base_instance=first, material=material, pass_id=pass_id, depth=depth)
+
+    def __upload(self, models: np.ndarray, levels: np.ndarray) -> list:
+        """Upload the models sorted by level: [(level, first instance, instance count)] of the used levels."""
+        levels = np.asarray(levels, dtype=np.int64)
+        if len(levels) > self.max_instances:
+            raise ValueError(f"LodMesh holds at most {self.max_instances} instances")
+        order = self.instance_order = np.argsort(levels, kind="stable")
+        sorted_models = np.ascontiguousarray(np.asarray(models, dtype=np.float32)[order])
+        counts = np.bincount(levels, minlength=self.level_count)
+
+        self.stats.objects = len(levels)
+        self.stats.triangles = int((counts * self.triangles).sum())
+        self.stats.full_triangles = int(len(levels) * self.triangles[0])
+        if not len(levels):
+            return []
+
+        default_state().bind_buffer(gl.GL_ARRAY_BUFFER, self.instance_vbo)
+        gl.glBufferSubData(gl.GL_ARRAY_BUFFER, 0, sorted_models.nbytes, sorted_models)
+
+        firsts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        return [(level, int(firsts[level]), int(count)) for level, count in enumerate(counts.tolist()) if count]
+
+    def delete(self):
+        default_state().delete_vertex_arrays([self.vao])
+        default_state().delete_buffers([self.vbo, self.ebo, self.instance_vbo])
+
+
+def _search(positions, indices, quadrics, target_triangles: int, low: int, high: int) -> tuple:
+    """
+    Bisect the finest grid in [low, high] meeting the budget, to within 2% of the
+    resolution: (indices, error, resolution).
+    """
+    best = _cluster(positions, indices, quadrics, low)
+    if len(best[0]) // 3 > target_triangles and low > 1:
+        # The guess was too fine, start over from the coarsest grid
+        low, best = 1, _cluster(positions, indices, quadrics, 1)
+    result_resolution = low
+    while high - low > max(0, low // 50):
+        resolution = (low + high + 1) // 2
+        result = _cluster(positions, indices, quadrics, resolution)
+        if len(result[0]) // 3 <= target_triangles:
+            best, low, result_resolution = result, resolution, resolution
+        else:
+            high = resolution - 1
+
+    return best[0], best[1], result_resolution
+
+
+def _cluster(positions: np.ndarray, indices: np.ndarray, quadrics: np.ndarray, resolution: int) -> tuple:
+    """One clustering pass on a resolution^3 grid: (indices, error)."""
+    low = positions.min(axis=0)
+    size = np.maximum(positions.max(axis=0) - low, 1e-12)
+    cells = np.minimum(((positions - low) / size * resolution).astype(np.int64), resolution - 1)
+    _, cluster = np.unique((cells[:, 0] * resolution + cells[:, 1]) * resolution + cells[:, 2], return_inverse=True)
+    cluster = cluster.reshape(-1)
+
+    # Error of every vertex under the summed quadric of its cell
+    summed = np.stack([np.bincount(cluster, weights=quadrics[:, component]) for component in range(10)], axis=1)
+    q = summed[cluster]
+    x, y, z = positions.T
+    error = (q[:, 0] * x * x + 2.0 * q[:, 1] * x * y + 2.0 * q[:, 2] * x * z + 2.0 * q[:, 3] * x
+             + q[:, 4] * y * y + 2.0 * q[:, 5] * y * z + 2.0 * q[:, 6] * y
+             + q[:, 7] * z * z + 2.0 * q[:, 8] * z + q[:, 9])
+
+    # Representative: the vertex with the lowest error in each cell
+    order = np.lexsort((error, cluster))
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = cluster[order][1:] != cluster[order][:-1]
+    representative = np.empty(cluster.max() + 1, dtype=np.int64)
+    representative[cluster[order][first]] = order[first]
+    remap = representative[cluster]
+
+    triangles = remap[indices.reshape(-1, 3)]
+    keep = ((triangles[:, 0] != triangles[:, 1]) & (triangles[:, 1] != triangles[:, 2])
+            & (triangles[:, 2] != triangles[:, 0]))
+    triangles = triangles[keep]
+    # Collapses fold some triangles onto the same corners, keep one of each
+    corners = np.sort(triangles, axis=1)
+    if len(positions) < 2 ** 21:
+        corners = (corners[:, 0] * len(positions) + corners[:, 1]) * len(positions) + corners[:, 2]
+    _, unique = np.unique(corners, axis=0 if corners.ndim > 1 else None, return_index=True)
+    triangles = triangles[np.sort(unique)]
+
+    # Quadric error of each representative per unit of the area it stands for. The normal
+    # part of a quadric sums area * n n^T with unit normals, its trace is that area
+    area = summed[:, 0] + summed[:, 4] + summed[:, 7]
+    covered = area > 0.0
+    squared = np.maximum(error[representative[covered]], 0.0) / area[covered]
+    geometric = float(np.sqrt(squared.max())) if len(squared) else 0.0
+
+    return triangles.reshape(-1), geometric
@@ -0,0 +1,113 @@
+"""
+Small numpy matrix/quaternion helpers.
+
+Matrices are 4x4 float32 in math (row-major) order and transform column vectors,
+``M @ v``. Upload them with transpose=True or through a ``row_major`` uniform block.
+Quaternions are (w, x, y, z), the same order as QQuaternion(scalar, x, y, z).
+"""
+import math
+
+import numpy as np
+
+
+def identity() -> np.ndarray:
+    return np.identity(4, dtype=np.float32)
+
+
+def translation(offset) -> np.ndarray:
+    matrix = identity()
+    matrix[:3, 3] = offset
+
+    return matrix
+
+
+def scaling(factor) -> np.ndarray:
+    matrix = identity()
+    matrix[0, 0], matrix[1, 1], matrix[2, 2] = np.broadcast_to(factor, 3)
+
+    return matrix
+
+
+def quaternion_from_axis_angle(axis, angle: float) -> np.ndarray:
+    """
+    Same as QQuaternion.fromAxisAndAngle.
+    :param axis: Rotation axis, does not have to be normalized
+    :param angle: Angle in degrees
+    :return:
+    """
+    axis = np.asarray(axis, dtype=np.float64)
+    length = np.linalg.norm(axis)
+    if length == 0.0:
+        return np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+
+    half = math.radians(angle) / 2.0
+    xyz = axis / length * math.sin(half)
+
+    return np.array([math.cos(half), xyz[0], xyz[1], xyz[2]], dtype=np.float32)
+
+
+def quaternion_multiply(a, b) -> np.ndarray:
+    """Hamilton product a * b (apply b first, then a)."""
+    aw, ax, ay, az = a
+    bw, bx, by, bz = b
+
+    return np.array([aw * bw - ax * bx - ay * by - az * bz,
+                     aw * bx + ax * bw + ay * bz - az * by,
+                     aw * by - ax * bz + ay * bw + az * bx,
+                     aw * bz + ax * by - ay * bx + az * bw], dtype=np.float32)
+
+
+def quaternion_normalize(quaternion) -> np.ndarray:
+    """
+    Unit quaternion in the same direction. Products of unit quaternions drift away from
+    unit length with float32 rounding, renormalize anything that is accumulated.
+    """
+    quaternion = np.asarray(quaternion, dtype=np.float64)
+    length = np.linalg.norm(quaternion)
+    if length == 0.0:
+        return np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+
+    return (quaternion / length).astype(np.float32)
+
+
+def rotation(quaternion) -> np.ndarray:
+    """Rotation matrix from a unit quaternion (w, x, y, z)."""
+    w, x, y, z = quaternion
+    matrix = identity()
+    matrix[:3, :3] = [[1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+                      [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+                      [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)]]
+
+    return matrix
+
+
+def look_at(eye, center, up) -> np.ndarray:
+    """Same as QMatrix4x4.lookAt / gluLookAt."""
+    eye = np.asarray(eye, dtype=np.float32)
+    forward = np.asarray(center, dtype=np.float32) - eye
+    forward /= np.linalg.norm(forward)
+    side = np.cross(forward, up)
+    side /= np.linalg.norm(side)
+    up = np.cross(side, forward)
+
+    matrix = identity()
+    matrix[0, :3] = side
+    matrix[1, :3] = up
+    matrix[2, :3] = -forward
+    matrix[:3, 3] = -matrix[:3, :3] @ eye
+
+    return matrix
+
+
+def perspective(fov: float, aspect: float, near: float, far: float) -> np.ndarray:
+    """Same as QMatrix4x4.perspective / gluPerspective. Field of view in degrees."""
+    cotan = 1.0 / math.tan(math.radians(fov) / 2.0)
+
+    matrix = np.zeros((4, 4), dtype=np.float32)
+    matrix[0, 0] = cotan / aspect
+    matrix[1, 1] = cotan
+    matrix[2, 2] = -(far + near) / (far - near)
+    matrix[2, 3] = -2.0 * near * far / (far - near)
+    matrix[3, 2] = -1.0
+
+    return matrix
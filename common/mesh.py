@@ -0,0 +1,112 @@
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_state import default_state
+from .mesh_io import MeshData, index_dtype
+from .mesh_optimizer import optimize_mesh
+from .render_queue import PASS_OPAQUE
+from .vertex_format import INDEX_TYPES, VertexFormat
+
+# Bytes handed to the driver per glBufferSubData call. Keeps the driver's staging copy
+# small and lets a memory-mapped file page in while earlier chunks are already uploaded
+UPLOAD_CHUNK = 64 * 2 ** 20
+
+class Mesh(object):
+    """
+    Indexed triangle mesh in a VAO with one interleaved VBO and an EBO.
+
+    Built from a MeshData, usually read_mesh() of a .mesh file: the buffers are filled
+    straight from the memory-mapped blocks, the data never becomes Python objects or a
+    second copy in memory.
+
+    The attribute layout comes from the vertex dtype (VertexFormat) and indices are stored
+    as uint16 whenever the vertex count allows it. Attributes are bound to locations by
+    name, by default in the order of the vertex fields:
+
+        layout (location = 0) in vec3 a_position;
+        layout (location = 1) in vec3 a_normal;
+    """
+
+    def __init__(self, mesh: MeshData, locations: dict = None, optimize: bool = False):
+        """
+        Create and fill the buffers. Needs a current context.
+        :param mesh: Vertices and indices, e.g. from read_mesh() or import_mesh()
+        :param locations: {field name: attribute location}, fields left out are not bound
+        :param optimize: Weld and reorder for the vertex cache before uploading, for meshes
+        that were not optimized offline (convert() already did it for .mesh files)
+        """
+        self.optimize_stats = None
+        if optimize:
+            mesh, self.optimize_stats = optimize_mesh(mesh)
+        for _ in self.__build(mesh, locations, UPLOAD_CHUNK):
+            pass
+
+    @classmethod
+    def upload_steps(cls, mesh: MeshData, locations: dict = None, chunk: int = UPLOAD_CHUNK):
+        """
+        Build a Mesh a chunk at a time, e.g. within a per-frame time budget (AssetLoader).
+        A generator: every next() allocates one buffer or uploads at most ``chunk`` bytes,
+        the Mesh is the value of its StopIteration. Other drawing can go on between steps,
+        the buffers are filled through GL_COPY_WRITE_BUFFER and no VAO is bound until the
+        last step.
+        """
+        instance = cls.__new__(cls)
+        instance.optimize_stats = None
+        yield from instance.__build(mesh, locations, chunk)
+
+        return instance
+
+    def draw(self):
+        default_state().bind_vertex_array(self.vao)
+        gl.glDrawElements(gl.GL_TRIANGLES, self.index_count, self.index_type, None)
+
+    def submit(self, queue, program, material=None, pass_id: int = PASS_OPAQUE, depth: float = 0.0,
+               instances: int = 1, base_instance: int = 0):
+        """Queue the same draw as draw() in a RenderQueue."""
+        queue.submit(program, self.vao, self.index_count, index_type=self.index_type, instances=instances,
+                     base_instance=base_instance, material=material, pass_id=pass_id, depth=depth)
+
+    def delete(self):
+        default_state().delete_vertex_arrays([self.vao])
+        default_state().delete_buffers([self.vbo, self.ebo])
+
+    def __build(self, mesh: MeshData, locations: dict, chunk: int):
+        self.vertex_count = mesh.vertex_count
+        self.index_count = mesh.index_count
+        self.format = VertexFormat.from_mesh(mesh)
+
+        indices = mesh.indices
+        if indices.dtype.itemsize > index_dtype(mesh.vertex_count).itemsize:
+            indices = indices.astype(index_dtype(mesh.vertex_count))
+        self.index_type = INDEX_TYPES[indices.dtype.newbyteorder("=")]
+
+        self.vbo, self.ebo = gl.glGenBuffers(2)
+        yield from buffer_upload_steps(self.vbo, mesh.vertices, chunk)
+        yield from buffer_upload_steps(self.ebo, indices, chunk)
+
+        state = default_state()
+        self.vao = gl.glGenVertexArrays(1)
+        state.bind_vertex_array(self.vao)
+        state.bind_buffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        self.format.bind(locations)
+        state.bind_buffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.ebo)
+        state.bind_vertex_array(0)
+
+
+def buffer_upload_steps(buffer, array: np.ndarray, chunk: int = UPLOAD_CHUNK):
+    """
+    Allocate and fill ``buffer`` a chunk per step, a generator like Mesh.upload_steps().
+    Uses GL_COPY_WRITE_BUFFER, bound again every step as other code may have rebound the
+    target, so no VAO or vertex buffer binding is touched.
+    """
+    state = default_state()
+    raw = array.reshape(-1).view(np.uint8) if array.size else np.zeros(0, dtype=np.uint8)
+    state.bind_buffer(gl.GL_COPY_WRITE_BUFFER, buffer)
+    gl.glBufferData(gl.GL_COPY_WRITE_BUFFER, raw.nbytes, None, gl.GL_STATIC_DRAW)
+    # The allocation is a step of its own, drivers that clear new storage make it the slowest one
+    yield
+    for start in range(0, raw.nbytes, chunk):
+        state.bind_buffer(gl.GL_COPY_WRITE_BUFFER, buffer)
+        part = raw[start:start + chunk]
+        gl.glBufferSubData(gl.GL_COPY_WRITE_BUFFER, start, part.nbytes, part)
+        yield
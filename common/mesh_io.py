@@ -0,0 +1,598 @@
+"""
+Compact binary mesh files and OBJ/PLY importers.
+
+A .mesh file is a header, one record per vertex attribute, then the interleaved vertex
+block and the index block, both stored exactly as they are uploaded:
+
+    HEADER      magic "GLMS", version, vertex count, index count, attribute count,
+                index size in bytes (2 or 4), vertex stride, vertex block offset, index block offset
+    ATTRIBUTE   name, numpy base type ("<f4", "|u1"...), components, byte offset in the
+                vertex, flags (ATTRIBUTE_NORMALIZED, ATTRIBUTE_PACKED)
+    vertices    vertex count * stride bytes, 64 byte aligned
+    indices     index count * index size bytes, 64 byte aligned
+
+read_mesh() maps both blocks with np.memmap, nothing is parsed or copied in Python, so a
+mesh of several gigabytes opens instantly and pages in while it is uploaded.
+
+The importers parse text with numpy over whole blocks of lines instead of line by line,
+OBJ files are read in chunks so memory stays bounded by the output arrays.
+
+    python common/mesh_io.py model.obj model.mesh
+"""
+import os
+import struct
+import sys
+
+import numpy as np
+
+MAGIC = b"GLMS"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sIQQIII4xQQ")
+ATTRIBUTE = struct.Struct("<32s8sIIB3x")
+ATTRIBUTE_NORMALIZED = 1
+ATTRIBUTE_PACKED = 2
+BLOCK_ALIGNMENT = 64
+# Bytes of text parsed at once by the OBJ importer and written at once by write_mesh()
+CHUNK_BYTES = 32 * 2 ** 20
+
+_PLY_TYPES = {
+    "char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+    "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+    "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+    "float": "f4", "float32": "f4", "double": "f8", "float64": "f8",
+}
+_PLY_TEXCOORDS = (("s", "t"), ("u", "v"), ("texture_u", "texture_v"))
+
+
+class MeshData(object):
+    """
+    Interleaved vertices and triangle indices, in memory or memory-mapped from a .mesh file.
+
+    ``vertices`` is a structured array with one field per attribute, e.g.
+    ``[("position", "<f4", (3,)), ("normal", "<f4", (3,)), ("color", "u1", (4,))]``;
+    fields named in ``normalized`` are integers read as [0, 1] / [-1, 1] by the shader,
+    fields named in ``packed`` are 32-bit integers holding 2_10_10_10 vectors
+    (see common/vertex_format.py).
+    """
+
+    def __init__(self, vertices: np.ndarray, indices: np.ndarray, normalized=(), packed=()):
+        """
+        :param vertices: Structured array, one field per attribute
+        :param indices: uint16 or uint32 triangle indices
+        :param normalized: Names of integer fields that are normalized
+        :param packed: Names of int32/uint32 fields in 2_10_10_10 layout
+        """
+        self.vertices = vertices
+        self.indices = indices
+        self.normalized = frozenset(normalized)
+        self.packed = frozenset(packed)
+
+    @property
+    def vertex_count(self) -> int:
+        return len(self.vertices)
+
+    @property
+    def index_count(self) -> int:
+        return len(self.indices)
+
+    @property
+    def stride(self) -> int:
+        return self.vertices.dtype.itemsize
+
+    @property
+    def attributes(self) -> list:
+        """[(name, base dtype, components, byte offset)] in memory order."""
+        attributes = []
+        for name in self.vertices.dtype.names:
+            field, offset = self.vertices.dtype.fields[name][:2]
+            components = int(np.prod(field.shape)) if field.shape else 1
+            attributes.append((name, field.base, components, offset))
+
+        return attributes
+
+    def bounds(self, attribute: str = "position") -> tuple:
+        """(minimum, maximum) corner of an attribute, computed chunk by chunk for mapped files."""
+        step = max(1, CHUNK_BYTES // max(self.stride, 1))
+        minimum, maximum = None, None
+        for start in range(0, self.vertex_count, step):
+            values = np.asarray(self.vertices[attribute][start:start + step], dtype=np.float64)
+            low, high = values.min(axis=0), values.max(axis=0)
+            minimum = low if minimum is None else np.minimum(minimum, low)
+            maximum = high if maximum is None else np.maximum(maximum, high)
+
+        return minimum, maximum
+
+
+def index_dtype(vertex_count: int) -> np.dtype:
+    """uint16 when every index fits, half the index memory and bandwidth of uint32."""
+    return np.dtype(np.uint16) if vertex_count <= 2 ** 16 else np.dtype(np.uint32)
+
+
+def write_mesh(path: str, mesh: MeshData):
+    """
+    Write a .mesh file. Blocks are written in chunks, a memory-mapped source is never
+    loaded as a whole.
+    """
+    if mesh.vertices.dtype.names is None:
+        raise ValueError("Mesh vertices must be a structured array")
+    index_size = mesh.indices.dtype.itemsize
+    if index_size not in (2, 4):
+        raise ValueError(f"Unsupported index type {mesh.indices.dtype}, expected uint16 or uint32")
+
+    attributes = mesh.attributes
+    vertex_offset = _align(HEADER.size + ATTRIBUTE.size * len(attributes))
+    index_offset = _align(vertex_offset + mesh.vertex_count * mesh.stride)
+    # Same layout (offsets, padding) in little endian, no copy unless the source is big endian
+    little = np.dtype({"names": [name for name, _, _, _ in attributes],
+                       "formats": [mesh.vertices.dtype.fields[name][0].newbyteorder("<")
+                                   for name, _, _, _ in attributes],
+                       "offsets": [offset for _, _, _, offset in attributes],
+                       "itemsize": mesh.stride})
+
+    with open(path, "wb") as file:
+        file.write(HEADER.pack(MAGIC, FORMAT_VERSION, mesh.vertex_count, mesh.index_count, len(attributes),
+                               index_size, mesh.stride, vertex_offset, index_offset))
+        for name, base, components, offset in attributes:
+            flags = ((ATTRIBUTE_NORMALIZED if name in mesh.normalized else 0)
+                     | (ATTRIBUTE_PACKED if name in mesh.packed else 0))
+            file.write(ATTRIBUTE.pack(name.encode(), base.newbyteorder("<").str.encode(), components, offset, flags))
+
+        file.seek(vertex_offset)
+        _write_block(file, mesh.vertices.astype(little, copy=False))
+        file.seek(index_offset)
+        _write_block(file, mesh.indices.astype(mesh.indices.dtype.newbyteorder("<"), copy=False))
+
+
+def read_mesh(path: str) -> MeshData:
+    """Memory-map a .mesh file. The arrays stay valid as long as they are referenced."""
+    with open(path, "rb") as file:
+        header = file.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f"'{path}' is not a mesh file")
+        (magic, version, vertex_count, index_count, attribute_count,
+         index_size, stride, vertex_offset, index_offset) = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is not a mesh file")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"'{path}' has mesh format version {version}, expected {FORMAT_VERSION}")
+
+        names, formats, offsets, normalized, packed = [], [], [], [], []
+        for _ in range(attribute_count):
+            name, base, components, offset, flags = ATTRIBUTE.unpack(file.read(ATTRIBUTE.size))
+            names.append(name.rstrip(b"\0").decode())
+            base = np.dtype(base.rstrip(b"\0").decode())
+            formats.append((base, (components,)) if components > 1 else base)
+            offsets.append(offset)
+            if flags & ATTRIBUTE_NORMALIZED:
+                normalized.append(names[-1])
+            if flags & ATTRIBUTE_PACKED:
+                packed.append(names[-1])
+
+    vertex_dtype = np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": stride})
+    index_type = np.dtype("<u2" if index_size == 2 else "<u4")
+
+    return MeshData(_map(path, vertex_dtype, vertex_offset, vertex_count),
+                    _map(path, index_type, index_offset, index_count), normalized, packed)
+
+
+def read_obj(path: str) -> MeshData:
+    """
+    Import a Wavefront OBJ: v (optionally with rgb), vt, vn and f with any polygon size,
+    fan-triangulated. Corners sharing the same v/vt/vn triple become one vertex.
+    Materials, groups, lines and points are ignored.
+    """
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    blocks = {b"v": [], b"vt": [], b"vn": []}
+    corners, face_sizes = [], []
+    # Running number of v, vt and vn lines, for negative (relative) indices
+    seen = {b"v": 0, b"vt": 0, b"vn": 0}
+    layout = None
+
+    for chunk in _line_chunks(data):
+        starts, ends = _lines(chunk)
+        kinds = {keyword: _keyword_lines(chunk, starts, keyword) for keyword in (b"v", b"vt", b"vn", b"f")}
+        faces = kinds.pop(b"f")
+
+        if faces.any() and layout is None:
+            layout = _obj_face_layout(bytes(chunk[starts[faces][0]:ends[faces][0]]))
+
+        if faces.any():
+            # Vertices defined before each face line, negative indices count back from there
+            before = {keyword: seen[keyword] + np.cumsum(kinds[keyword])[faces] for keyword in kinds}
+            text, line_starts = _line_text(chunk, starts, ends, faces, 1, slashes=True)
+            values = _parse(text, np.int64)
+            per_line = _numbers_per_line(text, line_starts)
+            if np.any(per_line % len(layout)):
+                raise ValueError(f"'{path}': faces mix different v/vt/vn layouts")
+            sizes = per_line // len(layout)
+            columns = values.reshape(-1, len(layout))
+            resolved = np.empty_like(columns)
+            for column, keyword in enumerate(layout):
+                reference = np.repeat(before[keyword], sizes)
+                index = columns[:, column]
+                resolved[:, column] = np.where(index < 0, reference + index, index - 1)
+            corners.append(resolved)
+            face_sizes.append(sizes)
+
+        for keyword, mask in kinds.items():
+            count = int(mask.sum())
+            if count:
+                values = _parse(_line_text(chunk, starts, ends, mask, len(keyword))[0], np.float64)
+                if values.size % count:
+                    raise ValueError(f"'{path}': '{keyword.decode()}' lines have different lengths")
+                blocks[keyword].append(values.reshape(count, -1))
+                seen[keyword] += count
+
+    if layout is None:
+        raise ValueError(f"'{path}' contains no faces")
+
+    positions = np.concatenate(blocks[b"v"])
+    corners = np.concatenate(corners)
+    for column, keyword in enumerate(layout):
+        _check_indices(path, corners[:, column], seen[keyword])
+    triangles = _fan_triangles(np.concatenate(face_sizes))
+    corners = corners[triangles.reshape(-1)]
+
+    columns = {"position": positions[:, :3]}
+    if positions.shape[1] >= 6:
+        columns["color"] = positions[:, 3:6]
+    if len(layout) == 1:
+        # Positions only, the OBJ indices can be used as they are
+        return MeshData(_interleave(columns), corners[:, 0].astype(index_dtype(len(positions))))
+
+    unique, indices = np.unique(corners, axis=0, return_inverse=True)
+    columns = {name: values[unique[:, 0]] for name, values in columns.items()}
+    if b"vn" in layout:
+        columns["normal"] = np.concatenate(blocks[b"vn"])[unique[:, layout.index(b"vn")], :3]
+    if b"vt" in layout:
+        columns["texcoord"] = np.concatenate(blocks[b"vt"])[unique[:, layout.index(b"vt")], :2]
+
+    return MeshData(_interleave(columns), indices.reshape(-1).astype(index_dtype(len(unique))))
+
+
+def read_ply(path: str) -> MeshData:
+    """
+    Import a PLY (ascii, binary little or big endian): x/y/z, nx/ny/nz, texture coordinates,
+    red/green/blue(/alpha) and a face list, fan-triangulated. Binary vertex data is mapped,
+    faces are read in one go when every face has the same corner count. Point clouds
+    (scans) without a face element get no indices.
+    """
+    file_format, elements, body = _ply_header(path)
+    binary = file_format != "ascii"
+    byte_order = ">" if file_format == "binary_big_endian" else "<"
+
+    vertices, faces = None, None
+    offset = body
+    text_lines = _ply_text_lines(path, body) if not binary else None
+    line = 0
+
+    for name, count, properties in elements:
+        lists = [prop for prop in properties if prop[1] == "list"]
+        if binary:
+            if not lists:
+                dtype = np.dtype([(prop[0], byte_order + prop[1]) for prop in properties])
+                values = _map(path, dtype, offset, count)
+                offset += count * dtype.itemsize
+            elif name == "face" and len(properties) == 1:
+                values, offset = _ply_binary_faces(path, offset, count, properties[0], byte_order)
+            else:
+                raise ValueError(f"'{path}': binary element '{name}' with list properties is not supported")
+        else:
+            text = text_lines(line, line + count)
+            line += count
+            if not lists:
+                table = np.fromstring(text, dtype=np.float64, sep=" ").reshape(count, len(properties))
+                values = np.empty(count, dtype=[(prop[0], prop[1]) for prop in properties])
+                for column, prop in enumerate(properties):
+                    values[prop[0]] = table[:, column]
+            elif name == "face" and len(properties) == 1:
+                values = _ply_text_faces(np.fromstring(text, dtype=np.int64, sep=" "), count)
+            else:
+                raise ValueError(f"'{path}': element '{name}' with list properties is not supported")
+
+        if name == "vertex":
+            vertices = values
+        elif name == "face":
+            faces = values
+
+    if vertices is None:
+        raise ValueError(f"'{path}' needs a vertex element")
+
+    names = vertices.dtype.names
+    columns = {"position": _stack(vertices, ("x", "y", "z"))}
+    normalized = []
+    if all(axis in names for axis in ("nx", "ny", "nz")):
+        columns["normal"] = _stack(vertices, ("nx", "ny", "nz"))
+    for pair in _PLY_TEXCOORDS:
+        if all(axis in names for axis in pair):
+            columns["texcoord"] = _stack(vertices, pair)
+            break
+    if all(channel in names for channel in ("red", "green", "blue")):
+        channels = ("red", "green", "blue", "alpha") if "alpha" in names else ("red", "green", "blue")
+        color = _stack(vertices, channels, dtype=vertices.dtype["red"])
+        if color.dtype == np.uint8:
+            # Kept as bytes, read as 0..1 floats by the shader
+            normalized.append("color")
+        columns["color"] = color
+
+    if faces is None:
+        return MeshData(_interleave(columns), np.zeros(0, dtype=index_dtype(len(vertices))), normalized)
+
+    sizes, corners = faces
+    _check_indices(path, corners, len(vertices))
+
+    indices = corners[_fan_triangles(sizes)].reshape(-1).astype(index_dtype(len(vertices)))
+
+    return MeshData(_interleave(columns), indices, normalized)
+
+
+def import_mesh(path: str) -> MeshData:
+    """Open a .mesh file (memory-mapped) or import an .obj / .ply by extension."""
+    extension = os.path.splitext(path)[1].lower()
+    readers = {".mesh": read_mesh, ".obj": read_obj, ".ply": read_ply}
+    if extension not in readers:
+        raise ValueError(f"Unknown mesh format '{extension}', expected one of {tuple(readers)}")
+
+    return readers[extension](path)
+
+
+def convert(source: str, destination: str, optimize: bool = True) -> MeshData:
+    """
+    Import an OBJ/PLY and write it as a .mesh file, loaded with read_mesh() from then on.
+    :param optimize: Weld vertices and reorder for the vertex cache first (mesh_optimizer.optimize_mesh)
+    """
+    mesh = import_mesh(source)
+    if optimize:
+        from .mesh_optimizer import optimize_mesh
+        mesh = optimize_mesh(mesh)[0]
+    write_mesh(destination, mesh)
+
+    return mesh
+
+
+def _align(value: int) -> int:
+    return (value + BLOCK_ALIGNMENT - 1) // BLOCK_ALIGNMENT * BLOCK_ALIGNMENT
+
+
+def _map(path: str, dtype: np.dtype, offset: int, count: int) -> np.ndarray:
+    if count == 0:
+        # np.memmap refuses empty mappings
+        return np.empty(0, dtype=dtype)
+
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=(count,))
+
+
+def _write_block(file, array: np.ndarray):
+    raw = array.reshape(-1).view(np.uint8) if array.size else array
+    for start in range(0, len(raw), CHUNK_BYTES):
+        file.write(np.ascontiguousarray(raw[start:start + CHUNK_BYTES]).data)
+
+
+def _line_chunks(data: np.ndarray):
+    """Copies of about CHUNK_BYTES each, always ending after a newline."""
+    start = 0
+    while start < len(data):
+        end = min(start + CHUNK_BYTES, len(data))
+        # Extend to the end of the line crossing the chunk border
+        while end < len(data):
+            newline = np.flatnonzero(data[end:end + 65536] == ord("\n"))
+            if len(newline):
+                end += int(newline[0]) + 1
+                break
+            end = min(end + 65536, len(data))
+        chunk = np.array(data[start:end])
+        if chunk[-1] != ord("\n"):
+            chunk = np.append(chunk, np.uint8(ord("\n")))
+        # Tabs and Windows line ends parse like spaces
+        chunk[(chunk == ord("\t")) | (chunk == ord("\r"))] = ord(" ")
+        yield chunk
+        start = end
+
+
+def _lines(chunk: np.ndarray) -> tuple:
+    """Start and end (index of the newline) of every line."""
+    ends = np.flatnonzero(chunk == ord("\n"))
+    starts = np.empty_like(ends)
+    starts[0] = 0
+    starts[1:] = ends[:-1] + 1
+
+    return starts, ends
+
+
+def _keyword_lines(chunk: np.ndarray, starts: np.ndarray, keyword: bytes) -> np.ndarray:
+    """Mask of the lines starting with ``keyword`` followed by a space."""
+    mask = np.ones(len(starts), dtype=bool)
+    for position, character in enumerate(keyword + b" "):
+        index = np.minimum(starts + position, len(chunk) - 1)
+        mask &= chunk[index] == character
+
+    return mask
+
+
+def _line_text(chunk, starts, ends, mask, keyword_length, slashes=False) -> tuple:
+    """
+    Bytes of the selected lines with keywords (and slashes) blanked out, and where each
+    line starts in them.
+    """
+    lengths = ends - starts + 1
+    text = chunk[np.repeat(mask, lengths)]
+    line_starts = np.cumsum(lengths[mask]) - lengths[mask]
+    for position in range(keyword_length):
+        text[line_starts + position] = ord(" ")
+    if slashes:
+        # "1/2/3" and "1//3": the face layout tells which column is which
+        text[text == ord("/")] = ord(" ")
+    if np.any(text == ord("#")):
+        raise ValueError("Comments after data on the same line are not supported")
+
+    return text, line_starts
+
+
+def _parse(text: np.ndarray, dtype) -> np.ndarray:
+    """All numbers of a block of lines in one np.fromstring call."""
+    return np.fromstring(text.tobytes(), dtype=dtype, sep=" ")
+
+
+def _numbers_per_line(text: np.ndarray, line_starts: np.ndarray) -> np.ndarray:
+    """Count of whitespace separated numbers on each line of ``text``."""
+    separator = (text == ord(" ")) | (text == ord("\n"))
+    token_start = np.empty(len(text), dtype=bool)
+    token_start[0] = not separator[0]
+    np.logical_and(~separator[1:], separator[:-1], out=token_start[1:])
+
+    return np.add.reduceat(token_start, line_starts, dtype=np.int64)
+
+
+def _obj_face_layout(line: bytes) -> tuple:
+    """Which of v, vt, vn every face corner references, from the first face line."""
+    corner = line.split()[1]
+    if b"//" in corner:
+        return b"v", b"vn"
+
+    return (b"v", b"vt", b"vn")[:corner.count(b"/") + 1]
+
+
+def _check_indices(path: str, indices: np.ndarray, count: int):
+    if len(indices) and (indices.min() < 0 or indices.max() >= count):
+        raise ValueError(f"'{path}': face index out of range, {count} elements defined")
+
+
+def _fan_triangles(sizes: np.ndarray) -> np.ndarray:
+    """(T, 3) corner indices triangulating polygons with ``sizes`` corners as fans."""
+    sizes = np.asarray(sizes, dtype=np.int64)
+    first = np.cumsum(sizes) - sizes
+    count = np.maximum(sizes - 2, 0)
+    base = np.repeat(first, count)
+    local = np.arange(int(count.sum())) - np.repeat(np.cumsum(count) - count, count)
+
+    return np.stack((base, base + local + 1, base + local + 2), axis=1)
+
+
+def _interleave(columns: dict) -> np.ndarray:
+    """Structured vertex array from {name: (N, components) array}, float32 unless integer."""
+    fields = []
+    for name, values in columns.items():
+        base = values.dtype if values.dtype.kind in "iu" else np.dtype(np.float32)
+        fields.append((name, base, (values.shape[1],)))
+    count = len(next(iter(columns.values())))
+    vertices = np.empty(count, dtype=fields)
+    for name, values in columns.items():
+        vertices[name] = values
+
+    return vertices
+
+
+def _stack(table: np.ndarray, names: tuple, dtype=np.float64) -> np.ndarray:
+    return np.stack([np.asarray(table[name], dtype=dtype) for name in names], axis=1)
+
+
+def _ply_header(path: str) -> tuple:
+    """(format, [(element, count, properties)], offset of the body)."""
+    elements = []
+    file_format = None
+    with open(path, "rb") as file:
+        if file.readline().strip() != b"ply":
+            raise ValueError(f"'{path}' is not a PLY file")
+        while True:
+            line = file.readline()
+            if not line:
+                raise ValueError(f"'{path}': PLY header has no end_header")
+            words = line.decode("ascii", errors="replace").split()
+            if not words or words[0] in ("comment", "obj_info"):
+                continue
+            if words[0] == "end_header":
+                return file_format, elements, file.tell()
+            if words[0] == "format":
+                file_format = words[1]
+            elif words[0] == "element":
+                elements.append((words[1], int(words[2]), []))
+            elif words[0] == "property":
+                if words[1] == "list":
+                    elements[-1][2].append((words[4], "list", _PLY_TYPES[words[2]], _PLY_TYPES[words[3]]))
+                else:
+                    elements[-1][2].append((words[2], _PLY_TYPES[words[1]]))
+
+
+def _ply_text_lines(path: str, body: int):
+    """Function returning the text of body lines [first, last) of an ascii PLY."""
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=body)
+    ends = np.flatnonzero(data == ord("\n"))
+
+    def lines(first: int, last: int) -> str:
+        if first == last:
+            return ""
+        start = 0 if first == 0 else int(ends[first - 1]) + 1
+        end = int(ends[last - 1]) if last <= len(ends) else len(data)
+
+        return bytes(data[start:end]).decode("ascii")
+
+    return lines
+
+
+def _ply_text_faces(values: np.ndarray, count: int) -> tuple:
+    """(sizes, flat corners) from the numbers of ``count`` ascii face lines."""
+    if count == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    corners_per_face = int(values[0])
+    if values.size == count * (corners_per_face + 1):
+        table = values.reshape(count, corners_per_face + 1)
+        if np.all(table[:, 0] == corners_per_face):
+            return np.full(count, corners_per_face), table[:, 1:].reshape(-1)
+
+    # Mixed polygon sizes: where each face starts depends on all previous ones
+    sizes = np.empty(count, dtype=np.int64)
+    position = 0
+    for face in range(count):
+        sizes[face] = values[position]
+        position += sizes[face] + 1
+    starts = np.cumsum(sizes + 1) - sizes
+    keep = np.repeat(starts, sizes) + np.arange(int(sizes.sum())) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+
+    return sizes, values[keep]
+
+
+def _ply_binary_faces(path: str, offset: int, count: int, prop: tuple, byte_order: str) -> tuple:
+    """((sizes, flat corners), offset after the faces) of a binary face element."""
+    _, _, count_type, index_type = prop
+    count_type = np.dtype(byte_order + count_type)
+    index_type = np.dtype(byte_order + index_type)
+    if count == 0:
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)), offset
+
+    first = int(_map(path, count_type, offset, 1)[0])
+    uniform = np.dtype([("size", count_type), ("corners", index_type, (first,))])
+    size = os.path.getsize(path)
+    if offset + count * uniform.itemsize <= size:
+        table = _map(path, uniform, offset, count)
+        if np.all(table["size"] == first):
+            return ((np.full(count, first), np.asarray(table["corners"], dtype=np.int64).reshape(-1)),
+                    offset + count * uniform.itemsize)
+
+    # Mixed polygon sizes, walk the faces one by one
+    data = np.memmap(path, dtype=np.uint8, mode="r", offset=offset)
+    sizes = np.empty(count, dtype=np.int64)
+    corners = []
+    position = 0
+    for face in range(count):
+        sizes[face] = int(data[position:position + count_type.itemsize].view(count_type)[0])
+        position += count_type.itemsize
+        end = position + int(sizes[face]) * index_type.itemsize
+        corners.append(data[position:end].view(index_type))
+        position = end
+
+    return (sizes, np.concatenate(corners).astype(np.int64)), offset + position
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("usage: python common/mesh_io.py input.(obj|ply) output.mesh")
+        sys.exit(1)
+    # The optimizer is imported through the package, this file runs as a plain script
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from common.mesh_optimizer import optimize_mesh
+    converted, stats = optimize_mesh(import_mesh(sys.argv[1]))
+    write_mesh(sys.argv[2], converted)
+    print(stats.report())
+    print(f"INFO::MESH::{sys.argv[2]}::VERTICES::{converted.vertex_count}::INDICES::{converted.index_count}"
+          f"::STRIDE::{converted.stride}")
@@ -0,0 +1,292 @@
+"""
+Index and vertex order optimization for MeshData, offline before write_mesh() or when a
+mesh is uploaded (Mesh(..., optimize=True)).
+
+    weld_vertices           merge bit-identical vertices, found by hashing whole vertices
+    optimize_vertex_cache   Tipsify triangle order, vertices are reused while still in the
+                            GPU's post-transform cache
+    optimize_overdraw       reorder clusters of that order so triangles facing outwards come
+                            first and hide what is behind them
+    optimize_vertex_fetch   number vertices in the order the indices first use them, so
+                            vertex fetch walks the buffer forwards
+    cache_statistics        ACMR (transformed vertices per triangle, 0.5 is ideal for a
+                            regular grid, 3 the worst) and ATVR (transformed per unique
+                            vertex, 1 is ideal)
+
+optimize_mesh() runs all of them and reports the statistics before and after.
+Everything but the Tipsify walk and the cache simulation, both inherently sequential,
+is vectorized numpy.
+
+P. Sander, D. Nehab, J. Barczak: Fast Triangle Reordering for Vertex Locality and Reduced Overdraw, 2007
+"""
+import time
+
+import numpy as np
+from numpy.lib import recfunctions
+
+from .mesh_io import MeshData, index_dtype
+
+# Entries of the simulated FIFO post-transform cache, small enough for every GPU
+CACHE_SIZE = 16
+
+_FNV_OFFSET = np.uint64(0xCBF29CE484222325)
+_FNV_PRIME = np.uint64(0x100000001B3)
+
+
+class OptimizeStats(object):
+    """Vertex count and cache statistics before and after optimize_mesh()."""
+
+    def __init__(self):
+        self.vertices = (0, 0)
+        self.acmr = (0.0, 0.0)
+        self.atvr = (0.0, 0.0)
+        self.seconds = 0.0
+
+    def report(self) -> str:
+        return (f"INFO::MESH_OPTIMIZER::VERTICES {self.vertices[0]} -> {self.vertices[1]}"
+                f"::ACMR {self.acmr[0]:.3f} -> {self.acmr[1]:.3f}::ATVR {self.atvr[0]:.3f} -> {self.atvr[1]:.3f}"
+                f"::{self.seconds * 1000.0:.0f}ms")
+
+
+def weld_vertices(mesh: MeshData) -> MeshData:
+    """
+    Merge vertices whose attributes are bit-identical (padding bytes are ignored) and
+    point the indices at the remaining ones. Vertices keep the order of their first copy,
+    unreferenced vertices are kept as well, optimize_vertex_fetch() drops them.
+    """
+    count = mesh.vertex_count
+    if count == 0:
+        return mesh
+    words = _vertex_words(mesh.vertices)
+
+    # FNV-1a over 64-bit words, then a finalizer so low bits depend on every byte
+    hashes = np.full(count, _FNV_OFFSET, dtype=np.uint64)
+    for column in words.T:
+        hashes = (hashes ^ column) * _FNV_PRIME
+    hashes ^= hashes >> np.uint64(33)
+    hashes *= np.uint64(0xFF51AFD7ED558CCD)
+    hashes ^= hashes >> np.uint64(33)
+
+    _, first, inverse = np.unique(hashes, return_index=True, return_inverse=True)
+    if not np.array_equal(words, words[first[inverse]]):
+        # Hash collision, compare the whole vertices instead
+        keys = np.ascontiguousarray(words).view(np.dtype((np.void, words.shape[1] * 8))).reshape(-1)
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    # Unique vertices in order of first appearance
+    order = np.argsort(first, kind="stable")
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order))
+    remap = rank[inverse.reshape(-1)]
+    vertices = mesh.vertices[first[order]]
+    indices = remap[np.asarray(mesh.indices, dtype=np.int64)]
+
+    return MeshData(vertices, indices.astype(index_dtype(len(vertices))), mesh.normalized, mesh.packed)
+
+
+def optimize_vertex_cache(indices: np.ndarray, vertex_count: int, cache_size: int = CACHE_SIZE) -> np.ndarray:
+    """
+    Tipsify: reorder triangles so the ones sharing a vertex are drawn close together.
+    Triangles are emitted in fans around one vertex at a time, the next fan is the
+    vertex of the last fans still in the cache with the most triangles left to draw.
+    :param indices: Triangle list
+    :param vertex_count: Number of vertices the indices refer to
+    :param cache_size: Entries of the post-transform cache to optimize for
+    :return: The same triangles in the new order, with the dtype of ``indices``
+    """
+    indices = np.asarray(indices)
+    triangles = indices.reshape(-1, 3)
+    if len(triangles) == 0:
+        return indices.copy()
+
+    corners = triangles.reshape(-1).astype(np.int64)
+    valence = np.bincount(corners, minlength=vertex_count)
+    # Triangles around every vertex: adjacency[offsets[v]:offsets[v + 1]]
+    adjacency = (np.argsort(corners, kind="stable") // 3).tolist()
+    offsets = np.concatenate(([0], np.cumsum(valence))).tolist()
+    live = valence.tolist()
+    corners_of = triangles.tolist()
+
+    stamp = [0] * vertex_count
+    emitted = [False] * len(triangles)
+    dead_end = []
+    order = []
+    clock = cache_size + 1
+    cursor = 0
+    fan = _next_live(live, 0)
+    while fan >= 0:
+        candidates = []
+        for triangle in adjacency[offsets[fan]:offsets[fan + 1]]:
+            if emitted[triangle]:
+                continue
+            emitted[triangle] = True
+            order.append(triangle)
+            for vertex in corners_of[triangle]:
+                dead_end.append(vertex)
+                candidates.append(vertex)
+                live[vertex] -= 1
+                if clock - stamp[vertex] > cache_size:
+                    stamp[vertex] = clock
+                    clock += 1
+
+        # Prefer vertices still in the cache whose remaining fan fits into it
+        fan, best = -1, -1
+        for vertex in candidates:
+            if live[vertex] > 0:
+                age = clock - stamp[vertex]
+                priority = age if age + 2 * live[vertex] <= cache_size else 0
+                if priority > best:
+                    fan, best = vertex, priority
+
+        if fan < 0:
+            # Dead end: the most recently used vertex with triangles left, else the next in the buffer
+            while dead_end and fan < 0:
+                vertex = dead_end.pop()
+                if live[vertex] > 0:
+                    fan = vertex
+            if fan < 0:
+                cursor = _next_live(live, cursor)
+                fan = cursor
+
+    return triangles[np.array(order, dtype=np.int64)].reshape(-1)
+
+
+def optimize_overdraw(indices: np.ndarray, positions: np.ndarray, cache_size: int = CACHE_SIZE) -> np.ndarray:
+    """
+    Reorder clusters of a cache-optimized triangle list for less overdraw from any view.
+    Clusters start where the cache is cold anyway (every corner of a triangle misses), so
+    the cache efficiency stays the same. Clusters facing away from the mesh center are
+    drawn first: seen from outside they are in front and occlude the rest.
+    :param indices: Triangle list, usually from optimize_vertex_cache()
+    :param positions: (N, 3) vertex positions
+    :param cache_size: Entries of the simulated cache, as for optimize_vertex_cache()
+    :return: The same triangles in the new order
+    """
+    indices = np.asarray(indices)
+    triangles = indices.reshape(-1, 3)
+    if len(triangles) < 2:
+        return indices.copy()
+
+    positions = np.asarray(positions, dtype=np.float64)[:, :3]
+    corners = positions[triangles.astype(np.int64)]
+    # Area weighted normals and centroids per triangle
+    normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+    centroids = corners.mean(axis=1)
+
+    misses = _fifo_misses(indices, len(positions), cache_size).reshape(-1, 3)
+    starts = misses.all(axis=1)
+    starts[0] = True
+    cluster = np.cumsum(starts) - 1
+    clusters = int(cluster[-1]) + 1
+
+    areas = np.linalg.norm(normals, axis=1)
+    weight = np.bincount(cluster, weights=areas, minlength=clusters)
+    center = np.stack([np.bincount(cluster, weights=centroids[:, axis] * areas, minlength=clusters)
+                       for axis in range(3)], axis=1) / np.maximum(weight, 1e-30)[:, None]
+    normal = np.stack([np.bincount(cluster, weights=normals[:, axis], minlength=clusters)
+                       for axis in range(3)], axis=1)
+    mesh_center = (centroids * areas[:, None]).sum(axis=0) / max(areas.sum(), 1e-30)
+
+    facing = ((center - mesh_center) * normal).sum(axis=1) / np.maximum(np.linalg.norm(normal, axis=1), 1e-30)
+    rank = np.empty(clusters, dtype=np.int64)
+    rank[np.argsort(-facing, kind="stable")] = np.arange(clusters)
+
+    return triangles[np.argsort(rank[cluster], kind="stable")].reshape(-1)
+
+
+def optimize_vertex_fetch(mesh: MeshData) -> MeshData:
+    """
+    Renumber vertices in the order the indices first reference them, so vertex fetch
+    reads the buffer mostly sequentially. Vertices no index uses are dropped.
+    """
+    indices = np.asarray(mesh.indices, dtype=np.int64)
+    used, first = np.unique(indices, return_index=True)
+    order = used[np.argsort(first, kind="stable")]
+    remap = np.full(mesh.vertex_count, -1, dtype=np.int64)
+    remap[order] = np.arange(len(order))
+    vertices = mesh.vertices[order]
+
+    return MeshData(vertices, remap[indices].astype(index_dtype(len(vertices))), mesh.normalized, mesh.packed)
+
+
+def cache_statistics(indices: np.ndarray, vertex_count: int, cache_size: int = CACHE_SIZE) -> tuple:
+    """
+    (ACMR, ATVR) of a triangle list drawn through a FIFO post-transform cache.
+    ACMR: vertex shader runs per triangle. ATVR: runs per referenced vertex.
+    """
+    triangles = len(indices) // 3
+    if triangles == 0:
+        return 0.0, 0.0
+    misses = int(_fifo_misses(indices, vertex_count, cache_size).sum())
+    referenced = int(np.count_nonzero(np.bincount(np.asarray(indices, dtype=np.int64), minlength=vertex_count)))
+
+    return misses / triangles, misses / max(referenced, 1)
+
+
+def optimize_mesh(mesh: MeshData, cache_size: int = CACHE_SIZE, overdraw: bool = True) -> tuple:
+    """
+    Weld, Tipsify, overdraw and fetch order in one go.
+    :param mesh: Triangle mesh, in memory or memory-mapped
+    :param cache_size: Entries of the post-transform cache to optimize for
+    :param overdraw: Also reorder clusters for less overdraw (needs a position attribute)
+    :return: (optimized in-memory MeshData, OptimizeStats)
+    """
+    stats = OptimizeStats()
+    start = time.perf_counter()
+    before = cache_statistics(mesh.indices, mesh.vertex_count, cache_size)
+    vertex_count = mesh.vertex_count
+
+    mesh = weld_vertices(mesh)
+    indices = optimize_vertex_cache(mesh.indices, mesh.vertex_count, cache_size)
+    names = mesh.vertices.dtype.names
+    if overdraw and names:
+        position = "position" if "position" in names else names[0]
+        values = mesh.vertices[position].reshape(mesh.vertex_count, -1)
+        if position not in mesh.packed and values.shape[1] >= 3:
+            indices = optimize_overdraw(indices, values, cache_size)
+    mesh = optimize_vertex_fetch(MeshData(mesh.vertices, indices, mesh.normalized, mesh.packed))
+
+    after = cache_statistics(mesh.indices, mesh.vertex_count, cache_size)
+    stats.vertices = (vertex_count, mesh.vertex_count)
+    stats.acmr = (before[0], after[0])
+    stats.atvr = (before[1], after[1])
+    stats.seconds = time.perf_counter() - start
+
+    return mesh, stats
+
+
+def _vertex_words(vertices: np.ndarray) -> np.ndarray:
+    """Every vertex as a row of uint64, fields packed together without padding, zero-filled to 8 bytes."""
+    packed = recfunctions.repack_fields(np.asarray(vertices))
+    raw = np.ascontiguousarray(packed).view(np.uint8).reshape(len(packed), -1)
+    width = (raw.shape[1] + 7) // 8 * 8
+    if width != raw.shape[1]:
+        raw = np.concatenate((raw, np.zeros((len(raw), width - raw.shape[1]), dtype=np.uint8)), axis=1)
+
+    return raw.view(np.uint64)
+
+
+def _fifo_misses(indices: np.ndarray, vertex_count: int, cache_size: int) -> np.ndarray:
+    """Per index: True if the vertex had to be transformed. A vertex is cached while fewer
+    than ``cache_size`` misses happened since it was inserted."""
+    inserted = [-cache_size - 1] * vertex_count
+    misses = 0
+    result = []
+    for vertex in np.asarray(indices).tolist():
+        if misses - inserted[vertex] > cache_size:
+            inserted[vertex] = misses
+            misses += 1
+            result.append(True)
+        else:
+            result.append(False)
+
+    return np.array(result, dtype=bool)
+
+
+def _next_live(live: list, cursor: int) -> int:
+    while cursor < len(live):
+        if live[cursor] > 0:
+            return cursor
+        cursor += 1
+
+    return -1
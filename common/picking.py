@@ -0,0 +1,286 @@
+"""
+Object picking on the GPU: object IDs are drawn into an integer framebuffer and the pixels
+under the cursor (or a selection rectangle) are read back asynchronously.
+
+Only the requested region is drawn (scissor) and read, optionally at a fraction of the
+window resolution. glReadPixels goes into a pixel pack buffer followed by a fence, so a
+click never waits for the GPU: the result is picked up by poll() a frame or two later.
+
+    picker.pick(x, y, draw_ids, width=5, height=5, data=slots)   # after drawing the frame
+    for result in picker.poll():                                  # every frame, never blocks
+        print(result.object_id, result.depth, result.data)
+
+``draw_ids`` draws the scene with a program writing one uint per object, 0 is nothing:
+
+    layout (location = 0) out uint fragId;
+"""
+import collections
+import ctypes
+import math
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_info import mapped_array
+from .gl_state import default_state
+
+
+class PickStats(object):
+    """Picks requested and completed, latency from request to result in milliseconds."""
+
+    def __init__(self, history: int = 240):
+        self.requests = 0
+        self.results = 0
+        self.pixels = 0
+        self.latency = collections.deque(maxlen=history)
+        # poll() calls a result waited for, roughly frames
+        self.polls = collections.deque(maxlen=history)
+
+    def report(self) -> str:
+        report = f"INFO::PICKING::{self.requests} REQUESTS::{self.results} RESULTS::{self.pixels} PIXELS READ"
+        if self.latency:
+            p50, p99 = np.percentile(np.fromiter(self.latency, dtype=np.float64), (50, 99))
+            report += (f"::LATENCY P50 {p50:.2f}ms P99 {p99:.2f}ms"
+                       f"::POLLS {np.mean(np.fromiter(self.polls, dtype=np.float64)):.1f}")
+
+        return report
+
+
+class PickResult(object):
+    """
+    Objects found in a picked region: ``ids`` holds every ID in it, ``object_id``, ``depth``
+    (window space, 0 near, 1 far) and ``hit`` (window pixel) are those of the hit nearest to
+    the centre of the region, the closest to the camera among equally near ones. None if
+    nothing was hit. ``data`` is what was passed to pick(), e.g. what the IDs stood for then.
+    """
+
+    def __init__(self, region: tuple, ids: np.ndarray, latency: float, object_id: int = None,
+                 depth: float = None, hit: tuple = None, data=None):
+        self.x, self.y, self.width, self.height = region
+        self.ids = ids
+        self.data = data
+        self.latency = latency
+        self.object_id = object_id
+        self.depth = depth
+        self.hit = hit
+
+    def position(self, view_projection: np.ndarray, viewport: tuple) -> np.ndarray:
+        """
+        World position of the closest hit, None if nothing was hit.
+        :param view_projection: projection @ view the IDs were drawn with
+        :param viewport: (width, height) of the picked window, same units as the pick coordinates
+        :return:
+        """
+        if self.depth is None:
+            return None
+        ndc = np.array((2.0 * self.hit[0] / viewport[0] - 1.0, 1.0 - 2.0 * self.hit[1] / viewport[1],
+                        2.0 * self.depth - 1.0, 1.0))
+        world = np.linalg.inv(view_projection) @ ndc
+
+        return world[:3] / world[3]
+
+
+class ObjectPicker(object):
+    """
+    R32UI + depth framebuffer the IDs are drawn into, and the PBOs of the pending readbacks.
+    Needs a current context, results are only valid with the context they were picked in.
+    """
+
+    def __init__(self, width: int, height: int, scale: float = 1.0):
+        """
+        :param width: Width of the window picked in, pick coordinates are in these pixels
+        :param height: Height of the window picked in
+        :param scale: Resolution of the ID buffer relative to the window, e.g. 0.5
+        """
+        self.scale = scale
+        self.stats = PickStats()
+
+        # [(pbo, capacity), fence, region, GL rect, ID buffer height, request time, polls, data] in request order
+        self.__pending = collections.deque()
+        # (pbo, capacity in bytes) ready for reuse
+        self.__free_pbos = []
+        self.__fbo = None
+        self.__allocate(width, height)
+
+    @property
+    def pending(self) -> bool:
+        return bool(self.__pending)
+
+    def resize(self, width: int, height: int):
+        if (width, height) == (self.width, self.height):
+            return
+
+        self.__free_targets()
+        self.__allocate(width, height)
+
+    def pick(self, x: int, y: int, draw, width: int = 1, height: int = 1, data=None) -> bool:
+        """
+        Draw the IDs of a region and queue its readback. Returns without waiting for the GPU.
+        :param x, y: Top left corner in window pixels, origin at the top left like mouse events
+        :param draw: Callable drawing the scene's IDs, called with the ID framebuffer bound
+        :param width, height: Region size in window pixels, e.g. a few pixels around the
+                              cursor or a selection rectangle
+        :param data: Handed back as PickResult.data, e.g. the ID -> object map of this frame
+        :return: False if the region is outside the ID buffer (e.g. the window shrank since
+                 the click) and nothing was queued
+        """
+        # Region in ID buffer pixels, GL rows start at the bottom
+        left = max(int(math.floor(x * self.scale)), 0)
+        right = min(int(math.ceil((x + width) * self.scale)), self.__width)
+        top = max(int(math.floor(y * self.scale)), 0)
+        bottom = min(int(math.ceil((y + height) * self.scale)), self.__height)
+        if right <= left or bottom <= top:
+            return False
+        rect = (left, self.__height - bottom, right - left, bottom - top)
+        requested = time.perf_counter()
+
+        state = default_state()
+        previous_read = gl.glGetIntegerv(gl.GL_READ_FRAMEBUFFER_BINDING)
+        previous_draw = gl.glGetIntegerv(gl.GL_DRAW_FRAMEBUFFER_BINDING)
+        viewport = gl.glGetIntegerv(gl.GL_VIEWPORT)
+        scissor = state.is_enabled(gl.GL_SCISSOR_TEST)
+
+        gl.glBindFramebuffer(gl.GL_FRAMEBUFFER, self.__fbo)
+        gl.glViewport(0, 0, self.__width, self.__height)
+        gl.glScissor(*rect)
+        state.enable(gl.GL_SCISSOR_TEST)
+        state.depth_mask(True)
+        gl.glClearBufferuiv(gl.GL_COLOR, 0, np.zeros(4, dtype=np.uint32))
+        gl.glClearBufferfv(gl.GL_DEPTH, 0, np.ones(1, dtype=np.float32))
+        draw()
+
+        pixels = rect[2] * rect[3]
+        pbo = self.__pbo(pixels * 8)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo[0])
+        gl.glPixelStorei(gl.GL_PACK_ALIGNMENT, 4)
+        gl.glReadBuffer(gl.GL_COLOR_ATTACHMENT0)
+        gl.glReadPixels(*rect, gl.GL_RED_INTEGER, gl.GL_UNSIGNED_INT, ctypes.c_void_p(0))
+        gl.glReadPixels(*rect, gl.GL_DEPTH_COMPONENT, gl.GL_FLOAT, ctypes.c_void_p(pixels * 4))
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+        fence = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+        self.__pending.append([pbo, fence, (x, y, width, height), rect, self.__height, requested, 0,
+                               data])
+
+        state.set_enabled(gl.GL_SCISSOR_TEST, scissor)
+        gl.glViewport(*viewport)
+        gl.glBindFramebuffer(gl.GL_READ_FRAMEBUFFER, previous_read)
+        gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, previous_draw)
+        self.stats.requests += 1
+
+        return True
+
+    def poll(self) -> list:
+        """PickResults of every readback the GPU finished, oldest first. Never blocks."""
+        return self.__collect(block=False)
+
+    def wait(self) -> list:
+        """PickResults of all pending picks, waiting for the GPU."""
+        return self.__collect(block=True)
+
+    def delete(self):
+        for pbo, fence, *_ in self.__pending:
+            gl.glDeleteSync(fence)
+            self.__free_pbos.append(pbo)
+        self.__pending.clear()
+        if self.__free_pbos:
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+            gl.glDeleteBuffers(len(self.__free_pbos), [pbo for pbo, _ in self.__free_pbos])
+            self.__free_pbos = []
+        self.__free_targets()
+
+    def __allocate(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.__width = max(int(round(width * self.scale)), 1)
+        self.__height = max(int(round(height * self.scale)), 1)
+
+        self.__ids, self.__depth = gl.glGenRenderbuffers(2)
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.__ids)
+        gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_R32UI, self.__width, self.__height)
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, self.__depth)
+        gl.glRenderbufferStorage(gl.GL_RENDERBUFFER, gl.GL_DEPTH_COMPONENT32F, self.__width, self.__height)
+        gl.glBindRenderbuffer(gl.GL_RENDERBUFFER, 0)
+
+        previous = gl.glGetIntegerv(gl.GL_DRAW_FRAMEBUFFER_BINDING)
+        self.__fbo = gl.glGenFramebuffers(1)
+        gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, self.__fbo)
+        gl.glFramebufferRenderbuffer(gl.GL_DRAW_FRAMEBUFFER, gl.GL_COLOR_ATTACHMENT0, gl.GL_RENDERBUFFER, self.__ids)
+        gl.glFramebufferRenderbuffer(gl.GL_DRAW_FRAMEBUFFER, gl.GL_DEPTH_ATTACHMENT, gl.GL_RENDERBUFFER, self.__depth)
+        status = gl.glCheckFramebufferStatus(gl.GL_DRAW_FRAMEBUFFER)
+        gl.glBindFramebuffer(gl.GL_DRAW_FRAMEBUFFER, previous)
+        if status != gl.GL_FRAMEBUFFER_COMPLETE:
+            raise RuntimeError(f"ERROR::PICKING::FRAMEBUFFER_INCOMPLETE::{status:#x}")
+
+    def __free_targets(self):
+        # Pending readbacks already copied out of the renderbuffers into their PBOs
+        gl.glDeleteFramebuffers(1, [self.__fbo])
+        gl.glDeleteRenderbuffers(2, [self.__ids, self.__depth])
+        self.__fbo = None
+
+    def __pbo(self, size: int) -> tuple:
+        """(pbo, capacity) of a free PBO of at least ``size`` bytes."""
+        for index, (_, capacity) in enumerate(self.__free_pbos):
+            if capacity >= size:
+                return self.__free_pbos.pop(index)
+
+        if self.__free_pbos:
+            pbo = self.__free_pbos.pop()[0]
+        else:
+            pbo = int(gl.glGenBuffers(1))
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo)
+        gl.glBufferData(gl.GL_PIXEL_PACK_BUFFER, size, None, gl.GL_STREAM_READ)
+        gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+
+        return pbo, size
+
+    def __collect(self, block: bool) -> list:
+        results = []
+        while self.__pending:
+            pending = self.__pending[0]
+            pbo, fence, region, rect, buffer_height, requested, polls, data = pending
+            # The flush bit submits the commands if the frame has not been swapped yet,
+            # an unflushed fence may never signal
+            result = gl.glClientWaitSync(fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, 0)
+            while block and result == gl.GL_TIMEOUT_EXPIRED:
+                result = gl.glClientWaitSync(fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000)
+            if result == gl.GL_TIMEOUT_EXPIRED:
+                pending[6] += 1
+                break
+            self.__pending.popleft()
+            gl.glDeleteSync(fence)
+
+            pixels = rect[2] * rect[3]
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, pbo[0])
+            address = gl.glMapBufferRange(gl.GL_PIXEL_PACK_BUFFER, 0, pixels * 8, gl.GL_MAP_READ_BIT)
+            mapped = mapped_array(address, pixels * 8)
+            ids = mapped[:pixels * 4].view(np.uint32).copy()
+            depths = mapped[pixels * 4:].view(np.float32).copy()
+            gl.glUnmapBuffer(gl.GL_PIXEL_PACK_BUFFER)
+            gl.glBindBuffer(gl.GL_PIXEL_PACK_BUFFER, 0)
+            self.__free_pbos.append(pbo)
+
+            latency = time.perf_counter() - requested
+            results.append(self.__result(region, rect, buffer_height, ids, depths, latency, data))
+            self.stats.results += 1
+            self.stats.pixels += pixels
+            self.stats.latency.append(latency * 1000.0)
+            self.stats.polls.append(polls + 1)
+
+        return results
+
+    def __result(self, region, rect, buffer_height, ids, depths, latency, data) -> PickResult:
+        hits = np.flatnonzero(ids)
+        if not len(hits):
+            return PickResult(region, np.zeros(0, dtype=np.uint32), latency, data=data)
+
+        # Hit pixels by distance to the centre of the region (the cursor), then by depth
+        rows, columns = np.divmod(hits, rect[2])
+        offsets = np.hypot(columns + 0.5 - rect[2] / 2.0, rows + 0.5 - rect[3] / 2.0)
+        closest = hits[np.lexsort((depths[hits], offsets))[0]]
+        row, column = divmod(int(closest), rect[2])
+        # Centre of that pixel, back to window pixels with the origin at the top
+        hit = ((rect[0] + column + 0.5) / self.scale, (buffer_height - rect[1] - row - 0.5) / self.scale)
+
+        return PickResult(region, np.unique(ids[hits]), latency, int(ids[closest]), float(depths[closest]), hit,
+                          data)
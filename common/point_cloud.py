@@ -0,0 +1,325 @@
+"""
+Point clouds of tens of millions of points (LiDAR scans) drawn as point sprites.
+
+prepare_points() sorts the points along a Morton curve and cuts them into chunks of
+CHUNK_POINTS neighbours, then shuffles the points inside every chunk. A chunk is thus a
+small box of space, and any prefix of it is a uniform random subsample of that box:
+
+- culling:  the chunk boxes go into a BoundingVolumeHierarchy, chunks outside the frustum
+            are not drawn at all
+- LOD:      a chunk draws only as many points from its start as the screen area its points
+            cover needs (``density`` points per pixel), from the chunk's point spacing and
+            distance: far or dense chunks draw a fraction of theirs.
+            Sprites of a thinned chunk grow by sqrt(points / drawn) so the surface stays closed
+- budget:   when the selected points exceed ``point_budget``, every chunk is thinned further
+
+Chunks are stored back to back in vertex buffers of GROUP_CHUNKS chunks, each drawn with a
+single glMultiDrawArrays of (first, count) per visible chunk. Prepared clouds are written
+as .points files (the .mesh layout, see mesh_io.py) and memory-mapped when read again:
+
+    python -m common.point_cloud scan.ply scan.points
+
+Shader side, the per-chunk sprite scale is read from a uniform block:
+
+    layout (std140, binding = 1) uniform PointChunks
+    {
+        vec4 u_chunkScale[1024];     // chunk i: u_chunkScale[i / 4][i % 4]
+    };
+    uniform int u_chunkSize;
+    uniform int u_firstChunk;        // first chunk of the buffer drawn, gl_VertexID counts from there
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .culling import BoundingVolumeHierarchy, _morton_codes
+from .gl_state import default_state
+from .lod import projection_scale
+from .mesh import UPLOAD_CHUNK
+from .mesh_io import MeshData, import_mesh, read_mesh, write_mesh
+from .vertex_format import VertexFormat
+
+# Points per chunk: the unit of culling and level of detail
+CHUNK_POINTS = 65536
+# Chunks per vertex buffer, 64 MB of points
+GROUP_CHUNKS = 64
+# Chunks the sprite scale block holds, 4 per vec4 in 16 KB (the minimum GL_MAX_UNIFORM_BLOCK_SIZE)
+MAX_CHUNKS = 4096
+# Uniform block binding of the sprite scales, 0 is the camera (uniform_buffer.py)
+CHUNK_BINDING = 1
+# Largest sprite growth of a thinned chunk, beyond it the cloud rather shows its gaps
+MAX_SIZE_SCALE = 4.0
+POINT_DTYPE = np.dtype([("position", "<f4", (3,)), ("color", "u1", (4,))])
+
+
+class PointStats(object):
+    """Points and chunks of the cloud against those drawn in the last frame."""
+
+    def __init__(self):
+        self.points = 0
+        self.chunks = 0
+        self.visible_chunks = 0
+        self.drawn = 0
+        self.draws = 0
+        self.seconds = 0.0
+
+    def report(self) -> str:
+        share = self.drawn / self.points * 100.0 if self.points else 0.0
+
+        return (f"INFO::POINTS::{self.drawn}/{self.points} DRAWN ({share:.1f}%)"
+                f"::CHUNKS {self.visible_chunks}/{self.chunks} VISIBLE::{self.draws} DRAWS"
+                f"::SELECT {self.seconds * 1000.0:.2f}ms")
+
+
+def height_colors(positions: np.ndarray, axis: int = 1) -> np.ndarray:
+    """(N, 4) uint8 blue to yellow ramp over the height along ``axis``, for clouds without colors."""
+    height = np.asarray(positions[:, axis], dtype=np.float32)
+    low, high = float(height.min()), float(height.max())
+    t = (height - low) / max(high - low, 1e-30)
+    colors = np.empty((len(t), 4), dtype=np.uint8)
+    colors[:, 0] = 40.0 + 215.0 * t
+    colors[:, 1] = 80.0 + 150.0 * t
+    colors[:, 2] = 220.0 - 180.0 * t
+    colors[:, 3] = 255
+
+    return colors
+
+
+def prepare_points(positions: np.ndarray, colors: np.ndarray = None, chunk_size: int = CHUNK_POINTS,
+                   seed: int = 0) -> MeshData:
+    """
+    Chunked point order: Morton sorted, shuffled within every chunk. No GL calls.
+    :param positions: (N, 3) floats, e.g. a memory-mapped array
+    :param colors: (N, 3) or (N, 4) uint8, a height ramp if None
+    :param chunk_size: Points per chunk, the same value has to be passed to PointCloud
+    :param seed: Seed of the shuffle, the same cloud always gets the same order
+    :return: MeshData with POINT_DTYPE vertices and no indices
+    """
+    positions = np.asarray(positions, dtype=np.float32)
+    if colors is None:
+        colors = height_colors(positions)
+    order = np.argsort(_morton_codes(positions), kind="stable")
+
+    rng = np.random.default_rng(seed)
+    for start in range(0, len(order), chunk_size):
+        chunk = order[start:start + chunk_size]
+        chunk[:] = chunk[rng.permutation(len(chunk))]
+
+    vertices = np.empty(len(order), dtype=POINT_DTYPE)
+    vertices["position"] = positions[order]
+    vertices["color"][:, :colors.shape[1]] = np.asarray(colors)[order]
+    if colors.shape[1] == 3:
+        vertices["color"][:, 3] = 255
+
+    return MeshData(vertices, np.zeros(0, dtype=np.uint32), normalized=("color",))
+
+
+def read_points(path: str, chunk_size: int = CHUNK_POINTS) -> MeshData:
+    """
+    Open a point cloud, no GL calls: .points files are memory-mapped as they are, .npy
+    arrays ((N, 3) positions or a structured array with "position" and "color") are
+    mapped and prepared, .ply / .obj are imported and prepared.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".points":
+        return read_mesh(path)
+    if extension == ".npy":
+        array = np.load(path, mmap_mode="r")
+        if array.dtype.names is None:
+            return prepare_points(array, None, chunk_size)
+        colors = array["color"] if "color" in array.dtype.names else None
+        return prepare_points(array["position"], colors, chunk_size)
+
+    mesh = import_mesh(path)
+    colors = mesh.vertices["color"] if "color" in mesh.vertices.dtype.names else None
+    if colors is not None and colors.dtype != np.uint8:
+        colors = (np.clip(colors, 0.0, 1.0) * 255.0).astype(np.uint8)
+
+    return prepare_points(mesh.vertices["position"], colors, chunk_size)
+
+
+def write_points(path: str, points: MeshData):
+    """Store prepared points, read_points() maps them again without preparing."""
+    write_mesh(path, points)
+
+
+class PointCloud(object):
+    """
+    Prepared points in chunked vertex buffers, culled and thinned per chunk every frame.
+
+        cloud = PointCloud(read_points("scan.points"))
+        ...
+        program.use()                    # position at location 0, color at 1
+        cloud.draw(program, view, projection, viewport_height)
+    """
+
+    def __init__(self, points: MeshData, chunk_size: int = CHUNK_POINTS, locations: dict = None):
+        """
+        Create and fill the buffers. Needs a current context.
+        :param points: From prepare_points() / read_points()
+        :param chunk_size: Chunk size the points were prepared with
+        :param locations: {field name: attribute location}, position at 0 and color at 1 if None
+        """
+        for _ in self.__build(points, chunk_size, locations, UPLOAD_CHUNK):
+            pass
+
+    @classmethod
+    def upload_steps(cls, points: MeshData, chunk_size: int = CHUNK_POINTS, locations: dict = None,
+                     chunk: int = UPLOAD_CHUNK):
+        """
+        Build a PointCloud a few chunks per next(), e.g. within a per-frame budget
+        (AssetLoader). The PointCloud is the value of the generator's StopIteration.
+        """
+        instance = cls.__new__(cls)
+        yield from instance.__build(points, chunk_size, locations, chunk)
+
+        return instance
+
+    def select(self, view: np.ndarray, projection: np.ndarray, viewport_height: int) -> tuple:
+        """
+        Visible chunks and the points each of them draws, see the module docstring.
+        :param view: Row-major view matrix
+        :param projection: Row-major perspective matrix
+        :param viewport_height: Pixels
+        :return: (chunk indices, point counts, sprite scales), nearest chunks first
+        """
+        start = time.perf_counter()
+        chunks = self.bvh.cull(projection @ view)
+
+        # Eye position from the view matrix [R t], eye = -R^T t
+        eye = -view[:3, :3].T @ view[:3, 3]
+        distances = np.linalg.norm(self.centers[chunks] - eye, axis=1)
+        order = np.argsort(distances)
+        chunks, distances = chunks[order], distances[order]
+
+        sizes = self.sizes[chunks]
+        radii = self.radii[chunks]
+        # Screen area the chunk's points cover: each one its spacing squared, in pixels at its distance
+        spacing = self.spacings[chunks] * projection_scale(projection, viewport_height) / np.maximum(distances, 1e-6)
+        # A near chunk covers the viewport at most, projection[1, 1] / projection[0, 0] is the aspect
+        viewport_pixels = viewport_height * viewport_height * projection[1, 1] / projection[0, 0]
+        wanted = np.minimum(sizes * spacing * spacing, viewport_pixels) * self.density
+        counts = np.where(distances <= radii, sizes, np.clip(wanted, self.min_points, sizes)).astype(np.int64)
+        total = int(counts.sum())
+        if total > self.point_budget:
+            counts = np.minimum(np.maximum(counts * self.point_budget // total, self.min_points), sizes)
+        scales = np.minimum(np.sqrt(sizes / np.maximum(counts, 1)), MAX_SIZE_SCALE).astype(np.float32)
+
+        self.stats.visible_chunks = len(chunks)
+        self.stats.drawn = int(counts.sum())
+        self.stats.seconds = time.perf_counter() - start
+
+        return chunks, counts, scales
+
+    def draw(self, program, view: np.ndarray, projection: np.ndarray, viewport_height: int):
+        """
+        Cull, pick the points per chunk and draw them with ``program``, which is in use and
+        reads the camera from the Camera uniform block.
+        """
+        chunks, counts, scales = self.select(view, projection, viewport_height)
+        self.__scales[chunks] = scales
+        state = default_state()
+        state.bind_buffer(gl.GL_UNIFORM_BUFFER, self.scale_buffer)
+        gl.glBufferSubData(gl.GL_UNIFORM_BUFFER, 0, self.__scales.nbytes, self.__scales)
+        # The whole block is bound, the shader declares all MAX_CHUNKS scales
+        state.bind_buffer_range(gl.GL_UNIFORM_BUFFER, CHUNK_BINDING, self.scale_buffer, 0, MAX_CHUNKS * 4)
+        state.enable(gl.GL_PROGRAM_POINT_SIZE)
+        program.set_int("u_chunkSize", self.chunk_size)
+        program.set_float("u_pixelScale", projection_scale(projection, viewport_height))
+        program.set_float("u_pointSize", self.point_size)
+
+        groups = chunks // GROUP_CHUNKS
+        self.stats.draws = 0
+        for group in np.unique(groups):
+            mask = groups == group
+            firsts = ((chunks[mask] - group * GROUP_CHUNKS) * self.chunk_size).astype(np.int32)
+            program.set_int("u_firstChunk", int(group) * GROUP_CHUNKS)
+            state.bind_vertex_array(self.vaos[group])
+            gl.glMultiDrawArrays(gl.GL_POINTS, firsts, counts[mask].astype(np.int32), len(firsts))
+            self.stats.draws += 1
+
+    def delete(self):
+        default_state().delete_vertex_arrays(self.vaos)
+        default_state().delete_buffers(self.vbos + [self.scale_buffer])
+
+    def __build(self, points: MeshData, chunk_size: int, locations: dict, chunk: int):
+        count = points.vertex_count
+        chunk_count = max(1, -(-count // chunk_size))
+        if chunk_count > MAX_CHUNKS:
+            raise ValueError(f"{count} points need {chunk_count} chunks, at most {MAX_CHUNKS} fit the scale block")
+        self.chunk_size = chunk_size
+        self.format = VertexFormat.from_mesh(points)
+        self.stats = PointStats()
+        self.stats.points = count
+        self.stats.chunks = chunk_count
+        # Points drawn per pixel of a chunk's projected area, the floor per visible chunk
+        # and the most points a frame draws
+        self.density = 0.5
+        self.min_points = 64
+        self.point_budget = 8 * 2 ** 20
+
+        starts = np.arange(chunk_count) * chunk_size
+        self.sizes = np.minimum(starts + chunk_size, count) - starts
+        lower = np.zeros((chunk_count, 3), dtype=np.float32)
+        upper = np.zeros((chunk_count, 3), dtype=np.float32)
+        # Uploads go a few whole chunks at a time, their bounds are taken on the way
+        step = max(1, chunk // (chunk_size * points.stride)) * chunk_size
+        self.vbos, self.vaos = [], []
+        state = default_state()
+        for group_start in range(0, max(count, 1), GROUP_CHUNKS * chunk_size):
+            group_end = min(group_start + GROUP_CHUNKS * chunk_size, count)
+            vbo = gl.glGenBuffers(1)
+            self.vbos.append(vbo)
+            state.bind_buffer(gl.GL_COPY_WRITE_BUFFER, vbo)
+            gl.glBufferData(gl.GL_COPY_WRITE_BUFFER, (group_end - group_start) * points.stride, None,
+                            gl.GL_STATIC_DRAW)
+            # The allocation is a step of its own, like Mesh.upload_steps()
+            yield
+            for start in range(group_start, group_end, step):
+                part = np.ascontiguousarray(points.vertices[start:min(start + step, group_end)])
+                state.bind_buffer(gl.GL_COPY_WRITE_BUFFER, vbo)
+                gl.glBufferSubData(gl.GL_COPY_WRITE_BUFFER, (start - group_start) * points.stride, part.nbytes, part)
+                first = start // chunk_size
+                offsets = np.arange(0, len(part), chunk_size)
+                lower[first:first + len(offsets)] = np.minimum.reduceat(part["position"], offsets, axis=0)
+                upper[first:first + len(offsets)] = np.maximum.reduceat(part["position"], offsets, axis=0)
+                yield
+
+        if locations is None:
+            locations = {"position": 0, "color": 1}
+        for vbo in self.vbos:
+            self.vaos.append(gl.glGenVertexArrays(1))
+            state.bind_vertex_array(self.vaos[-1])
+            state.bind_buffer(gl.GL_ARRAY_BUFFER, vbo)
+            self.format.bind(locations)
+        state.bind_vertex_array(0)
+
+        self.lower, self.upper = lower, upper
+        self.centers = (lower + upper) * 0.5
+        self.radii = np.linalg.norm(upper - lower, axis=1) * 0.5
+        self.bvh = BoundingVolumeHierarchy(leaf_size=4)
+        self.bvh.build(lower, upper)
+        # Distance between neighbours, for points spread over the two largest extents of
+        # their chunk (a scanned surface). The sprite diameter in world units is the median
+        extents = np.sort(upper - lower, axis=1)
+        self.spacings = np.sqrt(extents[:, 1] * extents[:, 2] / np.maximum(self.sizes, 1))
+        self.point_size = float(np.median(self.spacings)) if count else 1.0
+
+        self.__scales = np.ones(-(-chunk_count // 4) * 4, dtype=np.float32)
+        self.scale_buffer = gl.glGenBuffers(1)
+        state.bind_buffer(gl.GL_UNIFORM_BUFFER, self.scale_buffer)
+        gl.glBufferData(gl.GL_UNIFORM_BUFFER, MAX_CHUNKS * 4, None, gl.GL_DYNAMIC_DRAW)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print("usage: python -m common.point_cloud input.(ply|obj|npy) output.points")
+        sys.exit(1)
+    start = time.perf_counter()
+    prepared = read_points(sys.argv[1])
+    write_points(sys.argv[2], prepared)
+    print(f"INFO::POINTS::{prepared.vertex_count} POINTS::{-(-prepared.vertex_count // CHUNK_POINTS)} CHUNKS"
+          f"::{time.perf_counter() - start:.2f}s")
@@ -0,0 +1,346 @@
+import collections
+import csv
+import ctypes
+import json
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_info import query_result
+from .gl_state import default_state
+from .shader_program import ShaderProgram
+
+PERCENTILES = (50, 95, 99)
+
+
+class PassTimings(object):
+    """Rolling window of CPU and GPU times of one pass, in milliseconds."""
+
+    def __init__(self, history: int):
+        self.cpu = collections.deque(maxlen=history)
+        self.gpu = collections.deque(maxlen=history)
+
+    def summary(self) -> dict:
+        result = {}
+        for clock, samples in (("cpu", self.cpu), ("gpu", self.gpu)):
+            if not samples:
+                continue
+            values = np.fromiter(samples, dtype=np.float64, count=len(samples))
+            stats = dict(zip((f"p{p}" for p in PERCENTILES), np.percentile(values, PERCENTILES).tolist()))
+            stats["mean"] = float(values.mean())
+            stats["samples"] = len(values)
+            result[clock] = stats
+
+        return result
+
+
+class FrameProfiler(object):
+    """
+    CPU and GPU timings of named render passes.
+
+    Every pass is wrapped in a GL_TIME_ELAPSED query next to a perf_counter_ns() pair:
+
+        profiler.begin_frame()
+        with profiler.section("grid"):
+            grid.draw()
+        profiler.end_frame()
+
+    Query results are only read once GL_QUERY_RESULT_AVAILABLE says so, usually a frame or
+    two later, so reading never waits for the GPU. Queries still pending after
+    ``max_latency`` frames are dropped and counted in ``dropped``. Passes can not be nested,
+    GL_TIME_ELAPSED queries do not nest; the whole frame is timed on the CPU as pass "frame".
+    """
+
+    FRAME = "frame"
+
+    def __init__(self, history: int = 240, max_latency: int = 8):
+        """
+        Needs a current context.
+        :param history: Number of frames kept for the percentiles
+        :param max_latency: Frames a query result may take to arrive
+        """
+        self.history = history
+        self.max_latency = max_latency
+        self.enabled = True
+        self.dropped = 0
+
+        # Pass names in order of first appearance, drawing order for the overlay
+        self.passes = collections.OrderedDict()
+        self.frames = 0
+
+        # (frame, name, query) in submission order, waiting for their result
+        self.__pending = collections.deque()
+        # Unused query objects, GL names are recycled instead of generated every frame
+        self.__free_queries = []
+        self.__frame_start = None
+        self.__open = None
+
+    def begin_frame(self):
+        if not self.enabled:
+            return
+
+        self.__collect()
+        self.__frame_start = time.perf_counter_ns()
+
+    def end_frame(self):
+        if not self.enabled or self.__frame_start is None:
+            return
+
+        self.__timings(self.FRAME).cpu.append((time.perf_counter_ns() - self.__frame_start) / 1e6)
+        self.__frame_start = None
+        self.frames += 1
+
+    def section(self, name: str):
+        """Context manager timing one pass. Does nothing while the profiler is disabled."""
+        return _Section(self, name)
+
+    def begin(self, name: str):
+        if not self.enabled:
+            return
+        if self.__open is not None:
+            raise RuntimeError(f"Pass '{name}' started inside '{self.__open[0]}', passes can not be nested")
+
+        query = self.__free_queries.pop() if self.__free_queries else int(gl.glGenQueries(1)[0])
+        gl.glBeginQuery(gl.GL_TIME_ELAPSED, query)
+        self.__open = (name, query, time.perf_counter_ns())
+
+    def end(self):
+        if not self.enabled or self.__open is None:
+            return
+
+        name, query, start = self.__open
+        gl.glEndQuery(gl.GL_TIME_ELAPSED)
+        self.__timings(name).cpu.append((time.perf_counter_ns() - start) / 1e6)
+        self.__pending.append((self.frames, name, query))
+        self.__open = None
+
+    def summary(self) -> dict:
+        """{pass: {"cpu": {"p50", "p95", "p99", "mean", "samples"}, "gpu": {...}}}"""
+        return {name: timings.summary() for name, timings in self.passes.items()}
+
+    def report(self) -> str:
+        lines = []
+        for name, clocks in self.summary().items():
+            for clock, stats in clocks.items():
+                lines.append(f"INFO::PROFILE::{name}::{clock.upper()}::"
+                             + "::".join(f"P{p} {stats[f'p{p}']:.3f}ms" for p in PERCENTILES))
+
+        return "\n".join(lines)
+
+    def export_json(self, path: str, metadata: dict = None):
+        """
+        Write the percentiles together with the renderer, so runs on different machines
+        or releases can be compared.
+        :param path: Output file
+        :param metadata: Extra entries, e.g. a release tag or scene name
+        :return:
+        """
+        document = {
+            "renderer": gl.glGetString(gl.GL_RENDERER).decode(),
+            "version": gl.glGetString(gl.GL_VERSION).decode(),
+            "frames": self.frames,
+            "dropped_queries": self.dropped,
+            "passes": self.summary(),
+        }
+        document.update(metadata or {})
+        with open(path, "w") as file:
+            json.dump(document, file, indent=2)
+
+    def export_csv(self, path: str):
+        """One row per pass and clock: pass, clock, p50, p95, p99, mean, samples."""
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(["pass", "clock"] + [f"p{p}_ms" for p in PERCENTILES] + ["mean_ms", "samples"])
+            for name, clocks in self.summary().items():
+                for clock, stats in clocks.items():
+                    writer.writerow([name, clock] + [f"{stats[f'p{p}']:.4f}" for p in PERCENTILES]
+                                    + [f"{stats['mean']:.4f}", stats["samples"]])
+
+    def export(self, path: str):
+        """export_csv() for .csv paths, export_json() otherwise."""
+        if path.endswith(".csv"):
+            self.export_csv(path)
+        else:
+            self.export_json(path)
+
+    def delete(self):
+        queries = self.__free_queries + [query for _, _, query in self.__pending]
+        if queries:
+            gl.glDeleteQueries(len(queries), queries)
+        self.__free_queries = []
+        self.__pending.clear()
+
+    def __timings(self, name: str) -> PassTimings:
+        timings = self.passes.get(name)
+        if timings is None:
+            timings = self.passes[name] = PassTimings(self.history)
+
+        return timings
+
+    def __collect(self):
+        """Read every finished query, oldest first. The GPU completes them in order."""
+        while self.__pending:
+            frame, name, query = self.__pending[0]
+            if gl.glGetQueryObjectiv(query, gl.GL_QUERY_RESULT_AVAILABLE):
+                self.__timings(name).gpu.append(query_result(query) / 1e6)
+                self.__free_queries.append(query)
+            elif self.frames - frame > self.max_latency:
+                # Waiting would stall the frame, let it finish and forget the sample
+                self.dropped += 1
+                gl.glDeleteQueries(1, [query])
+            else:
+                return
+            self.__pending.popleft()
+
+
+class _Section(object):
+
+    def __init__(self, profiler: FrameProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.profiler.begin(self.name)
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.end()
+
+
+OVERLAY_VERTEX = """
+#version 330 core
+layout (location = 0) in vec4 a_rect;    // x0, y0, x1, y1 in NDC
+layout (location = 1) in vec4 a_color;
+
+out vec4 v_color;
+
+void main()
+{
+    vec2 corner = vec2(gl_VertexID & 1, gl_VertexID >> 1);
+    gl_Position = vec4(mix(a_rect.xy, a_rect.zw, corner), 0.0, 1.0);
+    v_color = a_color;
+}
+"""
+
+OVERLAY_FRAGMENT = """
+#version 330 core
+in vec4 v_color;
+out vec4 fragColor;
+
+void main()
+{
+    fragColor = v_color;
+}
+"""
+
+PASS_COLORS = np.array([
+    (0.90, 0.30, 0.25, 0.85),
+    (0.25, 0.65, 0.90, 0.85),
+    (0.35, 0.80, 0.35, 0.85),
+    (0.95, 0.75, 0.20, 0.85),
+    (0.70, 0.40, 0.85, 0.85),
+    (0.30, 0.80, 0.75, 0.85),
+], dtype=np.float32)
+
+
+class ProfilerOverlay(object):
+    """
+    Stacked bar graph of the last frames drawn in a corner of the viewport, one color per
+    pass in order of first appearance. GPU times are used when available, CPU times
+    otherwise. The white line marks 16.7 ms (60 FPS), the graph top is 33.3 ms.
+
+    Plain instanced quads, no text or font rendering: pass names and exact numbers are in
+    FrameProfiler.report() and the exports.
+    """
+
+    def __init__(self, profiler: FrameProfiler, frames: int = 120, scale_ms: float = 1000.0 / 30.0,
+                 rect=(-0.98, -0.98, -0.38, -0.68)):
+        """
+        Needs a current context.
+        :param profiler: Profiler to visualise
+        :param frames: Number of bars
+        :param scale_ms: Time at the top of the graph
+        :param rect: Graph area (x0, y0, x1, y1) in NDC
+        """
+        self.profiler = profiler
+        self.frames = frames
+        self.scale_ms = scale_ms
+        self.rect = rect
+        self.visible = False
+
+        self.vao = gl.glGenVertexArrays(1)
+        self.vbo = gl.glGenBuffers(1)
+        state = default_state()
+        state.bind_vertex_array(self.vao)
+        state.bind_buffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        for location in (0, 1):
+            gl.glEnableVertexAttribArray(location)
+            gl.glVertexAttribPointer(location, 4, gl.GL_FLOAT, gl.GL_FALSE, 8 * 4, ctypes.c_void_p(location * 4 * 4))
+            gl.glVertexAttribDivisor(location, 1)
+        self.program = ShaderProgram.from_sources(OVERLAY_VERTEX, OVERLAY_FRAGMENT)
+        state.bind_vertex_array(0)
+
+    def toggle(self):
+        self.visible = not self.visible
+
+    def draw(self):
+        if not self.visible:
+            return
+
+        instances = self.__build_rects()
+        x0, y0, x1, y1 = self.rect
+
+        state = default_state()
+        state.bind_buffer(gl.GL_ARRAY_BUFFER, self.vbo)
+        # Orphan and refill, the graph changes every frame
+        gl.glBufferData(gl.GL_ARRAY_BUFFER, instances.nbytes, instances, gl.GL_STREAM_DRAW)
+
+        depth_test = state.is_enabled(gl.GL_DEPTH_TEST)
+        state.disable(gl.GL_DEPTH_TEST)
+        state.enable(gl.GL_BLEND)
+        state.blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+
+        self.program.use()
+        state.bind_vertex_array(self.vao)
+        gl.glDrawArraysInstanced(gl.GL_TRIANGLE_STRIP, 0, 4, len(instances))
+
+        state.disable(gl.GL_BLEND)
+        state.set_enabled(gl.GL_DEPTH_TEST, depth_test)
+
+    def delete(self):
+        default_state().delete_vertex_arrays([self.vao])
+        default_state().delete_buffers([self.vbo])
+
+    def __build_rects(self) -> np.ndarray:
+        x0, y0, x1, y1 = self.rect
+        bar_width = (x1 - x0) / self.frames
+        to_height = (y1 - y0) / self.scale_ms
+
+        # (frames, passes) times of the newest frames, right aligned
+        names = [name for name in self.profiler.passes if name != FrameProfiler.FRAME]
+        times = np.zeros((self.frames, max(len(names), 1)), dtype=np.float32)
+        for column, name in enumerate(names):
+            timings = self.profiler.passes[name]
+            samples = timings.gpu if timings.gpu else timings.cpu
+            recent = list(samples)[-self.frames:]
+            if recent:
+                times[self.frames - len(recent):, column] = recent
+
+        tops = np.cumsum(times, axis=1)
+        bottoms = tops - times
+        left = x0 + np.arange(self.frames, dtype=np.float32) * bar_width
+
+        bars = np.empty((self.frames, times.shape[1], 8), dtype=np.float32)
+        bars[:, :, 0] = left[:, None]
+        bars[:, :, 1] = y0 + np.minimum(bottoms, self.scale_ms) * to_height
+        bars[:, :, 2] = (left + bar_width * 0.8)[:, None]
+        bars[:, :, 3] = y0 + np.minimum(tops, self.scale_ms) * to_height
+        bars[:, :, 4:] = PASS_COLORS[np.arange(times.shape[1]) % len(PASS_COLORS)]
+
+        background = np.array([[x0, y0, x1, y1, 0.0, 0.0, 0.0, 0.5]], dtype=np.float32)
+        budget_y = y0 + 1000.0 / 60.0 * to_height
+        budget = np.array([[x0, budget_y - 0.002, x1, budget_y + 0.002, 1.0, 1.0, 1.0, 0.8]], dtype=np.float32)
+
+        return np.concatenate((background, bars.reshape(-1, 8), budget))
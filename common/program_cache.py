@@ -0,0 +1,199 @@
+import ctypes
+import hashlib
+import os
+import struct
+import time
+
+import OpenGL.GL as gl
+from OpenGL.GL.shaders import compileShader
+from OpenGL.error import GLError
+
+from .gl_info import supports
+
+# Bump when the key or file layout changes, old entries are then simply never hit again
+CACHE_VERSION = 1
+HEADER = struct.Struct("<4sI")
+MAGIC = b"GLPB"
+
+
+def default_directory() -> str:
+    """$PYOPENGL_PROGRAM_CACHE, or the user's cache folder."""
+    directory = os.environ.get("PYOPENGL_PROGRAM_CACHE")
+    if directory:
+        return directory
+
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+
+    return os.path.join(base, "python-opengl", "programs")
+
+
+class ProgramCache(object):
+    """
+    Linked programs persisted with glGetProgramBinary / glProgramBinary.
+
+    Entries are keyed by a SHA-256 of the shader sources, the defines and the driver
+    (vendor, renderer, version), so a driver update or an edited shader never loads a stale
+    binary. Drivers may still reject a binary they wrote earlier; the program is then
+    compiled from source and the entry replaced. Without ARB_get_program_binary (or with
+    zero binary formats) every program is simply compiled.
+    """
+
+    def __init__(self, directory: str = None):
+        """
+        :param directory: Cache folder, default_directory() if omitted. Created on first store.
+        """
+        self.directory = directory or default_directory()
+
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.compile_time = 0.0
+        self.load_time = 0.0
+
+        # Queried from the first context that uses the cache
+        self.__driver = None
+        self.__supported = None
+
+    def program(self, vertex_src: str, fragment_src: str, defines: dict = None) -> int:
+        """
+        Linked program for these sources, from disk when possible. Needs a current context.
+        :param vertex_src: Vertex shader source, defines already applied
+        :param fragment_src: Fragment shader source, defines already applied
+        :param defines: Defines the sources were built with, only used for the key
+        :return: OpenGL program name
+        """
+        start = time.perf_counter()
+        key = self.key(vertex_src, fragment_src, defines)
+        path = os.path.join(self.directory, key + ".bin")
+
+        if self.__binaries_supported() and os.path.exists(path):
+            program = self.__load(path)
+            if program is not None:
+                self.hits += 1
+                self.load_time += time.perf_counter() - start
+
+                return program
+            self.rejected += 1
+
+        self.misses += 1
+        program = self.__link(vertex_src, fragment_src)
+        if self.__binaries_supported():
+            self.__store(program, path)
+        self.compile_time += time.perf_counter() - start
+
+        return program
+
+    def key(self, vertex_src: str, fragment_src: str, defines: dict = None) -> str:
+        digest = hashlib.sha256()
+        digest.update(f"{CACHE_VERSION}\0{self.__driver_string()}\0".encode())
+        for name, value in sorted((defines or {}).items()):
+            digest.update(f"{name}={value}\0".encode())
+        digest.update(vertex_src.encode())
+        digest.update(b"\0")
+        digest.update(fragment_src.encode())
+
+        return digest.hexdigest()
+
+    def clear(self):
+        """Delete every cached binary."""
+        if not os.path.isdir(self.directory):
+            return
+        for name in os.listdir(self.directory):
+            if name.endswith(".bin"):
+                os.remove(os.path.join(self.directory, name))
+
+    def report(self) -> str:
+        return (f"INFO::PROGRAM_CACHE::HITS::{self.hits}::MISSES::{self.misses}::REJECTED::{self.rejected}"
+                f"::LOAD {self.load_time * 1000.0:.1f}ms::COMPILE {self.compile_time * 1000.0:.1f}ms")
+
+    def __driver_string(self) -> str:
+        if self.__driver is None:
+            self.__driver = "|".join(gl.glGetString(name).decode()
+                                     for name in (gl.GL_VENDOR, gl.GL_RENDERER, gl.GL_VERSION))
+
+        return self.__driver
+
+    def __binaries_supported(self) -> bool:
+        if self.__supported is None:
+            self.__supported = (supports((4, 1), "GL_ARB_get_program_binary")
+                                and gl.glGetIntegerv(gl.GL_NUM_PROGRAM_BINARY_FORMATS) > 0)
+
+        return self.__supported
+
+    @staticmethod
+    def __link(vertex_src: str, fragment_src: str) -> int:
+        shaders = [compileShader(vertex_src, gl.GL_VERTEX_SHADER),
+                   compileShader(fragment_src, gl.GL_FRAGMENT_SHADER)]
+
+        program = gl.glCreateProgram()
+        for shader in shaders:
+            gl.glAttachShader(program, shader)
+        # Must be set before linking for glGetProgramBinary to return anything
+        gl.glProgramParameteri(program, gl.GL_PROGRAM_BINARY_RETRIEVABLE_HINT, gl.GL_TRUE)
+        gl.glLinkProgram(program)
+
+        for shader in shaders:
+            gl.glDetachShader(program, shader)
+            gl.glDeleteShader(shader)
+
+        if gl.glGetProgramiv(program, gl.GL_LINK_STATUS) != gl.GL_TRUE:
+            log = gl.glGetProgramInfoLog(program)
+            gl.glDeleteProgram(program)
+            raise RuntimeError(f"Link failure: {log}")
+
+        return program
+
+    @staticmethod
+    def __load(path: str):
+        with open(path, "rb") as file:
+            data = file.read()
+        if len(data) <= HEADER.size:
+            return None
+        magic, binary_format = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            return None
+
+        blob = data[HEADER.size:]
+        program = gl.glCreateProgram()
+        try:
+            gl.glProgramBinary(program, binary_format, blob, len(blob))
+        except GLError:
+            # Format no longer offered by the driver
+            gl.glDeleteProgram(program)
+            return None
+        # A rejected binary is not an error, it just leaves the program unlinked
+        if gl.glGetProgramiv(program, gl.GL_LINK_STATUS) != gl.GL_TRUE:
+            gl.glDeleteProgram(program)
+            return None
+
+        return program
+
+    def __store(self, program: int, path: str):
+        length = gl.glGetProgramiv(program, gl.GL_PROGRAM_BINARY_LENGTH)
+        if length <= 0:
+            return
+
+        blob = (ctypes.c_ubyte * length)()
+        written = gl.GLsizei(0)
+        binary_format = gl.GLenum(0)
+        gl.glGetProgramBinary(program, length, ctypes.byref(written), ctypes.byref(binary_format), blob)
+
+        os.makedirs(self.directory, exist_ok=True)
+        # Write next to the target and rename, a crash never leaves a truncated entry behind
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(HEADER.pack(MAGIC, binary_format.value))
+            file.write(bytes(blob)[:written.value])
+        os.replace(temporary, path)
+
+
+_default_cache = None
+
+
+def default_cache() -> ProgramCache:
+    """Process wide cache in default_directory(), shared by all examples."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ProgramCache()
+
+    return _default_cache
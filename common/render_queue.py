@@ -0,0 +1,284 @@
+"""
+Render queue: draws are submitted as packets in any order, sorted by state and issued with
+as few state changes and draw calls as possible.
+
+Every packet gets a 64-bit sort key, most significant first:
+
+    pass (4) | program (12) | material (12) | VAO (12) | depth (24)
+
+so a sorted frame switches pass, then program, then material, then VAO as rarely as
+possible, and draws front to back inside one state. Blending needs the transparent pass
+back to front across states, there the inverted depth comes right after the pass and
+the state fields follow. Programs, materials and VAOs get their key ids per frame, in
+order of submission.
+
+Keys are sorted with an LSD radix sort over 16-bit digits: numpy's stable argsort is a
+counting sort for 16-bit integers, four passes sort 64 bits and digits that are the same
+for every key (e.g. unused pass bits) are skipped. Runs of packets sharing program,
+material, VAO, mode and index type become one glMultiDrawElementsIndirect (or
+glMultiDrawArraysIndirect) call reading its commands from a GL_DRAW_INDIRECT_BUFFER filled
+once per frame. Without GL 4.3 every packet is its own draw call, still in sorted order.
+
+    queue.submit(program, mesh.vao, mesh.index_count, index_type=mesh.index_type)
+    grid.submit(queue)
+    queue.flush()
+    print(queue.stats.report())
+
+A material is any object with bind() and, optionally, unbind(): bind() runs after its
+program is in use, unbind() when the next packet uses another material.
+"""
+import ctypes
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_info import supports
+from .gl_state import default_state
+
+PASS_OPAQUE = 0
+PASS_TRANSPARENT = 1
+PASS_OVERLAY = 2
+# Sorted back to front before state, everything else by state then front to back
+BACK_TO_FRONT = (PASS_TRANSPARENT,)
+
+# Bit widths of the key fields
+PASS_BITS, PROGRAM_BITS, MATERIAL_BITS, VAO_BITS, DEPTH_BITS = 4, 12, 12, 12, 24
+DEPTH_SHIFT = 0
+VAO_SHIFT = DEPTH_SHIFT + DEPTH_BITS
+MATERIAL_SHIFT = VAO_SHIFT + VAO_BITS
+PROGRAM_SHIFT = MATERIAL_SHIFT + MATERIAL_BITS
+PASS_SHIFT = PROGRAM_SHIFT + PROGRAM_BITS
+
+PACKET_DTYPE = np.dtype([("pass", np.int64), ("program", np.int64), ("material", np.int64), ("vao", np.int64),
+                         ("depth", np.float32), ("mode", np.int64), ("index_type", np.int64),
+                         ("count", np.uint32), ("instances", np.uint32), ("first", np.uint32),
+                         ("base_vertex", np.int32), ("base_instance", np.uint32)])
+# Fields that have to match for packets to share one multi-draw call
+_BATCH_FIELDS = ("program", "material", "vao", "mode", "index_type")
+
+# DrawElementsIndirectCommand, DrawArraysIndirectCommand padded to the same size
+COMMAND_DTYPE = np.dtype([("count", np.uint32), ("instances", np.uint32), ("first", np.uint32),
+                          ("base_vertex", np.int32), ("base_instance", np.uint32)])
+# Arrays commands have no base vertex: (count, instances, first, base_instance, unused)
+_ARRAYS = 0
+
+_INDEX_SIZES = {gl.GL_UNSIGNED_BYTE: 1, gl.GL_UNSIGNED_SHORT: 2, gl.GL_UNSIGNED_INT: 4}
+
+
+class QueueStats(object):
+    """Draw calls and state changes of the last flush, in submission order and sorted."""
+
+    def __init__(self):
+        self.frames = 0
+        self.packets = 0
+        self.draw_calls = 0
+        self.unsorted_draw_calls = 0
+        self.state_changes = 0
+        self.unsorted_state_changes = 0
+        self.sort_time = 0.0
+
+    def report(self) -> str:
+        return (f"INFO::RENDER_QUEUE::{self.packets} PACKETS"
+                f"::STATE CHANGES {self.unsorted_state_changes} -> {self.state_changes}"
+                f"::DRAW CALLS {self.unsorted_draw_calls} -> {self.draw_calls}"
+                f"::SORT {self.sort_time * 1000.0:.2f}ms")
+
+
+class RenderQueue(object):
+    """Packets of one frame, sorted and drawn by flush(). Needs a current context."""
+
+    def __init__(self, multi_draw: bool = None):
+        """
+        :param multi_draw: Force (True) or disable (False) indirect multi-draw, detected if None
+        """
+        available = supports((4, 3), "GL_ARB_multi_draw_indirect")
+        self.multi_draw = available if multi_draw is None else multi_draw and available
+        self.stats = QueueStats()
+
+        # PACKET_DTYPE tuples in submission order
+        self.__packets = []
+        self.__materials = []
+        self.indirect_buffer = gl.glGenBuffers(1) if self.multi_draw else None
+
+    def __len__(self) -> int:
+        return len(self.__packets)
+
+    def submit(self, program, vao, count: int, index_type=gl.GL_UNSIGNED_INT, first: int = 0,
+               base_vertex: int = 0, instances: int = 1, base_instance: int = 0, material=None,
+               pass_id: int = PASS_OPAQUE, depth: float = 0.0, mode=gl.GL_TRIANGLES):
+        """
+        Queue one draw.
+        :param program: Program name or ShaderProgram
+        :param vao: Vertex array holding the attributes and the index buffer
+        :param count: Index count, vertex count for non-indexed draws
+        :param index_type: GL_UNSIGNED_BYTE/SHORT/INT, None for glDrawArrays
+        :param first: First index (or vertex) in elements, not bytes
+        :param base_vertex: Added to every index
+        :param instances: Instance count
+        :param base_instance: First instance of the per-instance attributes
+        :param material: Object with bind() (and unbind()), None for none
+        :param pass_id: PASS_OPAQUE, PASS_TRANSPARENT, PASS_OVERLAY, up to 15
+        :param depth: 0 (near) to 1 (far), orders draws inside a state
+        :param mode: Primitive type
+        :return:
+        """
+        if count == 0 or instances == 0:
+            return
+
+        self.__packets.append((pass_id, int(program), self.__material_id(material), int(vao), depth,
+                               mode, _ARRAYS if index_type is None else index_type,
+                               count, instances, first, base_vertex, base_instance))
+
+    def flush(self):
+        """Sort and draw everything submitted since the last flush, then empty the queue."""
+        packets, materials = self.__packets, self.__materials
+        self.__packets, self.__materials = [], []
+        self.stats.frames += 1
+        self.stats.packets = len(packets)
+        if not packets:
+            self.stats.draw_calls = self.stats.unsorted_draw_calls = 0
+            self.stats.state_changes = self.stats.unsorted_state_changes = 0
+            return
+
+        table = np.array(packets, dtype=PACKET_DTYPE)
+        keys = self.__keys(table)
+
+        start = time.perf_counter()
+        order = radix_argsort(keys)
+        self.stats.sort_time = time.perf_counter() - start
+
+        self.stats.unsorted_state_changes = _state_changes(table)
+        self.stats.unsorted_draw_calls = len(table)
+        table = table[order]
+        self.stats.state_changes = _state_changes(table)
+
+        # A batch ends wherever program, material, VAO, mode or index type change
+        breaks = np.zeros(len(table) - 1, dtype=bool)
+        for field in _BATCH_FIELDS:
+            breaks |= table[field][1:] != table[field][:-1]
+        breaks = np.flatnonzero(breaks) + 1
+        starts = np.concatenate(([0], breaks))
+        ends = np.concatenate((breaks, [len(table)]))
+
+        commands = np.zeros(len(table), dtype=COMMAND_DTYPE)
+        for field in ("count", "instances", "first"):
+            commands[field] = table[field]
+        arrays = table["index_type"] == _ARRAYS
+        # Arrays commands are 4 words, base instance goes where elements keep the base vertex
+        commands["base_vertex"] = np.where(arrays, table["base_instance"], table["base_vertex"])
+        commands["base_instance"] = np.where(arrays, 0, table["base_instance"])
+        self.__draw(table, commands, starts, ends, materials)
+
+    def delete(self):
+        if self.indirect_buffer is not None:
+            default_state().delete_buffers([self.indirect_buffer])
+            self.indirect_buffer = None
+
+    def __material_id(self, material) -> int:
+        if material is None:
+            return 0
+        # Ids are per frame: a handful of materials, a linear search is cheaper than hashing
+        for index, known in enumerate(self.__materials):
+            if known is material:
+                return index + 1
+        self.__materials.append(material)
+
+        return len(self.__materials)
+
+    @staticmethod
+    def __keys(table: np.ndarray) -> np.ndarray:
+        fields = [(table["pass"], PASS_BITS)]
+        # GL names become dense ids in order of first submission
+        for field, bits in (("program", PROGRAM_BITS), ("material", MATERIAL_BITS), ("vao", VAO_BITS)):
+            names, first = np.unique(table[field], return_index=True)
+            rank = np.empty(len(names), dtype=np.int64)
+            rank[np.argsort(first)] = np.arange(len(names))
+            fields.append((rank[np.searchsorted(names, table[field])], bits))
+        if any(values.max() >= 1 << bits for values, bits in fields):
+            raise ValueError("Too many passes, programs, materials or VAOs in one frame for the sort key")
+
+        passes, programs, materials, vaos = (values.astype(np.uint64) for values, _ in fields)
+        state = ((programs << np.uint64(PROGRAM_SHIFT)) | (materials << np.uint64(MATERIAL_SHIFT))
+                 | (vaos << np.uint64(VAO_SHIFT)))
+        depth = (np.clip(table["depth"], 0.0, 1.0) * ((1 << DEPTH_BITS) - 1)).astype(np.uint64)
+
+        # Back to front passes: inverted depth in the program..VAO bits, state below it
+        back_to_front = np.isin(table["pass"], BACK_TO_FRONT)
+        inverted = np.uint64((1 << DEPTH_BITS) - 1) - depth
+        keys = np.where(back_to_front,
+                        (inverted << np.uint64(PASS_SHIFT - DEPTH_BITS)) | (state >> np.uint64(DEPTH_BITS)),
+                        state | depth)
+
+        return keys | (passes << np.uint64(PASS_SHIFT))
+
+    def __draw(self, table, commands, starts, ends, materials):
+        state = default_state()
+        if self.multi_draw:
+            state.bind_buffer(gl.GL_DRAW_INDIRECT_BUFFER, self.indirect_buffer)
+            gl.glBufferData(gl.GL_DRAW_INDIRECT_BUFFER, commands.nbytes, commands, gl.GL_STREAM_DRAW)
+
+        draw_calls = 0
+        program = material = 0
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            packet = table[start]
+            program_id, material_id, vao = int(packet["program"]), int(packet["material"]), int(packet["vao"])
+            mode, index_type = int(packet["mode"]), int(packet["index_type"])
+
+            state.use_program(program_id)
+            # Materials set uniforms of the program in use: bind again after a program change
+            if material_id != material or program_id != program:
+                if material and hasattr(materials[material - 1], "unbind"):
+                    materials[material - 1].unbind()
+                if material_id:
+                    materials[material_id - 1].bind()
+                program, material = program_id, material_id
+            state.bind_vertex_array(vao)
+
+            if self.multi_draw:
+                offset = ctypes.c_void_p(start * COMMAND_DTYPE.itemsize)
+                if index_type == _ARRAYS:
+                    gl.glMultiDrawArraysIndirect(mode, offset, end - start, COMMAND_DTYPE.itemsize)
+                else:
+                    gl.glMultiDrawElementsIndirect(mode, index_type, offset, end - start, COMMAND_DTYPE.itemsize)
+                draw_calls += 1
+                continue
+
+            for command in commands[start:end].tolist():
+                count, instances, first, base_vertex, base_instance = command
+                if index_type == _ARRAYS:
+                    gl.glDrawArraysInstancedBaseInstance(mode, first, count, instances, base_vertex)
+                else:
+                    gl.glDrawElementsInstancedBaseVertexBaseInstance(
+                        mode, count, index_type, ctypes.c_void_p(first * _INDEX_SIZES[index_type]),
+                        instances, base_vertex, base_instance)
+                draw_calls += 1
+
+        if material and hasattr(materials[material - 1], "unbind"):
+            materials[material - 1].unbind()
+        self.stats.draw_calls = draw_calls
+
+
+def radix_argsort(keys: np.ndarray) -> np.ndarray:
+    """
+    Stable argsort of uint64 keys: LSD radix sort, one counting sort per 16-bit digit.
+    Digits that are the same in every key are skipped.
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    order = np.arange(len(keys))
+    if len(keys) < 2:
+        return order
+
+    for shift in range(0, 64, 16):
+        digits = ((keys >> np.uint64(shift)) & np.uint64(0xFFFF)).astype(np.uint16)
+        if digits.min() == digits.max():
+            continue
+        order = order[np.argsort(digits[order], kind="stable")]
+
+    return order
+
+
+def _state_changes(table: np.ndarray) -> int:
+    """Program, material and VAO switches of a packet sequence, the first binds included."""
+    return sum(int(np.count_nonzero(table[field][1:] != table[field][:-1])) + 1
+               for field in ("program", "material", "vao"))
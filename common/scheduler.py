@@ -0,0 +1,144 @@
+import collections
+import time
+
+import glfw
+import numpy as np
+
+ON_DEMAND = "on_demand"
+FIXED = "fixed"
+UNCAPPED = "uncapped"
+MODES = (ON_DEMAND, FIXED, UNCAPPED)
+
+
+class FrameTimeStats(object):
+    """Frame intervals, CPU work per frame and time spent idle, all in milliseconds."""
+
+    def __init__(self, history: int = 240):
+        self.intervals = collections.deque(maxlen=history)
+        self.work = collections.deque(maxlen=history)
+        self.frames = 0
+        self.idle = 0.0
+        self.busy = 0.0
+
+    def report(self) -> str:
+        if not self.intervals:
+            return f"INFO::FRAMES::{self.frames}"
+
+        intervals = np.fromiter(self.intervals, dtype=np.float64, count=len(self.intervals))
+        p50, p99 = np.percentile(intervals, (50, 99))
+        work = float(np.mean(self.work)) if self.work else 0.0
+        total = self.idle + self.busy
+        idle = self.idle / total * 100.0 if total else 0.0
+
+        return (f"INFO::FRAMES::{self.frames}::FPS::{1000.0 / intervals.mean():.1f}"
+                f"::INTERVAL P50 {p50:.2f}ms P99 {p99:.2f}ms JITTER {intervals.std():.3f}ms"
+                f"::WORK {work:.2f}ms::IDLE {idle:.1f}%")
+
+
+class RenderScheduler(object):
+    """
+    Decides when the GLFW main loop draws.
+
+    on_demand -- sleeps in glfw.wait_events() and draws only after invalidate(). Input and
+                 window callbacks invalidate, an idle window costs no CPU at all.
+    fixed     -- draws at ``rate`` Hz. Sleeps until shortly before the deadline and spins
+                 the rest, time.sleep alone overshoots by up to a scheduler tick.
+    uncapped  -- draws as fast as possible with vsync off, for benchmarks.
+
+    Loop:
+
+        while not glfw.window_should_close(window):
+            if scheduler.wait():
+                draw()
+                glfw.swap_buffers(window)
+                scheduler.frame_done()
+    """
+
+    def __init__(self, mode: str = ON_DEMAND, rate: float = 60.0, spin: float = 0.002, history: int = 240):
+        """
+        :param mode: One of MODES
+        :param rate: Target frames per second in fixed mode
+        :param spin: Seconds before a deadline where sleeping stops and spinning starts
+        :param history: Frames kept for the statistics
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown scheduler mode '{mode}', expected one of {MODES}")
+
+        self.mode = mode
+        self.period = 1.0 / rate
+        self.spin = spin
+        self.stats = FrameTimeStats(history)
+
+        self.__dirty = True
+        self.__deadline = None
+        self.__frame_start = None
+        self.__last_frame = None
+
+    def configure_swap(self):
+        """
+        Swap interval matching the mode, call with the window's context current.
+        Fixed and uncapped pace themselves, vsync would add its own waiting on top.
+        """
+        glfw.swap_interval(1 if self.mode == ON_DEMAND else 0)
+
+    def invalidate(self):
+        """Request a redraw. Safe to call from other threads, wakes up wait_events()."""
+        self.__dirty = True
+        if self.mode == ON_DEMAND:
+            glfw.post_empty_event()
+
+    def wait(self) -> bool:
+        """
+        Block until the next frame is due and process pending window events.
+        :return: True if a frame should be drawn now
+        """
+        start = time.perf_counter()
+
+        if self.mode == ON_DEMAND:
+            glfw.poll_events()
+            if not self.__dirty:
+                glfw.wait_events()
+            # Events that did not invalidate (e.g. mouse moves over the window) draw nothing
+            draw = self.__dirty
+            self.__dirty = False
+        elif self.mode == FIXED:
+            self.__sleep_until_deadline()
+            glfw.poll_events()
+            draw = True
+        else:
+            glfw.poll_events()
+            draw = True
+
+        now = time.perf_counter()
+        self.stats.idle += now - start
+        if draw:
+            self.__frame_start = now
+
+        return draw
+
+    def frame_done(self):
+        """Record the frame, call right after swap_buffers()."""
+        now = time.perf_counter()
+        self.stats.frames += 1
+        self.stats.busy += now - self.__frame_start
+        self.stats.work.append((now - self.__frame_start) * 1000.0)
+
+        # Intervals of an on-demand loop measure how often the user interacts, not pacing
+        if self.__last_frame is not None and self.mode != ON_DEMAND:
+            self.stats.intervals.append((now - self.__last_frame) * 1000.0)
+        self.__last_frame = now
+
+    def __sleep_until_deadline(self):
+        now = time.perf_counter()
+        if self.__deadline is None or now - self.__deadline > self.period:
+            # First frame, or more than a frame late: restart pacing instead of
+            # drawing a burst of frames to catch up
+            self.__deadline = now
+        else:
+            remaining = self.__deadline - now
+            if remaining > self.spin:
+                time.sleep(remaining - self.spin)
+            while time.perf_counter() < self.__deadline:
+                pass
+
+        self.__deadline += self.period
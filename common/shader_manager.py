@@ -0,0 +1,248 @@
+import ctypes
+import os
+import queue
+import threading
+
+import OpenGL.GL as gl
+from OpenGL.raw.GL.VERSION.GL_2_0 import glGetProgramiv as raw_glGetProgramiv
+
+from .gl_info import has_extension
+from .shader_program import ShaderProgram, apply_defines, load_source
+
+# GL_KHR_parallel_shader_compile / GL_ARB_parallel_shader_compile
+GL_COMPLETION_STATUS = 0x91B1
+
+
+class _Entry(object):
+    """A watched program: its files, defines and the rebuild currently in progress."""
+
+    def __init__(self, program: ShaderProgram, path_vertex: str, path_fragment: str, defines: dict):
+        self.program = program
+        self.path_vertex = path_vertex
+        self.path_fragment = path_fragment
+        self.defines = defines
+        # Shader files and all their includes
+        self.dependencies = []
+        # GL objects of a rebuild still compiling in the driver's threads
+        self.building = None
+
+
+class ShaderManager(object):
+    """
+    Rebuilds shader programs whose files changed while the application keeps running.
+
+    A background thread polls the modification time of every watched file and include
+    (polling works the same on every platform and a few dozen stat() calls are negligible).
+    Changed programs are read and preprocessed (#include, defines) on that thread, then
+    handed to the render thread, which calls update() once per frame between frames.
+
+    With GL_KHR/ARB_parallel_shader_compile the driver compiles in its own threads and
+    update() only polls GL_COMPLETION_STATUS, so a rebuild never blocks a frame; otherwise
+    the compile runs inside update(). Only programs depending on a changed file are rebuilt.
+    If compiling or linking fails, the error is printed and the old program stays in use.
+    The new program takes over the existing ShaderProgram in place, every reference to it
+    keeps working.
+    """
+
+    def __init__(self, poll_interval: float = 0.25, on_change=None):
+        """
+        Needs a current context, update() must always be called with that context current.
+        :param poll_interval: Seconds between two scans of the watched files
+        :param on_change: Called from the watcher thread when a rebuild is queued, e.g. to
+                          wake an on-demand render loop (RenderScheduler.invalidate)
+        """
+        self.poll_interval = poll_interval
+        self.on_change = on_change
+        self.rebuilds = 0
+        self.failures = 0
+
+        self.parallel = (has_extension("GL_KHR_parallel_shader_compile")
+                         or has_extension("GL_ARB_parallel_shader_compile"))
+        if self.parallel:
+            from OpenGL.GL.ARB.parallel_shader_compile import glMaxShaderCompilerThreadsARB
+            from OpenGL.GL.KHR.parallel_shader_compile import glMaxShaderCompilerThreadsKHR
+            # 0xFFFFFFFF: let the driver pick the number of threads
+            for set_threads in (glMaxShaderCompilerThreadsKHR, glMaxShaderCompilerThreadsARB):
+                if bool(set_threads):
+                    set_threads(0xFFFFFFFF)
+                    break
+
+        self.__entries = []
+        self.__lock = threading.Lock()
+        # {path: st_mtime_ns} of every watched file when it was last read
+        self.__modified = {}
+        # (entry, vertex source, fragment source, dependencies) ready to be compiled
+        self.__ready = queue.Queue()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def load(self, path_vertex: str, path_fragment: str, defines: dict = None, cache=None) -> ShaderProgram:
+        """
+        Build a program now and watch its files from then on.
+        :param path_vertex: Path to vertex shader
+        :param path_fragment: Path to fragment shader
+        :param defines: {name: value} inserted after #version
+        :param cache: ProgramCache used for this first build
+        :return: ShaderProgram that is updated in place on every successful rebuild
+        """
+        program = ShaderProgram.from_files(path_vertex, path_fragment, defines, cache)
+        self.watch(program, path_vertex, path_fragment, defines)
+
+        return program
+
+    def watch(self, program: ShaderProgram, path_vertex: str, path_fragment: str, defines: dict = None):
+        """Watch the files of a program that was built elsewhere (e.g. by InfiniteGrid)."""
+        entry = _Entry(program, path_vertex, path_fragment, defines or {})
+        self.__preprocess(entry)
+        with self.__lock:
+            self.__entries.append(entry)
+            # Stamped now rather than on the first poll, so a save before that poll is a change
+            for path in entry.dependencies:
+                if path not in self.__modified:
+                    self.__modified[path] = self.__stamp(path)
+
+        if self.__thread is None:
+            self.__thread = threading.Thread(target=self.__poll, name="ShaderManager", daemon=True)
+            self.__thread.start()
+
+    def has_pending(self) -> bool:
+        """True while a rebuild waits for update() or is still compiling."""
+        with self.__lock:
+            building = any(entry.building is not None for entry in self.__entries)
+
+        return building or not self.__ready.empty()
+
+    def update(self):
+        """
+        Start compiling queued sources and swap in programs that finished.
+        Call on the render thread between frames, e.g. at the top of paintGL.
+        """
+        while True:
+            try:
+                entry, vertex_src, fragment_src, dependencies = self.__ready.get_nowait()
+            except queue.Empty:
+                break
+            entry.dependencies = dependencies
+            self.__start_build(entry, vertex_src, fragment_src)
+
+        with self.__lock:
+            entries = list(self.__entries)
+        for entry in entries:
+            if entry.building is not None:
+                self.__finish_build(entry)
+
+    def stop(self):
+        self.__stop.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def __start_build(self, entry: _Entry, vertex_src: str, fragment_src: str):
+        if entry.building is not None:
+            # A newer edit supersedes the build in progress
+            self.__discard(entry.building)
+            entry.building = None
+
+        # With parallel compile this only queues the work for the driver's threads,
+        # otherwise the status queries in __finish_build() wait for the compiler
+        shaders = []
+        for source, shader_type in ((vertex_src, gl.GL_VERTEX_SHADER), (fragment_src, gl.GL_FRAGMENT_SHADER)):
+            shader = gl.glCreateShader(shader_type)
+            gl.glShaderSource(shader, source)
+            gl.glCompileShader(shader)
+            shaders.append(shader)
+        program = gl.glCreateProgram()
+        for shader in shaders:
+            gl.glAttachShader(program, shader)
+        gl.glLinkProgram(program)
+        entry.building = (program, shaders)
+
+        if not self.parallel:
+            self.__finish_build(entry)
+
+    def __finish_build(self, entry: _Entry):
+        program, shaders = entry.building
+        if self.parallel:
+            # PyOpenGL's wrapper does not know the size of this query, use the raw entry point
+            complete = gl.GLint(0)
+            raw_glGetProgramiv(program, GL_COMPLETION_STATUS, ctypes.byref(complete))
+            if not complete.value:
+                return
+        entry.building = None
+
+        if gl.glGetProgramiv(program, gl.GL_LINK_STATUS) != gl.GL_TRUE:
+            logs = [gl.glGetShaderInfoLog(shader) for shader in shaders] + [gl.glGetProgramInfoLog(program)]
+            self.__discard((program, shaders))
+            self.__report_failure(entry, b"".join(log for log in logs if log).decode(errors="replace"))
+            return
+
+        for shader in shaders:
+            gl.glDetachShader(program, shader)
+            gl.glDeleteShader(shader)
+        self.__swap(entry, program)
+
+    def __swap(self, entry: _Entry, program: int):
+        entry.program.replace(ShaderProgram(program))
+        self.rebuilds += 1
+        print(f"INFO::SHADER_RELOADED::{os.path.basename(entry.path_vertex)}"
+              f"::{os.path.basename(entry.path_fragment)}")
+
+    def __report_failure(self, entry: _Entry, error):
+        self.failures += 1
+        print(f"ERROR::SHADER_RELOAD_FAILED::{os.path.basename(entry.path_vertex)}"
+              f"::{os.path.basename(entry.path_fragment)}::KEEPING_PREVIOUS_PROGRAM\n{error}")
+
+    @staticmethod
+    def __discard(building):
+        program, shaders = building
+        for shader in shaders:
+            gl.glDeleteShader(shader)
+        gl.glDeleteProgram(program)
+
+    @staticmethod
+    def __stamp(path: str):
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            # Editors often delete and recreate a file when saving
+            return None
+
+    def __preprocess(self, entry: _Entry):
+        """Read sources and includes. Runs on the watcher thread, no GL calls here."""
+        dependencies = []
+        vertex_src = load_source(entry.path_vertex, dependencies)
+        fragment_src = load_source(entry.path_fragment, dependencies)
+        if entry.defines:
+            vertex_src = apply_defines(vertex_src, entry.defines)
+            fragment_src = apply_defines(fragment_src, entry.defines)
+        entry.dependencies = dependencies
+
+        return vertex_src, fragment_src, dependencies
+
+    def __poll(self):
+        while not self.__stop.is_set():
+            with self.__lock:
+                entries = list(self.__entries)
+
+                changed_files = set()
+                for path in {path for entry in entries for path in entry.dependencies}:
+                    stamp = self.__stamp(path)
+                    if stamp is None:
+                        continue
+                    # Includes a rebuild added are stamped here first, like watch() does
+                    if path in self.__modified and self.__modified[path] != stamp:
+                        changed_files.add(path)
+                    self.__modified[path] = stamp
+
+            for entry in entries:
+                if changed_files.isdisjoint(entry.dependencies):
+                    continue
+                try:
+                    self.__ready.put((entry,) + self.__preprocess(entry))
+                except (OSError, RuntimeError) as error:
+                    self.__report_failure(entry, error)
+                    continue
+                if self.on_change is not None:
+                    self.on_change()
+
+            self.__stop.wait(self.poll_interval)
@@ -0,0 +1,299 @@
+import os
+import re
+
+import numpy as np
+import OpenGL.GL as gl
+from OpenGL.GL.shaders import compileProgram, compileShader
+
+from .gl_state import default_state
+
+
+# GL type -> (upload function, is matrix)
+_UNIFORM_SETTERS = {
+    gl.GL_FLOAT: (gl.glUniform1fv, False),
+    gl.GL_FLOAT_VEC2: (gl.glUniform2fv, False),
+    gl.GL_FLOAT_VEC3: (gl.glUniform3fv, False),
+    gl.GL_FLOAT_VEC4: (gl.glUniform4fv, False),
+    gl.GL_DOUBLE: (gl.glUniform1dv, False),
+    gl.GL_DOUBLE_VEC2: (gl.glUniform2dv, False),
+    gl.GL_DOUBLE_VEC3: (gl.glUniform3dv, False),
+    gl.GL_DOUBLE_VEC4: (gl.glUniform4dv, False),
+    gl.GL_INT: (gl.glUniform1iv, False),
+    gl.GL_INT_VEC2: (gl.glUniform2iv, False),
+    gl.GL_INT_VEC3: (gl.glUniform3iv, False),
+    gl.GL_INT_VEC4: (gl.glUniform4iv, False),
+    gl.GL_UNSIGNED_INT: (gl.glUniform1uiv, False),
+    gl.GL_UNSIGNED_INT_VEC2: (gl.glUniform2uiv, False),
+    gl.GL_UNSIGNED_INT_VEC3: (gl.glUniform3uiv, False),
+    gl.GL_UNSIGNED_INT_VEC4: (gl.glUniform4uiv, False),
+    gl.GL_BOOL: (gl.glUniform1iv, False),
+    gl.GL_BOOL_VEC2: (gl.glUniform2iv, False),
+    gl.GL_BOOL_VEC3: (gl.glUniform3iv, False),
+    gl.GL_BOOL_VEC4: (gl.glUniform4iv, False),
+    gl.GL_FLOAT_MAT2: (gl.glUniformMatrix2fv, True),
+    gl.GL_FLOAT_MAT3: (gl.glUniformMatrix3fv, True),
+    gl.GL_FLOAT_MAT4: (gl.glUniformMatrix4fv, True),
+    gl.GL_FLOAT_MAT2x3: (gl.glUniformMatrix2x3fv, True),
+    gl.GL_FLOAT_MAT2x4: (gl.glUniformMatrix2x4fv, True),
+    gl.GL_FLOAT_MAT3x2: (gl.glUniformMatrix3x2fv, True),
+    gl.GL_FLOAT_MAT3x4: (gl.glUniformMatrix3x4fv, True),
+    gl.GL_FLOAT_MAT4x2: (gl.glUniformMatrix4x2fv, True),
+    gl.GL_FLOAT_MAT4x3: (gl.glUniformMatrix4x3fv, True),
+    gl.GL_DOUBLE_MAT2: (gl.glUniformMatrix2dv, True),
+    gl.GL_DOUBLE_MAT3: (gl.glUniformMatrix3dv, True),
+    gl.GL_DOUBLE_MAT4: (gl.glUniformMatrix4dv, True),
+}
+# Samplers and images of every shape and component type are texture / image unit indices
+_SHAPES = ("1D", "1D_ARRAY", "2D", "2D_ARRAY", "2D_MULTISAMPLE", "2D_MULTISAMPLE_ARRAY", "2D_RECT", "3D",
+           "BUFFER", "CUBE", "CUBE_MAP_ARRAY")
+_UNIFORM_SETTERS.update({
+    getattr(gl, f"GL_{prefix}{kind}_{shape}"): (gl.glUniform1iv, False)
+    for prefix in ("", "INT_", "UNSIGNED_INT_") for kind in ("SAMPLER", "IMAGE") for shape in _SHAPES
+})
+_UNIFORM_SETTERS.update({
+    getattr(gl, f"GL_SAMPLER_{shape}_SHADOW"): (gl.glUniform1iv, False)
+    for shape in ("1D", "1D_ARRAY", "2D", "2D_ARRAY", "2D_RECT", "CUBE", "CUBE_MAP_ARRAY")
+})
+
+_UNIFORM_DTYPES = {
+    gl.glUniform1iv: np.int32,
+    gl.glUniform2iv: np.int32,
+    gl.glUniform3iv: np.int32,
+    gl.glUniform4iv: np.int32,
+    gl.glUniform1uiv: np.uint32,
+    gl.glUniform2uiv: np.uint32,
+    gl.glUniform3uiv: np.uint32,
+    gl.glUniform4uiv: np.uint32,
+    gl.glUniform1dv: np.float64,
+    gl.glUniform2dv: np.float64,
+    gl.glUniform3dv: np.float64,
+    gl.glUniform4dv: np.float64,
+    gl.glUniformMatrix2dv: np.float64,
+    gl.glUniformMatrix3dv: np.float64,
+    gl.glUniformMatrix4dv: np.float64,
+}
+
+
+def apply_defines(source: str, defines: dict) -> str:
+    """
+    Insert "#define NAME VALUE" lines right after the #version directive,
+    which has to stay the first statement of a GLSL source.
+    """
+    block = "".join(f"#define {name} {value}\n" for name, value in defines.items())
+    version = _VERSION_LINE.search(source)
+    if version is None:
+        return block + source
+
+    return source[:version.end()] + block + source[version.end():]
+
+
+def load_source(path: str, dependencies: list = None) -> str:
+    """
+    Read a GLSL file and expand ``#include "file"`` lines, paths relative to the including file.
+    :param path: Shader file
+    :param dependencies: If given, every file read (the shader and all includes) is appended
+    :return: Source with all includes inlined
+    """
+    return _expand_includes(os.path.abspath(path), dependencies if dependencies is not None else [], ())
+
+
+def _expand_includes(path: str, dependencies: list, stack: tuple) -> str:
+    if path in stack:
+        raise RuntimeError(f"Recursive #include of {path}")
+    with open(path, "r") as file:
+        source = file.read()
+    if path not in dependencies:
+        dependencies.append(path)
+
+    def include(match):
+        included = os.path.join(os.path.dirname(path), match.group(1))
+
+        return _expand_includes(os.path.abspath(included), dependencies, stack + (path,))
+
+    return _INCLUDE_LINE.sub(include, source)
+
+
+# "#version 420 core" or "# version 440", comments may come before it
+_VERSION_LINE = re.compile(r"^[ \t]*#[ \t]*version[^\n]*\n", re.MULTILINE)
+_INCLUDE_LINE = re.compile(r'^[ \t]*#[ \t]*include[ \t]+"([^"]+)"[^\n]*$', re.MULTILINE)
+
+
+class ShaderProgram(object):
+    """
+    Linked shader program with uniform and attribute locations introspected once.
+
+    Drawing code should use ``set_uniform`` (or the typed helpers) instead of calling
+    glGetUniformLocation every frame. Values are remembered per location and an upload
+    is skipped when the new value is identical to the one the program already holds.
+    """
+
+    def __init__(self, program):
+        """
+        Wrap an already linked program (e.g. the result of ``compileProgram``).
+        :param program: OpenGL program name
+        """
+        self.program = program
+
+        # name -> location / GL type / array size
+        self.uniforms = {}
+        self.uniform_types = {}
+        self.uniform_sizes = {}
+        self.attributes = {}
+        self.attribute_types = {}
+
+        # location -> bytes of the last uploaded value
+        self.__values = {}
+
+        self.uploads = 0
+        self.skipped_uploads = 0
+
+        self.__introspect()
+
+    @classmethod
+    def from_sources(cls, vertex_src: str, fragment_src: str, defines: dict = None, cache=None):
+        """
+        Compile and link a program from GLSL sources.
+        :param vertex_src: Vertex shader source
+        :param fragment_src: Fragment shader source
+        :param defines: {name: value} inserted as #define lines after #version
+        :param cache: ProgramCache to load the linked binary from / store it in
+        :return: ShaderProgram
+        """
+        if defines:
+            vertex_src = apply_defines(vertex_src, defines)
+            fragment_src = apply_defines(fragment_src, defines)
+
+        if cache is not None:
+            return cls(cache.program(vertex_src, fragment_src, defines))
+
+        program = compileProgram(compileShader(vertex_src, gl.GL_VERTEX_SHADER),
+                                 compileShader(fragment_src, gl.GL_FRAGMENT_SHADER))
+
+        return cls(program)
+
+    @classmethod
+    def from_files(cls, path_vertex: str, path_fragment: str, defines: dict = None, cache=None):
+        """
+        Read, compile and link a program from .glsl files. ``#include "file"`` is expanded.
+        :param path_vertex: Path to vertex shader
+        :param path_fragment: Path to fragment shader
+        :param defines: {name: value} inserted as #define lines after #version
+        :param cache: ProgramCache to load the linked binary from / store it in
+        :return: ShaderProgram
+        """
+        return cls.from_sources(load_source(path_vertex), load_source(path_fragment), defines, cache)
+
+    def __int__(self):
+        return int(self.program)
+
+    def use(self):
+        default_state().use_program(self.program)
+
+    def uniform_location(self, name: str) -> int:
+        """Cached uniform location, -1 if the uniform is not active."""
+        return self.uniforms.get(name, -1)
+
+    def attribute_location(self, name: str) -> int:
+        """Cached attribute location, -1 if the attribute is not active."""
+        return self.attributes.get(name, -1)
+
+    def set_uniform(self, name: str, value, transpose: bool = False) -> bool:
+        """
+        Upload a uniform value unless the program already holds exactly this value.
+        The program must be in use. Unknown (inactive) uniforms are ignored.
+        :param name: Uniform name as declared in the shader
+        :param value: Scalar, sequence, ndarray or anything exposing floats (e.g. QMatrix4x4.data())
+        :param transpose: Only for matrices. Pass True for row-major numpy matrices
+        :return: True if glUniform* was called
+        """
+        location = self.uniforms.get(name, -1)
+        if location == -1:
+            return False
+
+        setter, is_matrix = _UNIFORM_SETTERS[self.uniform_types[name]]
+        data = np.ascontiguousarray(value, dtype=_UNIFORM_DTYPES.get(setter, np.float32))
+
+        key = data.tobytes()
+        if is_matrix:
+            key += b"T" if transpose else b"F"
+        if self.__values.get(location) == key:
+            self.skipped_uploads += 1
+            return False
+        self.__values[location] = key
+        self.uploads += 1
+
+        count = self.uniform_sizes[name]
+        if is_matrix:
+            setter(location, count, gl.GL_TRUE if transpose else gl.GL_FALSE, data)
+        else:
+            setter(location, count, data)
+
+        return True
+
+    def set_matrix4(self, name: str, matrix, transpose: bool = False) -> bool:
+        return self.set_uniform(name, matrix, transpose)
+
+    def set_float(self, name: str, value: float) -> bool:
+        return self.set_uniform(name, value)
+
+    def set_int(self, name: str, value: int) -> bool:
+        return self.set_uniform(name, value)
+
+    def set_vector(self, name: str, value) -> bool:
+        return self.set_uniform(name, value)
+
+    def replace(self, other):
+        """
+        Take over the GL program and introspection of ``other`` and delete our old program.
+        Everything holding a reference to this instance draws with the new program from then on.
+        :param other: Freshly linked ShaderProgram, unusable afterwards
+        :return:
+        """
+        previous = self.program
+        self.program = other.program
+        self.uniforms = other.uniforms
+        self.uniform_types = other.uniform_types
+        self.uniform_sizes = other.uniform_sizes
+        self.attributes = other.attributes
+        self.attribute_types = other.attribute_types
+        # The new program starts with default uniform values
+        self.__values.clear()
+        other.program = None
+
+        default_state().delete_program(previous)
+
+    def forget_values(self):
+        """Drop the remembered values, e.g. after something else touched the program uniforms."""
+        self.__values.clear()
+
+    def __introspect(self):
+        for index in range(gl.glGetProgramiv(self.program, gl.GL_ACTIVE_UNIFORMS)):
+            name, size, gl_type = gl.glGetActiveUniform(self.program, index)
+            name = self.__decode_name(name)
+            location = gl.glGetUniformLocation(self.program, name)
+            gl_type = int(gl_type)
+            # Uniforms living in a uniform block have no location
+            if location == -1:
+                continue
+            if gl_type not in _UNIFORM_SETTERS:
+                raise RuntimeError(f"Uniform {name} has a type set_uniform() cannot upload: 0x{gl_type:04X}")
+
+            # Arrays are reported as "name[0]", make both spellings work
+            base_name = name[:-3] if name.endswith("[0]") else name
+            for key in {name, base_name}:
+                self.uniforms[key] = location
+                self.uniform_types[key] = gl_type
+                self.uniform_sizes[key] = int(size)
+
+        for index in range(gl.glGetProgramiv(self.program, gl.GL_ACTIVE_ATTRIBUTES)):
+            name, size, gl_type = gl.glGetActiveAttrib(self.program, index)
+            name = self.__decode_name(name)
+            self.attributes[name] = gl.glGetAttribLocation(self.program, name)
+            self.attribute_types[name] = int(gl_type)
+
+    @staticmethod
+    def __decode_name(name) -> str:
+        if isinstance(name, bytes):
+            name = name.decode()
+
+        return name.split("\x00", 1)[0]
@@ -0,0 +1,230 @@
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_info import supports, mapped_array
+from .gl_state import default_state
+
+# Uploads go through this target so the VAO and index buffer bindings are never disturbed
+_UPLOAD_TARGET = gl.GL_COPY_WRITE_BUFFER
+
+
+class StreamStats(object):
+    """Bytes written, frames, and the time spent waiting for the GPU to release a region."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.writes = 0
+        self.frames = 0
+        self.stall = 0.0
+        self.orphans = 0
+        self.grows = 0
+
+    def report(self) -> str:
+        per_frame = self.bytes / self.frames / 2 ** 20 if self.frames else 0.0
+
+        return (f"INFO::STREAM::{self.frames} FRAMES::{per_frame:.2f} MB/FRAME::WRITES::{self.writes}"
+                f"::STALL {self.stall * 1000.0:.1f}ms::ORPHANS::{self.orphans}::GROWS::{self.grows}")
+
+
+class StreamBuffer(object):
+    """
+    Buffer for data that is replaced every frame (vertices of a live point cloud, particles...).
+
+    On GL 4.4+ (or with ARB_buffer_storage) one buffer holding ``regions`` regions is mapped
+    once with GL_MAP_PERSISTENT_BIT | GL_MAP_COHERENT_BIT. Each frame writes into the next
+    region straight through the mapping, a fence per region makes sure the GPU has finished
+    reading it before it is written again. Older contexts orphan the buffer with
+    glBufferData(NULL) on the first write of a frame and upload with glBufferSubData, the
+    driver then hands out fresh storage instead of waiting for draws still in flight.
+
+    Per frame:
+
+        offset = stream.write(points)                 # or: view, offset = stream.reserve(n, dtype)
+        default_state().bind_buffer(gl.GL_ARRAY_BUFFER, stream.buffer)
+        gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 12, ctypes.c_void_p(offset))
+        gl.glDrawArrays(gl.GL_POINTS, 0, len(points))
+        stream.end_frame()
+
+    A frame that does not fit in a region grows the buffer, ``buffer`` then names a new
+    buffer and attribute pointers have to be set again (they are re-set every write anyway).
+    """
+
+    def __init__(self, size: int, regions: int = 3, alignment: int = 16, persistent: bool = None):
+        """
+        Create the buffer. Needs a current context.
+        :param size: Bytes available per frame
+        :param regions: Frames that can be in flight in persistent mode
+        :param alignment: Alignment of every offset returned by write() / reserve()
+        :param persistent: Force (True) or disable (False) persistent mapping, detected if None
+        """
+        available = supports((4, 4), "GL_ARB_buffer_storage") and bool(gl.glBufferStorage)
+        self.persistent = available if persistent is None else persistent and available
+        self.regions = regions if self.persistent else 1
+        self.alignment = alignment
+        self.stats = StreamStats()
+
+        self.buffer = None
+        self.region_size = 0
+        self.__region = 0
+        self.__used = 0
+        self.__fences = [None] * self.regions
+        self.__mapped = None
+        # Fallback mode: CPU side memory handed out by reserve(), uploaded by flush()
+        self.__staging = None
+        self.__dirty = None
+        # Buffers replaced by a grow during this frame, draws may still reference them
+        self.__retired = []
+
+        self.__allocate(self.__align(max(size, alignment)))
+
+    def reserve(self, count: int, dtype=np.float32) -> tuple:
+        """
+        Room for ``count`` elements in this frame's region, to be filled in place.
+        In persistent mode the array is the mapped memory itself, e.g. a sensor driver can
+        decode into it or numpy can write results there with ``out=``. Otherwise it is
+        staging memory and flush() must run before drawing.
+        :param count: Number of elements
+        :param dtype: Element type, a structured dtype for interleaved vertices
+        :return: (numpy array, byte offset in ``buffer``)
+        """
+        dtype = np.dtype(dtype)
+        nbytes = count * dtype.itemsize
+        offset = self.__claim(nbytes)
+
+        if self.persistent:
+            view = self.__mapped[offset:offset + nbytes]
+        else:
+            view = self.__staging[offset:offset + nbytes]
+            start, end = self.__dirty or (offset, offset)
+            self.__dirty = (min(start, offset), max(end, offset + nbytes))
+
+        return view.view(dtype), offset
+
+    def write(self, array: np.ndarray) -> int:
+        """
+        Copy an array into this frame's region, a single memcpy from the numpy array.
+        :param array: Data, made contiguous only if it is not already
+        :return: Byte offset of the data in ``buffer``
+        """
+        array = np.ascontiguousarray(array)
+        offset = self.__claim(array.nbytes)
+
+        if self.persistent:
+            self.__mapped[offset:offset + array.nbytes] = array.reshape(-1).view(np.uint8)
+        else:
+            default_state().bind_buffer(_UPLOAD_TARGET, self.buffer)
+            gl.glBufferSubData(_UPLOAD_TARGET, offset, array.nbytes, array)
+
+        return offset
+
+    def flush(self):
+        """Upload what reserve() handed out in fallback mode. Coherent mappings need nothing."""
+        if self.__dirty is None:
+            return
+
+        start, end = self.__dirty
+        default_state().bind_buffer(_UPLOAD_TARGET, self.buffer)
+        gl.glBufferSubData(_UPLOAD_TARGET, start, end - start, self.__staging[start:end])
+        self.__dirty = None
+
+    def end_frame(self):
+        """Fence the draws of this frame and move to the next region. Call after the last draw."""
+        self.flush()
+        if self.persistent:
+            # Every command submitted so far may still read the current region
+            self.__fences[self.__region] = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            self.__region = (self.__region + 1) % self.regions
+        self.__used = 0
+        self.stats.frames += 1
+
+        if self.__retired:
+            default_state().delete_buffers(self.__retired)
+            self.__retired = []
+
+    def delete(self):
+        self.__free()
+        if self.__retired:
+            default_state().delete_buffers(self.__retired)
+            self.__retired = []
+
+    def __claim(self, nbytes: int) -> int:
+        start = self.__align(self.__used)
+        if start + nbytes > self.region_size:
+            self.__grow(start + nbytes)
+            start = 0
+        if self.__used == 0:
+            self.__begin_region()
+
+        self.__used = start + nbytes
+        self.stats.bytes += nbytes
+        self.stats.writes += 1
+
+        return self.__region * self.region_size + start
+
+    def __begin_region(self):
+        if self.persistent:
+            self.__wait(self.__region)
+        else:
+            # Orphan: the driver detaches the storage still used by earlier draws
+            default_state().bind_buffer(_UPLOAD_TARGET, self.buffer)
+            gl.glBufferData(_UPLOAD_TARGET, self.region_size, None, gl.GL_STREAM_DRAW)
+            self.stats.orphans += 1
+
+    def __grow(self, needed: int):
+        # Data already written this frame stays in the old buffer, which lives until end_frame().
+        # The driver keeps it alive for draws in flight, its fences are not needed any more
+        for region, fence in enumerate(self.__fences):
+            if fence is not None:
+                gl.glDeleteSync(fence)
+                self.__fences[region] = None
+        if self.persistent:
+            default_state().bind_buffer(_UPLOAD_TARGET, self.buffer)
+            gl.glUnmapBuffer(_UPLOAD_TARGET)
+        self.__retired.append(self.buffer)
+        self.flush()
+
+        self.__allocate(self.__align(max(needed, self.region_size * 2)))
+        self.__region = 0
+        self.__used = 0
+        self.stats.grows += 1
+
+    def __allocate(self, region_size: int):
+        self.region_size = region_size
+        size = region_size * self.regions
+
+        self.buffer = gl.glGenBuffers(1)
+        default_state().bind_buffer(_UPLOAD_TARGET, self.buffer)
+        if self.persistent:
+            flags = gl.GL_MAP_WRITE_BIT | gl.GL_MAP_PERSISTENT_BIT | gl.GL_MAP_COHERENT_BIT
+            gl.glBufferStorage(_UPLOAD_TARGET, size, None, flags)
+            address = gl.glMapBufferRange(_UPLOAD_TARGET, 0, size, flags)
+            self.__mapped = mapped_array(address, size)
+        else:
+            gl.glBufferData(_UPLOAD_TARGET, size, None, gl.GL_STREAM_DRAW)
+            self.__staging = np.empty(size, dtype=np.uint8)
+
+    def __free(self):
+        for region in range(self.regions):
+            self.__wait(region)
+        if self.persistent and self.__mapped is not None:
+            default_state().bind_buffer(_UPLOAD_TARGET, self.buffer)
+            gl.glUnmapBuffer(_UPLOAD_TARGET)
+        self.__mapped = None
+        self.__staging = None
+        default_state().delete_buffers([self.buffer])
+
+    def __wait(self, region: int):
+        fence = self.__fences[region]
+        if fence is None:
+            return
+
+        start = time.perf_counter()
+        gl.glClientWaitSync(fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000)
+        gl.glDeleteSync(fence)
+        self.__fences[region] = None
+        self.stats.stall += time.perf_counter() - start
+
+    def __align(self, value: int) -> int:
+        return (value + self.alignment - 1) // self.alignment * self.alignment
@@ -0,0 +1,485 @@
+"""
+2D textures: immutable storage, mip levels, BC compressed data, tiled uploads through a
+pixel unpack buffer and a cache that keeps the GPU memory they use within a budget.
+
+    cache = TextureCache(256 * 2 ** 20)          # 256 MB of textures at most
+    ...
+    cache.update()                               # every frame: loads in progress advance
+    texture = cache.get("bricks.ktx")            # None until the first level arrived
+    if texture is not None:
+        texture.bind(0)
+    ...
+    cache.end_frame()
+
+Files are read and decoded on the AssetLoader's pools (read_texture): PNG is decoded and
+its mip chain filtered in numpy in a reader process, KTX files (python -m common.texture_compression) are
+memory-mapped with their levels and BC blocks ready to upload. The upload runs on the
+render thread within the loader's per-frame budget, a tile per step: the tile is copied
+into a StreamBuffer used as pixel unpack buffer and glTexSubImage2D reads it from there,
+so the driver copies to the GPU while the frame goes on. Levels arrive from the smallest
+to the largest and GL_TEXTURE_BASE_LEVEL follows them: a texture shows blurred right
+away and sharpens while it streams in.
+"""
+import collections
+import ctypes
+import functools
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+from OpenGL.raw.GL.VERSION.GL_1_1 import glTexSubImage2D
+from OpenGL.raw.GL.VERSION.GL_1_3 import glCompressedTexSubImage2D
+
+from .asset_loader import AssetLoader, PAGE_SIZE
+from .gl_info import has_extension, supports
+from .gl_state import default_state
+from .image_io import KTX_BLOCK_BYTES, read_ktx, read_png
+from .stream_buffer import StreamBuffer
+from .texture_compression import PIXEL_FORMATS, compress_image, decompress_image, level_count
+
+# Texture unit used to create and fill textures, drawing code keeps the low units to itself
+UPLOAD_UNIT = 15
+# Texels per side of an upload tile, a multiple of the 4x4 compression blocks
+TILE = 256
+# Staging memory of the unpack buffer per region, a few tiles
+STAGING = 4 * 2 ** 20
+# Bytes per texel of the uncompressed internal formats
+_TEXEL_BYTES = {int(fmt): channels for channels, formats in PIXEL_FORMATS.items() for fmt in formats[:2]}
+# Compressed formats by the extension (or core version) that makes them available
+_S3TC = (0x83F0, 0x83F1, 0x83F2, 0x83F3)
+_S3TC_SRGB = (0x8C4C, 0x8C4D, 0x8C4E, 0x8C4F)
+_BPTC = (0x8E8C, 0x8E8D)
+
+
+def compression_supported(internal_format: int) -> bool:
+    """True if the current context can store ``internal_format`` (a compressed format) natively."""
+    if internal_format in _S3TC:
+        return has_extension("GL_EXT_texture_compression_s3tc")
+    if internal_format in _S3TC_SRGB:
+        return has_extension("GL_EXT_texture_compression_s3tc") and has_extension("GL_EXT_texture_sRGB")
+    if internal_format in _BPTC:
+        return supports((4, 2), "GL_ARB_texture_compression_bptc")
+
+    # BC4 / BC5
+    return supports((3, 0), "GL_ARB_texture_compression_rgtc")
+
+
+def storage_size(internal_format: int, width: int, height: int, levels: int) -> int:
+    """Bytes of GPU memory the levels take, without the driver's padding."""
+    total = 0
+    for level in range(levels):
+        level_width, level_height = max(1, width >> level), max(1, height >> level)
+        if internal_format in KTX_BLOCK_BYTES:
+            total += ((level_width + 3) // 4) * ((level_height + 3) // 4) * KTX_BLOCK_BYTES[internal_format]
+        else:
+            total += level_width * level_height * _TEXEL_BYTES[internal_format]
+
+    return total
+
+
+def read_texture(path: str, srgb: bool = True, mipmaps: bool = True, decompress=()) -> object:
+    """
+    Reader of TextureCache: decode on the loader's pool, no GL calls.
+    :param path: .png or .ktx file
+    :param srgb: PNG colors are sRGB (KTX files carry their own format)
+    :param mipmaps: Filter a full mip chain for PNG files
+    :param decompress: Compressed formats the context cannot sample, decoded to RGBA8
+    :return: KtxImage, levels bottom row first
+    """
+    if path.endswith(".ktx"):
+        image = read_ktx(path)
+        if image.internal_format in decompress:
+            image = decompress_image(image)
+        else:
+            for level in image.levels:
+                # One byte per page reads the mapped file in, the upload then does not fault
+                level.reshape(-1)[::PAGE_SIZE].max(initial=0)
+        return image
+
+    return compress_image(read_png(path), srgb, "none", mipmaps)
+
+
+class Texture(object):
+    """
+    Immutable 2D texture (glTexStorage2D): size, format and level count are fixed, the
+    contents are not. Levels are filled with upload() or a TextureUploader.
+
+        texture = Texture.from_image(compress_image(pixels))   # all levels at once
+        texture.bind(0)
+    """
+
+    def __init__(self, width: int, height: int, internal_format, levels: int = None,
+                 min_filter=gl.GL_LINEAR_MIPMAP_LINEAR, mag_filter=gl.GL_LINEAR, wrap=gl.GL_REPEAT):
+        """
+        Allocate the storage of every level. Needs a current context.
+        :param width: Texels
+        :param height: Texels
+        :param internal_format: Sized or compressed internal format, e.g. GL_SRGB8_ALPHA8
+        :param levels: Mip levels, the full chain if None
+        :param min_filter: Minification filter, mipmap filters fall back to GL_LINEAR for one level
+        :param mag_filter: Magnification filter
+        :param wrap: Wrap mode of S and T
+        """
+        self.width = width
+        self.height = height
+        self.internal_format = int(internal_format)
+        self.levels = level_count(width, height) if levels is None else levels
+        self.compressed = self.internal_format in KTX_BLOCK_BYTES
+        self.nbytes = storage_size(self.internal_format, width, height, self.levels)
+        # Finest level with data, sampling is limited to it and the levels below
+        self.base_level = self.levels
+
+        self.texture = gl.glGenTextures(1)
+        default_state().bind_texture(UPLOAD_UNIT, gl.GL_TEXTURE_2D, self.texture)
+        gl.glTexStorage2D(gl.GL_TEXTURE_2D, self.levels, self.internal_format, width, height)
+        if self.levels == 1 and min_filter not in (gl.GL_NEAREST, gl.GL_LINEAR):
+            min_filter = gl.GL_LINEAR
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, min_filter)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, mag_filter)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_S, wrap)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_WRAP_T, wrap)
+
+    @classmethod
+    def from_image(cls, image, **parameters):
+        """
+        Create and fill a texture right away from client memory.
+        A single level image with a mipmap filter gets its chain from glGenerateMipmap.
+        :param image: KtxImage, e.g. from read_texture() or compress_image()
+        :param parameters: Filters and wrap mode, see __init__
+        :return:
+        """
+        generate = len(image.levels) == 1 and not image.compressed and \
+            parameters.get("min_filter", gl.GL_LINEAR_MIPMAP_LINEAR) not in (gl.GL_NEAREST, gl.GL_LINEAR)
+        texture = cls(image.width, image.height, image.internal_format, None if generate else len(image.levels),
+                      **parameters)
+        for level, data in enumerate(image.levels):
+            texture.upload(level, data)
+        if generate:
+            texture.generate_mipmaps()
+        texture.set_base_level(0)
+
+        return texture
+
+    @property
+    def ready(self) -> bool:
+        """Every level has its data."""
+        return self.base_level == 0
+
+    def level_size(self, level: int) -> tuple:
+        return max(1, self.width >> level), max(1, self.height >> level)
+
+    def bind(self, unit: int):
+        default_state().bind_texture(unit, gl.GL_TEXTURE_2D, self.texture)
+
+    def upload(self, level: int, data: np.ndarray, x: int = 0, y: int = 0, width: int = None, height: int = None,
+               offset: int = None):
+        """
+        Fill a rectangle of a level from client memory, or from the bound pixel unpack buffer.
+        :param level: Mip level
+        :param data: (height, width, channels) texels or (rows, columns, bytes) compressed blocks.
+                     With ``offset`` only its shape and size are used
+        :param x, y: Corner in texels, multiples of 4 for compressed textures
+        :param width, height: Size in texels, the size of ``data`` if None
+        :param offset: Byte offset in GL_PIXEL_UNPACK_BUFFER instead of client memory
+        """
+        level_width, level_height = self.level_size(level)
+        if self.compressed:
+            width = min(data.shape[1] * 4, level_width - x) if width is None else width
+            height = min(data.shape[0] * 4, level_height - y) if height is None else height
+        else:
+            width = data.shape[1] if width is None else width
+            height = data.shape[0] if height is None else height
+        if offset is None:
+            data = np.ascontiguousarray(data)
+            pointer = data.ctypes.data_as(ctypes.c_void_p)
+        else:
+            pointer = ctypes.c_void_p(offset)
+
+        default_state().bind_texture(UPLOAD_UNIT, gl.GL_TEXTURE_2D, self.texture)
+        if self.compressed:
+            glCompressedTexSubImage2D(gl.GL_TEXTURE_2D, level, x, y, width, height, self.internal_format,
+                                      data.nbytes, pointer)
+        else:
+            # Rows of RGB and odd widths are not 4 byte aligned
+            gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+            glTexSubImage2D(gl.GL_TEXTURE_2D, level, x, y, width, height, PIXEL_FORMATS[data.shape[2]][2],
+                            gl.GL_UNSIGNED_BYTE, pointer)
+            gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 4)
+
+    def generate_mipmaps(self):
+        default_state().bind_texture(UPLOAD_UNIT, gl.GL_TEXTURE_2D, self.texture)
+        gl.glGenerateMipmap(gl.GL_TEXTURE_2D)
+
+    def set_base_level(self, level: int):
+        """Sample only ``level`` and the smaller levels, e.g. while the larger ones are streamed in."""
+        self.base_level = level
+        default_state().bind_texture(UPLOAD_UNIT, gl.GL_TEXTURE_2D, self.texture)
+        gl.glTexParameteri(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_BASE_LEVEL, level)
+
+    def delete(self):
+        default_state().delete_textures([self.texture])
+
+
+class UploadStats(object):
+    """Bytes, tiles and textures uploaded and the render thread time it took."""
+
+    def __init__(self):
+        self.bytes = 0
+        self.tiles = 0
+        self.textures = 0
+        self.time = 0.0
+
+    def report(self) -> str:
+        bandwidth = self.bytes / self.time / 2 ** 20 if self.time else 0.0
+
+        return (f"INFO::TEXTURE_UPLOAD::{self.textures} TEXTURES::{self.bytes / 2 ** 20:.1f} MB IN {self.tiles} TILES"
+                f"::{self.time * 1000.0:.1f}ms::{bandwidth:.0f} MB/s")
+
+
+class TextureUploader(object):
+    """
+    Uploads textures a tile at a time through a pixel unpack buffer. A StreamBuffer holds
+    the staging memory: persistently mapped with a fence per region where available, the
+    tile is copied straight into it, and glTexSubImage2D returns without waiting for the
+    copy to the GPU.
+    """
+
+    def __init__(self, tile: int = TILE, staging: int = STAGING, persistent: bool = None):
+        """
+        Needs a current context.
+        :param tile: Texels per side of a tile, a multiple of 4
+        :param staging: Bytes per staging region, tiles move to the next region once it is full
+        :param persistent: Passed to the StreamBuffer, detected if None
+        """
+        self.tile = tile
+        self.stats = UploadStats()
+        self.stream = StreamBuffer(max(staging, tile * tile * 4), regions=3, persistent=persistent)
+        self.__staged = 0
+
+    def upload_steps(self, texture: Texture, image, progressive: bool = True):
+        """
+        Generator uploading one tile per next(), the texture is the value of its StopIteration.
+        Levels go from the smallest to level 0 so the texture can be drawn after the first
+        step, with ``progressive`` its base level follows the levels that are complete.
+        Levels the image does not have are generated with glGenerateMipmap at the end.
+        :param texture: Texture with the size and format of ``image``
+        :param image: KtxImage
+        :param progressive: Move GL_TEXTURE_BASE_LEVEL down as levels complete
+        """
+        for level in reversed(range(len(image.levels))):
+            for _ in self.__upload_level(texture, level, image.levels[level]):
+                yield
+            if progressive or level == 0:
+                texture.set_base_level(level)
+        if len(image.levels) < texture.levels:
+            texture.generate_mipmaps()
+        self.stats.textures += 1
+
+        return texture
+
+    def upload(self, texture: Texture, image) -> Texture:
+        """All tiles right away, e.g. at startup."""
+        steps = self.upload_steps(texture, image, progressive=False)
+        while True:
+            try:
+                next(steps)
+            except StopIteration:
+                return texture
+
+    def delete(self):
+        self.stream.delete()
+
+    def __upload_level(self, texture: Texture, level: int, data: np.ndarray):
+        width, height = texture.level_size(level)
+        # Tiles in texels, data indices in texels or in blocks for compressed levels
+        block = 4 if texture.compressed else 1
+        for y in range(0, height, self.tile):
+            for x in range(0, width, self.tile):
+                start = time.perf_counter()
+                tile = data[y // block:(y + self.tile) // block, x // block:(x + self.tile) // block]
+                offset = self.__stage(tile)
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, self.stream.buffer)
+                texture.upload(level, tile, x, y, min(self.tile, width - x), min(self.tile, height - y), offset)
+                gl.glBindBuffer(gl.GL_PIXEL_UNPACK_BUFFER, 0)
+                self.stats.bytes += tile.nbytes
+                self.stats.tiles += 1
+                self.stats.time += time.perf_counter() - start
+                yield
+
+    def __stage(self, tile: np.ndarray) -> int:
+        """Copy a tile into the staging memory, return its offset in the unpack buffer."""
+        nbytes = tile.nbytes
+        aligned = (nbytes + self.stream.alignment - 1) // self.stream.alignment * self.stream.alignment
+        if self.__staged and self.__staged + aligned > self.stream.region_size:
+            # Fence the tiles in flight and go on in the next region
+            self.stream.end_frame()
+            self.__staged = 0
+        view, offset = self.stream.reserve(nbytes, np.uint8)
+        view.reshape(tile.shape)[...] = tile
+        self.stream.flush()
+        self.__staged += aligned
+
+        return offset
+
+
+class CacheStats(object):
+    """Requests, loads and evictions, and the GPU memory held by the cached textures."""
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.failed = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        # Frames where textures in use did not fit the budget
+        self.over_budget = 0
+        self.resident = 0
+        self.peak = 0
+
+    def report(self) -> str:
+        requests = self.hits + self.misses
+        hit_rate = self.hits / requests * 100.0 if requests else 0.0
+
+        return (f"INFO::TEXTURE_CACHE::{self.resident / 2 ** 20:.1f}/{self.budget / 2 ** 20:.1f} MB VRAM"
+                f" (PEAK {self.peak / 2 ** 20:.1f} MB)::HITS {hit_rate:.1f}%::{self.loads} LOADS::{self.failed} FAILED"
+                f"::{self.evictions} EVICTIONS ({self.evicted_bytes / 2 ** 20:.1f} MB)::OVER BUDGET {self.over_budget}")
+
+
+class TextureCache(object):
+    """
+    Textures by file path, loaded in the background on first use and kept until they are
+    the least recently used ones and room is needed within the budget. Textures used in
+    the current frame and textures still uploading are never evicted.
+    """
+
+    def __init__(self, budget: int, loader: AssetLoader = None, uploader: TextureUploader = None,
+                 srgb: bool = True, mipmaps: bool = True):
+        """
+        Needs a current context.
+        :param budget: Bytes of GPU memory for textures
+        :param loader: Reads and schedules the uploads, a private one if None
+        :param uploader: Tiled uploads, a private one if None
+        :param srgb: PNG colors are sRGB
+        :param mipmaps: Full mip chains for PNG files
+        """
+        self.stats = CacheStats(budget)
+        self.srgb = srgb
+        self.mipmaps = mipmaps
+        self.__own_loader = loader is None
+        self.__own_uploader = uploader is None
+        self.loader = loader if loader is not None else AssetLoader()
+        self.uploader = uploader if uploader is not None else TextureUploader()
+        # Compressed formats to decode on the reader, queried here on the render thread
+        self.__decompress = tuple(fmt for fmt in KTX_BLOCK_BYTES if not compression_supported(fmt))
+
+        # path -> Texture, least recently used first
+        self.__textures = collections.OrderedDict()
+        # path -> frame it was last requested in
+        self.__used = {}
+        self.__pending = set()
+        self.__uploading = set()
+        self.__failed = set()
+        self.__frame = 0
+
+    @property
+    def budget(self) -> int:
+        return self.stats.budget
+
+    @budget.setter
+    def budget(self, budget: int):
+        self.stats.budget = budget
+        self.__evict(0)
+
+    @property
+    def pending(self) -> int:
+        """Textures requested and not complete yet."""
+        return len(self.__pending) + len(self.__uploading)
+
+    def get(self, path: str) -> Texture:
+        """
+        Texture of ``path`` if at least its smallest level is uploaded, else None and the
+        load is started. Marks the texture as used in this frame.
+        """
+        self.__used[path] = self.__frame
+        texture = self.__textures.get(path)
+        if texture is not None:
+            self.__textures.move_to_end(path)
+            self.stats.hits += 1
+            return texture if texture.base_level < texture.levels else None
+
+        self.stats.misses += 1
+        if path not in self.__pending and path not in self.__failed:
+            self.__pending.add(path)
+            # PNG decoding and mip filtering run in a reader process, .ktx files are mapped on a thread
+            self.loader.submit(path, functools.partial(read_texture, path, self.srgb, self.mipmaps, self.__decompress),
+                               lambda image: self.__upload(path, image), cpu_bound=not path.endswith(".ktx"))
+
+        return None
+
+    def update(self, budget: float = None) -> list:
+        """Advance reads and uploads within the loader's budget, call once per frame."""
+        finished = self.loader.update(budget)
+        for asset in finished:
+            self.__pending.discard(asset.name)
+            if asset.error is not None:
+                self.__failed.add(asset.name)
+                self.stats.failed += 1
+
+        return finished
+
+    def end_frame(self):
+        self.__frame += 1
+
+    def delete(self):
+        for texture in self.__textures.values():
+            texture.delete()
+        self.__textures.clear()
+        self.stats.resident = 0
+        if self.__own_loader:
+            self.loader.shutdown(wait=False)
+        if self.__own_uploader:
+            self.uploader.delete()
+
+    def __upload(self, path: str, image):
+        # Render thread: make room, allocate, then one tile per step
+        needed = storage_size(image.internal_format, image.width, image.height,
+                              level_count(image.width, image.height) if self.mipmaps else len(image.levels))
+        self.__evict(needed)
+        levels = None if self.mipmaps and not image.compressed else len(image.levels)
+        texture = Texture(image.width, image.height, image.internal_format, levels)
+        self.__textures[path] = texture
+        self.__uploading.add(path)
+        self.__pending.discard(path)
+        self.stats.resident += texture.nbytes
+        self.stats.peak = max(self.stats.peak, self.stats.resident)
+        self.stats.loads += 1
+        try:
+            yield from self.uploader.upload_steps(texture, image)
+        except Exception:
+            self.__remove(path)
+            raise
+        finally:
+            self.__uploading.discard(path)
+
+        return texture
+
+    def __evict(self, needed: int):
+        """Delete least recently used textures until ``needed`` more bytes fit the budget."""
+        for path in list(self.__textures):
+            if self.stats.resident + needed <= self.stats.budget:
+                return
+            if self.__used.get(path) == self.__frame or path in self.__uploading:
+                continue
+            self.stats.evictions += 1
+            self.stats.evicted_bytes += self.__textures[path].nbytes
+            self.__remove(path)
+        if self.stats.resident + needed > self.stats.budget:
+            self.stats.over_budget += 1
+
+    def __remove(self, path: str):
+        texture = self.__textures.pop(path, None)
+        if texture is not None:
+            self.stats.resident -= texture.nbytes
+            texture.delete()
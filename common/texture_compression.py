@@ -0,0 +1,348 @@
+"""
+Mip chains and BC1/BC3 (DXT1/DXT5) block compression in numpy, for textures converted
+once ahead of time like meshes are converted to .mesh:
+
+    python -m common.texture_compression image.png image.ktx [--linear] [--uncompressed]
+
+BC1 stores a 4x4 block of RGB in 8 bytes (two RGB565 endpoints and a 2-bit index per
+texel), 1/4 of RGBA8 in memory and in sampling bandwidth. BC3 adds an alpha block of
+two 8-bit endpoints and 3-bit indices, 16 bytes per block. The endpoints of a block are
+the extremes of its colors along their principal axis, every texel takes the nearest of
+the four palette colors. The decoders are used to measure the error and as a fallback
+for contexts without GL_EXT_texture_compression_s3tc.
+"""
+import sys
+import time
+
+import numpy as np
+import OpenGL.GL as gl
+from OpenGL.GL.EXT.texture_compression_s3tc import GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_RGBA_S3TC_DXT5_EXT
+from OpenGL.GL.EXT.texture_sRGB import GL_COMPRESSED_SRGB_S3TC_DXT1_EXT, GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT5_EXT
+
+from .image_io import KtxImage, read_png, write_ktx
+
+BC1, BC3 = "bc1", "bc3"
+# (linear, sRGB) internal format of each encoding
+BC_FORMATS = {BC1: (GL_COMPRESSED_RGB_S3TC_DXT1_EXT, GL_COMPRESSED_SRGB_S3TC_DXT1_EXT),
+              BC3: (GL_COMPRESSED_RGBA_S3TC_DXT5_EXT, GL_COMPRESSED_SRGB_ALPHA_S3TC_DXT5_EXT)}
+# Channel count -> (linear, sRGB internal format, pixel format) of uncompressed textures
+PIXEL_FORMATS = {1: (gl.GL_R8, gl.GL_R8, gl.GL_RED),
+                 2: (gl.GL_RG8, gl.GL_RG8, gl.GL_RG),
+                 3: (gl.GL_RGB8, gl.GL_SRGB8, gl.GL_RGB),
+                 4: (gl.GL_RGBA8, gl.GL_SRGB8_ALPHA8, gl.GL_RGBA)}
+# Blocks encoded per numpy pass, bounds the temporaries to a few MB
+BLOCK_BATCH = 16384
+
+_SRGB_TO_LINEAR = np.where(np.arange(256) / 255.0 <= 0.04045, np.arange(256) / 255.0 / 12.92,
+                           ((np.arange(256) / 255.0 + 0.055) / 1.055) ** 2.4).astype(np.float32)
+
+
+def level_count(width: int, height: int) -> int:
+    """Levels of a full mip chain down to 1x1."""
+    return int(max(width, height)).bit_length()
+
+
+def mip_chain(pixels: np.ndarray, srgb: bool = True, levels: int = None) -> list:
+    """
+    Box filtered mip levels, each half the size of the one before (at least 1 texel).
+    sRGB colors are averaged in linear space so dark and bright texels mix as they do on
+    screen, alpha and linear textures are averaged as they are.
+    :param pixels: (height, width, channels) uint8, level 0
+    :param srgb: Color channels (not alpha) are sRGB encoded
+    :param levels: Levels to produce including level 0, the full chain if None
+    :return: List of (height, width, channels) uint8 arrays starting with ``pixels``
+    """
+    height, width, channels = pixels.shape
+    levels = level_count(width, height) if levels is None else levels
+    color = min(channels, 3) if srgb and channels >= 3 else 0
+
+    chain = [pixels]
+    current = pixels.astype(np.float32)
+    if color:
+        current[..., :color] = _SRGB_TO_LINEAR[pixels[..., :color]]
+    else:
+        current /= 255.0
+    for _ in range(1, levels):
+        current = _half(current)
+        encoded = current.copy()
+        if color:
+            linear = encoded[..., :color]
+            encoded[..., :color] = np.where(linear <= 0.0031308, linear * 12.92,
+                                            1.055 * np.power(linear, 1.0 / 2.4) - 0.055)
+        chain.append(np.clip(np.rint(encoded * 255.0), 0, 255).astype(np.uint8))
+
+    return chain
+
+
+def compress_bc1(pixels: np.ndarray) -> np.ndarray:
+    """
+    :param pixels: (height, width, 3 or 4) uint8, alpha is ignored
+    :return: (block rows, block columns, 8) uint8
+    """
+    blocks = _blocks(pixels)
+    rows, columns = blocks.shape[:2]
+    flat = blocks.reshape(-1, 16, blocks.shape[-1])
+    out = np.empty((len(flat), 8), dtype=np.uint8)
+    for start in range(0, len(flat), BLOCK_BATCH):
+        batch = flat[start:start + BLOCK_BATCH]
+        out[start:start + len(batch)] = _encode_colors(batch[..., :3].astype(np.float32))
+
+    return out.reshape(rows, columns, 8)
+
+
+def compress_bc3(pixels: np.ndarray) -> np.ndarray:
+    """
+    :param pixels: (height, width, 4) uint8
+    :return: (block rows, block columns, 16) uint8
+    """
+    blocks = _blocks(pixels)
+    rows, columns = blocks.shape[:2]
+    flat = blocks.reshape(-1, 16, 4)
+    out = np.empty((len(flat), 16), dtype=np.uint8)
+    for start in range(0, len(flat), BLOCK_BATCH):
+        batch = flat[start:start + BLOCK_BATCH]
+        out[start:start + len(batch), :8] = _encode_alpha(batch[..., 3])
+        out[start:start + len(batch), 8:] = _encode_colors(batch[..., :3].astype(np.float32))
+
+    return out.reshape(rows, columns, 16)
+
+
+def decompress_bc1(blocks: np.ndarray, width: int, height: int) -> np.ndarray:
+    """:return: (height, width, 4) uint8, alpha 0 where the 3-color mode marks a texel transparent"""
+    rows, columns = blocks.shape[:2]
+    colors, alpha = _decode_colors(blocks.reshape(-1, blocks.shape[-1])[:, :8], four_color=False)
+
+    return _unblock(np.concatenate((colors, alpha[..., None]), axis=-1), rows, columns, width, height)
+
+
+def decompress_bc3(blocks: np.ndarray, width: int, height: int) -> np.ndarray:
+    """:return: (height, width, 4) uint8"""
+    rows, columns = blocks.shape[:2]
+    flat = blocks.reshape(-1, 16)
+    colors, _ = _decode_colors(flat[:, 8:], four_color=True)
+    alpha = _decode_alpha(flat[:, :8])
+
+    return _unblock(np.concatenate((colors, alpha[..., None]), axis=-1), rows, columns, width, height)
+
+
+def compress_image(pixels: np.ndarray, srgb: bool = True, encoding: str = None, mipmaps: bool = True) -> KtxImage:
+    """
+    Mip chain of an image as KTX data, BC compressed unless ``encoding`` is "none".
+    :param pixels: (height, width, channels) uint8, first row is the top of the image
+    :param srgb: Color channels are sRGB encoded
+    :param encoding: BC1, BC3, "none" or None: BC3 if any texel is not opaque, else BC1
+    :param mipmaps: Full mip chain, level 0 only if False
+    :return:
+    """
+    if pixels.ndim == 2:
+        pixels = pixels[:, :, None]
+    height, width, channels = pixels.shape
+    # GL expects the bottom row first
+    pixels = pixels[::-1]
+
+    if encoding == "none":
+        linear, srgb_format, pixel_format = PIXEL_FORMATS[channels]
+        chain = mip_chain(np.ascontiguousarray(pixels), srgb, None if mipmaps else 1)
+        return KtxImage(srgb_format if srgb else linear, pixel_format, width, height, chain)
+
+    if encoding is None:
+        encoding = BC3 if channels in (2, 4) and (pixels[..., -1] < 255).any() else BC1
+    # Gray expands to RGB, BC4/BC5 would suit gray and gray + alpha better. BC3 needs an alpha channel
+    rgb = np.repeat(pixels[..., :1], 3, axis=2) if channels < 3 else pixels[..., :3]
+    if encoding == BC3:
+        alpha = pixels[..., -1:] if channels in (2, 4) else np.full((height, width, 1), 255, dtype=np.uint8)
+        rgb = np.concatenate((rgb, alpha), axis=2)
+    chain = mip_chain(np.ascontiguousarray(rgb), srgb, None if mipmaps else 1)
+    compress = compress_bc3 if encoding == BC3 else compress_bc1
+
+    return KtxImage(BC_FORMATS[encoding][1 if srgb else 0], 0, width, height, [compress(level) for level in chain])
+
+
+def decompress_image(image: KtxImage) -> KtxImage:
+    """BC1/BC3 KtxImage decoded to RGBA8 (sRGB if the compressed format was), for contexts without S3TC."""
+    for encoding, formats in BC_FORMATS.items():
+        if image.internal_format in formats:
+            break
+    else:
+        raise ValueError(f"No decoder for compressed format {image.internal_format:#x}")
+
+    srgb = image.internal_format == formats[1]
+    decode = decompress_bc3 if encoding == BC3 else decompress_bc1
+    levels = [decode(blocks, *image.level_size(level)) for level, blocks in enumerate(image.levels)]
+    if encoding == BC1:
+        # RGB BC1 is opaque whatever the 3-color mode says
+        for level in levels:
+            level[..., 3] = 255
+    linear, srgb_format, pixel_format = PIXEL_FORMATS[4]
+
+    return KtxImage(srgb_format if srgb else linear, pixel_format, image.width, image.height, levels)
+
+
+def psnr(reference: np.ndarray, decoded: np.ndarray) -> float:
+    """Peak signal to noise ratio in dB of the channels both images have."""
+    channels = min(reference.shape[-1], decoded.shape[-1])
+    error = np.mean((reference[..., :channels].astype(np.float64) - decoded[..., :channels]) ** 2)
+
+    return float("inf") if error == 0.0 else 10.0 * np.log10(255.0 ** 2 / error)
+
+
+def _half(level: np.ndarray) -> np.ndarray:
+    """Average 2x2 texels, a dimension that is already 1 stays 1. An odd last row/column is dropped."""
+    height, width = level.shape[:2]
+    if height > 1:
+        level = (level[0:height // 2 * 2:2] + level[1:height // 2 * 2:2]) * 0.5
+    if width > 1:
+        level = (level[:, 0:width // 2 * 2:2] + level[:, 1:width // 2 * 2:2]) * 0.5
+
+    return level
+
+
+def _blocks(pixels: np.ndarray) -> np.ndarray:
+    """(block rows, block columns, 16, channels), edges padded by repeating the last texel."""
+    height, width, channels = pixels.shape
+    padded = np.pad(pixels, ((0, -height % 4), (0, -width % 4), (0, 0)), mode="edge")
+    rows, columns = padded.shape[0] // 4, padded.shape[1] // 4
+
+    return padded.reshape(rows, 4, columns, 4, channels).transpose(0, 2, 1, 3, 4).reshape(rows, columns, 16, channels)
+
+
+def _unblock(texels: np.ndarray, rows: int, columns: int, width: int, height: int) -> np.ndarray:
+    image = texels.reshape(rows, columns, 4, 4, -1).transpose(0, 2, 1, 3, 4).reshape(rows * 4, columns * 4, -1)
+
+    return np.ascontiguousarray(image[:height, :width])
+
+
+def _encode_colors(colors: np.ndarray) -> np.ndarray:
+    """(N, 16, 3) float32 -> (N, 8) uint8 BC1 blocks, always in 4-color mode."""
+    mean = colors.mean(axis=1, keepdims=True)
+    centered = colors - mean
+    covariance = np.einsum("nki,nkj->nij", centered, centered)
+    # Principal axis by power iteration, a few steps settle for 16 points
+    axis = np.ones((len(colors), 3), dtype=np.float32)
+    for _ in range(4):
+        axis = np.einsum("nij,nj->ni", covariance, axis)
+        length = np.linalg.norm(axis, axis=1, keepdims=True)
+        axis = np.where(length > 1e-6, axis / np.maximum(length, 1e-6), 0.57735)
+    projection = np.einsum("nki,ni->nk", centered, axis)
+    low = mean[:, 0] + axis * projection.min(axis=1, keepdims=True)
+    high = mean[:, 0] + axis * projection.max(axis=1, keepdims=True)
+    # Inset the endpoints a little, the interpolated colors then cover the block better
+    inset = (high - low) / 16.0
+    low, high = np.clip(low + inset, 0.0, 255.0), np.clip(high - inset, 0.0, 255.0)
+
+    color0, color1 = _rgb565(high), _rgb565(low)
+    # color0 > color1 selects the 4-color mode
+    swap = color0 < color1
+    color0, color1 = np.where(swap, color1, color0), np.where(swap, color0, color1)
+
+    palette = _palette(color0, color1, four_color=True)
+    distances = ((colors[:, :, None, :] - palette[:, None, :, :]) ** 2).sum(axis=-1)
+    indices = np.argmin(distances, axis=2).astype(np.uint32)
+    indices[color0 == color1] = 0
+    bits = (indices << (2 * np.arange(16, dtype=np.uint32))).sum(axis=1, dtype=np.uint32)
+
+    out = np.empty(len(colors), dtype=[("color0", "<u2"), ("color1", "<u2"), ("indices", "<u4")])
+    out["color0"], out["color1"], out["indices"] = color0, color1, bits
+
+    return out.view(np.uint8).reshape(-1, 8)
+
+
+def _encode_alpha(alpha: np.ndarray) -> np.ndarray:
+    """(N, 16) uint8 -> (N, 8) uint8 BC3 alpha blocks in 8-value mode."""
+    alpha0 = alpha.max(axis=1).astype(np.int32)
+    alpha1 = alpha.min(axis=1).astype(np.int32)
+    palette = _alpha_palette(alpha0, alpha1)
+    indices = np.argmin(np.abs(alpha[:, :, None].astype(np.int32) - palette[:, None, :]), axis=2).astype(np.uint64)
+    indices[alpha0 == alpha1] = 0
+    bits = (indices << (3 * np.arange(16, dtype=np.uint64))).sum(axis=1, dtype=np.uint64)
+
+    out = np.empty((len(alpha), 8), dtype=np.uint8)
+    out[:, 0], out[:, 1] = alpha0, alpha1
+    out[:, 2:] = bits[:, None].view(np.uint8).reshape(-1, 8)[:, :6]
+
+    return out
+
+
+def _decode_colors(blocks: np.ndarray, four_color: bool) -> tuple:
+    """(N, 8) uint8 BC1 blocks -> ((N, 16, 3) uint8 colors, (N, 16) uint8 alpha)."""
+    fields = np.ascontiguousarray(blocks).view([("color0", "<u2"), ("color1", "<u2"), ("indices", "<u4")])[:, 0]
+    color0, color1 = fields["color0"].astype(np.int32), fields["color1"].astype(np.int32)
+    palette = _palette(color0, color1, four_color or None)
+    indices = (fields["indices"][:, None] >> (2 * np.arange(16, dtype=np.uint32))) & 3
+    colors = np.take_along_axis(palette, indices[:, :, None].astype(np.int64), axis=1)
+    alpha = np.full(indices.shape, 255, dtype=np.uint8)
+    if not four_color:
+        alpha[(color0 <= color1)[:, None] & (indices == 3)] = 0
+
+    return np.clip(np.rint(colors), 0, 255).astype(np.uint8), alpha
+
+
+def _decode_alpha(blocks: np.ndarray) -> np.ndarray:
+    """(N, 8) uint8 BC3 alpha blocks -> (N, 16) uint8."""
+    alpha0, alpha1 = blocks[:, 0].astype(np.int32), blocks[:, 1].astype(np.int32)
+    raw = np.zeros((len(blocks), 8), dtype=np.uint8)
+    raw[:, :6] = blocks[:, 2:8]
+    bits = raw.view("<u8")[:, 0]
+    indices = ((bits[:, None] >> (3 * np.arange(16, dtype=np.uint64))) & 7).astype(np.int64)
+    # 6-value mode (alpha0 <= alpha1) with 0 and 255 as the last two codes
+    six = _alpha_palette(alpha0, alpha1, six=True)
+    palette = np.where((alpha0 > alpha1)[:, None], _alpha_palette(alpha0, alpha1), six)
+
+    return np.take_along_axis(palette, indices, axis=1).astype(np.uint8)
+
+
+def _rgb565(colors: np.ndarray) -> np.ndarray:
+    red = np.rint(colors[:, 0] * 31.0 / 255.0).astype(np.int32)
+    green = np.rint(colors[:, 1] * 63.0 / 255.0).astype(np.int32)
+    blue = np.rint(colors[:, 2] * 31.0 / 255.0).astype(np.int32)
+
+    return (red << 11) | (green << 5) | blue
+
+
+def _expand565(color: np.ndarray) -> np.ndarray:
+    red, green, blue = (color >> 11) & 31, (color >> 5) & 63, color & 31
+
+    return np.stack(((red << 3) | (red >> 2), (green << 2) | (green >> 4), (blue << 3) | (blue >> 2)),
+                    axis=-1).astype(np.float32)
+
+
+def _palette(color0: np.ndarray, color1: np.ndarray, four_color) -> np.ndarray:
+    """
+    (N, 4, 3) float32 palette. ``four_color`` True forces the 4-color mode (BC2/BC3 color
+    blocks), None picks per block from the endpoint order as BC1 decoders do.
+    """
+    end0, end1 = _expand565(color0), _expand565(color1)
+    four = np.stack((end0, end1, (2.0 * end0 + end1) / 3.0, (end0 + 2.0 * end1) / 3.0), axis=1)
+    if four_color is True:
+        return four
+    three = np.stack((end0, end1, (end0 + end1) / 2.0, np.zeros_like(end0)), axis=1)
+
+    return np.where((color0 > color1)[:, None, None], four, three)
+
+
+def _alpha_palette(alpha0: np.ndarray, alpha1: np.ndarray, six: bool = False) -> np.ndarray:
+    """(N, 8) int32 alpha values of the 8-value mode, or of the 6-value mode with 0 and 255."""
+    alpha0, alpha1 = alpha0[:, None], alpha1[:, None]
+    if six:
+        steps = np.arange(1, 5)
+        between = ((5 - steps) * alpha0 + steps * alpha1) // 5
+        ends = np.broadcast_to(np.array([0, 255]), (len(alpha0), 2))
+        return np.concatenate((alpha0, alpha1, between, ends), axis=1)
+    steps = np.arange(1, 7)
+    between = ((7 - steps) * alpha0 + steps * alpha1) // 7
+
+    return np.concatenate((alpha0, alpha1, between), axis=1)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print("usage: python -m common.texture_compression input.png output.ktx [--linear] [--uncompressed]")
+        sys.exit(1)
+    start = time.perf_counter()
+    source = read_png(sys.argv[1])
+    srgb = "--linear" not in sys.argv
+    converted = compress_image(source, srgb, "none" if "--uncompressed" in sys.argv else None)
+    write_ktx(sys.argv[2], converted)
+    print(f"INFO::TEXTURE::{sys.argv[2]}::{converted.width}x{converted.height}::{len(converted.levels)} LEVELS"
+          f"::FORMAT {converted.internal_format:#x}::{source.nbytes / 2 ** 20:.1f} MB -> {converted.nbytes / 2 ** 20:.1f} MB"
+          f"::{(time.perf_counter() - start) * 1000.0:.0f}ms")
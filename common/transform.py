@@ -0,0 +1,119 @@
+import numpy as np
+
+from . import matrices
+
+
+class RebuildStats(object):
+    """Counts how often cached matrices were rebuilt and how often a rebuild was avoided."""
+
+    def __init__(self):
+        self.rebuilds = 0
+        self.skipped = 0
+
+    def reset(self):
+        self.rebuilds = 0
+        self.skipped = 0
+
+    def report(self) -> str:
+        total = self.rebuilds + self.skipped
+        ratio = self.skipped / total * 100.0 if total else 0.0
+
+        return f"INFO::MATRIX_REBUILDS::{self.rebuilds}::SKIPPED::{self.skipped} ({ratio:.1f}%)"
+
+
+class Camera(object):
+    """
+    Look-at camera with an extra orbit rotation and cached view/projection matrices.
+
+    view = lookAt(eye, target, up) * rotation * translate(-pivot), which matches what the Qt
+    viewport did with QMatrix4x4.lookAt() followed by QMatrix4x4.rotate() while the pivot is
+    at the origin. The rotation orbits around the pivot, panning moves it. ``version`` is
+    bumped whenever the view or projection changes, so uploads can be skipped for unchanged
+    frames as well.
+    """
+
+    def __init__(self, eye=(0.0, 5.0, -10.0), target=(0.0, 0.0, 0.0), up=(0.0, 1.0, 0.0),
+                 stats: RebuildStats = None):
+        self.stats = stats if stats is not None else RebuildStats()
+
+        self.__eye = np.array(eye, dtype=np.float32)
+        self.__target = np.array(target, dtype=np.float32)
+        self.__up = np.array(up, dtype=np.float32)
+        self.__rotation = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+        self.__pivot = np.zeros(3, dtype=np.float32)
+
+        self.__view = matrices.identity()
+        self.__projection = matrices.identity()
+        self.__view_dirty = True
+
+        self.version = 0
+
+    @property
+    def eye(self) -> np.ndarray:
+        return self.__eye.copy()
+
+    @eye.setter
+    def eye(self, value):
+        if np.array_equal(self.__eye, value):
+            return
+        self.__eye[:] = value
+        self.__touch()
+
+    @property
+    def target(self) -> np.ndarray:
+        return self.__target.copy()
+
+    @target.setter
+    def target(self, value):
+        if np.array_equal(self.__target, value):
+            return
+        self.__target[:] = value
+        self.__touch()
+
+    @property
+    def rotation(self) -> np.ndarray:
+        return self.__rotation.copy()
+
+    @rotation.setter
+    def rotation(self, value):
+        if np.array_equal(self.__rotation, value):
+            return
+        self.__rotation[:] = value
+        self.__touch()
+
+    @property
+    def pivot(self) -> np.ndarray:
+        return self.__pivot.copy()
+
+    @pivot.setter
+    def pivot(self, value):
+        if np.array_equal(self.__pivot, value):
+            return
+        self.__pivot[:] = value
+        self.__touch()
+
+    def set_perspective(self, fov: float, aspect: float, near: float, far: float):
+        self.__projection = matrices.perspective(fov, aspect, near, far)
+        self.version += 1
+
+    @property
+    def projection_matrix(self) -> np.ndarray:
+        return self.__projection
+
+    @property
+    def view_matrix(self) -> np.ndarray:
+        if not self.__view_dirty:
+            self.stats.skipped += 1
+            return self.__view
+
+        self.__view = (matrices.look_at(self.__eye, self.__target, self.__up)
+                       @ matrices.rotation(self.__rotation)
+                       @ matrices.translation(-self.__pivot))
+        self.__view_dirty = False
+        self.stats.rebuilds += 1
+
+        return self.__view
+
+    def __touch(self):
+        self.__view_dirty = True
+        self.version += 1
@@ -0,0 +1,181 @@
+import numpy as np
+
+from .transform import RebuildStats
+
+
+class TransformBatch(object):
+    """
+    Transforms of many objects stored as contiguous numpy arrays.
+
+    Positions (N, 3), rotations (N, 4) as unit quaternions (w, x, y, z) and scales (N, 3) are
+    composed into model matrices for all dirty objects at once, and MVP matrices with one
+    matrix product over the whole batch. No Python code runs per object.
+
+    ``models`` and ``mvps`` are (N, 4, 4) float32 in OpenGL (column-major) layout: each
+    entry is the transpose of the math matrix. They can be copied straight into a VBO or
+    uniform buffer, or passed to glUniformMatrix4fv with transpose=False.
+    """
+
+    BLOCK = 8192
+
+    def __init__(self, capacity: int, stats: RebuildStats = None):
+        """
+        :param capacity: Maximum number of objects
+        :param stats: Shared rebuild counters, a private one is created if omitted
+        """
+        self.capacity = capacity
+        self.count = 0
+        # Bumped whenever compose() rebuilt at least one model matrix
+        self.version = 0
+        self.stats = stats if stats is not None else RebuildStats()
+
+        self.__positions = np.zeros((capacity, 3), dtype=np.float32)
+        self.__rotations = np.zeros((capacity, 4), dtype=np.float32)
+        self.__rotations[:, 0] = 1.0
+        self.__scales = np.ones((capacity, 3), dtype=np.float32)
+
+        self.__models = np.zeros((capacity, 4, 4), dtype=np.float32)
+        self.__models[:, 3, 3] = 1.0
+        self.__mvps = np.zeros((capacity, 4, 4), dtype=np.float32)
+
+        self.__dirty = np.zeros(capacity, dtype=bool)
+        self.__mvp_dirty = np.zeros(capacity, dtype=bool)
+        self.__view_projection = None
+
+    # Views over the live objects. Write into them directly and call mark_dirty() after.
+    @property
+    def positions(self) -> np.ndarray:
+        return self.__positions[:self.count]
+
+    @property
+    def rotations(self) -> np.ndarray:
+        return self.__rotations[:self.count]
+
+    @property
+    def scales(self) -> np.ndarray:
+        return self.__scales[:self.count]
+
+    @property
+    def models(self) -> np.ndarray:
+        return self.__models[:self.count]
+
+    @property
+    def mvps(self) -> np.ndarray:
+        return self.__mvps[:self.count]
+
+    def add(self, position=(0.0, 0.0, 0.0), rotation=(1.0, 0.0, 0.0, 0.0), scale=1.0) -> int:
+        """
+        Append one object.
+        :return: Index of the object in the batch
+        """
+        return int(self.extend(np.reshape(position, (1, 3)), np.reshape(rotation, (1, 4)),
+                               np.broadcast_to(scale, (1, 3)))[0])
+
+    def extend(self, positions, rotations=None, scales=None) -> np.ndarray:
+        """
+        Append many objects at once.
+        :param positions: (K, 3) translations
+        :param rotations: (K, 4) quaternions, identity if omitted
+        :param scales: (K, 3) or (K, 1) scale factors, 1.0 if omitted
+        :return: Indices of the new objects
+        """
+        positions = np.asarray(positions, dtype=np.float32)
+        first, last = self.count, self.count + len(positions)
+        if last > self.capacity:
+            raise ValueError(f"TransformBatch is full ({self.capacity} objects)")
+
+        self.__positions[first:last] = positions
+        self.__rotations[first:last] = (1.0, 0.0, 0.0, 0.0) if rotations is None else rotations
+        self.__scales[first:last] = 1.0 if scales is None else scales
+        self.count = last
+        self.__dirty[first:last] = True
+
+        return np.arange(first, last)
+
+    def update(self, index: int, position=None, rotation=None, scale=None):
+        if position is not None:
+            self.__positions[index] = position
+        if rotation is not None:
+            self.__rotations[index] = rotation
+        if scale is not None:
+            self.__scales[index] = scale
+        self.__dirty[index] = True
+
+    def mark_dirty(self, indices=None):
+        """Flag objects whose arrays were edited in place, all objects if indices is None."""
+        if indices is None:
+            self.__dirty[:self.count] = True
+        else:
+            self.__dirty[indices] = True
+
+    def compose(self, view_projection=None):
+        """
+        Rebuild model matrices of dirty objects and, if a view-projection matrix is given,
+        the MVP matrices that are out of date.
+        :param view_projection: Row-major 4x4 (projection @ view) or None to skip MVPs
+        :return: (models, mvps) views, mvps is None when no view-projection was given
+        """
+        count = self.count
+        dirty = np.flatnonzero(self.__dirty[:count])
+        self.stats.rebuilds += len(dirty)
+        self.stats.skipped += count - len(dirty)
+
+        if len(dirty) == count:
+            # Blocks keep the temporaries in cache, large batches are notably faster this way
+            for first in range(0, count, self.BLOCK):
+                self.__compose_models(slice(first, min(first + self.BLOCK, count)))
+        elif len(dirty):
+            self.__compose_models(dirty)
+        if len(dirty):
+            self.version += 1
+        self.__dirty[:count] = False
+        self.__mvp_dirty[dirty] = True
+
+        if view_projection is None:
+            return self.models, None
+
+        view_projection = np.asarray(view_projection, dtype=np.float32)
+        if self.__view_projection is None or not np.array_equal(self.__view_projection, view_projection):
+            self.__view_projection = view_projection.copy()
+            self.__mvp_dirty[:count] = True
+
+        # GL layout: mvp^T = model^T @ vp^T, a single (N*4, 4) x (4, 4) product
+        vp_transposed = np.ascontiguousarray(view_projection.T)
+        stale = np.flatnonzero(self.__mvp_dirty[:count])
+        if len(stale) == count:
+            np.matmul(self.__models[:count].reshape(-1, 4), vp_transposed,
+                      out=self.__mvps[:count].reshape(-1, 4))
+        elif len(stale):
+            self.__mvps[stale] = self.__models[stale] @ vp_transposed
+        self.__mvp_dirty[:count] = False
+
+        return self.models, self.mvps
+
+    def __compose_models(self, rows):
+        # Work on contiguous per-component rows (planar layout), strided writes into
+        # the (N, 4, 4) array are several times slower than one transposed copy at the end
+        w, x, y, z = np.ascontiguousarray(self.__rotations[rows].T)
+        sx, sy, sz = np.ascontiguousarray(self.__scales[rows].T)
+
+        xx, yy, zz = x * x, y * y, z * z
+        xy, xz, yz = x * y, x * z, y * z
+        wx, wy, wz = w * x, w * y, w * z
+
+        # planar[column * 4 + row] = (T * R * S)[row, column]
+        planar = np.zeros((16, len(w)), dtype=np.float32)
+        np.multiply(1.0 - 2.0 * (yy + zz), sx, out=planar[0])
+        np.multiply(2.0 * (xy + wz), sx, out=planar[1])
+        np.multiply(2.0 * (xz - wy), sx, out=planar[2])
+        np.multiply(2.0 * (xy - wz), sy, out=planar[4])
+        np.multiply(1.0 - 2.0 * (xx + zz), sy, out=planar[5])
+        np.multiply(2.0 * (yz + wx), sy, out=planar[6])
+        np.multiply(2.0 * (xz + wy), sz, out=planar[8])
+        np.multiply(2.0 * (yz - wx), sz, out=planar[9])
+        np.multiply(1.0 - 2.0 * (xx + yy), sz, out=planar[10])
+        planar[12:15] = self.__positions[rows].T
+        planar[15] = 1.0
+
+        if isinstance(rows, slice):
+            self.__models[rows].reshape(-1, 16)[:] = planar.T
+        else:
+            self.__models[rows] = planar.T.reshape(-1, 4, 4)
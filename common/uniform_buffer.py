@@ -0,0 +1,122 @@
+import numpy as np
+import OpenGL.GL as gl
+
+from .gl_info import supports, mapped_array
+from .gl_state import default_state
+
+# Binding point every shader uses for "layout (std140, row_major, binding = 0) uniform Camera"
+CAMERA_BINDING = 0
+
+
+class CameraUniformBuffer(object):
+    """
+    std140 uniform block holding the view and projection matrices.
+
+    The block is written once per frame and every program reads it from the same binding
+    point, so the upload cost does not depend on how many programs are drawn.
+
+    On GL 4.4+ (or with ARB_buffer_storage) the buffer is persistently mapped and split into
+    ``frames`` slots. Each frame writes the next slot directly through the mapping; a fence
+    makes sure a slot the GPU may still read is never overwritten. Older contexts fall back
+    to glBufferSubData on a single block.
+
+    GLSL side:
+
+        layout (std140, row_major, binding = 0) uniform Camera
+        {
+            mat4 u_viewMatrix;
+            mat4 u_projectionMatrix;
+        };
+    """
+
+    BLOCK_NAME = "Camera"
+    # Two mat4, std140 keeps them tightly packed
+    BLOCK_SIZE = 2 * 16 * 4
+
+    def __init__(self, binding: int = CAMERA_BINDING, frames: int = 3):
+        """
+        Create the buffer. Needs a current OpenGL context.
+        :param binding: Uniform buffer binding point
+        :param frames: Number of slots used in persistent mode
+        """
+        self.binding = binding
+        self.persistent = supports((4, 4), "GL_ARB_buffer_storage") and bool(gl.glBufferStorage)
+
+        alignment = int(gl.glGetIntegerv(gl.GL_UNIFORM_BUFFER_OFFSET_ALIGNMENT))
+        self.stride = (self.BLOCK_SIZE + alignment - 1) // alignment * alignment
+        self.frames = frames if self.persistent else 1
+
+        self.uploads = 0
+        self.__slot = 0
+        self.__fences = [None] * self.frames
+        self.__mapped = None
+
+        self.ubo = gl.glGenBuffers(1)
+        default_state().bind_buffer(gl.GL_UNIFORM_BUFFER, self.ubo)
+
+        size = self.stride * self.frames
+        if self.persistent:
+            flags = gl.GL_MAP_WRITE_BIT | gl.GL_MAP_PERSISTENT_BIT | gl.GL_MAP_COHERENT_BIT
+            gl.glBufferStorage(gl.GL_UNIFORM_BUFFER, size, None, flags)
+            address = gl.glMapBufferRange(gl.GL_UNIFORM_BUFFER, 0, size, flags)
+            self.__mapped = mapped_array(address, size, np.float32)
+        else:
+            gl.glBufferData(gl.GL_UNIFORM_BUFFER, size, None, gl.GL_DYNAMIC_DRAW)
+
+        default_state().bind_buffer_range(gl.GL_UNIFORM_BUFFER, self.binding, self.ubo, 0, self.BLOCK_SIZE)
+
+    def attach(self, program):
+        """
+        Point the program's Camera block at our binding point.
+        Only needed for shaders without a "binding" layout qualifier.
+        :param program: ShaderProgram or raw program name
+        :return:
+        """
+        program = getattr(program, "program", program)
+        index = gl.glGetUniformBlockIndex(program, self.BLOCK_NAME)
+        if index != gl.GL_INVALID_INDEX:
+            gl.glUniformBlockBinding(program, index, self.binding)
+
+    def update(self, view, projection):
+        """
+        Upload this frame's camera. Call once per frame before drawing.
+        :param view: View matrix, 16 floats in row-major order (numpy 4x4 or QMatrix4x4.copyDataTo())
+        :param projection: Projection matrix, same layout as view
+        :return:
+        """
+        block = np.empty(32, dtype=np.float32)
+        block[:16] = np.ravel(view)
+        block[16:] = np.ravel(projection)
+
+        if self.persistent:
+            # Everything submitted so far may still read the current slot
+            self.__fences[self.__slot] = gl.glFenceSync(gl.GL_SYNC_GPU_COMMANDS_COMPLETE, 0)
+            self.__slot = (self.__slot + 1) % self.frames
+            self.__wait(self.__slot)
+
+            offset = self.__slot * self.stride
+            self.__mapped[offset // 4:offset // 4 + 32] = block
+            default_state().bind_buffer_range(gl.GL_UNIFORM_BUFFER, self.binding, self.ubo, offset, self.BLOCK_SIZE)
+        else:
+            default_state().bind_buffer(gl.GL_UNIFORM_BUFFER, self.ubo)
+            gl.glBufferSubData(gl.GL_UNIFORM_BUFFER, 0, block.nbytes, block)
+
+        self.uploads += 1
+
+    def delete(self):
+        for slot in range(self.frames):
+            self.__wait(slot)
+        if self.persistent:
+            default_state().bind_buffer(gl.GL_UNIFORM_BUFFER, self.ubo)
+            gl.glUnmapBuffer(gl.GL_UNIFORM_BUFFER)
+            self.__mapped = None
+        default_state().delete_buffers([self.ubo])
+
+    def __wait(self, slot: int):
+        fence = self.__fences[slot]
+        if fence is None:
+            return
+
+        gl.glClientWaitSync(fence, gl.GL_SYNC_FLUSH_COMMANDS_BIT, 1000000000)
+        gl.glDeleteSync(fence)
+        self.__fences[slot] = None
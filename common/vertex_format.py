@@ -0,0 +1,234 @@
+import ctypes
+
+import numpy as np
+import OpenGL.GL as gl
+
+from .mesh_io import MeshData, index_dtype
+
+GL_TYPES = {
+    np.dtype(np.float32): gl.GL_FLOAT,
+    np.dtype(np.float16): gl.GL_HALF_FLOAT,
+    np.dtype(np.float64): gl.GL_DOUBLE,
+    np.dtype(np.int8): gl.GL_BYTE,
+    np.dtype(np.uint8): gl.GL_UNSIGNED_BYTE,
+    np.dtype(np.int16): gl.GL_SHORT,
+    np.dtype(np.uint16): gl.GL_UNSIGNED_SHORT,
+    np.dtype(np.int32): gl.GL_INT,
+    np.dtype(np.uint32): gl.GL_UNSIGNED_INT,
+}
+PACKED_TYPES = {
+    np.dtype(np.int32): gl.GL_INT_2_10_10_10_REV,
+    np.dtype(np.uint32): gl.GL_UNSIGNED_INT_2_10_10_10_REV,
+}
+INDEX_TYPES = {
+    np.dtype(np.uint16): gl.GL_UNSIGNED_SHORT,
+    np.dtype(np.uint32): gl.GL_UNSIGNED_INT,
+}
+
+# Attributes start on 4 byte boundaries, vertex fetch is slow or undefined otherwise
+ATTRIBUTE_ALIGNMENT = 4
+
+# Encodings accepted by pack_mesh(): numpy type, normalized, packed
+ENCODINGS = {
+    "float32": (np.float32, False, False),
+    "float16": (np.float16, False, False),
+    "snorm8": (np.int8, True, False),
+    "snorm16": (np.int16, True, False),
+    "unorm8": (np.uint8, True, False),
+    "unorm16": (np.uint16, True, False),
+    "2_10_10_10": (np.int32, True, True),
+}
+
+
+class VertexAttribute(object):
+    """One attribute of a VertexFormat, everything glVertexAttribPointer needs."""
+
+    def __init__(self, name: str, components: int, gl_type: int, offset: int, normalized: bool, integer: bool):
+        self.name = name
+        self.components = components
+        self.gl_type = gl_type
+        self.offset = offset
+        self.normalized = normalized
+        self.integer = integer
+
+
+class VertexFormat(object):
+    """
+    Layout of interleaved vertices derived from a numpy structured dtype: component count,
+    GL type and offset of every attribute and the stride come from the fields, none of
+    them are written by hand.
+
+        dtype = np.dtype([("position", np.float16, (4,)), ("normal", np.int32), ("texcoord", np.uint16, (2,))])
+        VertexFormat(dtype, normalized=("normal", "texcoord"), packed=("normal",)).bind({"position": 0, ...})
+
+    Integer fields reach the shader as floats, scaled to [0, 1] / [-1, 1] when listed in
+    ``normalized``, or as ivec/uvec when listed in ``integer``. Fields in ``packed`` are one
+    int32 (signed) or uint32 holding a 2_10_10_10 vector, see pack_2_10_10_10().
+    """
+
+    def __init__(self, dtype: np.dtype, normalized=(), packed=(), integer=()):
+        """
+        :param dtype: Structured dtype of one vertex, field order is the default location order
+        :param normalized: Integer fields read as normalized floats
+        :param packed: int32/uint32 fields holding 2_10_10_10 vectors
+        :param integer: Integer fields read as integers (glVertexAttribIPointer)
+        """
+        dtype = np.dtype(dtype)
+        if dtype.names is None:
+            raise ValueError("A vertex format needs a structured dtype")
+
+        self.dtype = dtype
+        self.stride = dtype.itemsize
+        self.attributes = []
+        for name in dtype.names:
+            field, offset = dtype.fields[name][:2]
+            base = field.base.newbyteorder("=")
+            components = int(np.prod(field.shape)) if field.shape else 1
+            if name in packed:
+                if base not in PACKED_TYPES or components != 1:
+                    raise ValueError(f"Packed attribute '{name}' must be a single int32 or uint32")
+                gl_type, components = PACKED_TYPES[base], 4
+            elif base in GL_TYPES:
+                gl_type = GL_TYPES[base]
+            else:
+                raise ValueError(f"Attribute '{name}' has no OpenGL vertex type ({field})")
+            if not 1 <= components <= 4:
+                raise ValueError(f"Attribute '{name}' has {components} components, 1 to 4 are possible")
+            self.attributes.append(VertexAttribute(name, components, gl_type, offset,
+                                                   name in normalized or name in packed, name in integer))
+
+    @classmethod
+    def from_mesh(cls, mesh: MeshData):
+        return cls(mesh.vertices.dtype, mesh.normalized, mesh.packed)
+
+    def attribute(self, name: str) -> VertexAttribute:
+        for attribute in self.attributes:
+            if attribute.name == name:
+                return attribute
+
+        raise KeyError(f"Vertex format has no attribute '{name}'")
+
+    def bind(self, locations: dict = None, offset: int = 0):
+        """
+        Point attributes at the buffer bound to GL_ARRAY_BUFFER, into the bound VAO.
+        :param locations: {field name: location}, fields left out are skipped. Field order if None
+        :param offset: Byte offset of the first vertex in the buffer, e.g. from StreamBuffer.write()
+        :return:
+        """
+        if locations is None:
+            locations = {attribute.name: location for location, attribute in enumerate(self.attributes)}
+
+        for attribute in self.attributes:
+            if attribute.name not in locations:
+                continue
+            location = locations[attribute.name]
+            pointer = ctypes.c_void_p(offset + attribute.offset)
+            gl.glEnableVertexAttribArray(location)
+            if attribute.integer:
+                gl.glVertexAttribIPointer(location, attribute.components, attribute.gl_type, self.stride, pointer)
+            else:
+                gl.glVertexAttribPointer(location, attribute.components, attribute.gl_type, attribute.normalized,
+                                         self.stride, pointer)
+
+
+def aligned_dtype(fields: list) -> np.dtype:
+    """Structured dtype like np.dtype(fields), every field starting on ATTRIBUTE_ALIGNMENT."""
+    names, formats, offsets = [], [], []
+    offset = 0
+    for field in fields:
+        name, base = field[0], np.dtype(field[1])
+        shape = field[2] if len(field) > 2 else ()
+        names.append(name)
+        formats.append((base, shape) if shape else base)
+        offsets.append(offset)
+        offset = _align(offset + base.itemsize * int(np.prod(shape)))
+
+    return np.dtype({"names": names, "formats": formats, "offsets": offsets, "itemsize": offset})
+
+
+def to_snorm(values: np.ndarray, dtype=np.int8) -> np.ndarray:
+    """Floats in [-1, 1] as normalized signed integers."""
+    scale = np.iinfo(dtype).max
+
+    return np.clip(np.round(np.asarray(values) * scale), -scale, scale).astype(dtype)
+
+
+def to_unorm(values: np.ndarray, dtype=np.uint8) -> np.ndarray:
+    """Floats in [0, 1] as normalized unsigned integers."""
+    scale = np.iinfo(dtype).max
+
+    return np.clip(np.round(np.asarray(values) * scale), 0, scale).astype(dtype)
+
+
+def pack_2_10_10_10(xyz: np.ndarray, w=0) -> np.ndarray:
+    """
+    (N, 3) floats in [-1, 1] as GL_INT_2_10_10_10_REV: x, y and z get 10 bits each,
+    w the top 2. Normals and tangents in 4 bytes instead of 12.
+    """
+    xyz = np.asarray(xyz, dtype=np.float64)
+    bits = np.clip(np.round(xyz * 511.0), -511, 511).astype(np.int64) & 0x3FF
+    packed = bits[:, 0] | (bits[:, 1] << 10) | (bits[:, 2] << 20) | ((np.asarray(w, dtype=np.int64) & 0x3) << 30)
+
+    return packed.astype(np.uint32).view(np.int32)
+
+
+def pack_mesh(mesh: MeshData, encodings: dict = None) -> MeshData:
+    """
+    Re-encode the attributes of a mesh into a smaller vertex, e.g.
+
+        pack_mesh(mesh, {"position": "float16", "normal": "2_10_10_10", "texcoord": "unorm16"})
+
+    shrinks position + normal + texcoord from 32 to 16 bytes. Vectors that would end on
+    an unaligned byte get an extra zero component (float16 xyz becomes xyz0). Fields not
+    listed keep their type. Indices become uint16 when the vertex count allows it.
+    :param mesh: Source mesh, float attributes for every field listed in ``encodings``
+    :param encodings: {field name: key of ENCODINGS}
+    :return: New in-memory MeshData
+    """
+    encodings = encodings or {}
+    source = mesh.vertices
+    fields, columns = [], {}
+    normalized = set(mesh.normalized)
+    packed = set(mesh.packed)
+
+    for name, base, components, _ in mesh.attributes:
+        values = source[name].reshape(len(source), -1)
+        if name not in encodings:
+            fields.append((name, base, (components,)) if components > 1 else (name, base))
+            columns[name] = source[name]
+            continue
+
+        dtype, is_normalized, is_packed = ENCODINGS[encodings[name]]
+        normalized.discard(name)
+        packed.discard(name)
+        if is_normalized:
+            normalized.add(name)
+        if is_packed:
+            fields.append((name, dtype))
+            columns[name] = pack_2_10_10_10(values[:, :3])
+            packed.add(name)
+            continue
+
+        size = np.dtype(dtype).itemsize
+        # Pad vectors to a multiple of 4 bytes with zero components
+        padded = components
+        while padded * size % ATTRIBUTE_ALIGNMENT and padded < 4:
+            padded += 1
+        if padded != components:
+            values = np.concatenate((values, np.zeros((len(values), padded - components))), axis=1)
+        if is_normalized and np.dtype(dtype).kind == "i":
+            values = to_snorm(values, dtype)
+        elif is_normalized:
+            values = to_unorm(values, dtype)
+        fields.append((name, dtype, (padded,)) if padded > 1 else (name, dtype))
+        columns[name] = values.astype(dtype).reshape(len(source), *((padded,) if padded > 1 else ()))
+
+    vertices = np.empty(len(source), dtype=aligned_dtype(fields))
+    for name, values in columns.items():
+        vertices[name] = values
+
+    return MeshData(vertices, np.asarray(mesh.indices).astype(index_dtype(len(vertices))), normalized, packed)
+
+
+def _align(value: int) -> int:
+    return (value + ATTRIBUTE_ALIGNMENT - 1) // ATTRIBUTE_ALIGNMENT * ATTRIBUTE_ALIGNMENT
@@ -1,11 +1,26 @@
+import functools
+import os
+import sys
+
 import glfw
 import numpy as np
 from OpenGL.GL import *
 from OpenGL.GL.shaders import compileProgram, compileShader
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.asset_loader import AssetLoader, read_mesh_file
+from common.mesh import Mesh
+from common.mesh_io import MeshData
+from common.mesh_optimizer import optimize_mesh
+from common.scheduler import RenderScheduler, ON_DEMAND
+
+# on_demand (default), fixed or uncapped, e.g. "python index_drawing.py --mode fixed"
+scheduler = RenderScheduler(sys.argv[sys.argv.index("--mode") + 1] if "--mode" in sys.argv else ON_DEMAND)
+
 
 def window_resize(window, width, height):
     glViewport(0, 0, width, height)
+    scheduler.invalidate()
 
 # initializing glfw library
 if not glfw.init():
@@ -24,9 +39,12 @@ glfw.set_window_pos(window, 400, 200)
 
 # set the callback function for window resize
 glfw.set_window_size_callback(window, window_resize)
+# redraw when the window system lost the contents (uncovered, restored, ...)
+glfw.set_window_refresh_callback(window, lambda window: scheduler.invalidate())
 
 # make the context current
 glfw.make_context_current(window)
+scheduler.configure_swap()
 
 vertices = [-0.5, -0.5, 0.0, 1.0, 0.0, 0.0,
              0.5, -0.5, 0.0, 0.0, 1.0, 0.0,
@@ -38,8 +56,45 @@ indices = [0, 1, 2,
            1, 2, 3,
            2, 3, 4]
 
-vertices = np.array(vertices, dtype=np.float32)
-indices = np.array(indices, dtype=np.uint32)
+# Interleaved position + color, viewed as one structured record per vertex
+vertex_format = np.dtype([("position", np.float32, (3,)), ("color", np.float32, (3,))])
+mesh_data = MeshData(np.array(vertices, dtype=np.float32).view(vertex_format), np.array(indices, dtype=np.uint32))
+
+# "python index_drawing.py --mesh model.mesh" draws a model instead, .obj/.ply are imported first.
+# A .mesh file is memory-mapped and uploaded from the mapping (python common/mesh_io.py model.obj model.mesh)
+# The model is read in a worker process (a reader thread for .mesh files, which need no
+# processing) and uploaded a few milliseconds per frame, the built-in shape is drawn until it is ready
+loader = AssetLoader(on_loaded=scheduler.invalidate)
+
+
+def read_model(path: str):
+    """Reader: import, optimize unless it is a .mesh file, fit into the window. No GL calls."""
+    model_data = read_mesh_file(path)
+    optimize_report = None
+    if not path.endswith(".mesh"):
+        model_data, optimize_stats = optimize_mesh(model_data)
+        optimize_report = optimize_stats.report()
+    low, high = model_data.bounds()
+    # xyz: center, w: scale
+    return model_data, (*((low + high) / 2.0), 1.8 / max(float(np.max(high - low)), 1e-6)), optimize_report
+
+
+def upload_model(data):
+    """Render thread, a few buffer chunks per frame."""
+    model_data, model_fit, optimize_report = data
+    if optimize_report is not None:
+        print(optimize_report)
+    model = yield from Mesh.upload_steps(model_data, {"position": 0, "color": 1})
+
+    return model, model_fit
+
+
+if "--mesh" in sys.argv:
+    model_path = sys.argv[sys.argv.index("--mesh") + 1]
+    # Optimizing is a Python loop holding the GIL, it runs in a process. A mapped .mesh
+    # file would be copied to get back from one, it is read on a thread
+    loader.submit(model_path, functools.partial(read_model, model_path), upload_model,
+                  cpu_bound=not model_path.endswith(".mesh"))
 
 with open("shaders/index_drawing.vs", "r") as source:
     vertex_src = source.read()
@@ -49,34 +104,41 @@ with open("shaders/index_drawing.fs", "r") as source:
 
 shader = compileProgram(compileShader(vertex_src, GL_VERTEX_SHADER), compileShader(fragment_src, GL_FRAGMENT_SHADER))
 
-# Vertex Buffer Object
-VBO = glGenBuffers(1)
-glBindBuffer(GL_ARRAY_BUFFER, VBO)
-glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
-
-# Element Buffer Object
-EBO = glGenBuffers(1)
-glBindBuffer(GL_ELEMENT_ARRAY_BUFFER, EBO)
-glBufferData(GL_ELEMENT_ARRAY_BUFFER, indices.nbytes, indices, GL_STATIC_DRAW)
-
-glEnableVertexAttribArray(0)
-glVertexAttribPointer(0, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(0))
-
-glEnableVertexAttribArray(1)
-glVertexAttribPointer(1, 3, GL_FLOAT, GL_FALSE, 24, ctypes.c_void_p(12))
+# Vertex and Element Buffer Objects in a VAO, attributes by field name.
+# Index order is optimized for the vertex cache on upload
+mesh = Mesh(mesh_data, {"position": 0, "color": 1}, optimize=True)
 
 glUseProgram(shader)
+# xyz: center, w: scale. The built-in shape is drawn as it is
+glUniform4f(glGetUniformLocation(shader, "u_fit"), 0.0, 0.0, 0.0, 1.0)
 glClearColor(0, 0.1, 0.1, 1)
 
-# the main application loop
+# the main application loop, the scheduler sleeps until a frame is needed
 while not glfw.window_should_close(window):
-    glfw.poll_events()
+    if not scheduler.wait():
+        continue
+
+    for asset in loader.update():
+        if asset.error is None:
+            mesh.delete()
+            mesh, fit = asset.value
+            glUniform4f(glGetUniformLocation(shader, "u_fit"), *fit)
+    # Keep drawing while there is something to upload
+    if loader.uploads_waiting:
+        scheduler.invalidate()
 
     glClear(GL_COLOR_BUFFER_BIT)
 
-    glDrawElements(GL_TRIANGLES, len(indices), GL_UNSIGNED_INT, None)
+    mesh.draw()
 
     glfw.swap_buffers(window)
+    scheduler.frame_done()
+
+print(scheduler.stats.report())
+if loader.stats.requested:
+    print(loader.stats.report())
+loader.shutdown(wait=False)
+mesh.delete()
 
 # terminate glfw, free up allocated resources
 glfw.terminate()
\ No newline at end of file
@@ -4,7 +4,10 @@ layout(location = 0) in vec3 a_position;
 
 out vec3 v_color;
 
+// xyz: center of the model, w: scale fitting it into the window
+uniform vec4 u_fit;
+
 void main()
 {
-    gl_Position = vec4(a_position, 1.0);
+    gl_Position = vec4((a_position - u_fit.xyz) * u_fit.w, 1.0);
 }
\ No newline at end of file
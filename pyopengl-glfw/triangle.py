@@ -1,86 +1,195 @@
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import headless
+
+# PyOpenGL binds its platform on first import, headless backends have to be chosen before
+BACKEND = headless.platform_from_argv()
+
 import glfw
 import numpy as np
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileProgram, compileShader
+
+from common.frame_capture import FrameCapture
+from common.gl_state import default_state
+from common.profiler import FrameProfiler, ProfilerOverlay
+from common.program_cache import default_cache
+from common.scheduler import RenderScheduler, ON_DEMAND
+from common.shader_manager import ShaderManager
+from common.shader_program import ShaderProgram
+from common.stream_buffer import StreamBuffer
+from common.vertex_format import VertexFormat
 
 
 class Viewport(object):
-    def __init__(self, width, height, title="OpenGL Window", r=0.2, g=0.3, b=0.3, a=1.0):
+    def __init__(self, width, height, title="OpenGL Window", r=0.2, g=0.3, b=0.3, a=1.0, backend="glfw",
+                 mode=ON_DEMAND, rate=60.0):
+        """
+        :param backend: "glfw" for a window, "egl" or "osmesa" to render offscreen without a display
+        :param mode: Window redraw policy, "on_demand", "fixed" or "uncapped" (see RenderScheduler)
+        :param rate: Frames per second in "fixed" mode
+        """
         super().__init__()
         self.width = width
         self.height = height
         self.window_title = title
         self.bg_color = (r, g, b, a)
+        self.backend = backend
 
         # !!! MUST BE SET AS NDARRAY FROM NUMPY !!!
         self.vertices = np.array([], dtype=np.float32)
-
-        self.__check_glfw()
-        self.__setup_glfw()
-        self.window = self.__create_window()
-
-    def main_loop(self):
+        # Vertices are uploaded by the next frame, set_vertices() also works inside main_loop
+        self.stream = None
+        self.vertices_changed = True
+
+        self.window = None
+        self.headless = None
+        self.scheduler = RenderScheduler(mode, rate)
+        if backend == "glfw":
+            self.__check_glfw()
+            self.__setup_glfw()
+            self.window = self.__create_window()
+        else:
+            self.headless = headless.HeadlessContext(width, height, backend)
+
+    def main_loop(self, frames: int = 1000, capture_dir: str = None, profile_path: str = None):
+        """
+        :param frames: Number of frames to render with a headless backend, ignored for windows
+        :param capture_dir: Write every frame as PNG into this folder
+        :param profile_path: Export per pass timings to this .json or .csv file on exit
+        """
         self.__check_vertices(self.vertices, True)
 
-        self.VBO = self.__createVBO(self.vertices)
+        # Saved shader files are recompiled while the window stays open
+        self.shader_manager = ShaderManager(on_change=self.scheduler.invalidate)
         self.VAO = self.__createVAO()
+        self.stream = StreamBuffer(self.vertices.nbytes)
+        default_state().bind_buffer(GL_ARRAY_BUFFER, self.stream.buffer)
 
         self.shaderProgram = self.__compile_shaders(path_vertex="shaders/triangle.vs",
                                                     path_fragment="shaders/triangle.fs")
-        self.attr_position = self.create_attribute(self.shaderProgram, "a_position", 0)
+        self.vertex_format = VertexFormat(np.dtype([("a_position", np.float32, (3,))]))
+        self.attr_position = self.create_attribute(self.shaderProgram, "a_position")
+
+        self.profiler = FrameProfiler()
+        self.profiler_overlay = ProfilerOverlay(self.profiler)
+
+        capture = None
+        if capture_dir is not None:
+            capture = FrameCapture(self.width, self.height, capture_dir)
+
+        if self.headless is not None:
+            self.headless.render_frames(self.draw_frame, frames, capture)
+            if capture is not None:
+                capture.delete()
+            self.__finish_profile(profile_path)
+            self.shader_manager.stop()
+            self.stream.delete()
+            self.headless.delete()
+
+            return
 
         # MAIN LOOP
         # ---------
         while not glfw.window_should_close(self.window):
+            # Sleeps until a redraw is requested or the next frame is due
+            if not self.scheduler.wait():
+                continue
             self.__process_events(self.window)
 
-            glClearColor(self.bg_color[0], self.bg_color[1],
-                         self.bg_color[2], self.bg_color[3])
-            glClear(GL_COLOR_BUFFER_BIT)
-
-            # DO STUFF HERE
-            # -------------
-            glUseProgram(self.shaderProgram)
-            glDrawArrays(GL_TRIANGLES, 0, 3)
-
-            # -------------
+            self.draw_frame()
+            if capture is not None:
+                # Back buffer, read before the swap
+                capture.capture(0)
 
             glfw.swap_buffers(self.window)
-            glfw.poll_events()
+            self.scheduler.frame_done()
+        if capture is not None:
+            capture.delete()
+            print(capture.stats.report())
+        print(self.scheduler.stats.report())
+        self.__finish_profile(profile_path)
+        self.shader_manager.stop()
+        self.stream.delete()
         glfw.terminate()
 
-    def create_attribute(self, shader, attrib_name: str, stride: int):
-        attribute = glGetAttribLocation(shader, attrib_name)
-        glEnableVertexAttribArray(attribute)
-        glVertexAttribPointer(attribute, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(0))
+    def draw_frame(self):
+        # Swap in shaders that finished recompiling, never waits for the compiler
+        self.shader_manager.update()
+        if self.shader_manager.has_pending():
+            # Come back for the result even if nothing else asks for a frame
+            self.scheduler.invalidate()
+
+        self.profiler.begin_frame()
+
+        # State is set every frame as if nothing was known, the tracker drops what is already set
+        state = default_state()
+        with self.profiler.section("clear"):
+            state.clear_color(*self.bg_color)
+            glClear(GL_COLOR_BUFFER_BIT)
+
+        # DO STUFF HERE
+        # -------------
+        with self.profiler.section("triangle"):
+            self.shaderProgram.use()
+            state.bind_vertex_array(self.VAO)
+            if self.vertices_changed:
+                self.__upload_vertices()
+            glDrawArrays(GL_TRIANGLES, 0, len(self.vertices) // 3)
+
+        # -------------
+        self.profiler_overlay.draw()
+        self.profiler.end_frame()
+        self.stream.end_frame()
+        state.end_frame()
+
+    def create_attribute(self, shader: ShaderProgram, attrib_name: str):
+        # Size, type and stride come from the vertex format, not from the call site
+        attribute = shader.attribute_location(attrib_name)
+        self.vertex_format.bind({attrib_name: attribute})
 
         return attribute
 
     def set_vertices(self, vertex_list: list):
-        vertices = np.array(vertex_list, dtype=np.float32)
+        """
+        Replace the vertices, before or while main_loop runs (e.g. a new point cloud every frame).
+        :param vertex_list: x, y, z of every vertex, flat
+        """
+        vertices = np.asarray(vertex_list, dtype=np.float32)
         self.vertices = vertices
+        self.vertices_changed = True
+        if self.window is not None:
+            self.scheduler.invalidate()
+
+    def __finish_profile(self, path: str):
+        print(self.profiler.report())
+        print(default_state().stats.report())
+        if path is not None:
+            self.profiler.export(path)
+        self.profiler_overlay.delete()
+        self.profiler.delete()
 
     def __createVAO(self):
         VAO = glGenVertexArrays(1)
-        glBindVertexArray(VAO)
+        default_state().bind_vertex_array(VAO)
 
         return VAO
 
-    def __createVBO(self, vertices):
-        VBO = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, VBO)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
-
-        return VBO
+    def __upload_vertices(self):
+        # Written into this frame's region of the stream, no new buffer and no stall
+        self.vertices_changed = False
+        if self.vertices.nbytes == 0:
+            return
+        offset = self.stream.write(self.vertices)
+        default_state().bind_buffer(GL_ARRAY_BUFFER, self.stream.buffer)
+        self.vertex_format.bind({"a_position": self.attr_position}, offset)
 
     def __compile_shaders(self, path_vertex: str, path_fragment: str):
-        with open(path_vertex, "r") as source:
-            vertex = compileShader(source.read(), GL_VERTEX_SHADER)
-
-        with open(path_fragment, "r") as source:
-            fragment = compileShader(source.read(), GL_FRAGMENT_SHADER)
-
-        shader_program = compileProgram(vertex, fragment)
+        # Uniform/attribute locations are queried once here, not per frame,
+        # the linked binary comes from the on-disk cache after the first start
+        shader_program = self.shader_manager.load(path_vertex, path_fragment, cache=default_cache())
+        print(default_cache().report())
 
         return shader_program
 
@@ -89,23 +198,38 @@ class Viewport(object):
 
         glfw.set_window_pos(window, 400, 200)
         glfw.set_window_size_callback(window, self.__resize_window)
+        glfw.set_key_callback(window, self.__key_pressed)
+        glfw.set_window_refresh_callback(window, self.__refresh_window)
         glfw.make_context_current(window)
+        self.scheduler.configure_swap()
 
         return window
 
     def __resize_window(self, window, width: int, height: int):
         glViewport(0, 0, width, height)
+        self.scheduler.invalidate()
+
+    def __refresh_window(self, window):
+        self.scheduler.invalidate()
+
+    def __key_pressed(self, window, key: int, scancode: int, action: int, mods: int):
+        # O - show/hide the frame time graph
+        if key == glfw.KEY_O and action == glfw.PRESS:
+            self.profiler_overlay.toggle()
+        # Every key may change what is drawn (polygon mode, overlay)
+        self.scheduler.invalidate()
 
     @staticmethod
     def __process_events(window):
         if glfw.get_key(window, glfw.KEY_ESCAPE) is glfw.PRESS:
             glfw.set_window_should_close(window, True)
+        # Polled every frame while the key is held, repeats never reach GL
         if glfw.get_key(window, glfw.KEY_W) == glfw.PRESS:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_LINE)
+            default_state().polygon_mode(GL_LINE)
         if glfw.get_key(window, glfw.KEY_F) == glfw.PRESS:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_FILL)
+            default_state().polygon_mode(GL_FILL)
         if glfw.get_key(window, glfw.KEY_P) == glfw.PRESS:
-            glPolygonMode(GL_FRONT_AND_BACK, GL_POINT)
+            default_state().polygon_mode(GL_POINT)
 
     @staticmethod
     def __check_glfw():
@@ -136,11 +260,23 @@ class Viewport(object):
 
 
 if __name__ == '__main__':
-    window = Viewport(1280, 720, "Test window ")
+    mode = ON_DEMAND
+    if "--mode" in sys.argv:
+        mode = sys.argv[sys.argv.index("--mode") + 1]
+
+    window = Viewport(1280, 720, "Test window ", backend=BACKEND, mode=mode)
 
     vertices = [-0.5, -0.5, 0.0,
                  0.5, -0.5, 0.0,
                  0.0,  0.5, 0.0]
     window.set_vertices(vertices)
 
-    window.main_loop()
+    capture_dir = None
+    if "--capture" in sys.argv:
+        capture_dir = sys.argv[sys.argv.index("--capture") + 1]
+
+    profile_path = None
+    if "--profile" in sys.argv:
+        profile_path = sys.argv[sys.argv.index("--profile") + 1]
+
+    window.main_loop(capture_dir=capture_dir, profile_path=profile_path)
@@ -1,34 +1,74 @@
+import os
+import sys
 from builtins import RuntimeError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common import headless
+
+# PyOpenGL binds its platform on first import, headless backends have to be chosen before
+BACKEND = headless.platform_from_argv()
+
 import glfw
 from OpenGL.GL import *
 
+from common.gl_state import default_state
+from common.scheduler import RenderScheduler, ON_DEMAND
+
 class Viewport(object):
-    def __init__(self, widht, height, title="OpenGL Window", r=0.2, g=0.3, b=0.3, a=1.0):
+    def __init__(self, widht, height, title="OpenGL Window", r=0.2, g=0.3, b=0.3, a=1.0, backend="glfw",
+                 mode=ON_DEMAND, rate=60.0):
+        """
+        :param backend: "glfw" for a window, "egl" or "osmesa" to render offscreen without a display
+        :param mode: Window redraw policy, "on_demand", "fixed" or "uncapped" (see RenderScheduler)
+        :param rate: Frames per second in "fixed" mode
+        """
         super().__init__()
         self.widht = widht
         self.height = height
         self.window_title = title
         self.bg_color = (r, g, b, a)
+        self.backend = backend
+
+        self.window = None
+        self.headless = None
+        self.scheduler = RenderScheduler(mode, rate)
+        if backend == "glfw":
+            self.__check_glfw()
+            self.window = self.__create_window()
+        else:
+            self.headless = headless.HeadlessContext(widht, height, backend)
+
+    def main_loop(self, frames=1000):
+        """
+        :param frames: Number of frames to render with a headless backend, ignored for windows
+        """
+        if self.headless is not None:
+            self.headless.render_frames(self.draw_frame, frames)
+            self.headless.delete()
 
-        self.__check_glfw()
-        self.window = self.__create_window()
+            return
 
-    def main_loop(self):
         while not glfw.window_should_close(self.window):
+            # Sleeps until a redraw is requested or the next frame is due
+            if not self.scheduler.wait():
+                continue
             self.processEvents(self.window)
 
-            glClearColor(self.bg_color[0], self.bg_color[1],
-                         self.bg_color[2], self.bg_color[3])
-            glClear(GL_COLOR_BUFFER_BIT)
-
-            # DO STUFF HERE
-            #--------------
+            self.draw_frame()
 
             glfw.swap_buffers(self.window)
-            glfw.poll_events()
+            self.scheduler.frame_done()
+        print(self.scheduler.stats.report())
         glfw.terminate()
 
+    def draw_frame(self):
+        # Only reaches GL when the color changed
+        default_state().clear_color(*self.bg_color)
+        glClear(GL_COLOR_BUFFER_BIT)
+
+        # DO STUFF HERE
+        #--------------
+
     def processEvents(self, window):
         if glfw.get_key(window, glfw.KEY_ESCAPE) is glfw.PRESS:
             glfw.set_window_should_close(window, True)
@@ -37,7 +77,11 @@ class Viewport(object):
         window = glfw.create_window(self.widht, self.height, self.window_title, None, None)
 
         glfw.set_window_pos(window, 400, 200)
+        glfw.set_window_size_callback(window, lambda *args: self.scheduler.invalidate())
+        glfw.set_window_refresh_callback(window, lambda *args: self.scheduler.invalidate())
+        glfw.set_key_callback(window, lambda *args: self.scheduler.invalidate())
         glfw.make_context_current(window)
+        self.scheduler.configure_swap()
 
         return window
 
@@ -48,5 +92,9 @@ class Viewport(object):
 
 
 if __name__ == '__main__':
-    window = Viewport(1280, 720, "Test window ")
+    mode = ON_DEMAND
+    if "--mode" in sys.argv:
+        mode = sys.argv[sys.argv.index("--mode") + 1]
+
+    window = Viewport(1280, 720, "Test window ", backend=BACKEND, mode=mode)
     window.main_loop()
@@ -1,9 +1,16 @@
+import os
 import sys
 import numpy as np
 from OpenGL.GL import *
-from OpenGL.GL.shaders import compileShader, compileProgram
 from PySide2 import QtWidgets, QtCore, QtGui
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.gl_state import default_state
+from common.program_cache import default_cache
+from common.shader_program import ShaderProgram
+from common.stream_buffer import StreamBuffer
+from common.vertex_format import VertexFormat
+
 
 class GLSurfaceFormat(QtGui.QSurfaceFormat):
     """Setup OpenGL preferences."""
@@ -56,8 +63,11 @@ class Viewport(QtWidgets.QOpenGLWidget):
         self.polygon_mode = GL_FILL
 
         self.vertices = np.array([], dtype=np.float32)
+        # Vertices are uploaded by the next paintGL, setVertices() also works once the widget is shown
+        self.stream = None
+        self.vertices_changed = True
 
-        # Should be OpenGL.GL.shaders.ShaderProgram
+        # Should be common.shader_program.ShaderProgram
         self.shader_program = None
         # Should be int to be used in "layout (location = attr_position)..."
         self.attr_position = None
@@ -68,29 +78,38 @@ class Viewport(QtWidgets.QOpenGLWidget):
         Calls paintGL after
         :return:
         """
-        glPolygonMode(GL_FRONT_AND_BACK, self.polygon_mode)
-
-        VBO = self.__createVBO(self.vertices)
+        # A new context (e.g. after reparenting the widget) starts from GL defaults
+        default_state().invalidate()
+        default_state().polygon_mode(self.polygon_mode)
 
         # Create and bind here once because we have only one VAO that there's no need to bind every time
         VAO = self.__createVAO()
 
+        self.stream = StreamBuffer(self.vertices.nbytes)
+        default_state().bind_buffer(GL_ARRAY_BUFFER, self.stream.buffer)
+
         self.shader_program = self.__compileShaders(path_vertex="shaders/triangle.vs",
                                                     path_fragment="shaders/triangle.fs")
-        self.attr_position = self.createAttribute(self.shader_program, "a_position", 0)
+        self.vertex_format = VertexFormat(np.dtype([("a_position", np.float32, (3,))]))
+        self.attr_position = self.createAttribute(self.shader_program, "a_position")
 
     def paintGL(self):
         """
         OpenGl main loop.
         :return:
         """
-        glPolygonMode(GL_FRONT_AND_BACK, self.polygon_mode)
+        # Set every frame, only changes since the last frame reach GL
+        state = default_state()
+        state.polygon_mode(self.polygon_mode)
 
+        state.clear_color(*self.bg_color)
         glClear(GL_COLOR_BUFFER_BIT)
-        glClearColor(self.bg_color[0], self.bg_color[1],
-                     self.bg_color[2], self.bg_color[3])
-        glUseProgram(self.shader_program)
-        glDrawArrays(GL_TRIANGLES, 0, 3)
+        self.shader_program.use()
+        if self.vertices_changed:
+            self.__uploadVertices()
+        glDrawArrays(GL_TRIANGLES, 0, len(self.vertices) // 3)
+        self.stream.end_frame()
+        state.end_frame()
 
     def resizeGL(self, w: int, h: int):
         """
@@ -104,7 +123,7 @@ class Viewport(QtWidgets.QOpenGLWidget):
     def keyPressEvent(self, event: QtGui.QKeyEvent):
         """
         Process events from keyboard.
-        W - for wireframe, P - for point, F - for full fill
+        W - for wireframe, P - for point, F - for full fill, S - print issued/skipped state calls
         :param event: Event signal
         :return:
         """
@@ -123,19 +142,22 @@ class Viewport(QtWidgets.QOpenGLWidget):
             self.polygon_mode = GL_POINT
             self.update()
 
+        if event.key() == QtCore.Qt.Key_S:
+            print(default_state().stats.report())
+
         event.accept()
 
-    def __createVBO(self, vertices :np.ndarray):
+    def __uploadVertices(self):
         """
-        Generate and bind Vertex buffer.
-        :param vertices: Primitive vertices
+        Write the vertices into this frame's region of the stream buffer and point the attribute at them.
         :return:
         """
-        VBO = glGenBuffers(1)
-        glBindBuffer(GL_ARRAY_BUFFER, VBO)
-        glBufferData(GL_ARRAY_BUFFER, vertices.nbytes, vertices, GL_STATIC_DRAW)
-
-        return VBO
+        self.vertices_changed = False
+        if self.vertices.nbytes == 0:
+            return
+        offset = self.stream.write(self.vertices)
+        default_state().bind_buffer(GL_ARRAY_BUFFER, self.stream.buffer)
+        self.vertex_format.bind({"a_position": self.attr_position}, offset)
 
     def __createVAO(self):
         """
@@ -143,49 +165,48 @@ class Viewport(QtWidgets.QOpenGLWidget):
         :return:
         """
         VAO = glGenVertexArrays(1)
-        glBindVertexArray(VAO)
+        default_state().bind_vertex_array(VAO)
 
         return VAO
 
     def __compileShaders(self, path_vertex: str, path_fragment: str):
         """
-        Read and compile .glsl shaders into a shader program
+        Read and compile .glsl shaders into a shader program.
+        Uniform and attribute locations are introspected once here.
+        The linked binary is cached on disk, later starts skip the driver compiler.
         :param path_vertex: Path to vertex shader
         :param path_fragment: Path to fragment shader
         :return:
         """
-        with open(path_vertex, "r") as source:
-            vertex = compileShader(source.read(), GL_VERTEX_SHADER)
-
-        with open(path_fragment, "r") as source:
-            fragment = compileShader(source.read(), GL_FRAGMENT_SHADER)
-
-        shader_program = compileProgram(vertex, fragment)
+        shader_program = ShaderProgram.from_files(path_vertex, path_fragment, cache=default_cache())
+        print(default_cache().report())
 
         return shader_program
 
-    def createAttribute(self, shader, attrib_name: str, stride: int):
+    def createAttribute(self, shader: ShaderProgram, attrib_name: str):
         """
-        Define and pass attribute that will be used in a shader
+        Define and pass attribute that will be used in a shader.
+        Size, type and stride come from the vertex format.
         :param shader: Shader to pass an attribute
-        :param attrib_name: Attribute name. Should be similar as in shader.
-        :param stride: Attribute position offset
+        :param attrib_name: Attribute name. Should be similar as in shader and the vertex format field.
         :return:
         """
-        attribute = glGetAttribLocation(shader, attrib_name)
-        glEnableVertexAttribArray(attribute)
-        glVertexAttribPointer(attribute, 3, GL_FLOAT, GL_FALSE, stride, ctypes.c_void_p(0))
+        attribute = shader.attribute_location(attrib_name)
+        self.vertex_format.bind({attrib_name: attribute})
 
         return attribute
 
     def setVertices(self, vertex_list: list):
         """
-        Set vertices to be used to draw a primitive.
+        Set vertices to be used to draw a primitive. Can be called again at any time,
+        e.g. with a new point cloud every frame.
         :param vertex_list: Array of points.
         :return:
         """
-        vertices = np.array(vertex_list, dtype=np.float32)
+        vertices = np.asarray(vertex_list, dtype=np.float32)
         self.vertices = vertices
+        self.vertices_changed = True
+        self.update()
 
 
 
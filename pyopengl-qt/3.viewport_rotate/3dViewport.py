@@ -1,10 +1,52 @@
+import os
 import sys
 import ctypes
+import functools
 import numpy as np
 import OpenGL.GL as gl
-from OpenGL.GL.shaders import compileProgram, compileShader
 from PySide2 import QtGui, QtCore, QtWidgets
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.uniform_buffer import CameraUniformBuffer
+from common.transform import Camera, RebuildStats
+from common.camera_input import CameraInput
+from common.transform_batch import TransformBatch
+from common.matrices import quaternion_from_axis_angle
+from common.instanced_mesh import InstancedMesh
+from common.infinite_grid import InfiniteGrid, QuadGrid
+from common.frame_capture import FrameCapture
+from common.gl_state import default_state
+from common.profiler import FrameProfiler, ProfilerOverlay
+from common.program_cache import default_cache
+from common.shader_manager import ShaderManager
+from common.culling import BoundingVolumeHierarchy, aabbs_in_frustum, frustum_planes, transform_bounds
+from common.mesh_io import import_mesh
+from common.lod import LodMesh, build_lods, projection_scale, select_levels
+from common.asset_loader import AssetLoader
+from common.render_queue import RenderQueue
+from common.picking import ObjectPicker
+
+# "python 3dViewport.py --markers 100000" scatters that many markers to see culling at work
+MARKERS = int(sys.argv[sys.argv.index("--markers") + 1]) if "--markers" in sys.argv else 1
+# Local bounds of the marker quad
+MARK_BOUNDS = ((-0.5, -0.5, 0.0), (0.5, 0.5, 0.0))
+# Marker colors, picked ones are highlighted
+MARK_COLOR = (1.0, 0.0, 0.0, 1.0)
+SELECTED_COLOR = (1.0, 0.8, 0.0, 1.0)
+# "--mesh model.obj" draws that model at every marker instead, each at its level of detail
+MESH = sys.argv[sys.argv.index("--mesh") + 1] if "--mesh" in sys.argv else None
+# Largest extent of the model once placed, in world units
+MESH_SIZE = 4.0
+# "--analytic-grid" draws the anti-aliased infinite grid instead of the scaled quad grid
+ANALYTIC_GRID = "--analytic-grid" in sys.argv
+
+
+def read_lod_mesh(path: str) -> tuple:
+    """Reader process: import and simplify, no GL calls."""
+    mesh_data = import_mesh(path)
+
+    return mesh_data, build_lods(mesh_data)
+
 
 class GLSurfaceFormat(QtGui.QSurfaceFormat):
     """Setup OpenGL preferences."""
@@ -32,82 +74,124 @@ class ViewportWidget(QtWidgets.QOpenGLWidget):
         self.installEventFilter(self)
 
         # --- Setup View Projection matrices
-        self.m_projectionMatrix = QtGui.QMatrix4x4()
-        self.m_viewMatrix = QtGui.QMatrix4x4()
+        # Cached, rebuilt only when the camera moves or the widget is resized
+        self.m_matrixStats = RebuildStats()
+        self.m_camera = Camera(eye=(0.0, 5.0, -10.0), stats=self.m_matrixStats)
+        self.m_cameraVersion = -1
 
+        # Mouse deltas are summed between frames, the camera moves once per frame:
+        # left button orbits, middle (or shift + left) pans, wheel and right button zoom
         self.m_mousePos = QtGui.QVector2D()
-        self.m_viewRotation = QtGui.QQuaternion()
+        self.m_pressPos = QtGui.QVector2D()
+        self.m_input = CameraInput()
+        self.frameSwapped.connect(self.m_input.presented)
+
+        # --- Setup model matrices ---
+        # All objects live in one batch, composed together once per frame
+        self.m_transforms = TransformBatch(capacity=max(1024, MARKERS), stats=self.m_matrixStats)
+
+        # The model is imported and simplified in a reader process while the window opens and
+        # uploaded between frames, the markers stand in for it until then. Simplifying runs
+        # Python loops, on a thread they would hold the GIL the frames need
+        self.m_meshData = None
+        self.m_meshLevels = None
+        self.m_markBounds = MARK_BOUNDS
+        self.m_loader = AssetLoader()
+        if MESH is not None:
+            self.m_loader.submit(MESH, functools.partial(read_lod_mesh, MESH), self.__upload_mesh, cpu_bound=True)
+
+        # Markers lie in the XZ plane and are drawn instanced,
+        # adding more of them costs no extra draw calls
+        lay_flat = quaternion_from_axis_angle((1.0, 0.0, 0.0), 90.0)
+        positions = np.zeros((MARKERS, 3), dtype=np.float32)
+        if MARKERS > 1:
+            positions[:, [0, 2]] = np.random.default_rng(0).uniform(-500.0, 500.0, (MARKERS, 2))
+        self.mark_transforms = self.m_transforms.extend(positions, np.tile(lay_flat, (MARKERS, 1)))
+        self.m_transformsVersion = -1
+
+        # Markers outside the view frustum are not uploaded nor drawn,
+        # whole branches of the hierarchy are rejected at once
+        self.m_bvh = BoundingVolumeHierarchy()
+        self.m_cullVersion = (-1, -1)
+
+        # Level of every marker kept between frames for the hysteresis, -1 until first seen
+        self.m_lodLevels = np.full(MARKERS, -1, dtype=np.int64)
+        self.m_visible = np.zeros(0, dtype=np.int64)
+        # Result of the grid's frustum test, updated with the culling
+        self.m_gridVisible = True
+
+        # Click selects the marker under the cursor, ctrl + drag a rectangle. Regions wait
+        # here for the next frame, their instance slot -> marker map and view-projection ride
+        # along with the readback (PickResult.data)
+        self.m_pickRequests = []
+        self.m_selected = np.zeros(0, dtype=np.int64)
+        # Instance colors follow the instance slots, uploaded again when the slots or the selection change
+        self.m_colorsDirty = True
 
         # TODO: Should be abstracted. Initialized in paintGL for clarity.
-        self.gr_vao = None
-        self.gr_vbo = None
-        self.gr_ebo = None
-        self.gr_shaderProg = None
-
-        self.mark_vao = None
-        self.mark_vbo = None
-        self.mark_ebo = None
+        self.grid = None
+
+        self.mark_mesh = None
         self.mark_shaderProg = None
+        self.lod_mesh = None
 
-    def initializeGL(self):
-        gl.glEnable(gl.GL_DEPTH_TEST)
+        # Marker IDs drawn on demand into an integer framebuffer, read back without stalling
+        self.picker = None
+        self.pick_shaderProg = None
 
-        gl.glClearColor(0.4, 0.4, 0.4, 1)
-        gl.glClear(gl.GL_COLOR_BUFFER_BIT, gl.GL_DEPTH_BUFFER_BIT)
+        # Draws of a frame, sorted by state and merged into multi-draw calls
+        self.render_queue = None
 
-        # -- Grid object --
-        with open("shaders/grid_fragment.glsl", 'r') as f:
-            fragment = compileShader(f.read(), gl.GL_FRAGMENT_SHADER)
-        with open("shaders/grid_vertex.glsl", "r") as f:
-            vertex = compileShader(f.read(), gl.GL_VERTEX_SHADER)
-        self.gr_shaderProg = compileProgram(vertex, fragment)
+        # View/projection matrices shared by all programs
+        self.camera_ubo = None
 
-        grid_vertices = np.array(
-            [
-                 # Vertex positions     # UVs
-                 0.5,  0.5, 0.0,        1.0, 1.0,
-                 0.5, -0.5, 0.0,        1.0, 0.0,
-                -0.5, -0.5, 0.0,        0.0, 0.0,
-                -0.5,  0.5, 0.0,        0.0, 1.0
-            ], dtype=ctypes.c_float
-        )
-        grid_indices = np.array(
-            [
-                0, 1, 3,
-                1, 2, 3
-            ], dtype=ctypes.c_uint
-        )
+        # Writes every frame to "capture/" while active, toggled with C
+        self.frame_capture = None
 
-        self.gr_vao = gl.glGenVertexArrays(1)
-        self.gr_vbo = gl.glGenBuffers(1)
-        self.gr_ebo = gl.glGenBuffers(1)
+        # Per pass CPU/GPU timings, graph toggled with P
+        self.profiler = None
+        self.profiler_overlay = None
 
-        gl.glBindVertexArray(self.gr_vao)
+        # Recompiles shaders saved while the viewport is open
+        self.shader_manager = None
+        # The watcher and loader threads must not touch widgets, pending rebuilds and uploads
+        # are picked up from here
+        self.m_shaderTimer = QtCore.QTimer(self)
+        self.m_shaderTimer.timeout.connect(self.__check_background)
 
-        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.gr_vbo)
-        gl.glBufferData(gl.GL_ARRAY_BUFFER, grid_vertices.nbytes, grid_vertices, gl.GL_STATIC_DRAW)
+    def initializeGL(self):
+        # A new context (e.g. after reparenting the widget) starts from GL defaults
+        default_state().invalidate()
+        default_state().enable(gl.GL_DEPTH_TEST)
 
-        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.gr_ebo)
-        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, grid_indices.nbytes, grid_indices, gl.GL_STATIC_DRAW)
+        default_state().clear_color(0.4, 0.4, 0.4, 1.0)
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT, gl.GL_DEPTH_BUFFER_BIT)
 
-        # Position attribute
-        gl.glEnableVertexAttribArray(0)
-        gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 5 * ctypes.sizeof(ctypes.c_float), ctypes.c_void_p(0))
+        self.camera_ubo = CameraUniformBuffer()
+        self.m_cameraVersion = -1
 
-        # Texture coordinates attribute
-        gl.glEnableVertexAttribArray(1)
-        gl.glVertexAttribPointer(1, 2, gl.GL_FLOAT, gl.GL_FALSE, 5 * ctypes.sizeof(ctypes.c_float),
-                                 ctypes.c_void_p(3 * ctypes.sizeof(ctypes.c_float)))
-        # --------------------------------------------------------------------------------------------------------
+        self.profiler = FrameProfiler()
+        self.profiler_overlay = ProfilerOverlay(self.profiler)
+        self.shader_manager = ShaderManager()
 
-        # -- Center marker --
-        with open("shaders/mark_fragment.glsl", 'r') as f:
-            fragment = compileShader(f.read(), gl.GL_FRAGMENT_SHADER)
-        with open("shaders/mark_vertex.glsl", "r") as f:
-            vertex = compileShader(f.read(), gl.GL_VERTEX_SHADER)
-        self.mark_shaderProg = compileProgram(vertex, fragment)
+        # -- Grid object --
+        # The quad grid stays the default until the analytic one measures faster at 4K
+        # (benchmarks/grid_fill_rate.py)
+        grid_shaders = (("shaders/grid_vertex.glsl", "shaders/grid_fragment.glsl") if ANALYTIC_GRID else
+                        ("shaders/grid_quad_vertex.glsl", "shaders/grid_quad_fragment.glsl"))
+        self.grid = (InfiniteGrid if ANALYTIC_GRID else QuadGrid)(*grid_shaders, cache=default_cache())
+        self.shader_manager.watch(self.grid.program, *grid_shaders)
 
-        grid_vertices = np.array(
+        # -- Center marker --
+        self.mark_shaderProg = self.shader_manager.load("shaders/mark_vertex_instanced.glsl",
+                                                        "shaders/mark_fragment_instanced.glsl",
+                                                        cache=default_cache())
+        self.pick_shaderProg = self.shader_manager.load("shaders/pick_vertex_instanced.glsl",
+                                                        "shaders/pick_fragment.glsl",
+                                                        cache=default_cache())
+        self.picker = ObjectPicker(*self.__framebuffer_size())
+
+        mark_vertices = np.array(
             [
                  # Vertex positions
                  0.5,  0.5, 0.0,
@@ -116,82 +200,128 @@ class ViewportWidget(QtWidgets.QOpenGLWidget):
                 -0.5,  0.5, 0.0,
             ], dtype=ctypes.c_float
         )
-        grid_indices = np.array(
+        mark_indices = np.array(
             [
                 0, 1, 3,
                 1, 2, 3
             ], dtype=ctypes.c_uint
         )
 
-        self.mark_vao = gl.glGenVertexArrays(1)
-        self.mark_vbo = gl.glGenBuffers(1)
-        self.mark_ebo = gl.glGenBuffers(1)
-
-        gl.glBindVertexArray(self.mark_vao)
-
-        gl.glBindBuffer(gl.GL_ARRAY_BUFFER, self.mark_vbo)
-        gl.glBufferData(gl.GL_ARRAY_BUFFER, grid_vertices.nbytes, grid_vertices, gl.GL_STATIC_DRAW)
-
-        gl.glBindBuffer(gl.GL_ELEMENT_ARRAY_BUFFER, self.mark_ebo)
-        gl.glBufferData(gl.GL_ELEMENT_ARRAY_BUFFER, grid_indices.nbytes, grid_indices, gl.GL_STATIC_DRAW)
+        self.mark_mesh = InstancedMesh(mark_vertices, mark_indices, max_instances=self.m_transforms.capacity)
+        self.mark_mesh.set_colors(np.tile(MARK_COLOR, (self.m_transforms.capacity, 1)))
+        self.m_colorsDirty = True
+        if self.m_meshData is not None:
+            # A new context after the model was loaded, upload it again right away
+            for _ in self.__upload_mesh((self.m_meshData, self.m_meshLevels)):
+                pass
+        self.render_queue = RenderQueue()
+        self.m_transformsVersion = -1
+        self.m_cullVersion = (-1, -1)
 
-        # Position attribute
-        gl.glEnableVertexAttribArray(0)
-        gl.glVertexAttribPointer(0, 3, gl.GL_FLOAT, gl.GL_FALSE, 3 * ctypes.sizeof(ctypes.c_float), ctypes.c_void_p(0))
+        print(default_cache().report())
+        self.m_shaderTimer.start(100)
 
     def paintGL(self):
-        gl.glClearColor(0.4, 0.4, 0.4, 1.0)
-        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
-
-        # TODO: Put model matrix into model entity
-        # This is a *grid* model matrix
-        gridModelMatrix = QtGui.QMatrix4x4()
-        gridModelMatrix.rotate(90, QtGui.QVector3D(1.0, 0.0, 0.0))
-        gridModelMatrix.scale(1000)
-
-        markerModelMatrix = QtGui.QMatrix4x4()
-        markerModelMatrix.rotate(90, QtGui.QVector3D(1.0, 0.0, 0.0))
-
-        self.m_viewMatrix.setToIdentity()
-        self.m_viewMatrix.lookAt(QtGui.QVector3D(0.0, 5.0, -10.0),
-                                 QtGui.QVector3D(0.0, 0.0, 0.0),
-                                 QtGui.QVector3D(0.0, 1.0, 0.0))
-        self.m_viewMatrix.rotate(self.m_viewRotation)
-
-        # -- Draw grid --
-        gl.glUseProgram(self.gr_shaderProg)
-
-        u_projection_loc = gl.glGetUniformLocation(self.gr_shaderProg, "u_projectionMatrix")
-        gl.glUniformMatrix4fv(u_projection_loc, 1, gl.GL_FALSE, self.m_projectionMatrix.data())
-
-        u_view_loc = gl.glGetUniformLocation(self.gr_shaderProg, "u_viewMatrix")
-        gl.glUniformMatrix4fv(u_view_loc, 1, gl.GL_FALSE, self.m_viewMatrix.data())
-
-        u_model_loc = gl.glGetUniformLocation(self.gr_shaderProg, "u_modelMatrix")
-        gl.glUniformMatrix4fv(u_model_loc, 1, gl.GL_FALSE, gridModelMatrix.data())
-
-        gl.glBindVertexArray(self.gr_vao)
-        gl.glDrawElements(gl.GL_TRIANGLES, 6, gl.GL_UNSIGNED_INT, ctypes.c_void_p(0))
-
-        # -- Draw marker --
-        gl.glUseProgram(self.mark_shaderProg)
-
-        u_projection_loc = gl.glGetUniformLocation(self.mark_shaderProg, "u_projectionMatrix")
-        gl.glUniformMatrix4fv(u_projection_loc, 1, gl.GL_FALSE, self.m_projectionMatrix.data())
-
-        u_view_loc = gl.glGetUniformLocation(self.mark_shaderProg, "u_viewMatrix")
-        gl.glUniformMatrix4fv(u_view_loc, 1, gl.GL_FALSE, self.m_viewMatrix.data())
-
-        u_model_loc = gl.glGetUniformLocation(self.mark_shaderProg, "u_modelMatrix")
-        gl.glUniformMatrix4fv(u_model_loc, 1, gl.GL_FALSE, markerModelMatrix.data())
-
-        gl.glBindVertexArray(self.mark_vao)
-        gl.glDrawElements(gl.GL_TRIANGLES, 6, gl.GL_UNSIGNED_INT, ctypes.c_void_p(0))
+        # Between frames: swap in shaders that finished recompiling
+        self.shader_manager.update()
+
+        self.profiler.begin_frame()
+
+        # Readbacks of earlier clicks that the GPU has finished by now
+        for result in self.picker.poll():
+            self.__picked(result, *result.data)
+
+        # Redundant state changes are dropped by the tracker, I prints how many
+        state = default_state()
+        with self.profiler.section("clear"):
+            state.clear_color(0.4, 0.4, 0.4, 1.0)
+            gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+
+        with self.profiler.section("uploads"):
+            # A few milliseconds of loaded assets per frame, the rest waits for the next one
+            self.m_loader.update()
+
+        with self.profiler.section("transforms"):
+            self.m_input.apply(self.m_camera, self.height())
+
+            # Camera is uploaded once per frame no matter how many programs read it,
+            # and not at all when only a hover or resize triggered the redraw
+            view_matrix = self.m_camera.view_matrix
+            if self.m_camera.version != self.m_cameraVersion:
+                self.camera_ubo.update(view_matrix, self.m_camera.projection_matrix)
+                self.m_cameraVersion = self.m_camera.version
+
+            # Only objects that moved since the last frame are recomposed
+            models, _ = self.m_transforms.compose()
+            if self.m_transforms.version != self.m_transformsVersion:
+                self.m_bvh.refit(*transform_bounds(models[self.mark_transforms], *self.m_markBounds))
+                self.m_transformsVersion = self.m_transforms.version
+
+        with self.profiler.section("culling"):
+            # Culled again only when the camera or an object moved
+            if (self.m_camera.version, self.m_transformsVersion) != self.m_cullVersion:
+                view_projection = self.m_camera.projection_matrix @ view_matrix
+                visible = self.m_bvh.cull(view_projection)
+                # The quad grid is one flat box. Plane tests are conservative for a box that
+                # large: it is skipped looking straight up or from beyond its edge
+                self.m_gridVisible = self.grid.bounds is None or bool(
+                    aabbs_in_frustum(frustum_planes(view_projection), *(bound[None] for bound in self.grid.bounds))[0])
+                if self.lod_mesh is None:
+                    self.mark_mesh.set_models(models[self.mark_transforms[visible]])
+                    self.m_visible = visible
+                    self.m_colorsDirty = True
+                else:
+                    self.__select_levels(visible, view_matrix)
+                self.m_cullVersion = (self.m_camera.version, self.m_transformsVersion)
+
+        # -- Draw --
+        # Markers and the quad grid are opaque. The analytic grid is in the transparent pass:
+        # the queue draws it last, blended and depth tested against everything else
+        with self.profiler.section("draw"):
+            if self.lod_mesh is None:
+                if self.m_colorsDirty and len(self.m_visible):
+                    selected = np.isin(self.m_visible, self.m_selected)
+                    self.mark_mesh.set_colors(np.where(selected[:, None], SELECTED_COLOR, MARK_COLOR))
+                self.m_colorsDirty = False
+                # One draw for all of them, model matrices come from the instance buffer
+                self.mark_mesh.submit(self.render_queue, self.mark_shaderProg)
+            else:
+                self.lod_mesh.submit(self.render_queue, self.mark_shaderProg,
+                                     models[self.mark_transforms[self.m_visible]], self.m_lodLevels[self.m_visible])
+            if self.m_gridVisible:
+                self.grid.submit(self.render_queue)
+            self.render_queue.flush()
+
+        if self.m_pickRequests:
+            with self.profiler.section("picking"):
+                # Instance slot -> marker, the slots change with the culling and LOD levels.
+                # It travels with the request, a region dropped by pick() leaves no stale entry
+                markers = self.m_visible if self.lod_mesh is None else self.m_visible[self.lod_mesh.instance_order]
+                pick_map = (markers, self.m_camera.projection_matrix @ view_matrix)
+                for x, y, width, height in self.m_pickRequests:
+                    self.picker.pick(x, y, lambda: self.__draw_ids(models), width, height, data=pick_map)
+                self.m_pickRequests = []
+
+        if self.frame_capture is not None:
+            with self.profiler.section("capture"):
+                self.frame_capture.capture(self.defaultFramebufferObject())
+
+        self.profiler_overlay.draw()
+        self.profiler.end_frame()
+        state.end_frame()
+
+        if self.profiler_overlay.visible or self.picker.pending or self.m_loader.uploads_waiting:
+            # Keep the graph moving, pick results coming and uploads going even when nothing
+            # else asks for a redraw
+            self.update()
 
     def resizeGL(self, w: int, h: int):
         aspect = w / h
-        self.m_projectionMatrix.setToIdentity()
-        self.m_projectionMatrix.perspective(45, aspect, 0.1, 1000.0)
+        self.m_camera.set_perspective(45, aspect, 0.1, 1000.0)
+
+        if self.frame_capture is not None:
+            self.frame_capture.resize(*self.__framebuffer_size())
+        self.picker.resize(*self.__framebuffer_size())
 
     def eventFilter(self, watched: QtCore.QObject, event: QtCore.QEvent) -> bool:
         if event.type() == QtCore.QEvent.HoverEnter:
@@ -202,21 +332,176 @@ class ViewportWidget(QtWidgets.QOpenGLWidget):
         return super(ViewportWidget, self).eventFilter(watched, event)
 
     def mousePressEvent(self, event: QtGui.QMouseEvent):
-        if event.buttons() == QtCore.Qt.LeftButton:
-            self.m_mousePos = QtGui.QVector2D(event.localPos())
+        self.m_mousePos = QtGui.QVector2D(event.localPos())
+        self.m_pressPos = QtGui.QVector2D(event.localPos())
+
+    def mouseReleaseEvent(self, event: QtGui.QMouseEvent):
+        if event.button() != QtCore.Qt.LeftButton:
+            event.accept()
+            return
+
+        ratio = self.devicePixelRatioF()
+        start, end = self.m_pressPos * ratio, QtGui.QVector2D(event.localPos()) * ratio
+        if event.modifiers() & QtCore.Qt.ControlModifier:
+            # Rectangle selection
+            left, top = min(start.x(), end.x()), min(start.y(), end.y())
+            self.m_pickRequests.append((int(left), int(top), int(abs(end.x() - start.x())) + 1,
+                                        int(abs(end.y() - start.y())) + 1))
+        elif (end - start).length() < 3.0 * ratio:
+            # A click, not the end of an orbit: a few pixels of tolerance around the cursor
+            self.m_pickRequests.append((int(end.x()) - 2, int(end.y()) - 2, 5, 5))
+        else:
+            event.accept()
+            return
+
+        self.update()
+        event.accept()
 
     def mouseMoveEvent(self, event: QtGui.QMouseEvent):
-        if event.buttons() == QtCore.Qt.LeftButton:
-            diff = QtGui.QVector2D(event.localPos()) - self.m_mousePos
-            self.m_mousePos = QtGui.QVector2D(event.localPos())
+        diff = QtGui.QVector2D(event.localPos()) - self.m_mousePos
+        self.m_mousePos = QtGui.QVector2D(event.localPos())
+
+        # Only accumulated here, paintGL applies the sum. update() calls made before the
+        # next frame are merged into one
+        buttons = event.buttons()
+        if buttons == QtCore.Qt.LeftButton and event.modifiers() & QtCore.Qt.ControlModifier:
+            # Dragging a selection rectangle, picked on release
+            event.accept()
+            return
+        if buttons == QtCore.Qt.MiddleButton or (buttons == QtCore.Qt.LeftButton
+                                                 and event.modifiers() & QtCore.Qt.ShiftModifier):
+            self.m_input.pan(diff.x(), diff.y())
+        elif buttons == QtCore.Qt.LeftButton:
+            self.m_input.rotate(diff.x(), diff.y())
+        elif buttons == QtCore.Qt.RightButton:
+            self.m_input.zoom(-diff.y() / 20.0)
+        else:
+            event.accept()
+            return
+
+        self.update()
+        event.accept()
 
-            angle = diff.length() / 2.0
-            axis = QtGui.QVector3D(diff.y(), diff.x(), 0.0)
-            self.m_viewRotation = QtGui.QQuaternion.fromAxisAndAngle(axis, angle) * self.m_viewRotation
+    def wheelEvent(self, event: QtGui.QWheelEvent):
+        self.m_input.zoom(event.angleDelta().y() / 120.0)
+        self.update()
+        event.accept()
 
+    def keyPressEvent(self, event: QtGui.QKeyEvent):
+        # I - print how many matrix rebuilds the transform cache avoided, the last culling and LOD result
+        # and the state calls the state tracker skipped, render queue batching, input and picking latency
+        if event.key() == QtCore.Qt.Key_I:
+            print(self.m_matrixStats.report())
+            print(self.m_bvh.stats.report())
+            print(default_state().stats.report())
+            print(self.render_queue.stats.report())
+            print(self.m_input.stats.report())
+            print(self.picker.stats.report())
+            if self.m_loader.stats.requested:
+                print(self.m_loader.stats.report())
+            if self.lod_mesh is not None:
+                print(self.lod_mesh.stats.report())
+        # C - start/stop writing every frame as PNG
+        elif event.key() == QtCore.Qt.Key_C:
+            self.toggle_capture()
+        # P - show/hide the frame time graph
+        elif event.key() == QtCore.Qt.Key_P:
+            self.profiler_overlay.toggle()
             self.update()
+        # E - print per pass percentiles and export them to profile.json/profile.csv
+        elif event.key() == QtCore.Qt.Key_E:
+            self.makeCurrent()
+            print(self.profiler.report())
+            self.profiler.export_json("profile.json")
+            self.profiler.export_csv("profile.csv")
+            self.doneCurrent()
         event.accept()
 
+    def toggle_capture(self, directory: str = "capture"):
+        self.makeCurrent()
+        if self.frame_capture is None:
+            width, height = self.__framebuffer_size()
+            self.frame_capture = FrameCapture(width, height, directory,
+                                              multisampled=self.format().samples() > 0)
+            print(f"INFO::CAPTURE::STARTED::{directory}")
+        else:
+            self.frame_capture.delete()
+            print(self.frame_capture.stats.report())
+            self.frame_capture = None
+        self.doneCurrent()
+
+    def __check_background(self):
+        # Redraw until every queued rebuild has been compiled and swapped in and every
+        # loaded asset is uploaded
+        if self.shader_manager.has_pending() or self.m_loader.uploads_waiting:
+            self.update()
+
+    def __upload_mesh(self, data: tuple):
+        """Render thread, context current: the markers become the model. Uploads in steps (AssetLoader)."""
+        mesh_data, mesh_levels = data
+        # All levels in one buffer, a level switch only changes the index offset. The markers
+        # are drawn between the steps until the last one
+        self.lod_mesh = yield from LodMesh.upload_steps(mesh_data, mesh_levels, max_instances=MARKERS)
+        self.m_meshData, self.m_meshLevels = data
+        positions = self.m_meshData.vertices["position"].reshape(self.m_meshData.vertex_count, -1)[:, :3]
+        self.m_markBounds = (positions.min(axis=0), positions.max(axis=0))
+        scale = MESH_SIZE / max(float((self.m_markBounds[1] - self.m_markBounds[0]).max()), 1e-6)
+
+        # No per-instance colors in the LOD buffers, the constant attribute is used
+        gl.glVertexAttrib4f(6, 1.0, 0.0, 0.0, 1.0)
+        print(f"INFO::LOD::{MESH}::TRIANGLES " + "/".join(str(count) for count in self.lod_mesh.triangles))
+
+        # Models stand upright, bounds, levels and culling start over
+        self.m_transforms.rotations[self.mark_transforms] = (1.0, 0.0, 0.0, 0.0)
+        self.m_transforms.scales[self.mark_transforms] = scale
+        self.m_transforms.mark_dirty(self.mark_transforms)
+        self.m_lodLevels[:] = -1
+        self.m_cullVersion = (-1, -1)
+
+        return self.lod_mesh
+
+    def __draw_ids(self, models: np.ndarray):
+        # Same instances as the frame, instance slot + 1 written as the ID
+        self.pick_shaderProg.use()
+        if self.lod_mesh is None:
+            self.pick_shaderProg.set_int("u_baseInstance", 0)
+            self.mark_mesh.draw()
+        else:
+            self.lod_mesh.draw_instances(models[self.mark_transforms[self.m_visible]],
+                                         self.m_lodLevels[self.m_visible], self.pick_shaderProg)
+
+    def __picked(self, result, markers: np.ndarray, view_projection: np.ndarray):
+        # Highlighted from this frame on. The LOD buffers have no per-instance colors, a
+        # model's selection is only printed
+        self.m_colorsDirty = True
+        if result.object_id is None:
+            self.m_selected = np.zeros(0, dtype=np.int64)
+            print(f"INFO::PICKING::NOTHING::{result.latency * 1000.0:.2f}ms")
+            return
+
+        self.m_selected = markers[result.ids.astype(np.int64) - 1]
+        position = result.position(view_projection, self.__framebuffer_size())
+        print(f"INFO::PICKING::{len(self.m_selected)} MARKERS::CLOSEST {markers[result.object_id - 1]}"
+              f" AT {np.round(position, 3).tolist()}::{result.latency * 1000.0:.2f}ms")
+
+    def __select_levels(self, visible: np.ndarray, view_matrix: np.ndarray):
+        # Distance from the eye to the closest point of each bounding sphere, in model units
+        eye = np.linalg.inv(view_matrix)[:3, 3]
+        transforms = self.mark_transforms[visible]
+        scales = self.m_transforms.scales[transforms, 0]
+        radius = float(np.linalg.norm(np.maximum(np.abs(self.m_markBounds[0]), np.abs(self.m_markBounds[1]))))
+        distances = np.linalg.norm(self.m_transforms.positions[transforms] - eye, axis=1) / scales - radius
+
+        scale = projection_scale(self.m_camera.projection_matrix, self.__framebuffer_size()[1])
+        self.m_lodLevels[visible] = select_levels(self.lod_mesh.errors, distances, scale,
+                                                  self.m_lodLevels[visible], stats=self.lod_mesh.stats)
+        self.m_visible = visible
+
+    def __framebuffer_size(self) -> tuple:
+        ratio = self.devicePixelRatioF()
+
+        return int(self.width() * ratio), int(self.height() * ratio)
+
 if __name__ == '__main__':
     app = QtWidgets.QApplication()
 
@@ -3,25 +3,53 @@
 
 out vec4 fragColor;
 
-sample smooth in vec2 f_TexCoord;
-in vec3 f_vertexPos;
+in vec3 f_worldPos;
+flat in vec3 f_eyePos;
 
-vec4 gridColor;
+uniform float u_cellSize;       // World size of the finest grid level
+uniform float u_minCellPixels;  // A level fades out before its cells get smaller than this on screen
+uniform float u_fadeDistance;   // Lines vanish at this distance from the eye
+
+const vec3 lineColor = vec3(0.75, 0.75, 0.75);
+const vec3 farColor = vec3(0.25, 0.25, 0.25);
+
+// World distance to the nearest line of a grid with the given cell size, per axis
+vec2 lineDistance(vec2 coord, float cell)
+{
+    return abs(fract(coord / cell - 0.5) - 0.5) * cell;
+}
 
 void main()
 {
-    //Main grid pattern
-    if(fract(f_TexCoord.x / 0.0005f) < 0.025f || fract(f_TexCoord.y / 0.0005f) < 0.025f)
-        gridColor = vec4(0.75, 0.75, 0.75, 1.0);
-    else
-        gridColor = vec4(0);
-    // Check for alpha transparency
-    if(gridColor.a != 1)
+    vec2 footprint = fwidth(f_worldPos.xz);
+
+    // Every coarser level draws its lines on lines of the finest one: a pixel more than
+    // a footprint away from those is empty, whatever the level
+    vec2 finest = lineDistance(f_worldPos.xz, u_cellSize);
+    if (finest.x >= footprint.x && finest.y >= footprint.y)
         discard;
 
-    vec2 point_center = vec2(0.5, 0.5);
-    float distance = length(f_TexCoord.xy - vec2(0.5, 0.5));
-    gridColor *= mix(vec4(0.75, 0.75, 0.75, 1.0), vec4(0.25,0.25,0.25,1.), distance);
+    // LOD: the finest level whose cells are still at least u_minCellPixels wide. Levels
+    // are 10x apart, comparisons pick one instead of a log10 per pixel
+    float cellPixels = length(footprint) * u_minCellPixels / u_cellSize;
+    vec3 coarser = step(vec3(1.0, 10.0, 100.0), vec3(cellPixels));
+    float levelScale = (1.0 + 9.0 * coarser.x) * (1.0 + 9.0 * coarser.y) * (1.0 + 9.0 * coarser.z);
+    float cell = u_cellSize * levelScale;
+
+    // Coverage of a level's lines: 1 on the line, 0 a footprint away from it
+    vec2 fineDistance = lineDistance(f_worldPos.xz, cell) / footprint;
+    vec2 coarseDistance = lineDistance(f_worldPos.xz, cell * 10.0) / footprint;
+    float fine = 1.0 - min(min(fineDistance.x, fineDistance.y), 1.0);
+    float coarse = 1.0 - min(min(coarseDistance.x, coarseDistance.y), 1.0);
+
+    // The level fades out while its cells shrink from 10x to 1x u_minCellPixels, the next
+    // one stays. log10(shrink) over 1..10, a rational fit within 0.02 saves the log per pixel
+    float shrink = cellPixels / levelScale * 10.0;
+    float lodFade = clamp(1.4622 * (shrink - 1.0) / (shrink + 3.16), 0.0, 1.0);
+    float coverage = max(fine * (1.0 - lodFade), coarse);
+
+    float distanceFade = 1.0 - smoothstep(0.0, u_fadeDistance, distance(f_worldPos, f_eyePos));
+    vec3 color = mix(farColor, lineColor, distanceFade);
 
-    fragColor = gridColor;
+    fragColor = vec4(color, coverage * distanceFade);
 }
@@ -1,21 +1,32 @@
 //vertex
 #version 420 core
 
-layout (location = 0) in vec3 aPos;
-layout (location = 1) in vec2 aTexCoord;
+// Ground plane quad generated from gl_VertexID, no vertex buffer is bound.
+// It lies on y = 0 under the eye and reaches as far as the lines fade out. The
+// rasterizer clips it to the frustum and interpolates depth like any other
+// geometry, so the depth test runs before the fragment shader.
 
-sample smooth out vec2 f_TexCoord;
-out vec3 f_vertexPos;
+out vec3 f_worldPos;
+flat out vec3 f_eyePos;
 
-uniform mat4 u_modelMatrix;
-uniform mat4 u_viewMatrix;
-uniform mat4 u_projectionMatrix;
+uniform float u_fadeDistance;   // Half the size of the quad, nothing is drawn beyond it
+
+// Shared by every program, written once per frame (see common/uniform_buffer.py)
+layout (std140, row_major, binding = 0) uniform Camera
+{
+    mat4 u_viewMatrix;
+    mat4 u_projectionMatrix;
+};
+
+const vec2 corners[6] = vec2[](vec2(-1.0, -1.0), vec2(1.0, -1.0), vec2(-1.0, 1.0),
+                               vec2(-1.0, 1.0), vec2(1.0, -1.0), vec2(1.0, 1.0));
 
 void main()
 {
-    mat4 mv_matrix = u_viewMatrix * u_modelMatrix;
+    f_eyePos = inverse(u_viewMatrix)[3].xyz;
+    // Follows the eye so it never ends in view, the lines stay fixed in world space
+    vec2 corner = f_eyePos.xz + corners[gl_VertexID] * u_fadeDistance;
+    f_worldPos = vec3(corner.x, 0.0, corner.y);
 
-    gl_Position = u_projectionMatrix * mv_matrix * vec4(aPos, 1.0);
-    f_TexCoord = aTexCoord;
-    f_vertexPos = aPos;
+    gl_Position = u_projectionMatrix * u_viewMatrix * vec4(f_worldPos, 1.0);
 }
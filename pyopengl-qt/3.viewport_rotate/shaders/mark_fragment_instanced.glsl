@@ -0,0 +1,9 @@
+#version 420 core
+
+in vec4 f_color;
+
+out vec4 fragColor;
+
+void main() {
+    fragColor = f_color;
+}
@@ -3,8 +3,13 @@
 layout (location = 0) in vec3 aPos;
 
 uniform mat4 u_modelMatrix;
-uniform mat4 u_viewMatrix;
-uniform mat4 u_projectionMatrix;
+
+// Shared by every program, written once per frame (see common/uniform_buffer.py)
+layout (std140, row_major, binding = 0) uniform Camera
+{
+    mat4 u_viewMatrix;
+    mat4 u_projectionMatrix;
+};
 
 void main()
 {
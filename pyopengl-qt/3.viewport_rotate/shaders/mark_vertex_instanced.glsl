@@ -0,0 +1,24 @@
+#version 420 core
+
+layout (location = 0) in vec3 aPos;
+
+// Per-instance attributes, advanced once per instance (glVertexAttribDivisor)
+layout (location = 2) in mat4 aModelMatrix;
+layout (location = 6) in vec4 aColor;
+
+out vec4 f_color;
+
+// Shared by every program, written once per frame (see common/uniform_buffer.py)
+layout (std140, row_major, binding = 0) uniform Camera
+{
+    mat4 u_viewMatrix;
+    mat4 u_projectionMatrix;
+};
+
+void main()
+{
+    mat4 mv_matrix = u_viewMatrix * aModelMatrix;
+
+    gl_Position = u_projectionMatrix * mv_matrix * vec4(aPos, 1.0);
+    f_color = aColor;
+}
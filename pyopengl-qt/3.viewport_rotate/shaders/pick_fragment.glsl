@@ -0,0 +1,10 @@
+#version 420 core
+
+flat in uint f_id;
+
+// R32UI attachment of common/picking.py
+layout (location = 0) out uint fragId;
+
+void main() {
+    fragId = f_id;
+}
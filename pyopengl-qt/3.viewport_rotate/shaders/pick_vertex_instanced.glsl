@@ -0,0 +1,25 @@
+#version 420 core
+
+layout (location = 0) in vec3 aPos;
+
+// Per-instance attributes, advanced once per instance (glVertexAttribDivisor)
+layout (location = 2) in mat4 aModelMatrix;
+
+// Instance slot + 1, 0 is left for the background. gl_InstanceID restarts at every draw,
+// the base instance tells the draws of the LOD levels apart (LodMesh.draw_instances sets it)
+uniform int u_baseInstance;
+
+flat out uint f_id;
+
+// Shared by every program, written once per frame (see common/uniform_buffer.py)
+layout (std140, row_major, binding = 0) uniform Camera
+{
+    mat4 u_viewMatrix;
+    mat4 u_projectionMatrix;
+};
+
+void main()
+{
+    gl_Position = u_projectionMatrix * u_viewMatrix * aModelMatrix * vec4(aPos, 1.0);
+    f_id = uint(u_baseInstance + gl_InstanceID) + 1u;
+}
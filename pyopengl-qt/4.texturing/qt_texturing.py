@@ -0,0 +1,182 @@
+import os
+import sys
+import tempfile
+import numpy as np
+import OpenGL.GL as gl
+from PySide2 import QtGui, QtCore, QtWidgets
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.gl_state import default_state
+from common.image_io import write_png
+from common.program_cache import default_cache
+from common.shader_program import ShaderProgram
+from common.texture import Texture, TextureCache
+from common.texture_compression import compress_image
+
+# Images per page
+COLUMNS, ROWS = 4, 3
+# GPU memory the textures may take, small enough to see eviction while paging
+VRAM_BUDGET = 64 * 2 ** 20
+
+
+def generate_images(directory: str, count: int = 24, size: int = 1024) -> list:
+    """PNG files to show when no image is given on the command line."""
+    y, x = np.mgrid[0:size, 0:size].astype(np.float32) / size
+    paths = []
+    for index in range(count):
+        frequency = 4.0 + index
+        red = 0.5 + 0.5 * np.sin(x * frequency * np.pi + index)
+        green = 0.5 + 0.5 * np.sin(y * frequency * np.pi * 0.5)
+        blue = ((x * frequency).astype(int) + (y * frequency).astype(int)) % 2 * 0.5 + 0.25
+        pixels = (np.dstack([red, green, blue]) * 255.0).astype(np.uint8)
+        paths.append(os.path.join(directory, f"generated{index:02}.png"))
+        write_png(paths[-1], pixels)
+
+    return paths
+
+
+class GLSurfaceFormat(QtGui.QSurfaceFormat):
+    """Setup OpenGL preferences."""
+    def __init__(self):
+        super(GLSurfaceFormat, self).__init__()
+        self.setRenderableType(QtGui.QSurfaceFormat.OpenGL)
+        self.setMinorVersion(3)
+        self.setMajorVersion(4)
+        self.setProfile(QtGui.QSurfaceFormat.CoreProfile)
+        self.setSwapBehavior(QtGui.QSurfaceFormat.DoubleBuffer)
+
+
+class TextureViewport(QtWidgets.QOpenGLWidget):
+    def __init__(self, paths: list, width: int = 1280, height: int = 720, title: str = "Qt OpenGL Texturing"):
+        """
+        Page through images drawn as textured quads. Textures stream in on the render thread
+        a tile at a time and sharpen level by level, a checker shows until the first level arrived.
+        :param paths: .png and .ktx files
+        :param width: Set widget width
+        :param height: Set widget height
+        :param title: Set window title
+        """
+        super().__init__()
+        self.setWindowTitle(title)
+        self.resize(width, height)
+
+        self.paths = paths
+        self.page = 0
+
+        self.shader_program = None
+        self.cache = None
+        self.placeholder = None
+        self.VAO = None
+
+        # Reader threads must not touch widgets, loads in progress are picked up from here
+        self.m_loadTimer = QtCore.QTimer(self)
+        self.m_loadTimer.timeout.connect(self.__check_loads)
+
+    def initializeGL(self):
+        # A new context (e.g. after reparenting the widget) starts from GL defaults
+        default_state().invalidate()
+        default_state().enable(gl.GL_BLEND)
+        default_state().blend_func(gl.GL_SRC_ALPHA, gl.GL_ONE_MINUS_SRC_ALPHA)
+        default_state().clear_color(0.2, 0.3, 0.3, 1.0)
+
+        # Core profile draws need a VAO even without attributes
+        self.VAO = gl.glGenVertexArrays(1)
+        self.shader_program = ShaderProgram.from_files("shaders/quad.vs", "shaders/quad.fs", cache=default_cache())
+        self.shader_program.use()
+        self.shader_program.set_int("u_texture", 0)
+
+        checker = (np.indices((8, 8)).sum(axis=0) % 2 * 64 + 96).astype(np.uint8)
+        self.placeholder = Texture.from_image(compress_image(np.dstack([checker] * 3), srgb=True, encoding="none",
+                                                             mipmaps=False), min_filter=gl.GL_NEAREST,
+                                              mag_filter=gl.GL_NEAREST)
+        self.cache = TextureCache(VRAM_BUDGET)
+        self.m_loadTimer.start(16)
+
+    def paintGL(self):
+        state = default_state()
+        # Uploads first: within the loader's budget, the frame does not wait for whole textures
+        self.cache.update()
+
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT)
+        self.shader_program.use()
+        state.bind_vertex_array(self.VAO)
+        per_page = COLUMNS * ROWS
+        for slot, path in enumerate(self.paths[self.page * per_page:(self.page + 1) * per_page]):
+            texture = self.cache.get(path)
+            if texture is None:
+                texture = self.placeholder
+            texture.bind(0)
+            self.shader_program.set_vector("u_rect", self.__rect(slot, texture.width / texture.height))
+            gl.glDrawArrays(gl.GL_TRIANGLE_STRIP, 0, 4)
+
+        self.cache.end_frame()
+        state.end_frame()
+
+    def resizeGL(self, w: int, h: int):
+        gl.glViewport(0, 0, w, h)
+
+    def keyPressEvent(self, event: QtGui.QKeyEvent):
+        """
+        Left / Right - previous / next page, I - print cache, upload and loader statistics
+        :param event: Event signal
+        :return:
+        """
+        if event.key() == QtCore.Qt.Key_Escape:
+            app.exit()
+
+        pages = max(1, -(-len(self.paths) // (COLUMNS * ROWS)))
+        if event.key() == QtCore.Qt.Key_Right:
+            self.page = (self.page + 1) % pages
+            self.update()
+
+        if event.key() == QtCore.Qt.Key_Left:
+            self.page = (self.page - 1) % pages
+            self.update()
+
+        if event.key() == QtCore.Qt.Key_I:
+            print(self.cache.stats.report())
+            print(self.cache.uploader.stats.report())
+            print(self.cache.loader.stats.report())
+
+        event.accept()
+
+    def closeEvent(self, event: QtGui.QCloseEvent):
+        self.m_loadTimer.stop()
+        self.makeCurrent()
+        self.cache.delete()
+        self.placeholder.delete()
+        self.doneCurrent()
+        event.accept()
+
+    def __check_loads(self):
+        # Redraw until every requested texture is read and uploaded
+        if self.cache.pending:
+            self.update()
+
+    def __rect(self, slot: int, aspect: float) -> tuple:
+        """(left, bottom, right, top) in NDC of an image in grid cell ``slot``, aspect kept, top row first."""
+        column, row = slot % COLUMNS, ROWS - 1 - slot // COLUMNS
+        cell_width, cell_height = 2.0 / COLUMNS, 2.0 / ROWS
+        # Cell size in pixels decides which side limits the image
+        pixels_width, pixels_height = cell_width * self.width() / 2.0, cell_height * self.height() / 2.0
+        scale = 0.9 * min(pixels_width / aspect, pixels_height)
+        half_width = scale * aspect / pixels_width * cell_width / 2.0
+        half_height = scale / pixels_height * cell_height / 2.0
+        center_x, center_y = -1.0 + (column + 0.5) * cell_width, -1.0 + (row + 0.5) * cell_height
+
+        return center_x - half_width, center_y - half_height, center_x + half_width, center_y + half_height
+
+
+if __name__ == '__main__':
+    app = QtWidgets.QApplication()
+
+    surface = GLSurfaceFormat()
+    QtGui.QSurfaceFormat.setDefaultFormat(surface)
+
+    # "python qt_texturing.py a.png b.ktx ...", generated images without arguments
+    with tempfile.TemporaryDirectory() as directory:
+        window = TextureViewport(sys.argv[1:] or generate_images(directory))
+        window.show()
+        exit_code = app.exec_()
+
+    sys.exit(exit_code)
@@ -0,0 +1,14 @@
+# version 440 core
+
+uniform sampler2D u_texture;
+
+in vec2 v_uv;
+
+out vec4 out_color;
+
+void main()
+{
+    // sRGB textures are sampled as linear colors, the widget's framebuffer is not sRGB
+    vec4 color = texture(u_texture, v_uv);
+    out_color = vec4(pow(color.rgb, vec3(1.0 / 2.2)), color.a);
+}
@@ -0,0 +1,12 @@
+# version 440 core
+
+// Quad corners from gl_VertexID, drawn as a 4 vertex triangle strip without vertex buffers
+uniform vec4 u_rect;
+
+out vec2 v_uv;
+
+void main()
+{
+    v_uv = vec2(gl_VertexID & 1, gl_VertexID >> 1);
+    gl_Position = vec4(mix(u_rect.xy, u_rect.zw, v_uv), 0.0, 1.0);
+}
@@ -0,0 +1,203 @@
+import os
+import sys
+import time
+import numpy as np
+import OpenGL.GL as gl
+from PySide2 import QtGui, QtCore, QtWidgets
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.asset_loader import AssetLoader
+from common.camera_input import CameraInput
+from common.gl_state import default_state
+from common.point_cloud import PointCloud, prepare_points, read_points
+from common.program_cache import default_cache
+from common.shader_program import ShaderProgram
+from common.transform import Camera
+from common.uniform_buffer import CameraUniformBuffer
+
+# "python qt_point_cloud.py scan.points" (or .ply, .npy), a generated terrain otherwise
+CLOUD = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].startswith("--") else None
+# "--points 20" generates that many million points
+POINTS = float(sys.argv[sys.argv.index("--points") + 1]) if "--points" in sys.argv else 20.0
+
+
+def generate_terrain(millions: float, size: float = 400.0):
+    """Loader thread: rolling hills standing in for a LiDAR scan, prepared for PointCloud."""
+    count = int(millions * 1000000)
+    rng = np.random.default_rng(0)
+    positions = np.empty((count, 3), dtype=np.float32)
+    positions[:, 0] = rng.uniform(-size / 2.0, size / 2.0, count)
+    positions[:, 2] = rng.uniform(-size / 2.0, size / 2.0, count)
+    positions[:, 1] = np.sin(positions[:, 0] * 0.05) * np.cos(positions[:, 2] * 0.04) * 12.0
+
+    return prepare_points(positions)
+
+
+class GLSurfaceFormat(QtGui.QSurfaceFormat):
+    """Setup OpenGL preferences."""
+    def __init__(self):
+        super(GLSurfaceFormat, self).__init__()
+        self.setRenderableType(QtGui.QSurfaceFormat.OpenGL)
+        self.setMinorVersion(3)
+        self.setMajorVersion(4)
+        self.setProfile(QtGui.QSurfaceFormat.CoreProfile)
+        self.setSwapBehavior(QtGui.QSurfaceFormat.DoubleBuffer)
+
+
+class PointCloudViewport(QtWidgets.QOpenGLWidget):
+    """Point cloud viewer: left button orbits, middle (or shift + left) pans, wheel zooms."""
+
+    def __init__(self, width: int = 1280, height: int = 720, title: str = "Qt OpenGL Point Sprites"):
+        super(PointCloudViewport, self).__init__(parent=None)
+        self.setWindowTitle(title)
+        self.resize(width, height)
+
+        self.m_camera = Camera(eye=(0.0, 60.0, -250.0))
+        self.m_input = CameraInput(max_distance=5000.0)
+        self.m_mousePos = QtGui.QVector2D()
+        self.m_frameTime = 0.0
+
+        # Read (or generated) and prepared on a loader thread, uploaded a few chunks per frame
+        self.m_loader = AssetLoader()
+        if CLOUD is not None:
+            self.m_loader.submit(CLOUD, lambda: read_points(CLOUD), PointCloud.upload_steps)
+        else:
+            self.m_loader.submit("terrain", lambda: generate_terrain(POINTS), PointCloud.upload_steps)
+
+        self.cloud = None
+        self.program = None
+        self.camera_ubo = None
+
+        self.m_loadTimer = QtCore.QTimer(self)
+        self.m_loadTimer.timeout.connect(self.__check_loads)
+
+    def initializeGL(self):
+        # A new context (e.g. after reparenting the widget) starts from GL defaults
+        default_state().invalidate()
+        default_state().enable(gl.GL_DEPTH_TEST)
+        default_state().clear_color(0.05, 0.05, 0.08, 1.0)
+
+        self.camera_ubo = CameraUniformBuffer()
+        self.program = ShaderProgram.from_files("shaders/points_vertex.glsl", "shaders/points_fragment.glsl",
+                                                cache=default_cache())
+        self.m_loadTimer.start(16)
+
+    def paintGL(self):
+        start = time.perf_counter()
+        state = default_state()
+        for asset in self.m_loader.update():
+            if asset.value is not None:
+                self.__frame_cloud(asset.value)
+
+        self.m_input.apply(self.m_camera, self.height())
+        view, projection = self.m_camera.view_matrix, self.m_camera.projection_matrix
+        self.camera_ubo.update(view, projection)
+
+        gl.glClear(gl.GL_COLOR_BUFFER_BIT | gl.GL_DEPTH_BUFFER_BIT)
+        if self.cloud is not None:
+            self.program.use()
+            self.cloud.draw(self.program, view, projection, self.__framebuffer_size()[1])
+        state.end_frame()
+        self.m_frameTime = time.perf_counter() - start
+
+    def resizeGL(self, w: int, h: int):
+        self.m_camera.set_perspective(45, w / h, 0.5, 5000.0)
+
+    def keyPressEvent(self, event: QtGui.QKeyEvent):
+        """
+        I - print drawn points, chunks and loader statistics
+        L - level of detail on/off (off draws every point of the visible chunks)
+        +/- - more/fewer points per projected pixel
+        :param event: Event signal
+        :return:
+        """
+        if event.key() == QtCore.Qt.Key_Escape:
+            app.exit()
+
+        if self.cloud is not None:
+            if event.key() == QtCore.Qt.Key_I:
+                print(self.cloud.stats.report())
+                print(f"INFO::FRAME::{self.m_frameTime * 1000.0:.1f}ms CPU")
+                print(self.m_loader.stats.report())
+
+            if event.key() == QtCore.Qt.Key_L:
+                self.cloud.density = 0.5 if np.isinf(self.cloud.density) else np.inf
+                self.cloud.point_budget = 8 * 2 ** 20 if np.isfinite(self.cloud.density) else 2 ** 62
+                self.update()
+
+            if event.key() in (QtCore.Qt.Key_Plus, QtCore.Qt.Key_Equal):
+                self.cloud.density *= 2.0
+                self.update()
+
+            if event.key() == QtCore.Qt.Key_Minus:
+                self.cloud.density /= 2.0
+                self.update()
+
+        event.accept()
+
+    def mousePressEvent(self, event: QtGui.QMouseEvent):
+        self.m_mousePos = QtGui.QVector2D(event.localPos())
+
+    def mouseMoveEvent(self, event: QtGui.QMouseEvent):
+        diff = QtGui.QVector2D(event.localPos()) - self.m_mousePos
+        self.m_mousePos = QtGui.QVector2D(event.localPos())
+
+        buttons = event.buttons()
+        if buttons == QtCore.Qt.MiddleButton or (buttons == QtCore.Qt.LeftButton
+                                                 and event.modifiers() & QtCore.Qt.ShiftModifier):
+            self.m_input.pan(diff.x(), diff.y())
+        elif buttons == QtCore.Qt.LeftButton:
+            self.m_input.rotate(diff.x(), diff.y())
+        else:
+            event.accept()
+            return
+
+        self.update()
+        event.accept()
+
+    def wheelEvent(self, event: QtGui.QWheelEvent):
+        self.m_input.zoom(event.angleDelta().y() / 120.0)
+        self.update()
+        event.accept()
+
+    def closeEvent(self, event: QtGui.QCloseEvent):
+        self.m_loadTimer.stop()
+        self.m_loader.shutdown(wait=False)
+        self.makeCurrent()
+        if self.cloud is not None:
+            self.cloud.delete()
+        self.camera_ubo.delete()
+        self.doneCurrent()
+        event.accept()
+
+    def __frame_cloud(self, cloud: PointCloud):
+        """Orbit around the middle of the new cloud, far enough to see all of it."""
+        self.cloud = cloud
+        lower, upper = cloud.lower.min(axis=0), cloud.upper.max(axis=0)
+        radius = float(np.linalg.norm(upper - lower)) * 0.5
+        self.m_camera.pivot = (lower + upper) * 0.5
+        self.m_camera.eye = (0.0, radius * 0.3, -radius * 1.2)
+        print(f"INFO::POINTS::{cloud.stats.points} POINTS::{cloud.stats.chunks} CHUNKS"
+              f"::SPRITE {cloud.point_size:.3f} UNITS")
+
+    def __check_loads(self):
+        # The loader thread must not touch the widget, uploads in progress are picked up from here
+        if self.m_loader.uploads_waiting:
+            self.update()
+
+    def __framebuffer_size(self) -> tuple:
+        ratio = self.devicePixelRatioF()
+
+        return int(self.width() * ratio), int(self.height() * ratio)
+
+
+if __name__ == '__main__':
+    app = QtWidgets.QApplication()
+
+    surface = GLSurfaceFormat()
+    QtGui.QSurfaceFormat.setDefaultFormat(surface)
+
+    window = PointCloudViewport()
+    window.show()
+
+    sys.exit(app.exec_())
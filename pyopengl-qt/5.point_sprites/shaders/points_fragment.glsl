@@ -0,0 +1,17 @@
+#version 420 core
+
+in vec4 f_color;
+
+out vec4 FragColor;
+
+void main()
+{
+    // Round sprites shaded like small spheres facing the camera
+    vec2 coord = gl_PointCoord * 2.0 - 1.0;
+    float radius = dot(coord, coord);
+    if (radius > 1.0)
+        discard;
+
+    float facing = sqrt(1.0 - radius);
+    FragColor = vec4(f_color.rgb * (0.55 + 0.45 * facing), 1.0);
+}
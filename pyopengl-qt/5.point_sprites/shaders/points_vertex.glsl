@@ -0,0 +1,38 @@
+#version 420 core
+
+layout (location = 0) in vec3 aPos;
+layout (location = 1) in vec4 aColor;
+
+out vec4 f_color;
+
+// Shared by every program, written once per frame (see common/uniform_buffer.py)
+layout (std140, row_major, binding = 0) uniform Camera
+{
+    mat4 u_viewMatrix;
+    mat4 u_projectionMatrix;
+};
+
+// Sprite growth per chunk, set by PointCloud.draw() for chunks drawing a subsample
+layout (std140, binding = 1) uniform PointChunks
+{
+    vec4 u_chunkScale[1024];
+};
+
+uniform int u_chunkSize;
+uniform int u_firstChunk;
+// Sprite diameter in world units, pixels covered by one unit at distance one
+uniform float u_pointSize;
+uniform float u_pixelScale;
+
+void main()
+{
+    gl_Position = u_projectionMatrix * u_viewMatrix * vec4(aPos, 1.0);
+
+    // glMultiDrawArrays: gl_VertexID counts from the start of the buffer, first included
+    int chunk = u_firstChunk + gl_VertexID / u_chunkSize;
+    float scale = u_chunkScale[chunk / 4][chunk % 4];
+    // Perspective size attenuation: w is the distance along the view axis
+    float pixels = u_pointSize * u_pixelScale / max(gl_Position.w, 1e-4) * scale;
+    gl_PointSize = clamp(pixels, 1.0, 64.0);
+    f_color = aColor;
+}